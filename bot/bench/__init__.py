@@ -0,0 +1 @@
+"""Нагрузочные тесты и бенчмарки (запуск из каталога bot: python -m bench.<модуль>)"""
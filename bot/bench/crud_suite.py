@@ -0,0 +1,262 @@
+"""
+Бенчмарк функций поиска и статистики из database.crud на больших наборах.
+
+Для каждого размера (по умолчанию 10k, 100k и 1M пользователей) база
+заполняется генератором bench.dataset, после чего каждая функция
+вызывается --repeat раз со случайными аргументами из набора:
+- find_users_by_skills, find_cofounders, find_teams_for_participant
+- count_teams_need_skill
+- get_user_stats, get_team_stats, count_invitations_today
+
+Режимы:
+- db - кеши в памяти выключены (profile_snapshot, skill_histogram,
+  affinity, profile_cache): замеряются SQL-пути
+- cached - кеши построены, как в работающем боте; дополнительно
+  замеряется время их построения на этом размере
+
+Результаты сохраняются в JSON (bench/baselines/<метка>.json, метка по
+умолчанию - текущая ветка git). --compare печатает отношение p50 к
+другому файлу - так сравниваются ветки.
+
+ВНИМАНИЕ: перед каждым размером таблицы очищаются (TRUNCATE).
+
+Запуск (из каталога bot):
+    python -m bench.crud_suite --sizes 10000,100000 --yes
+    python -m bench.crud_suite --yes --compare bench/baselines/main.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+from sqlalchemy.engine import make_url
+from config import settings
+from database import crud, db
+from services.affinity import affinity
+from services.profile_cache import profile_cache
+from services.profile_snapshot import profile_snapshot
+from services.skill_histogram import skill_histogram
+from utils.texts import SKILLS_DESCRIPTIONS, format_selected_skills
+from bench.dataset import DatasetGenerator, seed
+
+logger = logging.getLogger(__name__)
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+
+MODES = ("db", "cached")
+
+# Вызов функции: (сессия, генератор случайных чисел, набор данных)
+Call = Callable[[object, random.Random, DatasetGenerator], Awaitable[object]]
+
+
+def _pick(rng: random.Random, generator: DatasetGenerator, user_type: str) -> int:
+    ids = generator.ids[user_type]
+    return rng.choice(ids) if ids else 1
+
+
+BENCHMARKS: Dict[str, Call] = {
+    "find_users_by_skills": lambda session, rng, generator: crud.find_users_by_skills(
+        session, format_selected_skills(generator.skills()), limit=settings.MATCH_FEED_SIZE
+    ),
+    "find_cofounders": lambda session, rng, generator: crud.find_cofounders(
+        session, _pick(rng, generator, "COFOUNDER"), limit=settings.MATCH_FEED_SIZE
+    ),
+    "find_teams_for_participant": lambda session, rng, generator: crud.find_teams_for_participant(
+        session, _pick(rng, generator, "PARTICIPANT"), limit=settings.MATCH_FEED_SIZE
+    ),
+    "count_teams_need_skill": lambda session, rng, generator: crud.count_teams_need_skill(
+        session, SKILLS_DESCRIPTIONS[generator.skills()[0]]["name"]
+    ),
+    "get_user_stats": lambda session, rng, generator: crud.get_user_stats(
+        session, rng.randint(1, generator.users)
+    ),
+    "get_team_stats": lambda session, rng, generator: crud.get_team_stats(
+        session, rng.randint(1, max(len(generator.team_by_leader), 1))
+    ),
+    "count_invitations_today": lambda session, rng, generator: crud.count_invitations_today(
+        session, _pick(rng, generator, "TEAM")
+    ),
+}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def _summary(timings: List[float]) -> dict:
+    timings = sorted(timings)
+    return {
+        "runs": len(timings),
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+        "p50_ms": round(_percentile(timings, 0.5) * 1000, 3),
+        "p95_ms": round(_percentile(timings, 0.95) * 1000, 3),
+        "min_ms": round(timings[0] * 1000, 3),
+        "max_ms": round(timings[-1] * 1000, 3),
+    }
+
+
+def _disable_caches() -> None:
+    """Переключить crud на SQL-пути"""
+    profile_snapshot.ready = False
+    skill_histogram.ready = False
+    affinity.ready = False
+    profile_cache.clear()
+
+
+async def _build_caches() -> Dict[str, float]:
+    """Построить кеши как при старте бота; время построения (мс)"""
+    timings = {}
+    for name, build in (
+        ("profile_snapshot", profile_snapshot.reload),
+        ("skill_histogram", skill_histogram.refresh),
+        ("affinity", affinity.rebuild),
+    ):
+        started = time.perf_counter()
+        await build()
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    return timings
+
+
+async def _measure(name: str, call: Call, generator: DatasetGenerator, mode: str,
+                   repeat: int, warmup: int, rng: random.Random) -> dict:
+    timings: List[float] = []
+    for index in range(warmup + repeat):
+        if mode == "db":
+            profile_cache.clear()
+        async with db.get_db() as session:
+            started = time.perf_counter()
+            await call(session, rng, generator)
+            elapsed = time.perf_counter() - started
+        if index >= warmup:
+            timings.append(elapsed)
+    return _summary(timings)
+
+
+async def run_size(users: int, args: argparse.Namespace) -> dict:
+    """Заполнить базу и замерить все функции во всех режимах"""
+    dataset, generator = await seed(users, args.seed, args.invitations_per_user)
+    result = {"dataset": dataset, "functions": {name: {} for name in BENCHMARKS}}
+
+    for mode in args.modes:
+        if mode == "cached":
+            result["cache_build_ms"] = await _build_caches()
+        else:
+            _disable_caches()
+        # Одинаковые аргументы для каждого режима
+        rng = random.Random(args.seed)
+        for name, call in BENCHMARKS.items():
+            stats = await _measure(name, call, generator, mode, args.repeat, args.warmup, rng)
+            result["functions"][name][mode] = stats
+            logger.info(f"{users} / {mode} / {name}: p50 {stats['p50_ms']} мс, p95 {stats['p95_ms']} мс")
+
+    _disable_caches()
+    return result
+
+
+async def run(args: argparse.Namespace) -> dict:
+    await db.init_db()
+    try:
+        sizes = {}
+        for users in args.sizes:
+            sizes[str(users)] = await run_size(users, args)
+    finally:
+        await db.close_db()
+
+    return {
+        "label": args.label,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {"repeat": args.repeat, "warmup": args.warmup, "seed": args.seed,
+                   "invitations_per_user": args.invitations_per_user},
+        "sizes": sizes,
+    }
+
+
+def format_report(report: dict, baseline: Optional[dict] = None) -> str:
+    """Таблица p50/p95 (и отношение p50 к baseline, если он задан)"""
+    lines = [f"Метка: {report['label']}"]
+    if baseline is not None:
+        lines[0] += f" (сравнение с {baseline['label']})"
+    for size, result in report["sizes"].items():
+        lines.append(f"\n{int(size):,} пользователей ({result['dataset']['seconds']} с на заполнение)")
+        if "cache_build_ms" in result:
+            builds = ", ".join(f"{name} {ms} мс" for name, ms in result["cache_build_ms"].items())
+            lines.append(f"  построение кешей: {builds}")
+        for name, modes in result["functions"].items():
+            for mode, stats in modes.items():
+                line = f"  {name:<28} {mode:<7} p50 {stats['p50_ms']:>9.2f} мс  p95 {stats['p95_ms']:>9.2f} мс"
+                base = ((baseline or {}).get("sizes", {}).get(size, {})
+                        .get("functions", {}).get(name, {}).get(mode))
+                if base and base["p50_ms"]:
+                    line += f"  x{stats['p50_ms'] / base['p50_ms']:.2f}"
+                lines.append(line)
+    return "\n".join(lines)
+
+
+def _git_branch() -> str:
+    try:
+        branch = subprocess.run(
+            ["git", "rev-parse", "--abbrev-ref", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "local"
+    return branch.replace("/", "-") or "local"
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк функций поиска и статистики crud")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Размеры набора через запятую")
+    parser.add_argument("--repeat", type=int, default=30, help="Замеров на функцию")
+    parser.add_argument("--warmup", type=int, default=3, help="Прогревочных вызовов (не учитываются)")
+    parser.add_argument("--modes", default=",".join(MODES), help="Режимы через запятую: db, cached")
+    parser.add_argument("--seed", type=int, default=1, help="Зерно набора и аргументов")
+    parser.add_argument("--invitations-per-user", type=float, default=2.0, help="Приглашений на пользователя")
+    parser.add_argument("--label", default=None, help="Метка результата (по умолчанию - ветка git)")
+    parser.add_argument("--output", default=None, help="JSON с результатами (по умолчанию bench/baselines/<метка>.json)")
+    parser.add_argument("--compare", default=None, help="JSON другой ветки для сравнения")
+    parser.add_argument("--yes", action="store_true", help="Подтвердить очистку таблиц")
+    parser.add_argument("--log-level", default="INFO", help="Уровень логов")
+    args = parser.parse_args(argv)
+
+    if not args.yes:
+        parser.error("таблицы users, teams и invitations будут очищены - добавьте --yes")
+    args.sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    args.modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"неизвестные режимы: {', '.join(sorted(unknown))}")
+    args.label = args.label or _git_branch()
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()),
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    target = make_url(settings.DATABASE_URL).render_as_string(hide_password=True)
+    print(f"База данных: {target}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as source:
+            baseline = json.load(source)
+
+    report = asyncio.run(run(args))
+    print(format_report(report, baseline))
+
+    output = Path(args.output) if args.output else BASELINE_DIR / f"{args.label}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as target_file:
+        json.dump(report, target_file, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Генератор большого набора данных для бенчмарков.
+
+Заполняет users, teams и invitations через COPY (asyncpg) - миллион
+профилей загружается за минуты, а не часы ORM-вставок. Распределения
+приближены к реальным:
+- типы: 70% соискателей, 10% соло-основателей, 20% лидеров команд
+  (у каждого лидера одна команда)
+- навыки из SKILLS_DESCRIPTIONS с убывающей популярностью (закон Ципфа):
+  Backend и Frontend встречаются намного чаще редких навыков
+- 1-3 навыка у профиля и команды, идеи с категориями из database.ranking
+- last_active экспоненциально за последние 60 дней, 10% не ищут команду
+- приглашения за последние 30 дней (5% - сегодня): команда -> соискатель,
+  соискатель -> лидер, соло -> соло; статусы pending/accepted/rejected/expired
+
+Набор детерминирован при одинаковом --seed.
+
+ВНИМАНИЕ: перед заполнением таблицы очищаются (TRUNCATE).
+
+Запуск (из каталога bot):
+    python -m bench.dataset --users 100000 --yes
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+import asyncpg
+from database.db import listener_dsn
+from database.ranking import IDEA_CATEGORIES
+from utils.texts import SKILLS_DESCRIPTIONS, format_selected_skills
+
+logger = logging.getLogger(__name__)
+
+SKILL_KEYS = list(SKILLS_DESCRIPTIONS)
+
+# Популярность навыка с номером i пропорциональна 1 / (i + 1) ** ZIPF_EXPONENT
+ZIPF_EXPONENT = 0.9
+
+# Доли типов пользователей
+TYPE_SHARES = (("PARTICIPANT", 0.7), ("COFOUNDER", 0.1), ("TEAM", 0.2))
+
+# Доли статусов приглашений
+STATUS_SHARES = (("PENDING", 0.45), ("ACCEPTED", 0.2), ("REJECTED", 0.3), ("EXPIRED", 0.05))
+
+# Telegram ID синтетических пользователей: TELEGRAM_ID_BASE + users.id
+TELEGRAM_ID_BASE = 10 ** 12
+
+# Строк в одном COPY
+BATCH_SIZE = 50000
+
+TRUNCATE_SQL = (
+    "TRUNCATE users, teams, invitations, invitations_archive, match_feed, seen_filters "
+    "RESTART IDENTITY CASCADE"
+)
+
+USER_COLUMNS = (
+    "id", "telegram_id", "username", "name", "user_type", "primary_skill", "additional_skills",
+    "idea_what", "idea_who", "is_searching", "last_active", "created_at", "updated_at",
+)
+TEAM_COLUMNS = (
+    "id", "team_name", "idea_description", "leader_id", "needed_skills", "status", "is_full",
+    "created_at", "updated_at",
+)
+INVITATION_COLUMNS = (
+    "from_user_id", "from_team_id", "to_user_id", "status", "created_at", "expires_at",
+    "viewed_at", "responded_at",
+)
+
+
+class DatasetGenerator:
+    """Построчная генерация профилей, команд и приглашений"""
+
+    def __init__(self, users: int, seed: int = 1, invitations_per_user: float = 2.0):
+        """
+        Args:
+            users: Число пользователей
+            seed: Зерно генератора
+            invitations_per_user: Среднее число приглашений на пользователя
+        """
+        self.users = users
+        self.invitations_per_user = invitations_per_user
+        self.rng = random.Random(seed)
+        self.now = datetime.utcnow()
+
+        self._skill_weights = [1 / (index + 1) ** ZIPF_EXPONENT for index in range(len(SKILL_KEYS))]
+        self._types = [name for name, _ in TYPE_SHARES]
+        self._type_weights = [share for _, share in TYPE_SHARES]
+        self._statuses = [name for name, _ in STATUS_SHARES]
+        self._status_weights = [share for _, share in STATUS_SHARES]
+
+        # id по типам - для приглашений и выборок бенчмарка
+        self.ids: Dict[str, List[int]] = {name: [] for name in self._types}
+        # id команды по id лидера
+        self.team_by_leader: Dict[int, int] = {}
+
+    # ===== Генерация =====
+
+    def user_rows(self) -> Iterator[tuple]:
+        rng = self.rng
+        for user_id in range(1, self.users + 1):
+            user_type = rng.choices(self._types, self._type_weights)[0]
+            self.ids[user_type].append(user_id)
+            if user_type == "TEAM":
+                self.team_by_leader[user_id] = len(self.team_by_leader) + 1
+
+            skills = self.skills()
+            primary_skill = additional_skills = idea_what = idea_who = None
+            if user_type != "TEAM":
+                primary_skill = SKILLS_DESCRIPTIONS[skills[0]]["name"]
+                additional_skills = format_selected_skills(skills[1:]) if len(skills) > 1 else None
+            if user_type == "COFOUNDER":
+                idea_what = self._idea()
+                idea_who = rng.choice(("студентов", "малого бизнеса", "врачей", "родителей", None))
+
+            last_active = self.now - timedelta(days=min(rng.expovariate(1 / 7), 60))
+            created_at = last_active - timedelta(days=rng.uniform(0, 180))
+            yield (
+                user_id,
+                TELEGRAM_ID_BASE + user_id,
+                f"user{user_id}" if rng.random() < 0.8 else None,
+                f"User {user_id}",
+                user_type,
+                primary_skill,
+                additional_skills,
+                idea_what,
+                idea_who,
+                rng.random() < 0.9,
+                last_active,
+                created_at,
+                last_active,
+            )
+
+    def team_rows(self) -> Iterator[tuple]:
+        rng = self.rng
+        for leader_id, team_id in self.team_by_leader.items():
+            created_at = self.now - timedelta(days=rng.uniform(0, 120))
+            status = "ACTIVE" if rng.random() < 0.85 else rng.choice(("INACTIVE", "COMPLETE"))
+            yield (
+                team_id,
+                f"Team {team_id}",
+                self._idea() if rng.random() < 0.7 else None,
+                leader_id,
+                format_selected_skills(self.skills()),
+                status,
+                status == "COMPLETE",
+                created_at,
+                created_at + timedelta(days=rng.uniform(0, 5)),
+            )
+
+    def invitation_rows(self) -> Iterator[tuple]:
+        rng = self.rng
+        participants, cofounders, leaders = self.ids["PARTICIPANT"], self.ids["COFOUNDER"], self.ids["TEAM"]
+        total = int(self.users * self.invitations_per_user)
+        for _ in range(total):
+            kind = rng.random()
+            if kind < 0.6 and leaders and participants:
+                from_user_id = rng.choice(leaders)
+                from_team_id = self.team_by_leader[from_user_id]
+                to_user_id = rng.choice(participants)
+            elif kind < 0.85 and leaders and participants:
+                from_user_id, from_team_id, to_user_id = rng.choice(participants), None, rng.choice(leaders)
+            elif len(cofounders) > 1:
+                from_user_id, to_user_id = rng.sample(cofounders, 2)
+                from_team_id = None
+            else:
+                continue
+
+            if rng.random() < 0.05:
+                created_at = self.now - timedelta(hours=rng.uniform(0, self.now.hour + self.now.minute / 60))
+            else:
+                created_at = self.now - timedelta(days=rng.uniform(0, 30))
+            status = rng.choices(self._statuses, self._status_weights)[0]
+            viewed_at = created_at + timedelta(hours=rng.uniform(0, 48)) if status != "PENDING" or rng.random() < 0.5 else None
+            responded_at = viewed_at if status in ("ACCEPTED", "REJECTED") else None
+            yield (
+                from_user_id,
+                from_team_id,
+                to_user_id,
+                status,
+                created_at,
+                created_at + timedelta(days=7) if status == "PENDING" else None,
+                viewed_at,
+                responded_at,
+            )
+
+    def skills(self) -> List[str]:
+        """1-3 навыка с учетом популярности"""
+        count = self.rng.choices((1, 2, 3), (0.5, 0.35, 0.15))[0]
+        chosen: List[str] = []
+        while len(chosen) < count:
+            key = self.rng.choices(SKILL_KEYS, self._skill_weights)[0]
+            if key not in chosen:
+                chosen.append(key)
+        return chosen
+
+    def _idea(self) -> str:
+        category = self.rng.choice(IDEA_CATEGORIES)
+        return f"Сервис в сфере {category} для {self.rng.choice(('студентов', 'компаний', 'семей'))}"
+
+
+async def _copy(conn: asyncpg.Connection, table: str, columns: Tuple[str, ...], rows: Iterator[tuple]) -> int:
+    """COPY пачками по BATCH_SIZE строк"""
+    copied = 0
+    batch: List[tuple] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            await conn.copy_records_to_table(table, records=batch, columns=columns)
+            copied += len(batch)
+            batch = []
+    if batch:
+        await conn.copy_records_to_table(table, records=batch, columns=columns)
+        copied += len(batch)
+    return copied
+
+
+async def seed(users: int, seed_value: int = 1, invitations_per_user: float = 2.0,
+               dsn: Optional[str] = None) -> Tuple[dict, DatasetGenerator]:
+    """
+    Очистить таблицы и заполнить их синтетическими данными.
+
+    Returns:
+        (сводка: число строк и время, генератор с id по типам)
+    """
+    generator = DatasetGenerator(users, seed=seed_value, invitations_per_user=invitations_per_user)
+    started = time.perf_counter()
+
+    conn = await asyncpg.connect(dsn or listener_dsn())
+    try:
+        await conn.execute(TRUNCATE_SQL)
+        counts = {
+            "users": await _copy(conn, "users", USER_COLUMNS, generator.user_rows()),
+            "teams": await _copy(conn, "teams", TEAM_COLUMNS, generator.team_rows()),
+            "invitations": await _copy(conn, "invitations", INVITATION_COLUMNS, generator.invitation_rows()),
+        }
+        # id заданы явно - сдвигаем последовательности
+        await conn.execute("SELECT setval(pg_get_serial_sequence('users', 'id'), $1)", max(users, 1))
+        await conn.execute(
+            "SELECT setval(pg_get_serial_sequence('teams', 'id'), $1)", max(len(generator.team_by_leader), 1)
+        )
+        await conn.execute("ANALYZE users, teams, invitations")
+    finally:
+        await conn.close()
+
+    summary = {
+        **counts,
+        "by_type": {name: len(ids) for name, ids in generator.ids.items()},
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+    logger.info(f"Набор данных: {summary}")
+    return summary, generator
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Синтетический набор данных для бенчмарков")
+    parser.add_argument("--users", type=int, required=True, help="Число пользователей")
+    parser.add_argument("--seed", type=int, default=1, help="Зерно генератора")
+    parser.add_argument("--invitations-per-user", type=float, default=2.0, help="Приглашений на пользователя")
+    parser.add_argument("--yes", action="store_true", help="Подтвердить очистку таблиц")
+    args = parser.parse_args()
+
+    if not args.yes:
+        parser.error("таблицы users, teams и invitations будут очищены - добавьте --yes")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    summary, _ = asyncio.run(seed(args.users, args.seed, args.invitations_per_user))
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+Локальный фейковый сервер Telegram Bot API для сквозных тестов.
+
+В отличие от FakeSession (bench.load), бот ходит сюда по настоящему HTTP
+через AiohttpSession - замеряется весь путь: polling, сериализация форм,
+пул соединений aiohttp, обработка 429 и ошибок сервера. Бот направляется
+сюда настройкой TELEGRAM_API_URL=http://127.0.0.1:8081.
+
+- sendMessage, editMessageText, editMessageReplyMarkup, deleteMessage,
+  answerCallbackQuery и прочие методы отвечают как Bot API (сообщения
+  складываются в ящики по chat_id, см. MessageStore)
+- getUpdates отдает апдейты из сценария: файл NDJSON (--feed, можно .gz)
+  с заданным темпом, синтетические команды (--users, --commands) или
+  POST /feed во время работы. Long polling и подтверждение по offset -
+  как у Telegram
+- Задержка (--latency-ms, --jitter-ms), ответы 429 с retry_after
+  (--rate-limit) и ошибки (--error-rate, --error-code) для доли вызовов;
+  getUpdates затрагивается только с --faults-on-updates
+
+Служебные эндпоинты: GET /stats - статистика, GET /inbox/{chat_id} -
+что бот отправил пользователю, POST /feed - добавить апдейт или список.
+
+Запуск (из каталога bot):
+    python -m bench.fake_api --latency-ms 50 --rate-limit 0.01 --users 200 --feed-rate 100
+    TELEGRAM_API_URL=http://127.0.0.1:8081 python main.py
+"""
+import argparse
+import asyncio
+import gzip
+import itertools
+import json
+import logging
+import random
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Deque, Dict, Iterable, Iterator, List, Optional
+from aiohttp import web
+from bench.fake_session import MessageStore
+
+logger = logging.getLogger(__name__)
+
+# Поля формы, которые приходят JSON-строкой или числом
+JSON_FIELDS = {"reply_markup", "entities", "caption_entities", "allowed_updates", "link_preview_options"}
+INT_FIELDS = {"chat_id", "message_id", "offset", "limit", "timeout", "from_chat_id", "user_id"}
+
+# Больше апдейтов за один getUpdates Telegram не отдает
+MAX_UPDATES = 100
+
+ERROR_DESCRIPTIONS = {
+    400: "Bad Request: injected error",
+    403: "Forbidden: bot was blocked by the user",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+}
+
+
+def _parse_value(key: str, value: str):
+    if key in JSON_FIELDS:
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    if key in INT_FIELDS:
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    return value
+
+
+def text_update(user_id: int, text: str, username: Optional[str] = None) -> dict:
+    """Апдейт с текстовым сообщением пользователя (update_id назначит сервер)"""
+    return {
+        "message": {
+            "message_id": 0,
+            "date": int(datetime.now().timestamp()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}",
+                     "username": username or f"fake_{user_id}"},
+            "text": text,
+        },
+    }
+
+
+def read_feed(path: str) -> Iterator[dict]:
+    """Апдейты из файла NDJSON (по одному JSON на строку, .gz - сжатый)"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as source:
+        for line in source:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class FakeTelegramAPI:
+    """aiohttp-приложение, которое отвечает как Bot API"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit: float = 0.0,
+                 retry_after: int = 1, error_rate: float = 0.0, error_code: int = 500,
+                 faults_on_updates: bool = False, seed: Optional[int] = None):
+        """
+        Args:
+            latency: Задержка каждого ответа (секунды)
+            jitter: Случайная добавка к задержке, 0..jitter (секунды)
+            rate_limit: Доля вызовов, получающих 429
+            retry_after: retry_after в ответах 429 (секунды)
+            error_rate: Доля вызовов, получающих ошибку
+            error_code: HTTP-код ошибки (400, 403, 500, 502)
+            faults_on_updates: Применять 429 и ошибки и к getUpdates
+            seed: Зерно генератора случайных чисел
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.faults_on_updates = faults_on_updates
+        self.rng = random.Random(seed)
+
+        self.store = MessageStore()
+        self._update_ids = itertools.count(1)
+        # Неподтвержденные апдейты: (апдейт, время постановки в очередь)
+        self._updates: Deque[tuple] = deque()
+        self._new_updates = asyncio.Event()
+        self._delivered: set = set()
+        self._runner: Optional[web.AppRunner] = None
+
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.call_time: Dict[str, float] = defaultdict(float)
+        self.faults: Dict[str, int] = defaultdict(int)
+        self.confirmed = 0
+        # Ожидание апдейта в очереди до первой выдачи боту (секунды)
+        self.delivery_lag: Deque[float] = deque(maxlen=10000)
+
+    # ===== Сценарий апдейтов =====
+
+    def push(self, update: dict) -> int:
+        """Поставить апдейт в очередь getUpdates; возвращает update_id"""
+        update = dict(update)
+        update_id = next(self._update_ids)
+        update["update_id"] = update_id
+        message = update.get("message")
+        if message is not None and not message.get("message_id"):
+            update["message"] = {**message, "message_id": update_id}
+        self._updates.append((update, time.monotonic()))
+        self._new_updates.set()
+        return update_id
+
+    async def play(self, updates: Iterable[dict], rate: float = 0.0) -> int:
+        """
+        Поставить апдейты в очередь с темпом rate в секунду (0 - сразу все).
+
+        Returns:
+            Сколько апдейтов поставлено
+        """
+        started = time.monotonic()
+        count = 0
+        for count, update in enumerate(updates, start=1):
+            self.push(update)
+            if rate > 0:
+                delay = started + count / rate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        logger.info(f"Сценарий: поставлено {count} апдейтов")
+        return count
+
+    # ===== HTTP =====
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle_method)
+        app.router.add_post("/feed", self.handle_feed)
+        app.router.add_get("/stats", self.handle_stats)
+        app.router.add_get("/inbox/{chat_id}", self.handle_inbox)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> None:
+        """Запустить HTTP-сервер"""
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Фейковый Bot API: http://{host}:{port}")
+
+    async def stop(self) -> None:
+        """Остановить HTTP-сервер"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        started = time.perf_counter()
+        name = request.match_info["method"]
+        params = await self._params(request)
+        try:
+            if name.lower() == "getupdates":
+                fault = self._fault(name) if self.faults_on_updates else None
+                return fault or self._ok(await self._get_updates(params))
+
+            delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            if delay:
+                await asyncio.sleep(delay)
+            fault = self._fault(name)
+            if fault is not None:
+                return fault
+            try:
+                return self._ok(self.store.result(name, params))
+            except (KeyError, TypeError, ValueError) as e:
+                return self._error(400, f"Bad Request: {e}")
+        finally:
+            self.calls[name] += 1
+            self.call_time[name] += time.perf_counter() - started
+
+    async def handle_feed(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        updates = body if isinstance(body, list) else [body]
+        return web.json_response({"update_ids": [self.push(update) for update in updates]})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.get_stats())
+
+    async def handle_inbox(self, request: web.Request) -> web.Response:
+        chat_id = int(request.match_info["chat_id"])
+        return web.json_response([
+            {"message_id": sent.message_id, "text": sent.text, "buttons": sent.buttons}
+            for sent in self.store.inboxes.get(chat_id, [])
+        ])
+
+    # ===== Статистика =====
+
+    def get_stats(self) -> dict:
+        """Вызовы по методам, внесенные сбои и состояние очереди апдейтов"""
+        lags = sorted(self.delivery_lag)
+        return {
+            "methods": {
+                name: {"calls": count, "avg_ms": round(self.call_time[name] / count * 1000, 3)}
+                for name, count in sorted(self.calls.items())
+            },
+            "faults": dict(self.faults),
+            "updates": {
+                "pending": len(self._updates),
+                "confirmed": self.confirmed,
+                "delivery_lag_p50_ms": round(lags[len(lags) // 2] * 1000, 3) if lags else 0.0,
+                "delivery_lag_max_ms": round(lags[-1] * 1000, 3) if lags else 0.0,
+            },
+        }
+
+    # ===== Внутреннее =====
+
+    async def _params(self, request: web.Request) -> dict:
+        params = dict(request.query)
+        if request.content_type == "application/json":
+            params.update(await request.json())
+            return params
+        if request.method == "POST":
+            params.update(await request.post())
+        return {
+            key: _parse_value(key, value) if isinstance(value, str) else value
+            for key, value in params.items()
+        }
+
+    async def _get_updates(self, params: dict) -> List[dict]:
+        offset = int(params.get("offset") or 0)
+        limit = min(int(params.get("limit") or MAX_UPDATES), MAX_UPDATES)
+        timeout = float(params.get("timeout") or 0)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            # Апдейты с id меньше offset подтверждены ботом
+            while self._updates and self._updates[0][0]["update_id"] < offset:
+                update, _ = self._updates.popleft()
+                self._delivered.discard(update["update_id"])
+                self.confirmed += 1
+            remaining = deadline - loop.time()
+            if self._updates or remaining <= 0:
+                break
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+
+        batch = list(itertools.islice(self._updates, limit))
+        now = time.monotonic()
+        for update, queued in batch:
+            if update["update_id"] not in self._delivered:
+                self._delivered.add(update["update_id"])
+                self.delivery_lag.append(now - queued)
+        return [update for update, _ in batch]
+
+    def _fault(self, name: str) -> Optional[web.Response]:
+        roll = self.rng.random()
+        if roll < self.rate_limit:
+            self.faults["retry_after"] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        if roll < self.rate_limit + self.error_rate:
+            self.faults[f"error_{self.error_code}"] += 1
+            return self._error(self.error_code, ERROR_DESCRIPTIONS.get(self.error_code, "Injected error"))
+        return None
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    def _error(code: int, description: str) -> web.Response:
+        return web.json_response({"ok": False, "error_code": code, "description": description}, status=code)
+
+
+def synthetic_updates(users: int, commands: List[str], id_base: int) -> Iterator[dict]:
+    """Каждый пользователь по очереди отправляет команды (круг за кругом)"""
+    for command in commands:
+        for index in range(users):
+            yield text_update(id_base + index, command)
+
+
+async def serve(args: argparse.Namespace) -> None:
+    api = FakeTelegramAPI(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        rate_limit=args.rate_limit,
+        retry_after=args.retry_after,
+        error_rate=args.error_rate,
+        error_code=args.error_code,
+        faults_on_updates=args.faults_on_updates,
+        seed=args.seed,
+    )
+    await api.start(args.host, args.port)
+
+    feeds = []
+    if args.feed:
+        feeds.append(read_feed(args.feed))
+    if args.users:
+        commands = [command.strip() for command in args.commands.split(",") if command.strip()]
+        feeds.append(synthetic_updates(args.users, commands, args.id_base))
+    try:
+        if feeds:
+            await api.play(itertools.chain(*feeds), rate=args.feed_rate)
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            print(json.dumps(api.get_stats(), ensure_ascii=False))
+    finally:
+        await api.stop()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Фейковый сервер Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1", help="Адрес сервера")
+    parser.add_argument("--port", type=int, default=8081, help="Порт сервера")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Задержка каждого ответа (мс)")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Случайная добавка к задержке (мс)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Доля вызовов с ответом 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429 (секунды)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля вызовов с ошибкой")
+    parser.add_argument("--error-code", type=int, default=500, help="HTTP-код ошибки")
+    parser.add_argument("--faults-on-updates", action="store_true", help="Сбои и для getUpdates")
+    parser.add_argument("--feed", help="Файл апдейтов NDJSON (.gz - сжатый)")
+    parser.add_argument("--users", type=int, default=0, help="Синтетических пользователей")
+    parser.add_argument("--commands", default="/start,/search", help="Команды синтетических пользователей")
+    parser.add_argument("--id-base", type=int, default=8 * 10**12, help="Первый telegram_id синтетических пользователей")
+    parser.add_argument("--feed-rate", type=float, default=0.0, help="Апдейтов в секунду (0 - сразу все)")
+    parser.add_argument("--stats-interval", type=float, default=10.0, help="Период вывода статистики (секунды)")
+    parser.add_argument("--seed", type=int, default=None, help="Зерно генератора сбоев")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
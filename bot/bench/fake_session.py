@@ -0,0 +1,163 @@
+"""
+Сессия бота без сети для нагрузочных тестов.
+
+FakeSession подменяет AiohttpSession: вызовы Bot API не уходят в
+Telegram, а записываются и сразу получают правдоподобный ответ.
+Путь запроса внутри aiogram сохраняется - middleware сессии,
+сериализация параметров (build_form_data) и разбор ответа
+(check_response) выполняются как при настоящем HTTP.
+
+Отправленные и отредактированные сообщения складываются в ящики по
+chat_id (MessageStore): симулированный пользователь читает из них кнопки
+и нажимает их. Тот же MessageStore отвечает и в HTTP-сервере
+bench.fake_api.
+"""
+import asyncio
+import itertools
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, AsyncGenerator, Dict, List, Optional
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+
+# Пользователь Telegram, от имени которого «отвечает» бот
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "TeamFinderBot", "username": "team_finder_bot"}
+
+
+class SentMessage:
+    """Сообщение бота, каким его видит пользователь"""
+
+    __slots__ = ("message_id", "chat_id", "text", "buttons", "payload")
+
+    def __init__(self, message_id: int, chat_id: int, text: Optional[str], buttons: List[str], payload: dict):
+        self.message_id = message_id
+        self.chat_id = chat_id
+        self.text = text
+        # callback_data всех inline-кнопок
+        self.buttons = buttons
+        # Сообщение в формате Bot API (для callback_query.message)
+        self.payload = payload
+
+
+def _buttons(reply_markup: Optional[dict]) -> List[str]:
+    if not reply_markup:
+        return []
+    return [
+        button["callback_data"]
+        for row in reply_markup.get("inline_keyboard", [])
+        for button in row
+        if button.get("callback_data")
+    ]
+
+
+class MessageStore:
+    """Ящики сообщений по chat_id и правдоподобные ответы Bot API"""
+
+    def __init__(self):
+        self._message_ids = itertools.count(1)
+        self.inboxes: Dict[int, List[SentMessage]] = defaultdict(list)
+
+    def result(self, name: str, params: dict) -> Any:
+        """Поле result ответа на вызов name с параметрами params"""
+        if name == "sendMessage":
+            return self.store_message(next(self._message_ids), params)
+        if name in ("editMessageText", "editMessageReplyMarkup"):
+            if params.get("inline_message_id"):
+                return True
+            return self.store_message(params["message_id"], params)
+        if name == "getMe":
+            return BOT_USER
+        return True
+
+    def store_message(self, message_id: int, params: dict) -> dict:
+        """Положить сообщение в ящик чата и вернуть его в формате Bot API"""
+        chat_id = int(params["chat_id"])
+        payload = {
+            "message_id": message_id,
+            "date": int(datetime.now().timestamp()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        text = params.get("text")
+        if text is None:
+            # editMessageReplyMarkup: текст прежний
+            text = next(
+                (sent.text for sent in reversed(self.inboxes[chat_id]) if sent.message_id == message_id),
+                None
+            )
+        if text is not None:
+            payload["text"] = text
+        reply_markup = params.get("reply_markup")
+        if reply_markup:
+            payload["reply_markup"] = reply_markup
+
+        self.inboxes[chat_id].append(SentMessage(message_id, chat_id, text, _buttons(reply_markup), payload))
+        return payload
+
+
+class FakeSession(BaseSession):
+    """Записывает вызовы Bot API и отвечает без сети"""
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Args:
+            latency: Искусственная задержка каждого вызова (секунды)
+        """
+        super().__init__()
+        self.latency = latency
+
+        self.store = MessageStore()
+        self.inboxes = self.store.inboxes
+
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.call_time: Dict[str, float] = defaultdict(float)
+
+    # ===== BaseSession =====
+
+    async def make_request(
+        self, bot: Bot, method: TelegramMethod[TelegramType], timeout: Optional[int] = None
+    ) -> TelegramType:
+        started = time.perf_counter()
+        name = method.__api_method__
+
+        # Та же подготовка параметров, что и перед отправкой формы
+        params = {
+            key: self.prepare_value(value, bot=bot, files={}, _dumps_json=False)
+            for key, value in method.model_dump(warnings=False).items()
+        }
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        result = self.store.result(name, params)
+        response = self.check_response(
+            bot=bot, method=method, status_code=200,
+            content=self.json_dumps({"ok": True, "result": result})
+        )
+
+        self.calls[name] += 1
+        self.call_time[name] += time.perf_counter() - started
+        return response.result
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        raise NotImplementedError("FakeSession не скачивает файлы")
+        yield b""  # pragma: no cover
+
+    async def close(self) -> None:
+        pass
+
+    # ===== Публичный API =====
+
+    def total_calls(self) -> int:
+        """Сколько всего вызовов Bot API было сделано"""
+        return sum(self.calls.values())
+
+    def get_stats(self) -> Dict[str, dict]:
+        """Вызовы и среднее время обработки по методам"""
+        return {
+            name: {"calls": count, "avg_ms": round(self.call_time[name] / count * 1000, 3)}
+            for name, count in sorted(self.calls.items())
+        }
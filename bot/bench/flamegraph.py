@@ -0,0 +1,124 @@
+"""
+Сводка профилей обработчиков (services.profiler) во вход для flamegraph.
+
+- .collapsed (режим sampler) суммируются по одинаковым стекам; результат -
+  collapsed stacks для flamegraph.pl, speedscope или inferno:
+  каждый обработчик - отдельный корень стека
+- .pstats (режим cprofile) объединяются в один файл --pstats (для
+  snakeviz, gprof2dot) с выводом топа по cumulative time
+
+Запуск (из каталога bot):
+    python -m bench.flamegraph logs/profiles -o all.folded
+    python -m bench.flamegraph logs/profiles --handler cmd_search --cpu-only -o search.folded
+    flamegraph.pl search.folded > search.svg
+    python -m bench.flamegraph logs/profiles --pstats merged.pstats --top 30
+"""
+import argparse
+import io
+import pstats
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+from services.profiler import AWAIT_MARKER
+
+
+def profile_files(directory: Path, suffix: str, handler: Optional[str] = None,
+                  since_minutes: Optional[float] = None) -> List[Path]:
+    """Файлы профилей с расширением suffix (фильтр по имени обработчика и возрасту)"""
+    cutoff = time.time() - since_minutes * 60 if since_minutes else None
+    return sorted(
+        path for path in directory.glob(f"*/*.{suffix}")
+        if (handler is None or handler in path.parent.name)
+        and (cutoff is None or path.stat().st_mtime >= cutoff)
+    )
+
+
+def merge_collapsed(files: List[Path], cpu_only: bool = False) -> Dict[str, Counter]:
+    """Сумма сэмплов по стекам для каждого обработчика (каталога)"""
+    merged: Dict[str, Counter] = {}
+    for path in files:
+        counter = merged.setdefault(path.parent.name, Counter())
+        with open(path, encoding="utf-8") as source:
+            for line in source:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                if not stack or not count.isdigit():
+                    continue
+                if cpu_only and stack.endswith(AWAIT_MARKER):
+                    continue
+                counter[stack] += int(count)
+    return merged
+
+
+def write_collapsed(merged: Dict[str, Counter], output) -> int:
+    """Collapsed stacks с обработчиком в корне; возвращает число сэмплов"""
+    total = 0
+    for handler, counter in sorted(merged.items()):
+        for stack, count in sorted(counter.items()):
+            output.write(f"{handler};{stack} {count}\n")
+            total += count
+    return total
+
+
+def summary(merged: Dict[str, Counter], files: List[Path]) -> str:
+    """Сэмплы и доля ожидания по обработчикам"""
+    profiles = Counter(path.parent.name for path in files)
+    lines = [f"{'handler':<60}{'profiles':>10}{'samples':>10}{'await %':>10}"]
+    for handler, counter in sorted(merged.items(), key=lambda item: -sum(item[1].values())):
+        samples = sum(counter.values())
+        waiting = sum(count for stack, count in counter.items() if stack.endswith(AWAIT_MARKER))
+        share = waiting / samples * 100 if samples else 0.0
+        lines.append(f"{handler:<60}{profiles[handler]:>10}{samples:>10}{share:>10.1f}")
+    return "\n".join(lines)
+
+
+def merge_pstats(files: List[Path], output: str, top: int) -> str:
+    """Объединить .pstats в один файл; топ функций по cumulative time"""
+    stats = pstats.Stats(str(files[0]))
+    for path in files[1:]:
+        stats.add(str(path))
+    stats.dump_stats(output)
+
+    report = io.StringIO()
+    stats.stream = report
+    stats.sort_stats("cumulative").print_stats(top)
+    return report.getvalue()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Сводка профилей обработчиков для flamegraph")
+    parser.add_argument("directory", nargs="?", default="logs/profiles", help="Каталог профилей (PROFILER_DIR)")
+    parser.add_argument("--handler", help="Только обработчики, в имени которых есть подстрока")
+    parser.add_argument("--since", type=float, default=None, help="Только профили за последние N минут")
+    parser.add_argument("--cpu-only", action="store_true", help="Без сэмплов ожидания (await)")
+    parser.add_argument("-o", "--output", help="Файл collapsed stacks (по умолчанию stdout)")
+    parser.add_argument("--pstats", help="Объединить .pstats (режим cprofile) в этот файл")
+    parser.add_argument("--top", type=int, default=25, help="Строк топа для --pstats")
+    args = parser.parse_args(argv)
+
+    directory = Path(args.directory)
+    if args.pstats:
+        files = profile_files(directory, "pstats", args.handler, args.since)
+        if not files:
+            parser.error(f"в {directory} нет файлов .pstats")
+        print(merge_pstats(files, args.pstats, args.top))
+        print(f"Объединено профилей: {len(files)} -> {args.pstats}")
+        return
+
+    files = profile_files(directory, "collapsed", args.handler, args.since)
+    if not files:
+        parser.error(f"в {directory} нет файлов .collapsed")
+    merged = merge_collapsed(files, cpu_only=args.cpu_only)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            total = write_collapsed(merged, output)
+        print(summary(merged, files))
+        print(f"\n{total} сэмплов из {len(files)} профилей -> {args.output}")
+    else:
+        write_collapsed(merged, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""
+Нагрузочный тест: настоящий Dispatcher и обработчики на синтетических апдейтах.
+
+BotApplication запускается целиком (БД, кеши, воркеры, middleware,
+роутеры), но вместо HTTP к Telegram используется FakeSession. N
+симулированных пользователей проходят сценарии, нажимая кнопки из
+сообщений, которые им отправил бот:
+- registration - /start и регистрация соискателя или команды
+- search - /search
+- swipe, invite - пропуск или отклик на карточку команды (соискатели),
+  приглашение соискателя (команды)
+- invitations, accept - /invitations и принятие приглашений
+
+По каждому сценарию считаются пропускная способность, перцентили
+задержки апдейта, SQL-запросы и вызовы Bot API на апдейт, ошибки.
+
+ВНИМАНИЕ: тест пишет в БД из DATABASE_URL - используйте тестовую базу.
+
+Запуск (из каталога bot):
+    python -m bench.load --users 200 --concurrency 50 --rounds 3
+    python -m bench.load --users 1000 --fresh --json load.json
+"""
+import os
+
+# Эндпоинт /metrics нагрузочному тесту не нужен (до импорта config)
+os.environ.setdefault("METRICS_ENABLED", "False")
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+from aiogram.types import Update
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from config import settings
+from database import db
+from main import BotApplication
+from utils.metrics import throttling_rejections
+from utils.texts import SKILLS_DESCRIPTIONS
+from bench.fake_session import FakeSession, SentMessage
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ("registration", "search", "swipe", "invite", "invitations", "accept")
+
+# Счетчики текущего апдейта: [SQL-запросы, вызовы Bot API, ошибки в логе]
+_counters: ContextVar[Optional[List[int]]] = ContextVar("bench_counters", default=None)
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany) -> None:
+    counters = _counters.get()
+    if counters is not None:
+        counters[0] += 1
+
+
+async def _count_request(make_request, bot, method):
+    counters = _counters.get()
+    if counters is not None:
+        counters[1] += 1
+    return await make_request(bot, method)
+
+
+class _ErrorCounter(logging.Handler):
+    """Ошибки, которые обработчики перехватили и только записали в лог"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        counters = _counters.get()
+        if counters is not None:
+            counters[2] += 1
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class ScenarioStats:
+    """Замеры апдейтов одного сценария"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statements: List[int] = []
+        self.api_calls = 0
+        self.errors = 0
+        self.missing = 0
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+
+    def record(self, started: float, elapsed: float, counters: List[int], failed: bool) -> None:
+        self.latencies.append(elapsed)
+        self.statements.append(counters[0])
+        self.api_calls += counters[1]
+        self.errors += counters[2] + failed
+        self.first = started if self.first is None else min(self.first, started)
+        self.last = max(self.last or 0.0, started + elapsed)
+
+    def report(self) -> dict:
+        updates = len(self.latencies)
+        latencies = sorted(self.latencies)
+        wall = (self.last - self.first) if updates else 0.0
+        return {
+            "updates": updates,
+            "throughput": round(updates / wall, 1) if wall else 0.0,
+            "p50_ms": round(_percentile(latencies, 0.5) * 1000, 2),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            "sql_avg": round(sum(self.statements) / updates, 2) if updates else 0.0,
+            "sql_max": max(self.statements, default=0),
+            "api_avg": round(self.api_calls / updates, 2) if updates else 0.0,
+            "errors": self.errors,
+            # Кнопка, которую сценарий ожидал, не пришла
+            "missing": self.missing,
+        }
+
+
+class SimulatedUser:
+    """Пользователь Telegram со своим сценарием и генератором случайных чисел"""
+
+    def __init__(self, index: int, telegram_id: int, rng: random.Random, team_share: float):
+        self.index = index
+        self.telegram_id = telegram_id
+        self.rng = rng
+        self.kind = "team" if rng.random() < team_share else "participant"
+        self.name = f"Bench User {index}"
+        self.skills = rng.sample(list(SKILLS_DESCRIPTIONS), rng.randint(1, 3))
+
+    @property
+    def payload(self) -> dict:
+        return {
+            "id": self.telegram_id,
+            "is_bot": False,
+            "first_name": self.name,
+            "username": f"bench_{self.index}",
+        }
+
+
+class LoadTest:
+    """Прогон сценариев через Dispatcher с замером каждого апдейта"""
+
+    def __init__(self, app: BotApplication, session: FakeSession, concurrency: int = 50,
+                 think_time: float = 0.0, invite_rate: float = 0.3, accept_rate: float = 0.5,
+                 swipes: int = 5):
+        """
+        Args:
+            app: Запущенное приложение (startup с FakeSession)
+            session: Сессия бота
+            concurrency: Сколько пользователей действуют одновременно
+            think_time: Максимальная пауза пользователя между действиями (секунды)
+            invite_rate: Доля карточек, на которые пользователь откликается
+            accept_rate: Доля приглашений, которые принимаются
+            swipes: Сколько карточек команд соискатель листает за /search
+        """
+        self.app = app
+        self.session = session
+        self.concurrency = concurrency
+        self.think_time = think_time
+        self.invite_rate = invite_rate
+        self.accept_rate = accept_rate
+        self.swipes = swipes
+
+        self._update_ids = itertools.count(1)
+        self.stats: Dict[str, ScenarioStats] = {name: ScenarioStats() for name in SCENARIOS}
+
+    # ===== Прогон =====
+
+    async def run_phase(self, users: List[SimulatedUser],
+                        script: Callable[[SimulatedUser], Awaitable[None]]) -> None:
+        """Выполнить сценарий для всех пользователей, не больше concurrency одновременно"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(user: SimulatedUser) -> None:
+            async with semaphore:
+                await script(user)
+
+        await asyncio.gather(*(run(user) for user in users))
+
+    async def register(self, user: SimulatedUser) -> None:
+        replies = await self.send(user, "/start", "registration")
+        if user.kind == "team":
+            replies = await self.press(user, replies, "type_team", "registration")
+            replies = await self.send(user, f"Bench Team {user.index}", "registration")
+            replies = await self.press(user, replies, "skip", "registration")
+            for key in user.skills:
+                replies = await self.press(user, replies, f"skill_{key}", "registration")
+            await self.press(user, replies, "skills_done", "registration")
+        else:
+            replies = await self.press(user, replies, "type_participant", "registration")
+            replies = await self.send(user, user.name, "registration")
+            for key in user.skills:
+                replies = await self.press(user, replies, f"limited_skill_{key}", "registration")
+            await self.press(user, replies, "limited_skills_done", "registration")
+
+    async def search(self, user: SimulatedUser) -> None:
+        replies = await self.send(user, "/search", "search")
+        if user.kind == "team":
+            # Карточки соискателей: приглашаем часть
+            for sent in list(replies):
+                invite = next((data for data in sent.buttons if data.startswith("invite_")), None)
+                if invite and user.rng.random() < self.invite_rate:
+                    await self.press(user, [sent], invite, "invite")
+            return
+
+        # Карточки команд по одной (Tinder-style)
+        for _ in range(self.swipes):
+            card = next((sent for sent in reversed(replies) if any(
+                data.startswith("skip_team_") for data in sent.buttons
+            )), None)
+            if card is None:
+                return
+            if user.rng.random() < self.invite_rate:
+                data = next(data for data in card.buttons if data.startswith("interested_team_"))
+                replies = await self.press(user, [card], data, "invite")
+            else:
+                data = next(data for data in card.buttons if data.startswith("skip_team_"))
+                replies = await self.press(user, [card], data, "swipe")
+
+    async def accept(self, user: SimulatedUser) -> None:
+        replies = await self.send(user, "/invitations", "invitations")
+        for sent in list(replies):
+            data = next((data for data in sent.buttons if data.startswith("accept_invite_")), None)
+            if data and user.rng.random() < self.accept_rate:
+                await self.press(user, [sent], data, "accept")
+
+    # ===== Апдейты =====
+
+    async def send(self, user: SimulatedUser, text: str, scenario: str) -> List[SentMessage]:
+        """Текстовое сообщение от пользователя"""
+        update_id = next(self._update_ids)
+        return await self.feed(user, scenario, {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(datetime.now().timestamp()),
+                "chat": {"id": user.telegram_id, "type": "private"},
+                "from": user.payload,
+                "text": text,
+            },
+        })
+
+    async def press(self, user: SimulatedUser, replies: List[SentMessage], data: str,
+                    scenario: str) -> List[SentMessage]:
+        """Нажатие inline-кнопки в последнем сообщении, где она есть"""
+        inbox = self.session.inboxes[user.telegram_id]
+        sent = next((sent for sent in reversed(replies) if data in sent.buttons), None)
+        if sent is not None:
+            # Берем последнюю версию сообщения (его могли отредактировать)
+            sent = next(item for item in reversed(inbox) if item.message_id == sent.message_id)
+        if sent is None or data not in sent.buttons:
+            self.stats[scenario].missing += 1
+            return []
+
+        update_id = next(self._update_ids)
+        return await self.feed(user, scenario, {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": user.payload,
+                "chat_instance": str(user.telegram_id),
+                "data": data,
+                "message": sent.payload,
+            },
+        })
+
+    async def feed(self, user: SimulatedUser, scenario: str, raw: dict) -> List[SentMessage]:
+        """Передать апдейт в Dispatcher и замерить его; возвращает ответы бота"""
+        if self.think_time:
+            await asyncio.sleep(user.rng.uniform(0, self.think_time))
+
+        bot = self.app.bot
+        inbox = self.session.inboxes[user.telegram_id]
+        seen = len(inbox)
+        counters = [0, 0, 0]
+        token = _counters.set(counters)
+        failed = False
+        started = time.perf_counter()
+        try:
+            # Как при polling: апдейт собирается из JSON с привязкой к боту
+            update = Update.model_validate(raw, context={"bot": bot})
+            await self.app.dp.feed_update(bot, update)
+        except Exception as e:
+            failed = True
+            logger.debug(f"Апдейт {scenario} завершился ошибкой: {e}")
+        finally:
+            elapsed = time.perf_counter() - started
+            _counters.reset(token)
+        self.stats[scenario].record(started, elapsed, counters, failed)
+        return inbox[seen:]
+
+    # ===== Отчет =====
+
+    def report(self) -> dict:
+        scenarios = {
+            name: stats.report() for name, stats in self.stats.items() if stats.latencies or stats.missing
+        }
+        total = ScenarioStats()
+        for stats in self.stats.values():
+            total.latencies.extend(stats.latencies)
+            total.statements.extend(stats.statements)
+            total.api_calls += stats.api_calls
+            total.errors += stats.errors
+            total.missing += stats.missing
+            if stats.first is not None:
+                total.first = stats.first if total.first is None else min(total.first, stats.first)
+                total.last = max(total.last or 0.0, stats.last)
+        return {
+            "scenarios": scenarios,
+            "total": total.report(),
+            "telegram_api": self.session.get_stats(),
+            "throttled": int(throttling_rejections.value()),
+        }
+
+
+def format_report(report: dict) -> str:
+    """Таблица сценариев для терминала"""
+    columns = ("updates", "throughput", "p50_ms", "p95_ms", "p99_ms", "max_ms",
+               "sql_avg", "sql_max", "api_avg", "errors", "missing")
+    rows = list(report["scenarios"].items()) + [("TOTAL", report["total"])]
+    width = max([13] + [len(name) + 1 for name, _ in rows])
+    lines = [f"{'scenario':<{width}}" + "".join(f"{column:>11}" for column in columns)]
+    for name, values in rows:
+        lines.append(f"{name:<{width}}" + "".join(f"{values[column]:>11}" for column in columns))
+    lines.append(f"throttled messages: {report['throttled']}")
+    return "\n".join(lines)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    if args.fresh:
+        await db.init_db()
+        await db.recreate_database()
+        await db.close_db()
+
+    session = FakeSession(latency=args.api_latency_ms / 1000)
+    app = BotApplication()
+    await app.startup(session=session)
+
+    event.listen(db.engine.sync_engine, "after_cursor_execute", _count_statement)
+    app.bot.session.middleware(_count_request)
+    error_counter = _ErrorCounter()
+    logging.getLogger().addHandler(error_counter)
+
+    rng = random.Random(args.seed)
+    id_base = args.id_base if args.id_base is not None else 9 * 10**12 + int(time.time()) % 10**6 * 10**6
+    users = [
+        SimulatedUser(index, id_base + index, random.Random(rng.random()), args.team_share)
+        for index in range(args.users)
+    ]
+    test = LoadTest(
+        app, session,
+        concurrency=args.concurrency,
+        think_time=args.think_ms / 1000,
+        invite_rate=args.invite_rate,
+        accept_rate=args.accept_rate,
+        swipes=args.swipes,
+    )
+
+    try:
+        started = time.perf_counter()
+        await test.run_phase(users, test.register)
+        for _ in range(args.rounds):
+            await test.run_phase(users, test.search)
+        await test.run_phase(users, test.accept)
+        elapsed = time.perf_counter() - started
+    finally:
+        logging.getLogger().removeHandler(error_counter)
+        await app.shutdown()
+
+    report = test.report()
+    report["config"] = {
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "rounds": args.rounds,
+        "seed": args.seed,
+        "api_latency_ms": args.api_latency_ms,
+        "think_ms": args.think_ms,
+        "elapsed_s": round(elapsed, 2),
+    }
+    return report
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест обработчиков бота")
+    parser.add_argument("--users", type=int, default=100, help="Число симулированных пользователей")
+    parser.add_argument("--concurrency", type=int, default=50, help="Пользователей одновременно")
+    parser.add_argument("--rounds", type=int, default=2, help="Сколько раз каждый делает /search")
+    parser.add_argument("--swipes", type=int, default=5, help="Карточек команд за один /search")
+    parser.add_argument("--team-share", type=float, default=0.3, help="Доля пользователей-команд")
+    parser.add_argument("--invite-rate", type=float, default=0.3, help="Доля карточек с откликом")
+    parser.add_argument("--accept-rate", type=float, default=0.5, help="Доля принятых приглашений")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Пауза пользователя между действиями (мс)")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="Задержка каждого вызова Bot API (мс)")
+    parser.add_argument("--seed", type=int, default=1, help="Зерно генератора сценариев")
+    parser.add_argument("--id-base", type=int, default=None, help="Первый telegram_id (по умолчанию от времени)")
+    parser.add_argument("--fresh", action="store_true", help="Пересоздать таблицы перед тестом (удалит данные!)")
+    parser.add_argument("--json", help="Сохранить отчет в JSON-файл")
+    parser.add_argument("--log-level", default="WARNING", help="Уровень логов во время теста")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()),
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    target = make_url(settings.DATABASE_URL).render_as_string(hide_password=True)
+    print(f"База данных: {target}")
+
+    report = asyncio.run(run(args))
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        print(f"Отчет: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Воспроизведение записанных апдейтов (services.update_recorder).
+
+Записи из продакшена проигрываются через настоящий Dispatcher и
+обработчики - как в bench.load, BotApplication запускается целиком с
+FakeSession вместо HTTP к Telegram. Так сравниваются релизы на реальной
+смеси /search, свайпов и регистраций.
+
+- Темп: --speed 1 - как в записи, --speed N - в N раз быстрее,
+  --speed 0 - без пауз (с ограничением --concurrency)
+- Апдейты одного пользователя обрабатываются по порядку, разных - параллельно
+  (как при polling)
+- --seed-users создает профили соискателей для псевдонимов из записи,
+  которых нет в базе - иначе /search и свайпы упрутся в «зарегистрируйтесь»
+- Отчет по видам апдейтов (команда, callback_data без id, text):
+  пропускная способность, p50/p95/p99 задержки, SQL и вызовы Bot API на
+  апдейт, ошибки; отставание от расписания записи. --json сохраняет
+  отчет, --compare печатает отношение p50 к отчету другого релиза
+
+ВНИМАНИЕ: апдейты пишут в БД из DATABASE_URL - используйте тестовую базу.
+
+Запуск (из каталога bot):
+    python -m bench.replay recordings/ --speed 10 --seed-users --json replay.json
+    python -m bench.replay recordings/updates-*.ndjson.gz --speed 0 --compare old.json
+"""
+import os
+
+# Эндпоинт /metrics воспроизведению не нужен (до импорта config)
+os.environ.setdefault("METRICS_ENABLED", "False")
+# Записанные апдейты не записываются повторно
+os.environ["UPDATE_RECORD_ENABLED"] = "False"
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import random
+import re
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+from aiogram.types import Update
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from config import settings
+from database import crud, db
+from database.models import UserType
+from main import BotApplication
+from utils.metrics import throttling_rejections
+from utils.texts import SKILLS_DESCRIPTIONS, format_selected_skills
+from bench.fake_session import FakeSession
+from bench.load import (
+    ScenarioStats, _ErrorCounter, _count_request, _count_statement, _counters, _percentile, format_report
+)
+
+logger = logging.getLogger(__name__)
+
+# Числовые хвосты callback_data (id приглашений, команд, позиции в ленте)
+_CALLBACK_IDS = re.compile(r"(_-?\d+)+$")
+
+
+def recording_files(paths: List[str]) -> List[Path]:
+    """Файлы записей: явные пути и *.ndjson.gz из каталогов (по имени = по времени)"""
+    files: List[Path] = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.glob("*.ndjson*")) if path.is_dir() else [path])
+    return files
+
+
+def read_records(files: List[Path]) -> Iterator[dict]:
+    """Записи {"ts", "update"} из NDJSON (.gz - сжатый)"""
+    for path in files:
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8") as source:
+            for line in source:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def update_kind(raw: dict) -> str:
+    """Вид апдейта для отчета: команда, callback_data без id или тип апдейта"""
+    message = raw.get("message")
+    if message is not None:
+        text = message.get("text") or ""
+        return text.split(maxsplit=1)[0] if text.startswith("/") else "text"
+    callback = raw.get("callback_query")
+    if callback is not None:
+        return "cb:" + _CALLBACK_IDS.sub("", callback.get("data") or "")
+    return next((key for key in raw if key != "update_id"), "unknown")
+
+
+def update_user(raw: dict) -> Optional[int]:
+    """id отправителя апдейта"""
+    for key, value in raw.items():
+        if isinstance(value, dict) and isinstance(value.get("from"), dict):
+            return value["from"]["id"]
+    return None
+
+
+class Replayer:
+    """Проигрывает записи через Dispatcher по расписанию и замеряет апдейты"""
+
+    def __init__(self, app: BotApplication, session: FakeSession, speed: float = 1.0,
+                 concurrency: int = 100):
+        self.app = app
+        self.session = session
+        self.speed = speed
+        self.concurrency = concurrency
+
+        self.stats: Dict[str, ScenarioStats] = defaultdict(ScenarioStats)
+        # Насколько позже расписания записи апдейт передан в Dispatcher
+        self.behind: List[float] = []
+
+    async def run(self, records: Iterator[dict], limit: Optional[int] = None) -> int:
+        """Проиграть записи; возвращает число апдейтов"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # Последняя задача пользователя - следующая ждет ее
+        last: Dict[Optional[int], asyncio.Task] = {}
+        tasks: Set[asyncio.Task] = set()
+
+        count = 0
+        first_ts: Optional[float] = None
+        started = time.perf_counter()
+        for record in records:
+            if limit is not None and count >= limit:
+                break
+            count += 1
+            first_ts = record["ts"] if first_ts is None else first_ts
+            if self.speed > 0:
+                due = started + (record["ts"] - first_ts) / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.behind.append(-delay)
+
+            await semaphore.acquire()
+            raw = record["update"]
+            user_id = update_user(raw)
+            task = asyncio.create_task(self._process(raw, last.get(user_id), semaphore))
+            last[user_id] = task
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        return count
+
+    async def _process(self, raw: dict, previous: Optional[asyncio.Task], semaphore: asyncio.Semaphore) -> None:
+        try:
+            if previous is not None:
+                await previous
+            await self.feed(raw)
+        finally:
+            semaphore.release()
+
+    async def feed(self, raw: dict) -> None:
+        """Передать апдейт в Dispatcher и замерить его"""
+        bot = self.app.bot
+        counters = [0, 0, 0]
+        token = _counters.set(counters)
+        failed = False
+        started = time.perf_counter()
+        try:
+            update = Update.model_validate(raw, context={"bot": bot})
+            await self.app.dp.feed_update(bot, update)
+        except Exception as e:
+            failed = True
+            logger.debug(f"Апдейт {raw.get('update_id')} завершился ошибкой: {e}")
+        finally:
+            elapsed = time.perf_counter() - started
+            _counters.reset(token)
+        self.stats[update_kind(raw)].record(started, elapsed, counters, failed)
+
+    def report(self) -> dict:
+        total = ScenarioStats()
+        for stats in self.stats.values():
+            total.latencies.extend(stats.latencies)
+            total.statements.extend(stats.statements)
+            total.api_calls += stats.api_calls
+            total.errors += stats.errors
+            if stats.first is not None:
+                total.first = stats.first if total.first is None else min(total.first, stats.first)
+                total.last = max(total.last or 0.0, stats.last)
+        behind = sorted(self.behind)
+        return {
+            "scenarios": {
+                kind: stats.report()
+                for kind, stats in sorted(self.stats.items(), key=lambda item: -len(item[1].latencies))
+            },
+            "total": total.report(),
+            "telegram_api": self.session.get_stats(),
+            "throttled": int(throttling_rejections.value()),
+            "schedule": {
+                "late_updates": len(behind),
+                "behind_p95_ms": round(_percentile(behind, 0.95) * 1000, 2),
+                "behind_max_ms": round(behind[-1] * 1000, 2) if behind else 0.0,
+            },
+        }
+
+
+async def seed_users(files: List[Path], limit: Optional[int], seed: int) -> int:
+    """Создать профили соискателей для отправителей из записи, которых нет в базе"""
+    user_ids: Set[int] = set()
+    for index, record in enumerate(read_records(files)):
+        if limit is not None and index >= limit:
+            break
+        user_id = update_user(record["update"])
+        if user_id is not None:
+            user_ids.add(user_id)
+
+    rng = random.Random(seed)
+    skills = list(SKILLS_DESCRIPTIONS)
+    created = 0
+    async with db.get_db() as session:
+        for user_id in sorted(user_ids):
+            if await crud.get_user_by_telegram_id(session, user_id) is not None:
+                continue
+            chosen = rng.sample(skills, rng.randint(1, 3))
+            await crud.create_user(
+                session,
+                telegram_id=user_id,
+                name=f"Replay {user_id}",
+                user_type=UserType.PARTICIPANT,
+                primary_skill=SKILLS_DESCRIPTIONS[chosen[0]]["name"],
+                additional_skills=format_selected_skills(chosen[1:]) if len(chosen) > 1 else None,
+            )
+            created += 1
+    logger.info(f"Создано профилей для воспроизведения: {created} из {len(user_ids)}")
+    return created
+
+
+def format_comparison(report: dict, baseline: dict) -> str:
+    """Отношение p50 и пропускной способности к отчету другого релиза"""
+    lines = [f"{'kind':<28}{'p50 x':>10}{'p95 x':>10}{'tput x':>10}"]
+    rows = list(report["scenarios"].items()) + [("TOTAL", report["total"])]
+    for kind, values in rows:
+        base = baseline["total"] if kind == "TOTAL" else baseline["scenarios"].get(kind)
+        if not base:
+            continue
+        ratios = [
+            values[key] / base[key] if base[key] else 0.0
+            for key in ("p50_ms", "p95_ms", "throughput")
+        ]
+        lines.append(f"{kind:<28}" + "".join(f"{ratio:>10.2f}" for ratio in ratios))
+    return "\n".join(lines)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    files = recording_files(args.recordings)
+    if not files:
+        raise SystemExit("Файлы записей не найдены")
+
+    session = FakeSession(latency=args.api_latency_ms / 1000)
+    app = BotApplication()
+    await app.startup(session=session)
+
+    event.listen(db.engine.sync_engine, "after_cursor_execute", _count_statement)
+    app.bot.session.middleware(_count_request)
+    error_counter = _ErrorCounter()
+    logging.getLogger().addHandler(error_counter)
+
+    replayer = Replayer(app, session, speed=args.speed, concurrency=args.concurrency)
+    try:
+        if args.seed_users:
+            await seed_users(files, args.limit, args.seed)
+        started = time.perf_counter()
+        count = await replayer.run(read_records(files), limit=args.limit)
+        elapsed = time.perf_counter() - started
+    finally:
+        logging.getLogger().removeHandler(error_counter)
+        await app.shutdown()
+
+    report = replayer.report()
+    report["config"] = {
+        "files": [str(path) for path in files],
+        "updates": count,
+        "speed": args.speed,
+        "concurrency": args.concurrency,
+        "api_latency_ms": args.api_latency_ms,
+        "elapsed_s": round(elapsed, 2),
+    }
+    return report
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных апдейтов")
+    parser.add_argument("recordings", nargs="+", help="Файлы записей или каталоги с ними")
+    parser.add_argument("--speed", type=float, default=1.0, help="Темп: 1 - как в записи, N - быстрее, 0 - без пауз")
+    parser.add_argument("--concurrency", type=int, default=100, help="Апдейтов в обработке одновременно")
+    parser.add_argument("--limit", type=int, default=None, help="Проиграть только первые N апдейтов")
+    parser.add_argument("--seed-users", action="store_true", help="Создать профили отсутствующих пользователей")
+    parser.add_argument("--seed", type=int, default=1, help="Зерно навыков создаваемых профилей")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="Задержка каждого вызова Bot API (мс)")
+    parser.add_argument("--json", help="Сохранить отчет в JSON-файл")
+    parser.add_argument("--compare", help="Отчет другого релиза (JSON) для сравнения")
+    parser.add_argument("--log-level", default="WARNING", help="Уровень логов во время воспроизведения")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()),
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    target = make_url(settings.DATABASE_URL).render_as_string(hide_password=True)
+    print(f"База данных: {target}")
+
+    report = asyncio.run(run(args))
+    print(format_report(report))
+    schedule = report["schedule"]
+    print(f"behind schedule: {schedule['late_updates']} updates, "
+          f"p95 {schedule['behind_p95_ms']} ms, max {schedule['behind_max_ms']} ms")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as source:
+            print(format_comparison(report, json.load(source)))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field, PostgresDsn, field_validator
-from typing import Optional
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -19,6 +19,10 @@ class Settings(BaseSettings):
         description="Telegram Bot Token от @BotFather",
         min_length=30
     )
+    TELEGRAM_API_URL: Optional[str] = Field(
+        default=None,
+        description="Адрес Bot API (пусто - api.telegram.org; для тестов - локальный bench.fake_api)"
+    )
 
     # ===== Database =====
     DB_HOST: str = Field(default="localhost", description="PostgreSQL хост")
@@ -27,12 +31,72 @@ class Settings(BaseSettings):
     DB_USER: str = Field(default="postgres", min_length=1, description="Пользователь БД")
     DB_PASSWORD: str = Field(..., min_length=1, description="Пароль БД")
     DATABASE_URL: Optional[str] = Field(default=None, description="Полный URL БД (опционально)")
+    DB_POOL_SIZE: int = Field(default=10, ge=1, description="Постоянных соединений в пуле primary")
+    DB_MAX_OVERFLOW: int = Field(default=20, ge=0, description="Дополнительных соединений primary при пике")
+    DB_POOL_TIMEOUT_SECONDS: float = Field(
+        default=30.0,
+        gt=0,
+        description="Максимальное ожидание свободного соединения (секунды)"
+    )
+    DB_POOL_PRE_PING: bool = Field(default=True, description="Проверять соединение перед выдачей из пула")
+    DB_POOL_RECYCLE_SECONDS: int = Field(default=3600, ge=60, description="Пересоздавать соединения старше (секунды)")
+    DB_POOL_ADAPTIVE: bool = Field(
+        default=False,
+        description="Подбирать число постоянных соединений по наблюдаемой нагрузке"
+    )
+    DB_POOL_MIN_SIZE: int = Field(default=2, ge=1, description="Минимум постоянных соединений в адаптивном режиме")
+    DB_POOL_ADAPT_SECONDS: float = Field(
+        default=60.0,
+        ge=1,
+        description="Окно наблюдения нагрузки адаптивного пула (секунды)"
+    )
+    DATABASE_REPLICA_URLS: str = Field(
+        default="",
+        description="URL реплик чтения через запятую (пусто - все читается из primary)"
+    )
+    REPLICA_POOL_SIZE: int = Field(default=5, ge=1, description="Постоянных соединений в пуле каждой реплики")
+    REPLICA_MAX_OVERFLOW: int = Field(default=10, ge=0, description="Дополнительных соединений реплики при пике")
+    REPLICA_MAX_LAG_SECONDS: float = Field(
+        default=5.0,
+        gt=0,
+        description="Максимальное отставание реплики; столько же чтения после записи идут в primary (секунды)"
+    )
+    REPLICA_LAG_CHECK_SECONDS: float = Field(
+        default=5.0,
+        gt=0,
+        description="Интервал проверки отставания реплик (секунды)"
+    )
 
     # ===== Application Settings =====
     DEBUG: bool = Field(default=False, description="Режим отладки")
     LOG_LEVEL: str = Field(default="INFO", description="Уровень логирования")
     LOG_TO_FILE: bool = Field(default=False, description="Писать логи в файл")
     LOG_FILE_PATH: str = Field(default="logs/bot.log", description="Путь к файлу логов")
+    LOG_JSON: bool = Field(default=False, description="Писать логи в JSON (по объекту на строку)")
+    LOG_QUEUE_SIZE: int = Field(
+        default=10000,
+        ge=100,
+        description="Размер очереди записей перед потоком вывода (при переполнении записи отбрасываются)"
+    )
+    LOG_RATE_LIMIT_BURST: int = Field(
+        default=10,
+        ge=1,
+        description="Сколько предупреждений и ошибок с одного места пропускать за окно"
+    )
+    LOG_RATE_LIMIT_WINDOW_SECONDS: float = Field(
+        default=60.0,
+        gt=0,
+        description="Окно ограничения повторяющихся записей (секунды)"
+    )
+    LOG_SAMPLE_RATE: int = Field(
+        default=100,
+        ge=0,
+        description="Сверх лимита пропускать каждую N-ю запись (0 - ни одной)"
+    )
+    ADMIN_IDS: List[int] = Field(
+        default_factory=list,
+        description="Telegram ID администраторов (доступ к /stats), JSON-список"
+    )
 
     # ===== Rate Limiting =====
     RATE_LIMIT_DAILY_INVITATIONS: int = Field(
@@ -59,11 +123,255 @@ class Settings(BaseSettings):
         ge=1,
         description="Время неактивности для архивации (дни)"
     )
+    ACTIVITY_TOUCH_INTERVAL_SECONDS: int = Field(
+        default=300,
+        ge=1,
+        description="Как часто записывать last_active одного пользователя (секунды)"
+    )
     CLEANUP_INTERVAL_MINUTES: int = Field(
         default=60,
         ge=5,
         description="Интервал запуска фоновой очистки (минуты)"
     )
+    INVITATION_EXPIRY_HEAP_SIZE: int = Field(
+        default=10000,
+        ge=100,
+        description="Максимум дедлайнов приглашений в памяти планировщика"
+    )
+    INVITATION_EXPIRY_BATCH_SIZE: int = Field(
+        default=100,
+        ge=1,
+        le=1000,
+        description="Максимум приглашений, истекающих за одну транзакцию"
+    )
+    INVITATION_EXPIRY_NOTIFY: bool = Field(
+        default=False,
+        description="Уведомлять обе стороны об истечении приглашения"
+    )
+    INVITATION_ARCHIVE_AFTER_DAYS: int = Field(
+        default=90,
+        ge=7,
+        description="Через сколько дней закрытые приглашения переносятся в архив"
+    )
+    INVITATION_PARTITIONS_AHEAD_MONTHS: int = Field(
+        default=2,
+        ge=1,
+        le=12,
+        description="На сколько месяцев вперед создавать секции invitations"
+    )
+    CLEANUP_BATCH_SIZE: int = Field(
+        default=500,
+        ge=10,
+        le=10000,
+        description="Количество строк, обрабатываемых фоновой очисткой за одну транзакцию"
+    )
+    CLEANUP_BATCH_PAUSE_SECONDS: float = Field(
+        default=0.1,
+        ge=0,
+        description="Пауза между батчами фоновой очистки (секунды)"
+    )
+
+    # ===== Caching =====
+    PROFILE_CACHE_SIZE: int = Field(
+        default=10000,
+        ge=0,
+        description="Максимум профилей в кеше (0 - кеш выключен)"
+    )
+    PROFILE_CACHE_TTL_SECONDS: int = Field(
+        default=300,
+        ge=1,
+        description="Время жизни профиля в кеше (секунды)"
+    )
+    PROFILE_CACHE_NEGATIVE_TTL_SECONDS: int = Field(
+        default=30,
+        ge=1,
+        description="Время жизни записи «пользователь не зарегистрирован» (секунды)"
+    )
+    USER_COUNTER_RECONCILE_SECONDS: int = Field(
+        default=600,
+        ge=10,
+        description="Интервал сверки счетчика пользователей с БД (секунды)"
+    )
+    USER_COUNTER_APPROXIMATE: bool = Field(
+        default=False,
+        description="Сверять счетчик пользователей по pg_class.reltuples вместо count(*)"
+    )
+    SKILL_HISTOGRAM_REFRESH_SECONDS: int = Field(
+        default=300,
+        ge=10,
+        description="Интервал полного пересчета гистограммы навыков (секунды)"
+    )
+
+    # ===== Ranking =====
+    RANKING_HALF_LIFE_DAYS: float = Field(
+        default=7.0,
+        gt=0,
+        description="Период полураспада свежести в оценке кандидата (дни)"
+    )
+    RANKING_RECENCY_WEIGHT: float = Field(
+        default=0.5,
+        ge=0,
+        description="Вес свежести относительно одного общего навыка"
+    )
+    RANKING_RESPONSE_WEIGHT: float = Field(
+        default=0.5,
+        ge=0,
+        description="Вес доли принятых приглашений относительно одного общего навыка"
+    )
+
+    # ===== Match Feed =====
+    MATCH_FEED_SIZE: int = Field(
+        default=100,
+        ge=10,
+        le=1000,
+        description="Максимум кандидатов в предрассчитанной ленте одного пользователя"
+    )
+    MATCH_FEED_FLUSH_SECONDS: float = Field(
+        default=1.0,
+        ge=0,
+        description="Задержка перед пересчетом лент после изменений (секунды)"
+    )
+    MATCH_FEED_REBUILD_HOURS: int = Field(
+        default=24,
+        ge=1,
+        description="Интервал полной перестройки лент совпадений (часы)"
+    )
+    AFFINITY_REBUILD_MINUTES: int = Field(
+        default=30,
+        ge=1,
+        description="Интервал полной перестройки матрицы совместимости (минуты)"
+    )
+    SEEN_FILTER_BITS: int = Field(
+        default=8192,
+        ge=1024,
+        description="Размер поколения фильтра просмотренных кандидатов (биты)"
+    )
+    SEEN_FILTER_CAPACITY: int = Field(
+        default=1000,
+        ge=10,
+        description="Кандидатов в поколении фильтра до ротации"
+    )
+    SEEN_FILTER_TTL_DAYS: int = Field(
+        default=14,
+        ge=1,
+        description="Через сколько дней пропущенные кандидаты показываются снова"
+    )
+    SEEN_FILTER_FLUSH_SECONDS: float = Field(
+        default=5.0,
+        gt=0,
+        description="Интервал записи фильтров просмотренных в БД (секунды)"
+    )
+    SNAPSHOT_SYNC_SECONDS: float = Field(
+        default=5.0,
+        gt=0,
+        description="Интервал опроса измененных профилей для снимка поиска (секунды)"
+    )
+    SNAPSHOT_RELOAD_MINUTES: int = Field(
+        default=60,
+        ge=1,
+        description="Интервал полной перезагрузки снимка профилей (минуты)"
+    )
+
+    # ===== SQL Instrumentation =====
+    SQL_TRACE_ENABLED: bool = Field(
+        default=True,
+        description="Считать SQL-запросы по обработчикам и искать N+1"
+    )
+    SQL_TRACE_REPEAT_THRESHOLD: int = Field(
+        default=5,
+        ge=1,
+        description="Сколько раз один запрос может выполниться за апдейт до предупреждения N+1"
+    )
+    SQL_TRACE_STRICT: bool = Field(
+        default=False,
+        description="Выбрасывать ошибку при N+1 вместо предупреждения (для тестов)"
+    )
+
+    # ===== Metrics =====
+    METRICS_ENABLED: bool = Field(default=True, description="Отдавать метрики Prometheus на /metrics")
+    METRICS_HOST: str = Field(
+        default="127.0.0.1",
+        description="Адрес эндпоинта метрик (без авторизации - наружу только за firewall)"
+    )
+    METRICS_PORT: int = Field(default=9108, ge=1, le=65535, description="Порт эндпоинта метрик")
+
+    # ===== Event Loop Monitor =====
+    LOOP_MONITOR_ENABLED: bool = Field(default=True, description="Следить за задержкой и зависаниями event loop")
+    LOOP_MONITOR_INTERVAL_SECONDS: float = Field(
+        default=0.5,
+        gt=0,
+        description="Период пробы задержки event loop (секунды)"
+    )
+    LOOP_SLOW_CALLBACK_SECONDS: float = Field(
+        default=0.1,
+        gt=0,
+        description="Сколько event loop может не отвечать до снятия стека (секунды)"
+    )
+    LOOP_ASYNCIO_DEBUG: bool = Field(
+        default=False,
+        description="Отладочный режим asyncio: замер каждого колбэка (дорого, для диагностики)"
+    )
+    LOOP_DUMP_ENABLED: bool = Field(default=False, description="Писать дампы стеков при долгих зависаниях")
+    LOOP_DUMP_THRESHOLD_SECONDS: float = Field(
+        default=1.0,
+        gt=0,
+        description="Длительность зависания event loop для дампа (секунды)"
+    )
+    LOOP_DUMP_DIR: str = Field(default="logs/loop_dumps", description="Каталог дампов зависаний")
+
+    # ===== Update Recorder =====
+    UPDATE_RECORD_ENABLED: bool = Field(default=False, description="Записывать входящие апдейты для bench.replay")
+    UPDATE_RECORD_DIR: str = Field(default="recordings", description="Каталог записей апдейтов")
+    UPDATE_RECORD_SAMPLE_RATE: float = Field(
+        default=1.0,
+        ge=0,
+        le=1,
+        description="Доля пользователей, чьи апдейты записываются"
+    )
+    UPDATE_RECORD_MAX_FILE_MB: int = Field(default=100, ge=1, description="Размер файла записи до ротации (МБ)")
+    UPDATE_RECORD_SALT: str = Field(
+        default="",
+        description="Ключ псевдонимизации id (пусто - случайный при каждом запуске)"
+    )
+    UPDATE_RECORD_KEEP_TEXT: bool = Field(default=False, description="Сохранять свободный текст сообщений")
+
+    # ===== Handler Profiler =====
+    PROFILER_ENABLED: bool = Field(default=False, description="Профилировать часть апдейтов (меняется /profiler)")
+    PROFILER_MODE: str = Field(default="sampler", description="Режим профилирования: sampler или cprofile")
+    PROFILER_SAMPLE_RATE: float = Field(
+        default=0.01,
+        ge=0,
+        le=1,
+        description="Доля случайных апдейтов для профилирования"
+    )
+    PROFILER_HANDLERS: List[str] = Field(
+        default_factory=list,
+        description="Обработчики, которые профилируются всегда (имя или модуль.имя), JSON-список"
+    )
+    PROFILER_USER_IDS: List[int] = Field(
+        default_factory=list,
+        description="Telegram ID пользователей, чьи апдейты профилируются всегда, JSON-список"
+    )
+    PROFILER_INTERVAL_MS: float = Field(default=5.0, gt=0, description="Период сэмплирования стека (мс)")
+    PROFILER_DIR: str = Field(default="logs/profiles", description="Каталог профилей обработчиков")
+    PROFILER_MAX_FILES: int = Field(default=1000, ge=1, description="Сколько файлов профилей хранить")
+
+    # ===== Cross-instance Invalidation =====
+    INVALIDATION_ENABLED: bool = Field(
+        default=True,
+        description="Рассылать изменения другим экземплярам через LISTEN/NOTIFY"
+    )
+    INVALIDATION_CHANNEL: str = Field(
+        default="team_finder_invalidation",
+        min_length=1,
+        max_length=63,
+        description="Имя канала PostgreSQL для сообщений инвалидации"
+    )
+    INVALIDATION_HEALTHCHECK_SECONDS: float = Field(
+        default=30.0,
+        gt=0,
+        description="Интервал проверки соединения слушателя инвалидации (секунды)"
+    )
 
     # Конфигурация Pydantic
     model_config = SettingsConfigDict(
@@ -87,6 +395,15 @@ class Settings(BaseSettings):
             f"@{data.get('DB_HOST')}:{data.get('DB_PORT')}/{data.get('DB_NAME')}"
         )
 
+    @field_validator("PROFILER_MODE")
+    @classmethod
+    def validate_profiler_mode(cls, v: str) -> str:
+        """Проверить режим профилирования"""
+        allowed = {"sampler", "cprofile"}
+        if v.lower() not in allowed:
+            raise ValueError(f"PROFILER_MODE должен быть одним из: {allowed}")
+        return v.lower()
+
     @field_validator("LOG_LEVEL")
     @classmethod
     def validate_log_level(cls, v: str) -> str:
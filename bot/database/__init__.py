@@ -1,11 +1,14 @@
 """Модуль работы с базой данных"""
-from database.models import User, Team, Invitation, UserType, InvitationStatus, TeamStatus
+from database.models import User, Team, Invitation, InvitationArchive, MatchFeed, SeenFilter, UserType, InvitationStatus, TeamStatus
 from database.db import create_tables, drop_tables, get_db
 
 __all__ = [
     "User",
     "Team",
     "Invitation",
+    "InvitationArchive",
+    "MatchFeed",
+    "SeenFilter",
     "UserType",
     "InvitationStatus",
     "TeamStatus",
@@ -1,10 +1,63 @@
 from sqlalchemy import select, update, delete, func, or_, and_
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.models import User, Team, Invitation, UserType, InvitationStatus, TeamStatus
-from typing import Optional, List
+from sqlalchemy.orm import aliased
+from database.models import (
+    User, Team, Invitation, InvitationArchive, MatchFeed, UserType, InvitationStatus, TeamStatus,
+    active_searchers_filter
+)
+from database.db import notify_change, read_only
+from services.invitation_expiry import invitation_expiry
+from services.profile_cache import profile_cache, is_cached
+from services.user_counter import user_counter
+from services.skill_histogram import skill_histogram
+from services.match_feed import match_feed
+from services.affinity import affinity
+from services.profile_snapshot import profile_snapshot
+from services.seen_filter import seen_filters, SeenCheck
+from services.cache_sync import cache_sync
+from utils.skills import skill_mask, keyword_bit
+from database.ranking import idea_category, ranking_score_expr, skill_overlap_expr
+from config import settings
+from typing import Any, Optional, List, Callable
 from datetime import datetime, timedelta
 
 
+def hot_invitations_since() -> datetime:
+    """
+    Нижняя граница created_at для оценок по недавним приглашениям (ранжирование).
+
+    Закрытые приглашения старше INVITATION_ARCHIVE_AFTER_DAYS уже в архиве,
+    а явная граница позволяет PostgreSQL отсечь старые секции (partition pruning).
+    Счетчики за все время - count_invitations_with_archive.
+    """
+    return datetime.utcnow() - timedelta(days=settings.INVITATION_ARCHIVE_AFTER_DAYS)
+
+
+async def count_invitations_with_archive(
+    session: AsyncSession,
+    condition: Callable[[type], Any]
+) -> int:
+    """
+    Количество приглашений за все время: горячая таблица + архив.
+
+    Строка лежит ровно в одной из таблиц (перенос - один DELETE ... RETURNING
+    с INSERT), поэтому сумма точная. Оба подсчета - в одном запросе.
+
+    Args:
+        session: сессия БД
+        condition: условие по модели, например lambda m: m.to_user_id == user_id
+    """
+    hot = select(func.count()).select_from(Invitation).where(condition(Invitation)).scalar_subquery()
+    archived = (
+        select(func.count())
+        .select_from(InvitationArchive)
+        .where(condition(InvitationArchive))
+        .scalar_subquery()
+    )
+    result = await session.execute(select(hot + archived))
+    return result.scalar()
+
+
 # ===== USER CRUD =====
 
 async def create_user(
@@ -30,17 +83,33 @@ async def create_user(
         idea_who=idea_who,
     )
     session.add(user)
+    await session.flush()
+    change = {
+        "user_id": user.id,
+        "telegram_id": telegram_id,
+        "mask": skill_mask(primary_skill, additional_skills) if user_type == UserType.PARTICIPANT else None,
+        "last_active": user.last_active,
+    }
+    await notify_change(session, "user_created", change)
     await session.commit()
     await session.refresh(user)
+    cache_sync.apply("user_created", change)
+    match_feed.mark_user(user.id)
     return user
 
 
 async def get_user_by_telegram_id(session: AsyncSession, telegram_id: int) -> Optional[User]:
-    """Получить пользователя по telegram_id"""
+    """Получить пользователя по telegram_id (через кеш профилей)"""
+    cached = profile_cache.get_user(telegram_id)
+    if is_cached(cached):
+        return cached
+
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
     )
-    return result.scalar_one_or_none()
+    user = result.scalar_one_or_none()
+    profile_cache.put_user(telegram_id, user)
+    return user
 
 
 async def get_user_by_id(session: AsyncSession, user_id: int) -> Optional[User]:
@@ -51,24 +120,80 @@ async def get_user_by_id(session: AsyncSession, user_id: int) -> Optional[User]:
     return result.scalar_one_or_none()
 
 
-async def update_user_last_active(session: AsyncSession, user_id: int) -> None:
-    """Обновить время последней активности пользователя"""
-    await session.execute(
+async def record_user_activity(session: AsyncSession, telegram_id: int) -> bool:
+    """
+    Обновить время последней активности и вернуть пользователя в поиск.
+
+    Фоновая очистка снимает с поиска тех, кто не появлялся
+    CLEANUP_INACTIVE_USERS_DAYS дней; любое действие в боте возвращает
+    профиль (кроме нашедших команду). Прежнее значение is_searching
+    читается в том же запросе под блокировкой строки - параллельные
+    вызовы не учтут возвращение дважды.
+
+    Returns:
+        True, если пользователь вернулся в поиск
+    """
+    now = datetime.utcnow()
+    previous = (
+        select(User.id, User.is_searching)
+        .where(and_(User.telegram_id == telegram_id, User.deleted_at.is_(None)))
+        .with_for_update()
+        .cte("previous")
+    )
+    result = await session.execute(
         update(User)
-        .where(User.id == user_id)
-        .values(last_active=datetime.utcnow())
+        .where(User.id == previous.c.id)
+        .values(last_active=now, is_searching=or_(User.is_searching, User.found_team_at.is_(None)))
+        .returning(
+            User.id, User.user_type, User.primary_skill, User.additional_skills,
+            User.is_searching, previous.c.is_searching.label("was_searching")
+        )
     )
+    row = result.one_or_none()
+
+    change = None
+    if row is not None and row.is_searching and not row.was_searching:
+        change = {
+            "user_id": row.id,
+            "telegram_id": telegram_id,
+            "mask": skill_mask(row.primary_skill, row.additional_skills)
+            if row.user_type == UserType.PARTICIPANT else None,
+            "last_active": now,
+        }
+        await notify_change(session, "user_active", change)
     await session.commit()
 
+    if change is None:
+        # Другим экземплярам не рассылаем: это самая частая запись, а устаревшее
+        # last_active в их кеше живет не дольше PROFILE_CACHE_TTL_SECONDS
+        profile_cache.invalidate_user(telegram_id)
+        return False
+
+    cache_sync.apply("user_active", change)
+    match_feed.mark_user(row.id)
+    return True
+
 
 async def count_users(session: AsyncSession) -> int:
-    """Подсчитать общее количество пользователей"""
+    """Подсчитать количество активных пользователей (ищут и не удалены)"""
     result = await session.execute(
-        select(func.count()).select_from(User)
+        select(func.count())
+        .select_from(User)
+        .where(active_searchers_filter())
     )
     return result.scalar()
 
 
+async def count_users_cached(session: AsyncSession) -> int:
+    """
+    Количество активных пользователей из поддерживаемого счетчика.
+
+    Без запроса к БД (кроме первого обращения); значение сверяется
+    с count_users в фоне. Подходит для проверки «холодного старта».
+    """
+    return await user_counter.get(session)
+
+
 # ===== TEAM CRUD =====
 
 async def create_team(
@@ -86,8 +211,20 @@ async def create_team(
         needed_skills=needed_skills,
     )
     session.add(team)
+    await session.flush()
+    change = {
+        "team_id": team.id,
+        "leader_id": leader_id,
+        "mask": skill_mask(needed_skills),
+        "updated_at": team.updated_at,
+        "active": True,
+        "delta": 1,
+    }
+    await notify_change(session, "team", change)
     await session.commit()
     await session.refresh(team)
+    cache_sync.apply("team", change)
+    match_feed.mark_team(team.id)
     return team
 
 
@@ -100,11 +237,17 @@ async def get_team_by_id(session: AsyncSession, team_id: int) -> Optional[Team]:
 
 
 async def get_teams_by_leader(session: AsyncSession, leader_id: int) -> List[Team]:
-    """Получить все команды пользователя"""
+    """Получить все команды пользователя (через кеш профилей)"""
+    cached = profile_cache.get_teams(leader_id)
+    if is_cached(cached):
+        return list(cached)
+
     result = await session.execute(
         select(Team).where(Team.leader_id == leader_id)
     )
-    return list(result.scalars().all())
+    teams = list(result.scalars().all())
+    profile_cache.put_teams(leader_id, teams)
+    return list(teams)
 
 
 async def update_team_status(
@@ -113,13 +256,42 @@ async def update_team_status(
     status: TeamStatus
 ) -> None:
     """Обновить статус команды"""
-    await session.execute(
-        update(Team)
+    # Прежний статус нужен для гистограммы навыков - берем его в том же запросе
+    previous = (
+        select(Team.id, Team.status)
         .where(Team.id == team_id)
+        .with_for_update()
+        .subquery("previous")
+    )
+    result = await session.execute(
+        update(Team)
+        .where(Team.id == previous.c.id)
         .values(status=status)
+        .returning(Team.leader_id, Team.needed_skills, Team.updated_at, previous.c.status)
     )
+    row = result.one_or_none()
+    if row is None:
+        await session.commit()
+        return
+
+    leader_id, needed_skills, updated_at, previous_status = row
+    was_active = previous_status == TeamStatus.ACTIVE
+    is_active = status == TeamStatus.ACTIVE
+    change = {
+        "team_id": team_id,
+        "leader_id": leader_id,
+        "mask": skill_mask(needed_skills),
+        "updated_at": updated_at,
+        "active": is_active,
+        "delta": 0 if was_active == is_active else (1 if is_active else -1),
+    }
+    await notify_change(session, "team", change)
     await session.commit()
 
+    cache_sync.apply("team", change)
+    if change["delta"]:
+        match_feed.mark_team(team_id)
+
 
 # ===== INVITATION CRUD =====
 
@@ -130,16 +302,30 @@ async def create_invitation(
     from_team_id: Optional[int] = None,
     message: Optional[str] = None,
 ) -> Invitation:
-    """Создать новое приглашение"""
+    """Создать новое приглашение (истекает через CLEANUP_EXPIRED_INVITATIONS_HOURS)"""
     invitation = Invitation(
         from_user_id=from_user_id,
         from_team_id=from_team_id,
         to_user_id=to_user_id,
         message=message,
+        expires_at=datetime.utcnow() + timedelta(hours=settings.CLEANUP_EXPIRED_INVITATIONS_HOURS),
     )
     session.add(invitation)
+    change = {
+        "from_user_id": from_user_id,
+        "to_user_id": to_user_id,
+        "from_team_id": from_team_id,
+        "status": InvitationStatus.PENDING.name,
+    }
+    await notify_change(session, "invitation", change)
     await session.commit()
     await session.refresh(invitation)
+
+    # Планируем истечение точно к дедлайну
+    invitation_expiry.schedule(invitation.id, invitation.expires_at)
+    cache_sync.apply("invitation", change)
+    match_feed.mark_viewer(from_user_id)
+    match_feed.mark_viewer(to_user_id)
     return invitation
 
 
@@ -151,12 +337,19 @@ async def get_invitation_by_id(session: AsyncSession, invitation_id: int) -> Opt
     return result.scalar_one_or_none()
 
 
+@read_only(user_arg="user_id")
 async def get_received_invitations(
     session: AsyncSession,
     user_id: int,
     status: Optional[InvitationStatus] = None
 ) -> List[Invitation]:
-    """Получить полученные приглашения пользователя"""
+    """
+    Получить полученные приглашения пользователя
+
+    Только горячая таблица: закрытые приглашения старше
+    INVITATION_ARCHIVE_AFTER_DAYS уже в архиве (счетчик за все время -
+    count_invitations_with_archive).
+    """
     query = select(Invitation).where(Invitation.to_user_id == user_id)
     if status:
         query = query.where(Invitation.status == status)
@@ -164,12 +357,39 @@ async def get_received_invitations(
     return list(result.scalars().all())
 
 
+@read_only(user_arg="user_id")
+async def get_received_invitations_with_senders(
+    session: AsyncSession,
+    user_id: int,
+    status: Optional[InvitationStatus] = None
+) -> List[tuple[Invitation, User, Optional[Team]]]:
+    """
+    Полученные приглашения вместе с отправителем и командой - одним запросом
+    (для списка /invitations без запроса на каждое приглашение)
+
+    Returns:
+        Список кортежей (Invitation, отправитель, команда или None)
+    """
+    query = (
+        select(Invitation, User, Team)
+        .join(User, User.id == Invitation.from_user_id)
+        .outerjoin(Team, Team.id == Invitation.from_team_id)
+        .where(Invitation.to_user_id == user_id)
+        .order_by(Invitation.created_at)
+    )
+    if status:
+        query = query.where(Invitation.status == status)
+    result = await session.execute(query)
+    return [(invitation, from_user, team) for invitation, from_user, team in result.all()]
+
+
+@read_only(user_arg="user_id")
 async def get_sent_invitations(
     session: AsyncSession,
     user_id: int,
     status: Optional[InvitationStatus] = None
 ) -> List[Invitation]:
-    """Получить отправленные приглашения пользователя"""
+    """Получить отправленные приглашения пользователя (без архива, см. выше)"""
     query = select(Invitation).where(Invitation.from_user_id == user_id)
     if status:
         query = query.where(Invitation.status == status)
@@ -193,15 +413,126 @@ async def update_invitation_status(
     )
     await session.commit()
 
+    if status != InvitationStatus.PENDING:
+        invitation_expiry.discard(invitation_id)
+
+
+async def transition_invitation(
+    session: AsyncSession,
+    invitation_id: int,
+    status: InvitationStatus,
+    expected_status: InvitationStatus = InvitationStatus.PENDING,
+    to_telegram_id: Optional[int] = None
+) -> Optional[dict]:
+    """
+    Сменить статус приглашения за один запрос к БД.
+
+    UPDATE ... WHERE status = expected_status RETURNING, соединенный
+    с отправителем, получателем и командой. Повторное нажатие кнопки
+    (или параллельное) не находит приглашение в ожидаемом статусе
+    и возвращает None - уведомления не дублируются.
+
+    Args:
+        session: сессия БД
+        invitation_id: ID приглашения
+        status: новый статус
+        expected_status: статус, из которого разрешен переход
+        to_telegram_id: если указан - переход разрешен только получателю
+
+    Returns:
+        None если переход не выполнен, иначе dict с полями:
+        - invitation_id, status
+        - from_telegram_id, from_name, from_username: отправитель
+        - to_telegram_id, to_name, to_username: получатель
+        - team_name: название команды (None для личных приглашений)
+        - from_user_id, to_user_id, from_team_id: id участников приглашения
+    """
+    conditions = [
+        Invitation.id == invitation_id,
+        Invitation.status == expected_status,
+    ]
+    if to_telegram_id is not None:
+        conditions.append(
+            Invitation.to_user_id == select(User.id)
+            .where(User.telegram_id == to_telegram_id)
+            .scalar_subquery()
+        )
+
+    moved = (
+        update(Invitation)
+        .where(and_(*conditions))
+        .values(status=status, responded_at=datetime.utcnow())
+        .returning(Invitation.from_user_id, Invitation.to_user_id, Invitation.from_team_id)
+        .cte("moved")
+    )
+    from_user = aliased(User)
+    to_user = aliased(User)
+
+    result = await session.execute(
+        select(
+            from_user.telegram_id, from_user.name, from_user.username,
+            to_user.telegram_id, to_user.name, to_user.username,
+            Team.team_name,
+            moved.c.from_user_id, moved.c.to_user_id, moved.c.from_team_id,
+        )
+        .select_from(moved)
+        .join(from_user, from_user.id == moved.c.from_user_id)
+        .join(to_user, to_user.id == moved.c.to_user_id)
+        .outerjoin(Team, Team.id == moved.c.from_team_id)
+    )
+    row = result.one_or_none()
+    if row is None:
+        await session.commit()
+        return None
+
+    change = {
+        "from_user_id": row[7],
+        "to_user_id": row[8],
+        "from_team_id": row[9],
+        "status": status.name,
+    }
+    await notify_change(session, "invitation", change)
+    await session.commit()
+
+    invitation_expiry.discard(invitation_id)
+    cache_sync.apply("invitation", change)
+    match_feed.mark_viewer(row[7])
+    match_feed.mark_viewer(row[8])
+
+    return {
+        'invitation_id': invitation_id,
+        'status': status,
+        'from_telegram_id': row[0],
+        'from_name': row[1],
+        'from_username': row[2],
+        'to_telegram_id': row[3],
+        'to_name': row[4],
+        'to_username': row[5],
+        'team_name': row[6],
+        'from_user_id': row[7],
+        'to_user_id': row[8],
+        'from_team_id': row[9],
+    }
+
 
 async def mark_invitation_viewed(
     session: AsyncSession,
     invitation_id: int
 ) -> None:
     """Отметить приглашение как просмотренное"""
+    await mark_invitations_viewed(session, [invitation_id])
+
+
+async def mark_invitations_viewed(
+    session: AsyncSession,
+    invitation_ids: List[int]
+) -> None:
+    """Отметить приглашения как просмотренные (одним UPDATE)"""
+    if not invitation_ids:
+        return
     await session.execute(
         update(Invitation)
-        .where(Invitation.id == invitation_id)
+        .where(Invitation.id.in_(invitation_ids))
         .values(viewed_at=datetime.utcnow())
     )
     await session.commit()
@@ -209,10 +540,73 @@ async def mark_invitation_viewed(
 
 # ===== SEARCH FUNCTIONS =====
 
+async def _load_by_ids(session: AsyncSession, model, ids: List[int]) -> list:
+    """Загрузить строки model по списку id, сохранив порядок списка"""
+    if not ids:
+        return []
+    result = await session.execute(select(model).where(model.id.in_(ids)))
+    by_id = {row.id: row for row in result.scalars().all()}
+    return [by_id[row_id] for row_id in ids if row_id in by_id]
+
+
+async def _fetch_unseen(session: AsyncSession, query, limit: Optional[int], seen: Optional[SeenCheck]) -> list:
+    """
+    Выполнить ранжированный запрос, пропуская просмотренных кандидатов.
+
+    С limit читает страницами по limit строк, пока не наберет limit
+    непросмотренных или не кончатся строки.
+    """
+    if seen is None or limit is None:
+        result = await session.execute(query.limit(limit))
+        return [row for row in result.scalars().all() if seen is None or not seen(row.id)]
+
+    found = []
+    offset = 0
+    while True:
+        result = await session.execute(query.offset(offset).limit(limit))
+        page = list(result.scalars().all())
+        found.extend(row for row in page if not seen(row.id))
+        if len(found) >= limit or len(page) < limit:
+            return found[:limit]
+        offset += limit
+
+
+@read_only()
+async def find_participants_for_team(
+    session: AsyncSession,
+    team: Team,
+    exclude_user_id: Optional[int] = None,
+    seen: Optional[SeenCheck] = None
+) -> List[User]:
+    """
+    Найти соискателей для команды
+
+    Когда матрица совместимости построена - до MATCH_FEED_SIZE лучших
+    соискателей из строки команды (по оценке пары), иначе find_users_by_skills.
+    Если seen скрыл всю строку матрицы - ищем дальше через find_users_by_skills.
+    """
+    if affinity.ready and affinity.has_team(team.id):
+        user_ids = [
+            user_id for user_id, _ in affinity.participants_for_team(team.id)
+            if user_id != exclude_user_id and (seen is None or not seen(user_id))
+        ]
+        if user_ids or seen is None or not seen.hidden:
+            return await _load_by_ids(session, User, user_ids)
+
+    if not team.needed_skills:
+        return []
+    return await find_users_by_skills(
+        session, team.needed_skills, exclude_user_id=exclude_user_id, limit=settings.MATCH_FEED_SIZE, seen=seen
+    )
+
+
+@read_only()
 async def find_users_by_skills(
     session: AsyncSession,
     needed_skills: str,
-    exclude_user_id: Optional[int] = None
+    exclude_user_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    seen: Optional[SeenCheck] = None
 ) -> List[User]:
     """
     Найти пользователей по навыкам
@@ -221,15 +615,30 @@ async def find_users_by_skills(
         session: сессия БД
         needed_skills: строка с нужными навыками (например: "Mobile (Flutter), Design (Figma)")
         exclude_user_id: ID пользователя, которого нужно исключить из поиска
+        limit: сколько лучших вернуть (None - всех)
+        seen: уже просмотренные кандидаты - отбрасываются до отбора limit лучших
     
     Returns:
-        Список пользователей, отсортированный по активности
+        Список активных соискателей по убыванию оценки (database.ranking):
+        пересечение навыков + свежесть + доля принятых приглашений
     """
+    # Отбор и ранжирование по снимку профилей, из БД - только итоговая страница
+    mask = skill_mask(needed_skills)
+    if profile_snapshot.ready and mask:
+        user_ids = profile_snapshot.rank_participants(mask, exclude_user_id, limit, skip=seen)
+        return await _load_by_ids(session, User, user_ids)
+
     # Разбираем навыки
     skills_list = [skill.strip() for skill in needed_skills.split(',')]
     
     # Строим запрос для поиска пользователей с нужными навыками
-    query = select(User).where(User.user_type == UserType.PARTICIPANT)
+    # (только активные соискатели - спящие профили не сканируются)
+    query = select(User).where(
+        and_(
+            User.user_type == UserType.PARTICIPANT,
+            active_searchers_filter()
+        )
+    )
     
     if exclude_user_id:
         query = query.where(User.id != exclude_user_id)
@@ -242,11 +651,16 @@ async def find_users_by_skills(
     
     query = query.where(or_(*skill_conditions))
     
-    # Сортируем по активности (last_active от новых к старым)
-    query = query.order_by(User.last_active.desc())
-    
-    result = await session.execute(query)
-    return list(result.scalars().all())
+    # Ранжируем в БД: в Python приходит только страница
+    score = ranking_score_expr(
+        mask,
+        (User.primary_skill, User.additional_skills),
+        User.last_active,
+        User.id,
+        hot_invitations_since()
+    )
+    query = query.order_by(score.desc(), User.last_active.desc(), User.id.desc())
+    return await _fetch_unseen(session, query, limit, seen)
 
 
 async def count_invitations_today(
@@ -264,7 +678,8 @@ async def count_invitations_today(
         Количество приглашений за сегодня
     """
     today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    
+
+    # Условие по created_at отсекает все секции, кроме текущего месяца
     result = await session.execute(
         select(func.count())
         .select_from(Invitation)
@@ -300,6 +715,7 @@ async def check_invitation_limit(
 
 # ===== STATISTICS FUNCTIONS =====
 
+@read_only(user_arg="user_id")
 async def get_user_stats(session: AsyncSession, user_id: int) -> dict:
     """
     Получить статистику пользователя
@@ -308,8 +724,9 @@ async def get_user_stats(session: AsyncSession, user_id: int) -> dict:
         dict с полями:
         - user: объект User
         - days_registered: количество дней с регистрации
-        - sent_invitations: список отправленных приглашений
-        - received_invitations: список полученных приглашений
+        - sent_invitations: список отправленных приглашений (без архива)
+        - received_invitations: список полученных приглашений (без архива)
+        - sent_count, received_count: количество за все время (с архивом)
     """
     # Получаем пользователя
     user = await get_user_by_id(session, user_id)
@@ -330,9 +747,12 @@ async def get_user_stats(session: AsyncSession, user_id: int) -> dict:
         'days_registered': days_registered,
         'sent_invitations': sent_invitations,
         'received_invitations': received_invitations,
+        'sent_count': await count_invitations_with_archive(session, lambda m: m.from_user_id == user_id),
+        'received_count': await count_invitations_with_archive(session, lambda m: m.to_user_id == user_id),
     }
 
 
+@read_only(team_arg="team_id")
 async def get_team_stats(session: AsyncSession, team_id: int) -> dict:
     """
     Получить статистику команды
@@ -340,8 +760,9 @@ async def get_team_stats(session: AsyncSession, team_id: int) -> dict:
     Returns:
         dict с полями:
         - team: объект Team
-        - sent_invitations: приглашения от команды
-        - received_requests: запросы к команде
+        - sent_invitations: приглашения от команды (без архива)
+        - received_requests: запросы к команде (без архива)
+        - sent_count, received_count: количество за все время (с архивом)
         - matching_users_count: количество подходящих пользователей
     """
     # Получаем команду
@@ -366,31 +787,37 @@ async def get_team_stats(session: AsyncSession, team_id: int) -> dict:
     )
     received_requests = list(result.scalars().all())
 
-    # Считаем подходящих пользователей по навыкам
+    # Считаем подходящих пользователей по навыкам (из матрицы или гистограммы)
     matching_users_count = 0
     if team.needed_skills:
-        matching_users = await find_users_by_skills(session, team.needed_skills)
-        matching_users_count = len(matching_users)
+        if affinity.ready and affinity.has_team(team_id):
+            matching_users_count = affinity.matching_participants_count(team_id)
+        elif skill_histogram.ready:
+            matching_users_count = skill_histogram.participants_matching(skill_mask(team.needed_skills))
+        else:
+            matching_users = await find_users_by_skills(session, team.needed_skills)
+            matching_users_count = len(matching_users)
 
     return {
         'team': team,
         'sent_invitations': sent_invitations,
         'received_requests': received_requests,
+        'sent_count': await count_invitations_with_archive(session, lambda m: m.from_team_id == team_id),
+        'received_count': await count_invitations_with_archive(
+            session, lambda m: and_(m.to_user_id == team.leader_id, m.from_team_id == None)
+        ),
         'matching_users_count': matching_users_count,
     }
 
 
+@read_only(user_arg="user_id")
 async def count_profile_views(session: AsyncSession, user_id: int) -> int:
     """
     Подсчитать просмотры профиля
-    Пока возвращаем количество полученных приглашений как прокси для просмотров
+    Пока возвращаем количество полученных приглашений за все время
+    (включая архив) как прокси для просмотров
     """
-    result = await session.execute(
-        select(func.count())
-        .select_from(Invitation)
-        .where(Invitation.to_user_id == user_id)
-    )
-    return result.scalar()
+    return await count_invitations_with_archive(session, lambda m: m.to_user_id == user_id)
 
 
 # ===== SEARCH FOR COFOUNDERS AND PARTICIPANTS =====
@@ -418,19 +845,8 @@ def calculate_compatibility(user1: User, user2: User) -> int:
         stars = 4
 
     # Проверяем похожесть идей (простой check на общие слова)
-    idea1_what = (user1.idea_what or "").lower()
-    idea2_what = (user2.idea_what or "").lower()
-
-    # Ищем общие ключевые слова
-    common_keywords = ["образование", "доставка", "финансы", "здоровье", "edtech", "fintech", "healthtech", "foodtech"]
-    idea1_category = None
-    idea2_category = None
-
-    for keyword in common_keywords:
-        if keyword in idea1_what:
-            idea1_category = keyword
-        if keyword in idea2_what:
-            idea2_category = keyword
+    idea1_category = idea_category(user1.idea_what)
+    idea2_category = idea_category(user2.idea_what)
 
     # Если идеи из одной категории - добавляем звезду
     if idea1_category and idea2_category and idea1_category == idea2_category:
@@ -439,31 +855,47 @@ def calculate_compatibility(user1: User, user2: User) -> int:
     return stars
 
 
+@read_only(user_arg="user_id")
 async def find_cofounders(
     session: AsyncSession,
-    user_id: int
+    user_id: int,
+    limit: Optional[int] = None,
+    seen: Optional[SeenCheck] = None
 ) -> List[tuple[User, int]]:
     """
     Найти других соло-основателей для коллаборации
 
+    seen - уже просмотренные, отбрасываются до отбора limit лучших.
+
     Returns:
         Список кортежей (User, stars) отсортированный по совместимости
     """
+    if profile_snapshot.ready:
+        ranked = profile_snapshot.rank_cofounders(user_id, limit, skip=seen)
+        if ranked is not None:
+            stars_by_id = dict(ranked)
+            cofounders = await _load_by_ids(session, User, [other_id for other_id, _ in ranked])
+            return [(cofounder, stars_by_id[cofounder.id]) for cofounder in cofounders]
+
     # Получаем текущего пользователя
     current_user = await get_user_by_id(session, user_id)
     if not current_user:
         return []
 
-    # Ищем других соло-основателей
+    # Ищем других активных соло-основателей
     query = select(User).where(
         and_(
             User.user_type == UserType.COFOUNDER,
-            User.id != user_id
+            User.id != user_id,
+            active_searchers_filter()
         )
     ).order_by(User.last_active.desc())
 
     result = await session.execute(query)
-    cofounders = list(result.scalars().all())
+    cofounders = [
+        cofounder for cofounder in result.scalars().all()
+        if seen is None or not seen(cofounder.id)
+    ]
 
     # Рассчитываем совместимость для каждого
     cofounders_with_stars = []
@@ -474,56 +906,70 @@ async def find_cofounders(
     # Сортируем по количеству звезд (от большего к меньшему)
     cofounders_with_stars.sort(key=lambda x: x[1], reverse=True)
 
-    return cofounders_with_stars
+    return cofounders_with_stars[:limit]
 
 
+@read_only(user_arg="participant_id")
 async def find_teams_for_participant(
     session: AsyncSession,
-    participant_id: int
+    participant_id: int,
+    limit: Optional[int] = None,
+    seen: Optional[SeenCheck] = None
 ) -> List[Team]:
     """
     Найти команды, которым нужны навыки соискателя
 
+    Когда матрица совместимости построена - до MATCH_FEED_SIZE лучших
+    команд из столбца соискателя (по оценке пары), иначе ранжирование
+    в БД (database.ranking) по активности команды и ее лидера.
+    Просмотренные (seen) отбрасываются до отбора limit лучших; если они
+    скрыли весь столбец матрицы - ранжируем в БД.
+
     Returns:
-        Список команд, отсортированный по активности
+        Список команд по убыванию оценки
     """
+    if affinity.ready and affinity.has_participant(participant_id):
+        team_ids = [
+            team_id for team_id, _ in affinity.teams_for_participant(participant_id)
+            if seen is None or not seen(team_id)
+        ]
+        if team_ids or seen is None or not seen.hidden:
+            teams = await _load_by_ids(session, Team, team_ids)
+            return [team for team in teams if team.leader_id != participant_id][:limit]
+
     # Получаем соискателя
     participant = await get_user_by_id(session, participant_id)
     if not participant:
         return []
 
-    # Собираем все навыки соискателя
-    participant_skills = []
-    if participant.primary_skill:
-        participant_skills.append(participant.primary_skill.lower())
-    if participant.additional_skills:
-        additional = [s.strip().lower() for s in participant.additional_skills.split(',')]
-        participant_skills.extend(additional)
-
-    if not participant_skills:
+    mask = skill_mask(participant.primary_skill, participant.additional_skills)
+    if not mask:
         return []
 
-    # Ищем команды, которым нужны эти навыки
-    query = select(Team).where(Team.status == TeamStatus.ACTIVE)
-    result = await session.execute(query)
-    all_teams = list(result.scalars().all())
+    score = ranking_score_expr(mask, (Team.needed_skills,), Team.updated_at, Team.leader_id, hot_invitations_since())
+    query = (
+        select(Team)
+        .where(
+            and_(
+                Team.status == TeamStatus.ACTIVE,
+                Team.leader_id != participant_id,
+                skill_overlap_expr(mask, Team.needed_skills) > 0
+            )
+        )
+        .order_by(score.desc(), Team.updated_at.desc(), Team.id.desc())
+    )
+    return await _fetch_unseen(session, query, limit, seen)
 
-    # Фильтруем команды по навыкам
-    matching_teams = []
-    for team in all_teams:
-        if team.needed_skills:
-            needed_skills_lower = team.needed_skills.lower()
-            for skill in participant_skills:
-                # Простой поиск подстроки
-                skill_keywords = skill.split('(')[0].strip().lower()
-                if skill_keywords in needed_skills_lower:
-                    matching_teams.append(team)
-                    break
 
-    # Сортируем по дате обновления (более активные сверху)
-    matching_teams.sort(key=lambda t: t.updated_at, reverse=True)
+async def count_matching_users(session: AsyncSession, needed_skills: str, fallback: int = 0) -> int:
+    """
+    Сколько активных соискателей подходят под навыки команды.
 
-    return matching_teams
+    Берется из гистограммы навыков; пока она не построена - fallback.
+    """
+    if skill_histogram.ready:
+        return skill_histogram.participants_matching(skill_mask(needed_skills))
+    return fallback
 
 
 async def count_teams_need_skill(
@@ -532,17 +978,135 @@ async def count_teams_need_skill(
 ) -> int:
     """
     Подсчитать количество команд, которым нужен определенный навык
+
+    Известные навыки считаются по гистограмме навыков без запроса к БД.
     """
+    bit = keyword_bit(skill)
+    if bit and skill_histogram.ready:
+        return skill_histogram.teams_needing(bit)
+
     skill_lower = skill.lower()
     skill_keywords = skill_lower.split('(')[0].strip()
 
-    query = select(Team).where(
+    query = select(func.count()).select_from(Team).where(
         and_(
             Team.status == TeamStatus.ACTIVE,
             Team.needed_skills.ilike(f"%{skill_keywords}%")
         )
     )
     result = await session.execute(query)
-    teams = list(result.scalars().all())
+    return result.scalar()
+
+
+# ===== MATCH FEED =====
+
+async def get_feed_users(
+    session: AsyncSession,
+    viewer_id: int,
+    candidate_type: UserType,
+    limit: int,
+    offset: int = 0,
+    seen: Optional[SeenCheck] = None
+) -> List[tuple[User, float]]:
+    """
+    Страница предрассчитанной ленты кандидатов-пользователей.
+
+    Читает match_feed по индексу (viewer_id, score DESC), кандидаты,
+    переставшие искать, отбрасываются при чтении. С seen лента читается
+    дальше, пока не наберется limit непросмотренных (_read_feed).
+
+    Returns:
+        Список кортежей (User, score); пустой, если лента еще не построена
+        или в ней не осталось непросмотренных
+    """
+    query = (
+        select(User, MatchFeed.score)
+        .join(
+            MatchFeed,
+            and_(
+                MatchFeed.candidate_id == User.id,
+                MatchFeed.candidate_type == candidate_type
+            )
+        )
+        .where(
+            and_(
+                MatchFeed.viewer_id == viewer_id,
+                active_searchers_filter()
+            )
+        )
+        .order_by(MatchFeed.score.desc(), User.last_active.desc(), User.id.desc())
+    )
+    return await _read_feed(session, query, viewer_id, limit, offset, seen)
+
+
+async def get_feed_teams(
+    session: AsyncSession,
+    viewer_id: int,
+    limit: int,
+    offset: int = 0,
+    seen: Optional[SeenCheck] = None
+) -> List[tuple[Team, float]]:
+    """
+    Страница предрассчитанной ленты команд для соискателя (seen - как в get_feed_users).
+
+    Returns:
+        Список кортежей (Team, score); пустой, если лента еще не построена
+        или в ней не осталось непросмотренных
+    """
+    query = (
+        select(Team, MatchFeed.score)
+        .join(
+            MatchFeed,
+            and_(
+                MatchFeed.candidate_id == Team.id,
+                MatchFeed.candidate_type == UserType.TEAM
+            )
+        )
+        .where(
+            and_(
+                MatchFeed.viewer_id == viewer_id,
+                Team.status == TeamStatus.ACTIVE
+            )
+        )
+        .order_by(MatchFeed.score.desc(), Team.updated_at.desc(), Team.id.desc())
+    )
+    return await _read_feed(session, query, viewer_id, limit, offset, seen)
+
+
+async def _read_feed(
+    session: AsyncSession,
+    query,
+    viewer_id: int,
+    limit: int,
+    offset: int,
+    seen: Optional[SeenCheck]
+) -> list:
+    """Прочитать ленту страницами по limit, пропуская просмотренных кандидатов"""
+    rows = []
+    start = offset
+    while True:
+        result = await session.execute(query.offset(start).limit(limit))
+        page = [(candidate, score) for candidate, score in result.all()]
+        if not page and start == 0:
+            match_feed.mark_viewer(viewer_id)
+        rows.extend(item for item in page if seen is None or not seen(item[0].id))
+        if seen is None or len(rows) >= limit or len(page) < limit:
+            return rows[:limit]
+        start += limit
+
+
+# ===== SEEN CANDIDATES =====
+
+async def mark_seen(
+    session: AsyncSession,
+    user_id: int,
+    candidate_type: UserType,
+    candidate_id: int
+) -> None:
+    """Отметить кандидата как просмотренного (пропущен или уже отправлен запрос)"""
+    await seen_filters.add(session, user_id, candidate_type, candidate_id)
+
 
-    return len(teams)
+async def seen_check(session: AsyncSession, user_id: int, candidate_type: UserType) -> SeenCheck:
+    """Предикат "кандидат уже просмотрен" для передачи в функции поиска и ленты"""
+    return await seen_filters.check(session, user_id, candidate_type)
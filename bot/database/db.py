@@ -1,9 +1,21 @@
+import asyncio
+import functools
+import inspect
+import itertools
+import json
+import uuid
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar
+import asyncpg
+from cachetools import TTLCache
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine, create_async_engine, async_sessionmaker
-from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy import text
 from database.models import Base
+from database.pool import InstrumentedPool, PoolMonitor
+from database.sql_trace import sql_tracer
+from database.partitions import ensure_invitation_partitions
 from config import settings
 import logging
 
@@ -11,7 +23,66 @@ logger = logging.getLogger(__name__)
 
 # Глобальные переменные для движка и фабрики сессий
 engine: AsyncEngine | None = None
-AsyncSessionLocal: async_sessionmaker[AsyncSession] | None = None
+# Фабрика создается сразу, а движок привязывается в init_db: обработчики
+# импортируют AsyncSessionLocal до инициализации БД
+AsyncSessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False,
+)
+
+# Метрики пулов: primary и реплики
+pool_monitors: Dict[str, PoolMonitor] = {}
+
+
+def create_pooled_engine(name: str, url: str, pool_size: int, max_overflow: int) -> AsyncEngine:
+    """
+    Создать движок с инструментированным пулом.
+
+    В адаптивном режиме (DB_POOL_ADAPTIVE) все pool_size + max_overflow
+    соединений доступны без ожидания, а число постоянных подбирает PoolMonitor.
+    """
+    if settings.DB_POOL_ADAPTIVE:
+        pool_size, max_overflow = pool_size + max_overflow, 0
+
+    created = create_async_engine(
+        url,
+        echo=settings.DEBUG,
+        poolclass=InstrumentedPool,
+        pool_size=pool_size,  # Количество постоянных соединений
+        max_overflow=max_overflow,  # Дополнительные соединения при пиковой нагрузке
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,  # Ожидание свободного соединения
+        pool_pre_ping=settings.DB_POOL_PRE_PING,  # Проверка соединения перед использованием
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,  # Пересоздание старых соединений
+    )
+    pool_monitors[name] = PoolMonitor(
+        name,
+        created,
+        adaptive=settings.DB_POOL_ADAPTIVE,
+        min_size=settings.DB_POOL_MIN_SIZE,
+        adapt_interval=settings.DB_POOL_ADAPT_SECONDS,
+    )
+    if settings.SQL_TRACE_ENABLED:
+        sql_tracer.attach(created)
+    return created
+
+
+def get_pool_stats() -> Dict[str, dict]:
+    """Статистика всех пулов соединений"""
+    return {name: monitor.get_stats() for name, monitor in pool_monitors.items()}
+
+
+async def start_pool_monitors() -> None:
+    """Запустить адаптивный подбор размера пулов (если включен)"""
+    for monitor in pool_monitors.values():
+        await monitor.start()
+
+
+async def stop_pool_monitors() -> None:
+    """Остановить подбор размера пулов"""
+    for monitor in pool_monitors.values():
+        await monitor.stop()
 
 
 async def init_db() -> None:
@@ -19,29 +90,24 @@ async def init_db() -> None:
     Инициализация подключения к БД.
     ОБЯЗАТЕЛЬНО вызвать при старте приложения!
     """
-    global engine, AsyncSessionLocal
+    global engine
 
     logger.info("Инициализация подключения к базе данных...")
 
     # Создаем асинхронный движок с пулом соединений
-    engine = create_async_engine(
+    engine = create_pooled_engine(
+        "primary",
         settings.DATABASE_URL,
-        echo=settings.DEBUG,
-        poolclass=AsyncAdaptedQueuePool,
-        pool_size=10,  # Количество постоянных соединений
-        max_overflow=20,  # Дополнительные соединения при пиковой нагрузке
-        pool_pre_ping=True,  # Проверка соединения перед использованием
-        pool_recycle=3600,  # Пересоздание соединений каждый час
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
     )
 
-    # Создаем фабрику сессий
-    AsyncSessionLocal = async_sessionmaker(
-        engine,
-        class_=AsyncSession,
-        expire_on_commit=False,
-        autocommit=False,
-        autoflush=False,
-    )
+    # Реплики чтения (если заданы) - со своими пулами
+    replicas.configure(settings.DATABASE_REPLICA_URLS)
+
+    # Привязываем фабрику сессий: запись всегда в primary, чтение из crud
+    # с пометкой @read_only может уйти на реплику
+    AsyncSessionLocal.configure(bind=engine, sync_session_class=RoutingSession)
 
     logger.info("Подключение к базе данных успешно инициализировано")
 
@@ -57,7 +123,10 @@ async def close_db() -> None:
         return
 
     logger.info("Закрытие подключения к базе данных...")
+    await stop_pool_monitors()
+    await replicas.dispose()
     await engine.dispose()
+    pool_monitors.clear()
     logger.info("Подключение к базе данных закрыто")
 
 
@@ -76,7 +145,7 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
     - Автоматический rollback при ошибке
     - ОБЯЗАТЕЛЬНОЕ закрытие сессии в finally (предотвращает memory leak!)
     """
-    if AsyncSessionLocal is None:
+    if engine is None:
         raise RuntimeError(
             "Database not initialized! Call init_db() first in main.py startup"
         )
@@ -93,6 +162,204 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         await session.close()
 
 
+# ===== Реплики чтения =====
+#
+# Тяжелые чтения (поиск, статистика, списки приглашений) помечены в crud
+# декоратором @read_only и выполняются на реплике, если она есть и отстает
+# не больше REPLICA_MAX_LAG_SECONDS. Read-your-writes: после записи,
+# затрагивающей пользователя или команду (cache_sync вызывает note_write),
+# чтения по этому ключу REPLICA_MAX_LAG_SECONDS идут в primary -
+# реплика с допустимым отставанием к этому времени запись уже получила.
+
+# Отставание реплики в секундах; 0 - догнала primary (или это не реплика)
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+
+class RoutingSession(Session):
+    """Сессия, которая отправляет чтения в выбранную реплику"""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get("replica_bind")
+        if replica is not None and not self._flushing:
+            return replica.sync_engine
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+
+class ReplicaRouter:
+    """Пулы реплик, контроль отставания и закрепление ключей за primary"""
+
+    def __init__(self, max_lag: float = 5.0, check_interval: float = 5.0):
+        """
+        Args:
+            max_lag: Максимальное отставание реплики для чтения (секунды)
+            check_interval: Интервал проверки отставания (секунды)
+        """
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+
+        self.engines: List[AsyncEngine] = []
+        self._lag: Dict[int, Optional[float]] = {}
+        self._next = itertools.count()
+        # Ключи недавних записей: ("user", id) / ("team", id)
+        self._pinned: TTLCache = TTLCache(maxsize=100000, ttl=max_lag)
+        self._task: Optional[asyncio.Task] = None
+
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.pinned_reads = 0
+
+    # ===== Публичный API =====
+
+    def configure(self, urls: str) -> None:
+        """Создать движки реплик из списка URL через запятую"""
+        for url in filter(None, (part.strip() for part in urls.split(","))):
+            self.engines.append(create_pooled_engine(
+                f"replica{len(self.engines)}",
+                url,
+                pool_size=settings.REPLICA_POOL_SIZE,
+                max_overflow=settings.REPLICA_MAX_OVERFLOW,
+            ))
+        if self.engines:
+            logger.info(f"Реплик чтения: {len(self.engines)}")
+
+    async def dispose(self) -> None:
+        """Закрыть пулы реплик"""
+        for replica in self.engines:
+            await replica.dispose()
+        self.engines.clear()
+        self._lag.clear()
+
+    def note_write(self, user_ids: Iterable[Optional[int]] = (), team_ids: Iterable[Optional[int]] = ()) -> None:
+        """Закрепить чтения по ключам за primary на время допустимого отставания"""
+        if not self.engines:
+            return
+        for user_id in user_ids:
+            if user_id is not None:
+                self._pinned[("user", user_id)] = True
+        for team_id in team_ids:
+            if team_id is not None:
+                self._pinned[("team", team_id)] = True
+
+    def pick(self, user_id: Optional[int] = None, team_id: Optional[int] = None) -> Optional[AsyncEngine]:
+        """Реплика для чтения или None (читать из primary)"""
+        healthy = [
+            replica for index, replica in enumerate(self.engines)
+            if (lag := self._lag.get(index)) is not None and lag <= self.max_lag
+        ]
+        if not healthy:
+            self.primary_reads += 1
+            return None
+        if ("user", user_id) in self._pinned or ("team", team_id) in self._pinned:
+            self.pinned_reads += 1
+            return None
+        self.replica_reads += 1
+        return healthy[next(self._next) % len(healthy)]
+
+    async def check_lag(self) -> None:
+        """Измерить отставание реплик (недоступная реплика исключается)"""
+        for index, replica in enumerate(self.engines):
+            try:
+                async with replica.connect() as conn:
+                    lag = float((await conn.execute(REPLICA_LAG_SQL)).scalar() or 0)
+            except Exception as e:
+                if self._lag.get(index) is not None:
+                    logger.warning(f"Реплика {index} недоступна: {e}")
+                lag = None
+            self._lag[index] = lag
+
+    async def start(self) -> Optional[asyncio.Task]:
+        """Проверить реплики и запустить фоновый контроль отставания"""
+        if not self.engines:
+            return None
+        await self.check_lag()
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self) -> None:
+        """Остановить контроль отставания"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> dict:
+        """Статистика маршрутизации (для мониторинга)"""
+        return {
+            "replicas": len(self.engines),
+            "lag_seconds": [self._lag.get(index) for index in range(len(self.engines))],
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "pinned_reads": self.pinned_reads,
+            "pinned_keys": len(self._pinned),
+        }
+
+    # ===== Внутренняя логика =====
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.check_lag()
+            except Exception as e:
+                logger.error(f"Ошибка при проверке отставания реплик: {e}", exc_info=True)
+
+
+# Глобальный маршрутизатор реплик
+replicas = ReplicaRouter(
+    max_lag=settings.REPLICA_MAX_LAG_SECONDS,
+    check_interval=settings.REPLICA_LAG_CHECK_SECONDS,
+)
+
+
+def read_only(user_arg: Optional[str] = None, team_arg: Optional[str] = None) -> Callable[[F], F]:
+    """
+    Пометить функцию crud как только читающую.
+
+    Пока функция выполняется, запросы ее сессии идут на реплику (если
+    она есть и ключ не закреплен за primary недавней записью).
+
+    Args:
+        user_arg: имя аргумента с id пользователя для read-your-writes
+        team_arg: имя аргумента с id команды для read-your-writes
+    """
+    def decorator(func: F) -> F:
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not replicas.engines:
+                return await func(*args, **kwargs)
+
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            info = arguments["session"].sync_session.info
+            # Вложенный вызов читает там же, где внешний
+            if "replica_bind" in info:
+                return await func(*args, **kwargs)
+
+            info["replica_bind"] = replicas.pick(
+                user_id=arguments.get(user_arg) if user_arg else None,
+                team_id=arguments.get(team_arg) if team_arg else None,
+            )
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                del info["replica_bind"]
+
+        return wrapper
+    return decorator
+
+
 async def create_tables() -> None:
     """Создать все таблицы в БД"""
     if engine is None:
@@ -101,6 +368,8 @@ async def create_tables() -> None:
     logger.info("Создание таблиц в базе данных...")
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # Секции invitations по месяцам (текущий + несколько вперед)
+        await ensure_invitation_partitions(conn, settings.INVITATION_PARTITIONS_AHEAD_MONTHS)
     logger.info("Таблицы успешно созданы")
 
 
@@ -125,3 +394,197 @@ async def recreate_database() -> None:
     await drop_tables()
     await create_tables()
     logger.info("База данных успешно пересоздана")
+
+
+# ===== Межинстансная инвалидация кешей (LISTEN/NOTIFY) =====
+#
+# Каждый экземпляр бота держит локальные кеши (профили, гистограмма,
+# матрица совместимости, снимок профилей, фильтры просмотренных).
+# Запись в crud публикует компактное сообщение через pg_notify в той же
+# транзакции: PostgreSQL доставит его только после COMMIT, откат отменит.
+# Отдельное asyncpg-соединение (не из пула) слушает канал и раздает
+# сообщения зарегистрированным обработчикам. Уведомления, пропущенные
+# за время разрыва соединения, не повторяются - после переподключения
+# вызываются обработчики полной пересинхронизации.
+
+# Идентификатор процесса: свои сообщения уже применены локально
+INSTANCE_ID = uuid.uuid4().hex[:12]
+
+ChangeHandler = Callable[[str, dict], None]
+ResyncHandler = Callable[[], Awaitable[None]]
+
+_change_handlers: List[ChangeHandler] = []
+_resync_handlers: List[ResyncHandler] = []
+
+
+def register_change_handler(handler: ChangeHandler) -> None:
+    """Подписать обработчик на изменения других экземпляров: handler(kind, data)"""
+    if handler not in _change_handlers:
+        _change_handlers.append(handler)
+
+
+def register_resync_handler(handler: ResyncHandler) -> None:
+    """Подписать корутину полной пересинхронизации (после разрыва LISTEN)"""
+    if handler not in _resync_handlers:
+        _resync_handlers.append(handler)
+
+
+async def notify_change(session: AsyncSession, kind: str, data: dict) -> None:
+    """
+    Опубликовать изменение для других экземпляров.
+
+    Вызывать ДО commit: сообщение уйдет вместе с транзакцией.
+
+    Args:
+        session: сессия, в которой выполняется запись
+        kind: тип изменения (см. services/cache_sync.py)
+        data: поля изменения (JSON, до 8000 байт)
+    """
+    if not settings.INVALIDATION_ENABLED:
+        return
+    payload = json.dumps({"o": INSTANCE_ID, "k": kind, **data}, separators=(",", ":"), default=str)
+    await session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": settings.INVALIDATION_CHANNEL, "payload": payload}
+    )
+
+
+def listener_dsn() -> str:
+    """DSN для asyncpg из DATABASE_URL (без +asyncpg)"""
+    url = make_url(settings.DATABASE_URL).set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
+
+
+class ChangeListener:
+    """Слушатель канала инвалидации на выделенном соединении"""
+
+    def __init__(self, channel: str, healthcheck_interval: float = 30.0, max_backoff: float = 30.0):
+        """
+        Args:
+            channel: Имя канала LISTEN/NOTIFY
+            healthcheck_interval: Интервал проверки соединения (секунды)
+            max_backoff: Максимальная пауза между попытками переподключения (секунды)
+        """
+        self.channel = channel
+        self.healthcheck_interval = healthcheck_interval
+        self.max_backoff = max_backoff
+
+        self.connected = False
+        self._task: Optional[asyncio.Task] = None
+
+        self.received = 0
+        self.own_skipped = 0
+        self.errors = 0
+        self.connections = 0
+        self.resyncs = 0
+
+    async def start(self) -> asyncio.Task:
+        """Запустить прослушивание (переподключается само)"""
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self) -> None:
+        """Остановить прослушивание и закрыть соединение"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> dict:
+        """Статистика слушателя (для мониторинга)"""
+        return {
+            "instance_id": INSTANCE_ID,
+            "connected": self.connected,
+            "received": self.received,
+            "own_skipped": self.own_skipped,
+            "errors": self.errors,
+            "connections": self.connections,
+            "resyncs": self.resyncs,
+        }
+
+    # ===== Внутренняя логика =====
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                conn = await asyncpg.connect(listener_dsn())
+            except Exception as e:
+                logger.warning(f"Слушатель инвалидации не подключился: {e}; повтор через {backoff:.0f} с")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            backoff = 1.0
+            try:
+                await self._listen(conn)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Соединение слушателя инвалидации потеряно: {e}")
+            finally:
+                self.connected = False
+                if not conn.is_closed():
+                    conn.terminate()
+
+    async def _listen(self, conn: "asyncpg.Connection") -> None:
+        lost = asyncio.Event()
+        conn.add_termination_listener(lambda _: lost.set())
+        await conn.add_listener(self.channel, self._on_notify)
+        self.connected = True
+
+        # LISTEN уже активен - все, что пропущено до этого момента, добираем полной сверкой
+        if self.connections:
+            await self._resync()
+        self.connections += 1
+
+        while not lost.is_set():
+            try:
+                await asyncio.wait_for(lost.wait(), timeout=self.healthcheck_interval)
+            except asyncio.TimeoutError:
+                # Полуоткрытое соединение иначе не заметить: запрос упадет по таймауту
+                await conn.fetchval("SELECT 1", timeout=self.healthcheck_interval)
+
+    def _on_notify(self, conn: Any, pid: int, channel: str, payload: str) -> None:
+        try:
+            data = json.loads(payload)
+            origin = data.pop("o", None)
+            kind = data.pop("k")
+        except (ValueError, KeyError):
+            self.errors += 1
+            logger.warning(f"Некорректное сообщение инвалидации: {payload[:200]}")
+            return
+
+        if origin == INSTANCE_ID:
+            self.own_skipped += 1
+            return
+
+        self.received += 1
+        for handler in _change_handlers:
+            try:
+                handler(kind, data)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка обработки изменения {kind}: {e}", exc_info=True)
+
+    async def _resync(self) -> None:
+        logger.info("Полная пересинхронизация кешей после переподключения слушателя")
+        self.resyncs += 1
+        for handler in _resync_handlers:
+            try:
+                result = handler()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка пересинхронизации кеша: {e}", exc_info=True)
+
+
+# Глобальный слушатель
+change_listener = ChangeListener(
+    channel=settings.INVALIDATION_CHANNEL,
+    healthcheck_interval=settings.INVALIDATION_HEALTHCHECK_SECONDS,
+)
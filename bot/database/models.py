@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import BigInteger, String, Text, DateTime, ForeignKey, Enum, Boolean, Index, CheckConstraint
+from sqlalchemy import BigInteger, String, Text, DateTime, ForeignKey, Enum, Boolean, Float, Integer, LargeBinary, Index, CheckConstraint, text, func, and_
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from typing import Optional, List
 import enum
@@ -81,13 +81,38 @@ class User(Base):
     __table_args__ = (
         Index('idx_user_active_search', 'user_type', 'is_searching', 'deleted_at'),
         Index('idx_user_last_active', 'last_active', 'deleted_at'),
-        CheckConstraint("user_type IN ('participant', 'cofounder', 'team')", name='check_user_type'),
+        # Опрос изменений снимком профилей (updated_at выше водяной отметки)
+        Index('idx_user_updated_at', 'updated_at'),
+        # Частичный индекс только по активным соискателям (~30% пользователей):
+        # поиск и подсчеты не сканируют спящие и удаленные профили
+        Index(
+            'idx_user_searching',
+            'user_type',
+            'last_active',
+            postgresql_where=text('is_searching AND deleted_at IS NULL'),
+        ),
+        # Enum хранится по именам членов (PARTICIPANT), а не по значениям
+        CheckConstraint("user_type IN ('PARTICIPANT', 'COFOUNDER', 'TEAM')", name='check_user_type'),
     )
 
     def __repr__(self) -> str:
         return f"<User(id={self.id}, telegram_id={self.telegram_id}, name={self.name}, type={self.user_type})>"
 
 
+def active_searchers_filter():
+    """
+    Условие «активный соискатель»: профиль ищет команду и не удален.
+
+    Совпадает с условием частичного индекса idx_user_searching. Общее для
+    crud, фоновых задач и всех кешей (счетчик, гистограмма, лента,
+    матрица) - они считают одно и то же множество пользователей.
+    """
+    return and_(
+        User.is_searching == True,
+        User.deleted_at.is_(None)
+    )
+
+
 class Team(Base):
     """Модель команды с оптимизацией"""
     __tablename__ = "teams"
@@ -125,7 +150,13 @@ class Team(Base):
 
 
 class Invitation(Base):
-    """Модель приглашения с оптимизацией для лимитов"""
+    """
+    Модель приглашения с оптимизацией для лимитов.
+
+    Таблица секционирована по месяцам (RANGE по created_at), поэтому
+    created_at входит в первичный ключ. Секции создаются в database/partitions.py,
+    закрытые приглашения старше срока хранения переносятся в invitations_archive.
+    """
     __tablename__ = "invitations"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
@@ -140,7 +171,7 @@ class Invitation(Base):
         default=InvitationStatus.PENDING,
         index=True
     )
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, primary_key=True, default=datetime.utcnow, index=True)
     expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)
     viewed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     responded_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
@@ -167,8 +198,84 @@ class Invitation(Base):
         Index('idx_invitation_daily_limit', 'from_user_id', 'created_at'),
         Index('idx_invitation_team_daily', 'from_team_id', 'created_at'),
         Index('idx_invitation_expired', 'status', 'expires_at'),
-        CheckConstraint("status IN ('pending', 'accepted', 'rejected', 'expired')", name='check_invitation_status'),
+        CheckConstraint("status IN ('PENDING', 'ACCEPTED', 'REJECTED', 'EXPIRED')", name='check_invitation_status'),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
 
     def __repr__(self) -> str:
         return f"<Invitation(id={self.id}, from_user={self.from_user_id}, to_user={self.to_user_id}, status={self.status})>"
+
+
+class InvitationArchive(Base):
+    """
+    Архив закрытых приглашений (ACCEPTED, REJECTED, EXPIRED).
+
+    Сюда фоновая задача переносит приглашения старше
+    INVITATION_ARCHIVE_AFTER_DAYS, чтобы горячая таблица не росла.
+    Без внешних ключей: архив переживает удаление пользователей и команд.
+    """
+    __tablename__ = "invitations_archive"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    from_user_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
+    from_team_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True, index=True)
+    to_user_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
+    message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    status: Mapped[InvitationStatus] = mapped_column(Enum(InvitationStatus), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    viewed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    responded_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    # server_default: строки приходят через INSERT ... SELECT, Python-дефолты не срабатывают
+    archived_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+
+    def __repr__(self) -> str:
+        return f"<InvitationArchive(id={self.id}, from_user={self.from_user_id}, to_user={self.to_user_id}, status={self.status})>"
+
+
+class MatchFeed(Base):
+    """
+    Предрассчитанная лента совпадений: (зритель, кандидат, оценка).
+
+    Поддерживается фоновым воркером services.match_feed, /search читает
+    из нее готовую отсортированную страницу. candidate_type определяет,
+    на что ссылается candidate_id: TEAM - teams.id, иначе users.id.
+    """
+    __tablename__ = "match_feed"
+
+    viewer_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    candidate_type: Mapped[UserType] = mapped_column(Enum(UserType), primary_key=True)
+    candidate_id: Mapped[int] = mapped_column(primary_key=True)
+    score: Mapped[float] = mapped_column(Float, nullable=False)
+    computed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Страница ленты: WHERE viewer_id = ? ORDER BY score DESC LIMIT k
+        Index('idx_match_feed_rank', 'viewer_id', text('score DESC')),
+        # Поиск зрителей, у которых кандидат есть в ленте (при его удалении)
+        Index('idx_match_feed_candidate', 'candidate_type', 'candidate_id'),
+    )
+
+    def __repr__(self) -> str:
+        return f"<MatchFeed(viewer={self.viewer_id}, candidate={self.candidate_type}:{self.candidate_id}, score={self.score})>"
+
+
+class SeenFilter(Base):
+    """
+    Просмотренные и пропущенные кандидаты пользователя.
+
+    Хранится компактно - два поколения фильтра Блума (services.seen_filter):
+    текущее и предыдущее. При ротации старое поколение отбрасывается,
+    поэтому пропуски со временем «забываются».
+    """
+    __tablename__ = "seen_filters"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    current_bits: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    current_count: Mapped[int] = mapped_column(Integer, default=0)
+    previous_bits: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    rotated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"<SeenFilter(user_id={self.user_id}, count={self.current_count})>"
@@ -0,0 +1,139 @@
+"""
+Обслуживание секций таблицы invitations.
+
+invitations секционирована по месяцам (RANGE по created_at):
+- invitations_pYYYY_MM - секция за месяц, создается заранее
+- invitations_default - страховочная секция для строк вне созданных диапазонов
+
+Старые закрытые приглашения переносятся в invitations_archive
+(см. tasks.archive_closed_invitations), после чего опустевшие секции
+старше срока хранения удаляются.
+"""
+import logging
+import re
+from datetime import datetime
+from typing import List
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "invitations"
+DEFAULT_PARTITION = "invitations_default"
+PARTITION_NAME_RE = re.compile(r"^invitations_p(\d{4})_(\d{2})$")
+
+
+def month_start(dt: datetime) -> datetime:
+    """Начало месяца для даты"""
+    return datetime(dt.year, dt.month, 1)
+
+
+def add_months(dt: datetime, months: int) -> datetime:
+    """Сдвинуть начало месяца на months месяцев"""
+    index = dt.year * 12 + (dt.month - 1) + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(start: datetime) -> str:
+    """Имя секции за месяц: invitations_p2024_05"""
+    return f"{PARENT_TABLE}_p{start.year:04d}_{start.month:02d}"
+
+
+async def is_partitioned(conn: AsyncConnection) -> bool:
+    """Проверить, что invitations создана как секционированная таблица"""
+    result = await conn.execute(
+        text("SELECT relkind::text FROM pg_class WHERE relname = :name"),
+        {"name": PARENT_TABLE}
+    )
+    return result.scalar() == "p"
+
+
+async def ensure_invitation_partitions(conn: AsyncConnection, months_ahead: int = 2) -> List[str]:
+    """
+    Создать секции за текущий месяц и months_ahead месяцев вперед.
+
+    Returns:
+        Список созданных секций
+    """
+    if not await is_partitioned(conn):
+        logger.warning(
+            "Таблица invitations не секционирована (создана старой версией). "
+            "Пересоздайте ее для включения секций по месяцам"
+        )
+        return []
+
+    await conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} "
+        f"PARTITION OF {PARENT_TABLE} DEFAULT"
+    ))
+
+    existing = await _list_partitions(conn)
+    created = []
+    current = month_start(datetime.utcnow())
+
+    for offset in range(months_ahead + 1):
+        start = add_months(current, offset)
+        name = partition_name(start)
+        if name in existing:
+            continue
+
+        end = add_months(start, 1)
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        ))
+        created.append(name)
+
+    if created:
+        logger.info(f"Созданы секции приглашений: {', '.join(created)}")
+
+    return created
+
+
+async def drop_empty_partitions(conn: AsyncConnection, older_than: datetime) -> List[str]:
+    """
+    Удалить пустые секции, целиком лежащие раньше older_than.
+
+    Секция пустеет после переноса закрытых приглашений в архив.
+
+    Returns:
+        Список удаленных секций
+    """
+    if not await is_partitioned(conn):
+        return []
+
+    dropped = []
+    for name in sorted(await _list_partitions(conn)):
+        match = PARTITION_NAME_RE.match(name)
+        if not match:
+            continue
+
+        start = datetime(int(match.group(1)), int(match.group(2)), 1)
+        if add_months(start, 1) > older_than:
+            continue
+
+        has_rows = await conn.execute(text(f"SELECT 1 FROM {name} LIMIT 1"))
+        if has_rows.first() is not None:
+            continue
+
+        await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        await conn.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+
+    if dropped:
+        logger.info(f"Удалены пустые секции приглашений: {', '.join(dropped)}")
+
+    return dropped
+
+
+async def _list_partitions(conn: AsyncConnection) -> set:
+    result = await conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :name"
+        ),
+        {"name": PARENT_TABLE}
+    )
+    return {row[0] for row in result.all()}
@@ -0,0 +1,259 @@
+"""
+Наблюдаемость пула соединений и адаптивный размер.
+
+InstrumentedPool - AsyncAdaptedQueuePool, который замеряет время
+получения соединения (ожидание в очереди пула, открытие нового
+соединения и pre-ping) и в адаптивном режиме не держит больше
+простаивающих соединений, чем нужно.
+
+PoolMonitor подписывается на события пула SQLAlchemy (connect, checkout,
+checkin, close, invalidate) и считает:
+- ожидание выдачи соединения (среднее, p95, максимум) и таймауты
+- занятые соединения, пик и overflow
+- время удержания соединения обработчиком
+- неудачные pre-ping и время жизни соединений
+
+Адаптивный режим (DB_POOL_ADAPTIVE): пул разрешает до
+DB_POOL_SIZE + DB_MAX_OVERFLOW соединений без ожидания, а раз в
+DB_POOL_ADAPT_SECONDS целевой размер пересчитывается по пику занятых
+соединений за окно (с запасом 25%, не меньше DB_POOL_MIN_SIZE).
+Соединения сверх целевого размера закрываются при возврате в пул.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Deque, Optional
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних замеров ожидания хранить для p95
+WAIT_SAMPLES = 1024
+
+# Запас целевого размера над пиком занятых соединений
+ADAPTIVE_HEADROOM = 1.25
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул с замером ожидания соединения и целевым размером"""
+
+    monitor: Optional["PoolMonitor"] = None
+    target_size: Optional[int] = None
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            if self.monitor is not None:
+                self.monitor.timeouts += 1
+            raise
+        finally:
+            if self.monitor is not None:
+                self.monitor.record_wait(time.perf_counter() - started)
+
+    def recreate(self) -> "InstrumentedPool":
+        # engine.dispose() пересоздает пул - мониторинг и размер переносим
+        pool = super().recreate()
+        pool.monitor = self.monitor
+        pool.target_size = self.target_size
+        if self.monitor is not None:
+            self.monitor.pool = pool
+        return pool
+
+    # Переопределяет внутренний метод QueuePool (SQLAlchemy 2.0) - поведение
+    # закреплено в tests/test_pool.py
+    def _do_return_conn(self, record) -> None:
+        if self.target_size is not None and self.checkedout() + self.checkedin() > self.target_size:
+            # Лишнее соединение закрываем, освобождая место под overflow
+            try:
+                record.close()
+            finally:
+                self._dec_overflow()
+            if self.monitor is not None:
+                self.monitor.trimmed += 1
+            return
+        super()._do_return_conn(record)
+
+
+class PoolMonitor:
+    """Метрики одного пула по событиям SQLAlchemy"""
+
+    def __init__(self, name: str, engine: AsyncEngine, adaptive: bool = False,
+                 min_size: int = 2, adapt_interval: float = 60.0):
+        """
+        Args:
+            name: Имя пула в статистике (primary, replica0, ...)
+            engine: Движок с пулом InstrumentedPool
+            adaptive: Подбирать целевой размер пула по нагрузке
+            min_size: Минимальный целевой размер в адаптивном режиме
+            adapt_interval: Окно наблюдения адаптивного режима (секунды)
+        """
+        self.name = name
+        self.engine = engine
+        self.pool: InstrumentedPool = engine.sync_engine.pool
+        self.adaptive = adaptive
+        self.min_size = min_size
+        self.adapt_interval = adapt_interval
+        # Жесткий предел: постоянные соединения + overflow
+        self.capacity = self.pool.size() + max(self.pool._max_overflow, 0)
+
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._task: Optional[asyncio.Task] = None
+
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.window_peak = 0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+        self.preping_failures = 0
+        self.lifetime_total = 0.0
+        self.lifetime_max = 0.0
+        self.trimmed = 0
+
+        self.pool.monitor = self
+        self._listen()
+
+    # ===== Публичный API =====
+
+    def record_wait(self, seconds: float) -> None:
+        """Учесть время получения соединения (из InstrumentedPool.connect)"""
+        self._waits.append(seconds)
+        self.waits += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    async def start(self) -> Optional[asyncio.Task]:
+        """Запустить подбор размера пула (только в адаптивном режиме)"""
+        if not self.adaptive:
+            return None
+        self.pool.target_size = self.capacity
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self) -> None:
+        """Остановить подбор размера пула"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def adapt(self) -> int:
+        """Пересчитать целевой размер по пику занятых соединений за окно"""
+        target = math.ceil(self.window_peak * ADAPTIVE_HEADROOM)
+        target = max(self.min_size, min(self.capacity, target))
+        if target != self.pool.target_size:
+            logger.info(f"Пул {self.name}: целевой размер {self.pool.target_size} -> {target}")
+        self.pool.target_size = target
+        self.window_peak = self.in_use
+        return target
+
+    def get_stats(self) -> dict:
+        """Статистика пула (для мониторинга)"""
+        waits = sorted(self._waits)
+        p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+        return {
+            "size": self.pool.size(),
+            "capacity": self.capacity,
+            "target_size": self.pool.target_size,
+            "checked_out": self.pool.checkedout(),
+            "checked_in": self.pool.checkedin(),
+            "overflow": self.pool.overflow(),
+            "peak_in_use": self.peak_in_use,
+            "checkouts": self.checkouts,
+            "wait_avg_ms": round(self.wait_total / self.waits * 1000, 3) if self.waits else 0.0,
+            "wait_p95_ms": round(p95 * 1000, 3),
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+            "timeouts": self.timeouts,
+            "hold_avg_ms": round(self.hold_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "hold_max_ms": round(self.hold_max * 1000, 3),
+            "connects": self.connects,
+            "closes": self.closes,
+            "invalidations": self.invalidations,
+            "preping_failures": self.preping_failures,
+            "lifetime_avg_s": round(self.lifetime_total / self.closes, 1) if self.closes else 0.0,
+            "lifetime_max_s": round(self.lifetime_max, 1),
+            "trimmed": self.trimmed,
+        }
+
+    # ===== События пула =====
+
+    def _listen(self) -> None:
+        # События на движке переживают пересоздание пула (engine.dispose)
+        target = self.engine.sync_engine
+        event.listen(target, "connect", self._on_connect)
+        event.listen(target, "checkout", self._on_checkout)
+        event.listen(target, "checkin", self._on_checkin)
+        event.listen(target, "close", self._on_close)
+        event.listen(target, "invalidate", self._on_invalidate)
+
+        # Pre-ping не порождает отдельного события - оборачиваем проверку диалекта
+        dialect = self.engine.sync_engine.dialect
+        do_ping = dialect.do_ping
+
+        def counted_ping(dbapi_connection) -> bool:
+            try:
+                return do_ping(dbapi_connection)
+            except Exception:
+                self.preping_failures += 1
+                raise
+
+        dialect.do_ping = counted_ping
+
+    def _on_connect(self, dbapi_connection, record) -> None:
+        record.info["connected_at"] = time.monotonic()
+        self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, record, proxy) -> None:
+        # record_info переживает инвалидацию соединения, info - нет
+        record.record_info["checked_out_at"] = time.monotonic()
+        self.checkouts += 1
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        self.window_peak = max(self.window_peak, self.in_use)
+
+    def _on_checkin(self, dbapi_connection, record) -> None:
+        checked_out_at = record.record_info.pop("checked_out_at", None)
+        if checked_out_at is None:
+            return
+        self.in_use -= 1
+        held = time.monotonic() - checked_out_at
+        self.hold_total += held
+        self.hold_max = max(self.hold_max, held)
+
+    def _on_close(self, dbapi_connection, record) -> None:
+        connected_at = record.info.pop("connected_at", None)
+        if connected_at is None:
+            return
+        self.closes += 1
+        lifetime = time.monotonic() - connected_at
+        self.lifetime_total += lifetime
+        self.lifetime_max = max(self.lifetime_max, lifetime)
+
+    def _on_invalidate(self, dbapi_connection, record, exception) -> None:
+        self.invalidations += 1
+
+    # ===== Внутренняя логика =====
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.adapt_interval)
+            try:
+                self.adapt()
+            except Exception as e:
+                logger.error(f"Ошибка подбора размера пула {self.name}: {e}", exc_info=True)
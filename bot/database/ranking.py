@@ -0,0 +1,170 @@
+"""
+SQL-выражения для оценки совпадений.
+
+Одни и те же правила совпадения используются в поиске (crud), в ленте
+совпадений (services.match_feed) и в Python-проверках:
+- пересечение навыков - сколько навыков из маски встречается в строке
+  навыков (ilike по названию, как в find_users_by_skills)
+- совместимость соло-основателей - звезды из calculate_compatibility
+- активность кандидата - затухание по давности (период полураспада
+  RANKING_HALF_LIFE_DAYS) плюс доля принятых приглашений
+
+Оценка кандидата в поиске: пересечение навыков + активность. Весь
+расчет идет в SQL, в Python приходит только страница ORDER BY score LIMIT k.
+"""
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import case, func, literal, or_, select
+from sqlalchemy.sql import ColumnElement
+from database.models import Invitation, InvitationStatus
+from utils.texts import SKILLS_DESCRIPTIONS
+from utils.skills import SKILL_KEYS, mask_bits
+from config import settings
+
+# Категории идей по ключевым словам (для совместимости соло-основателей)
+IDEA_CATEGORIES = ["образование", "доставка", "финансы", "здоровье", "edtech", "fintech", "healthtech", "foodtech"]
+
+
+def idea_category(idea: Optional[str]) -> Optional[str]:
+    """Категория идеи: последнее из IDEA_CATEGORIES, найденное в тексте"""
+    idea_lower = (idea or "").lower()
+    category = None
+    for keyword in IDEA_CATEGORIES:
+        if keyword in idea_lower:
+            category = keyword
+    return category
+
+
+def idea_category_expr(idea_column) -> ColumnElement:
+    """SQL-аналог idea_category (последнее совпадение = первое в обратном порядке)"""
+    lowered = func.lower(func.coalesce(idea_column, ""))
+    return case(
+        *[(lowered.contains(keyword), keyword) for keyword in reversed(IDEA_CATEGORIES)],
+        else_=None
+    )
+
+
+def skill_overlap_expr(mask: int, *skills_columns) -> ColumnElement:
+    """
+    Количество навыков из mask, найденных хотя бы в одной из колонок.
+
+    Пример: skill_overlap_expr(mask, User.primary_skill, User.additional_skills)
+    """
+    terms = []
+    for index in mask_bits(mask):
+        name = SKILLS_DESCRIPTIONS[SKILL_KEYS[index]]["name"]
+        found = or_(*[column.ilike(f"%{name}%") for column in skills_columns])
+        terms.append(case((found, 1), else_=0))
+
+    if not terms:
+        return literal(0)
+
+    total = terms[0]
+    for term in terms[1:]:
+        total = total + term
+    return total
+
+
+def cofounder_stars_expr(primary_skill: Optional[str], category: Optional[str], user_model) -> ColumnElement:
+    """
+    SQL-аналог calculate_compatibility для фиксированного соло-основателя
+    (primary_skill, category) против колонок user_model.
+    """
+    skill = (primary_skill or "").lower()
+    other_skill = func.lower(func.coalesce(user_model.primary_skill, ""))
+
+    if skill:
+        base = case(
+            ((other_skill != "") & (other_skill != skill), 4),
+            else_=2
+        )
+    else:
+        base = literal(2)
+
+    if category is None:
+        return base
+
+    same_idea = case(
+        (idea_category_expr(user_model.idea_what) == category, 1),
+        else_=0
+    )
+    return base + same_idea
+
+
+def recency_decay(moment: Optional[datetime], now: Optional[datetime] = None) -> float:
+    """Затухание по давности: 1.0 - только что, 0.5 - RANKING_HALF_LIFE_DAYS назад"""
+    if moment is None:
+        return 0.0
+    return decay_by_age(((now or datetime.utcnow()) - moment).total_seconds() / 86400)
+
+
+def decay_by_age(age_days: float) -> float:
+    """recency_decay по возрасту в днях"""
+    return 0.5 ** (max(age_days, 0.0) / settings.RANKING_HALF_LIFE_DAYS)
+
+
+def response_rate(accepted: int, received: int) -> float:
+    """Доля принятых приглашений со сглаживанием (без приглашений - 0.5)"""
+    return (accepted + 1) / (received + 2)
+
+
+def activity_score(moment: Optional[datetime], accepted: int = 0, received: int = 0) -> float:
+    """Активность кандидата (Python-аналог activity_expr)"""
+    return (
+        settings.RANKING_RECENCY_WEIGHT * recency_decay(moment)
+        + settings.RANKING_RESPONSE_WEIGHT * response_rate(accepted, received)
+    )
+
+
+def activity_by_age(age_days: float, accepted: int = 0, received: int = 0) -> float:
+    """activity_score по возрасту в днях (для колонок с epoch)"""
+    return (
+        settings.RANKING_RECENCY_WEIGHT * decay_by_age(age_days)
+        + settings.RANKING_RESPONSE_WEIGHT * response_rate(accepted, received)
+    )
+
+
+def recency_decay_expr(moment_column) -> ColumnElement:
+    """SQL-аналог recency_decay"""
+    age_days = func.greatest(
+        func.extract("epoch", literal(datetime.utcnow()) - moment_column) / 86400.0,
+        0.0
+    )
+    return func.coalesce(func.power(0.5, age_days / settings.RANKING_HALF_LIFE_DAYS), 0.0)
+
+
+def response_rate_expr(user_id_column, since: datetime) -> ColumnElement:
+    """
+    SQL-аналог response_rate по приглашениям, полученным user_id_column.
+
+    Коррелированный подзапрос по индексу to_user_id; граница since
+    отсекает старые секции invitations.
+    """
+    accepted = func.count().filter(Invitation.status == InvitationStatus.ACCEPTED)
+    return (
+        select((accepted + 1.0) / (func.count() + 2.0))
+        .where(
+            Invitation.to_user_id == user_id_column,
+            Invitation.created_at >= since
+        )
+        .scalar_subquery()
+    )
+
+
+def activity_expr(moment_column, user_id_column, since: datetime) -> ColumnElement:
+    """SQL-аналог activity_score"""
+    return (
+        settings.RANKING_RECENCY_WEIGHT * recency_decay_expr(moment_column)
+        + settings.RANKING_RESPONSE_WEIGHT * response_rate_expr(user_id_column, since)
+    )
+
+
+def ranking_score_expr(mask: int, skills_columns, moment_column, user_id_column, since: datetime) -> ColumnElement:
+    """
+    Оценка кандидата: пересечение навыков с mask + активность.
+
+    Пример (соискатели для команды):
+        ranking_score_expr(mask, (User.primary_skill, User.additional_skills),
+                           User.last_active, User.id, since)
+    """
+    return skill_overlap_expr(mask, *skills_columns) + activity_expr(moment_column, user_id_column, since)
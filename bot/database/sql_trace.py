@@ -0,0 +1,171 @@
+"""
+Учет SQL-запросов по обработчикам и поиск N+1.
+
+События движка before_cursor_execute / after_cursor_execute пишут каждый
+запрос в трассу текущего апдейта (contextvar, ее открывает
+middlewares.SqlTraceMiddleware). По трассе считаются:
+- число запросов и суммарное время в БД
+- отпечатки запросов: текст без значений параметров и литералов
+
+Если один отпечаток выполнился в апдейте больше SQL_TRACE_REPEAT_THRESHOLD
+раз - это N+1 (запрос в цикле по результатам другого запроса): пишется
+предупреждение, а в строгом режиме (SQL_TRACE_STRICT, для тестов)
+выбрасывается RepeatedQueryError.
+"""
+import hashlib
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from config import settings
+from utils.metrics import update_db_statements, update_db_time
+
+logger = logging.getLogger(__name__)
+
+# Нормализация текста запроса в отпечаток
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+# Сколько символов запроса показывать в предупреждениях
+SAMPLE_LENGTH = 200
+
+
+class RepeatedQueryError(RuntimeError):
+    """Один и тот же запрос выполнен в апдейте слишком много раз (строгий режим)"""
+
+
+def fingerprint(statement: str) -> Tuple[str, str]:
+    """Отпечаток запроса: (короткий хеш, нормализованный текст)"""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _PLACEHOLDER_LIST.sub("?+", normalized)
+    normalized = _WHITESPACE.sub(" ", normalized).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+
+class SqlTrace:
+    """Запросы одного апдейта"""
+
+    def __init__(self, handler: str):
+        self.handler = handler
+        self.statements = 0
+        self.db_time = 0.0
+        self.counts: Counter = Counter()
+        self.samples: Dict[str, str] = {}
+
+    def record(self, statement: str, elapsed: float) -> None:
+        key, normalized = fingerprint(statement)
+        self.statements += 1
+        self.db_time += elapsed
+        self.counts[key] += 1
+        self.samples.setdefault(key, normalized[:SAMPLE_LENGTH])
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Отпечатки, выполненные больше threshold раз"""
+        return [(key, count) for key, count in self.counts.most_common() if count > threshold]
+
+
+class SqlTracer:
+    """Подписка на события движков и сводка по обработчикам"""
+
+    def __init__(self, repeat_threshold: int = 5, strict: bool = False):
+        """
+        Args:
+            repeat_threshold: Сколько раз отпечаток может повториться в апдейте
+            strict: Выбрасывать RepeatedQueryError вместо предупреждения
+        """
+        self.repeat_threshold = repeat_threshold
+        self.strict = strict
+
+        self._current: ContextVar[Optional[SqlTrace]] = ContextVar("sql_trace", default=None)
+        # handler -> [апдейтов, запросов, время в БД, максимум запросов, N+1]
+        self._handlers: Dict[str, List[float]] = {}
+
+        self.untraced_statements = 0
+
+    # ===== Публичный API =====
+
+    def attach(self, engine: AsyncEngine) -> None:
+        """Подписаться на запросы движка"""
+        target = engine.sync_engine
+        event.listen(target, "before_cursor_execute", self._before_execute)
+        event.listen(target, "after_cursor_execute", self._after_execute)
+
+    def begin(self, handler: str) -> SqlTrace:
+        """Открыть трассу апдейта (вызывается из middleware)"""
+        trace = SqlTrace(handler)
+        trace.token = self._current.set(trace)
+        return trace
+
+    def end(self, trace: SqlTrace) -> None:
+        """
+        Закрыть трассу: учесть в сводке и проверить на N+1.
+
+        Raises:
+            RepeatedQueryError: в строгом режиме при повторяющемся запросе
+        """
+        self._current.reset(trace.token)
+        repeated = trace.repeated(self.repeat_threshold)
+
+        totals = self._handlers.setdefault(trace.handler, [0, 0, 0.0, 0, 0])
+        totals[0] += 1
+        totals[1] += trace.statements
+        totals[2] += trace.db_time
+        totals[3] = max(totals[3], trace.statements)
+        totals[4] += bool(repeated)
+        update_db_time.observe(trace.db_time, trace.handler)
+        update_db_statements.observe(trace.statements, trace.handler)
+
+        if not repeated:
+            return
+        details = "; ".join(
+            f"{count}x [{key}] {trace.samples[key]}" for key, count in repeated
+        )
+        text = (
+            f"Возможный N+1 в {trace.handler}: {trace.statements} запросов, "
+            f"{trace.db_time * 1000:.1f} мс - {details}"
+        )
+        if self.strict:
+            raise RepeatedQueryError(text)
+        logger.warning(text)
+
+    def get_stats(self) -> Dict[str, dict]:
+        """Запросы по обработчикам (для мониторинга)"""
+        return {
+            handler: {
+                "updates": int(updates),
+                "statements_avg": round(statements / updates, 2),
+                "statements_max": int(statements_max),
+                "db_time_avg_ms": round(db_time / updates * 1000, 3),
+                "n_plus_one": int(repeated),
+            }
+            for handler, (updates, statements, db_time, statements_max, repeated) in self._handlers.items()
+        }
+
+    # ===== События движка =====
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if context is not None:
+            context._sql_trace_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        trace = self._current.get()
+        if trace is None:
+            self.untraced_statements += 1
+            return
+        started = getattr(context, "_sql_trace_started", None)
+        elapsed = time.perf_counter() - started if started is not None else 0.0
+        trace.record(statement, elapsed)
+
+
+# Глобальный экземпляр
+sql_tracer = SqlTracer(
+    repeat_threshold=settings.SQL_TRACE_REPEAT_THRESHOLD,
+    strict=settings.SQL_TRACE_STRICT,
+)
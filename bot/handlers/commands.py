@@ -1,8 +1,11 @@
 """Обработчики основных команд бота"""
 from aiogram import Router
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
+from config import settings
+from services.stats import collect_stats, format_stats
+from services.profiler import handler_profiler, MODES as PROFILER_MODES
 
 router = Router()
 
@@ -71,3 +74,63 @@ async def cmd_cancel(message: Message, state: FSMContext):
         "/search - Поиск teammates\n"
         "/profile - Ваш профиль"
     )
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    """Команда /stats - статистика пулов БД, кешей и воркеров (только для администраторов)"""
+    if message.from_user.id not in settings.ADMIN_IDS:
+        return
+
+    await message.answer(format_stats(collect_stats()))
+
+
+PROFILER_USAGE = (
+    "/profiler on [доля] - профилировать долю апдейтов\n"
+    "/profiler off - выключить\n"
+    "/profiler handler <имя> - всегда профилировать обработчик (повторно - убрать)\n"
+    "/profiler user <telegram_id> - всегда профилировать пользователя (повторно - убрать)\n"
+    "/profiler mode sampler|cprofile - режим\n"
+    "/profiler clear - убрать обработчики и пользователей"
+)
+
+
+@router.message(Command("profiler"))
+async def cmd_profiler(message: Message, command: CommandObject):
+    """Команда /profiler - профилирование обработчиков без перезапуска (только для администраторов)"""
+    if message.from_user.id not in settings.ADMIN_IDS:
+        return
+
+    args = (command.args or "").split()
+    action, value = (args + [None, None])[:2]
+    try:
+        if action == "on":
+            handler_profiler.enabled = True
+            if value is not None:
+                handler_profiler.sample_rate = min(max(float(value), 0.0), 1.0)
+        elif action == "off":
+            handler_profiler.enabled = False
+        elif action == "handler" and value:
+            handler_profiler.handlers ^= {value}
+            handler_profiler.enabled = True
+        elif action == "user" and value:
+            handler_profiler.user_ids ^= {int(value)}
+            handler_profiler.enabled = True
+        elif action == "mode" and value in PROFILER_MODES:
+            handler_profiler.mode = value
+        elif action == "clear":
+            handler_profiler.handlers.clear()
+            handler_profiler.user_ids.clear()
+        elif action is not None:
+            await message.answer(PROFILER_USAGE)
+            return
+    except ValueError:
+        await message.answer(PROFILER_USAGE)
+        return
+
+    stats = handler_profiler.get_stats()
+    await message.answer(
+        f"Профилирование: {handler_profiler.describe()}\n"
+        f"Профилей записано: {stats['written']}, пропущено (занято): {stats['skipped_busy']}\n"
+        f"Каталог: {handler_profiler.directory}"
+    )
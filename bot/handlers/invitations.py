@@ -13,6 +13,7 @@ from utils.texts import (
     INVITATION_ACCEPTED_TO_TEAM, INVITATION_ACCEPTED_TO_USER,
     INVITATION_MEET_TO_TEAM, INVITATION_MEET_TO_USER,
     INVITATION_REJECTED_TO_TEAM, INVITATION_REJECTED_TO_USER,
+    INVITATION_ALREADY_PROCESSED,
     BUTTON_SEND_CHECKLIST, MEETING_CHECKLIST
 )
 
@@ -32,8 +33,8 @@ async def cmd_invitations(message: Message):
                 await message.answer("❌ Сначала зарегистрируйтесь с помощью /start")
                 return
 
-            # Получаем приглашения
-            invitations = await crud.get_received_invitations(
+            # Приглашения вместе с отправителями и командами - одним запросом
+            invitations = await crud.get_received_invitations_with_senders(
                 session,
                 user.id,
                 status=InvitationStatus.PENDING
@@ -46,68 +47,64 @@ async def cmd_invitations(message: Message):
             await message.answer(f"📬 У вас {len(invitations)} новых приглашений:")
 
             # Показываем каждое приглашение
-            for invitation in invitations:
-                await show_invitation(message, invitation)
+            shown = []
+            for invitation, from_user, team in invitations:
+                if await show_invitation(message, invitation, from_user, team):
+                    shown.append(invitation.id)
+
+            # Отмечаем показанные как просмотренные
+            await crud.mark_invitations_viewed(session, shown)
 
     except Exception as e:
         logger.error(f"Ошибка при показе приглашений: {e}")
         await message.answer("❌ Произошла ошибка. Попробуйте еще раз.")
 
 
-async def show_invitation(message: Message, invitation):
-    """Показать приглашение"""
+async def show_invitation(message: Message, invitation, from_user, team=None) -> bool:
+    """Показать приглашение (отправитель и команда уже загружены); True - показано"""
     try:
-        async with AsyncSessionLocal() as session:
-            # Получаем команду
-            team = await crud.get_team_by_id(session, invitation.from_team_id) if invitation.from_team_id else None
-            from_user = await crud.get_user_by_id(session, invitation.from_user_id)
-
-            if not from_user:
-                return
-
-            # Формируем текст
-            if team:
-                text = INVITATION_RECEIVED.format(
-                    team_name=team.team_name,
-                    idea=team.idea_description or "Не указано",
-                    needed_skills=team.needed_skills or "Не указано"
+        # Формируем текст
+        if team:
+            text = INVITATION_RECEIVED.format(
+                team_name=team.team_name,
+                idea=team.idea_description or "Не указано",
+                needed_skills=team.needed_skills or "Не указано"
+            )
+        else:
+            text = f"👤 {from_user.name} приглашает вас к сотрудничеству!"
+
+        # Кнопки
+        keyboard = [
+            [
+                InlineKeyboardButton(
+                    text=BUTTON_ACCEPT_INVITE,
+                    callback_data=f"accept_invite_{invitation.id}"
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    text=BUTTON_MEET,
+                    callback_data=f"meet_invite_{invitation.id}"
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    text=BUTTON_REJECT_INVITE,
+                    callback_data=f"reject_invite_{invitation.id}"
                 )
-            else:
-                text = f"👤 {from_user.name} приглашает вас к сотрудничеству!"
-
-            # Кнопки
-            keyboard = [
-                [
-                    InlineKeyboardButton(
-                        text=BUTTON_ACCEPT_INVITE,
-                        callback_data=f"accept_invite_{invitation.id}"
-                    )
-                ],
-                [
-                    InlineKeyboardButton(
-                        text=BUTTON_MEET,
-                        callback_data=f"meet_invite_{invitation.id}"
-                    )
-                ],
-                [
-                    InlineKeyboardButton(
-                        text=BUTTON_REJECT_INVITE,
-                        callback_data=f"reject_invite_{invitation.id}"
-                    )
-                ]
             ]
+        ]
 
-            await message.answer(
-                text,
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
-                parse_mode="HTML"
-            )
-
-            # Отмечаем как просмотренное
-            await crud.mark_invitation_viewed(session, invitation.id)
+        await message.answer(
+            text,
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+            parse_mode="HTML"
+        )
+        return True
 
     except Exception as e:
         logger.error(f"Ошибка при показе приглашения: {e}")
+        return False
 
 
 @router.callback_query(F.data.startswith("accept_invite_"))
@@ -117,64 +114,58 @@ async def accept_invitation(callback: CallbackQuery, bot: Bot):
 
     try:
         async with AsyncSessionLocal() as session:
-            invitation = await crud.get_invitation_by_id(session, invitation_id)
-
-            if not invitation:
-                await callback.answer("❌ Приглашение не найдено", show_alert=True)
-                return
+            # Смена статуса и все данные для уведомлений - одним запросом
+            transition = await crud.transition_invitation(
+                session,
+                invitation_id,
+                InvitationStatus.ACCEPTED,
+                to_telegram_id=callback.from_user.id
+            )
 
-            # Получаем всю необходимую информацию
-            from_user = await crud.get_user_by_id(session, invitation.from_user_id)
-            to_user = await crud.get_user_by_id(session, invitation.to_user_id)
-            team = await crud.get_team_by_id(session, invitation.from_team_id) if invitation.from_team_id else None
+        if not transition:
+            await callback.answer(INVITATION_ALREADY_PROCESSED, show_alert=True)
+            return
 
-            if not from_user or not to_user:
-                await callback.answer("❌ Ошибка получения данных", show_alert=True)
-                return
+        # Отправляем уведомление соискателю (текущий пользователь)
+        if transition['from_username']:
+            user_text = INVITATION_ACCEPTED_TO_USER.format(
+                team_name=transition['team_name'] or transition['from_name'],
+                leader_username=transition['from_username']
+            )
+        else:
+            user_text = f"✅ Ты принял приглашение!\n\nК сожалению, у лидера команды нет username в Telegram."
 
-            # Обновляем статус
-            await crud.update_invitation_status(session, invitation_id, InvitationStatus.ACCEPTED)
+        await callback.message.edit_text(user_text, parse_mode="HTML")
 
-            # Отправляем уведомление соискателю (текущий пользователь)
-            if from_user.username:
-                user_text = INVITATION_ACCEPTED_TO_USER.format(
-                    team_name=team.team_name if team else from_user.name,
-                    leader_username=from_user.username
+        # Отправляем уведомление команде
+        try:
+            if transition['to_username']:
+                team_text = INVITATION_ACCEPTED_TO_TEAM.format(
+                    name=transition['to_name'],
+                    username=transition['to_username']
                 )
             else:
-                user_text = f"✅ Ты принял приглашение!\n\nК сожалению, у лидера команды нет username в Telegram."
-
-            await callback.message.edit_text(user_text, parse_mode="HTML")
-
-            # Отправляем уведомление команде
-            try:
-                if to_user.username:
-                    team_text = INVITATION_ACCEPTED_TO_TEAM.format(
-                        name=to_user.name,
-                        username=to_user.username
-                    )
-                else:
-                    team_text = f"🎉 {to_user.name} принял приглашение!\n\nК сожалению, у него нет username в Telegram."
-
-                # Добавляем кнопку для отправки чеклиста
-                keyboard = [
-                    [InlineKeyboardButton(
-                        text=BUTTON_SEND_CHECKLIST,
-                        callback_data=f"send_checklist_{to_user.telegram_id}"
-                    )]
-                ]
-
-                await bot.send_message(
-                    from_user.telegram_id,
-                    team_text,
-                    reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
-                )
-                logger.info(f"Уведомление о принятии отправлено команде {from_user.telegram_id}")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомления команде: {e}")
+                team_text = f"🎉 {transition['to_name']} принял приглашение!\n\nК сожалению, у него нет username в Telegram."
 
-            await callback.answer("✅ Приглашение принято!")
-            logger.info(f"Приглашение {invitation_id} принято")
+            # Добавляем кнопку для отправки чеклиста
+            keyboard = [
+                [InlineKeyboardButton(
+                    text=BUTTON_SEND_CHECKLIST,
+                    callback_data=f"send_checklist_{transition['to_telegram_id']}"
+                )]
+            ]
+
+            await bot.send_message(
+                transition['from_telegram_id'],
+                team_text,
+                reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+            )
+            logger.info(f"Уведомление о принятии отправлено команде {transition['from_telegram_id']}")
+        except Exception as e:
+            logger.error(f"Ошибка при отправке уведомления команде: {e}")
+
+        await callback.answer("✅ Приглашение принято!")
+        logger.info(f"Приглашение {invitation_id} принято")
 
     except Exception as e:
         logger.error(f"Ошибка при принятии приглашения: {e}")
@@ -188,55 +179,49 @@ async def meet_invitation(callback: CallbackQuery, bot: Bot):
 
     try:
         async with AsyncSessionLocal() as session:
-            invitation = await crud.get_invitation_by_id(session, invitation_id)
-
-            if not invitation:
-                await callback.answer("❌ Приглашение не найдено", show_alert=True)
-                return
+            # Статус тоже ACCEPTED
+            transition = await crud.transition_invitation(
+                session,
+                invitation_id,
+                InvitationStatus.ACCEPTED,
+                to_telegram_id=callback.from_user.id
+            )
 
-            # Получаем всю необходимую информацию
-            from_user = await crud.get_user_by_id(session, invitation.from_user_id)
-            to_user = await crud.get_user_by_id(session, invitation.to_user_id)
-            team = await crud.get_team_by_id(session, invitation.from_team_id) if invitation.from_team_id else None
+        if not transition:
+            await callback.answer(INVITATION_ALREADY_PROCESSED, show_alert=True)
+            return
 
-            if not from_user or not to_user:
-                await callback.answer("❌ Ошибка получения данных", show_alert=True)
-                return
+        # Отправляем уведомление соискателю (текущий пользователь)
+        if transition['from_username']:
+            user_text = INVITATION_MEET_TO_USER.format(
+                team_name=transition['team_name'] or transition['from_name'],
+                leader_username=transition['from_username']
+            )
+        else:
+            user_text = f"📅 Отлично!\n\nК сожалению, у лидера команды нет username в Telegram."
 
-            # Обновляем статус (тоже ACCEPTED)
-            await crud.update_invitation_status(session, invitation_id, InvitationStatus.ACCEPTED)
+        await callback.message.edit_text(user_text, parse_mode="HTML")
 
-            # Отправляем уведомление соискателю (текущий пользователь)
-            if from_user.username:
-                user_text = INVITATION_MEET_TO_USER.format(
-                    team_name=team.team_name if team else from_user.name,
-                    leader_username=from_user.username
+        # Отправляем уведомление команде
+        try:
+            if transition['to_username']:
+                team_text = INVITATION_MEET_TO_TEAM.format(
+                    name=transition['to_name'],
+                    username=transition['to_username']
                 )
             else:
-                user_text = f"📅 Отлично!\n\nК сожалению, у лидера команды нет username в Telegram."
-
-            await callback.message.edit_text(user_text, parse_mode="HTML")
-
-            # Отправляем уведомление команде
-            try:
-                if to_user.username:
-                    team_text = INVITATION_MEET_TO_TEAM.format(
-                        name=to_user.name,
-                        username=to_user.username
-                    )
-                else:
-                    team_text = f"📅 {to_user.name} хочет встретиться!\n\nК сожалению, у него нет username в Telegram."
-
-                await bot.send_message(
-                    from_user.telegram_id,
-                    team_text
-                )
-                logger.info(f"Уведомление о встрече отправлено команде {from_user.telegram_id}")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомления команде: {e}")
+                team_text = f"📅 {transition['to_name']} хочет встретиться!\n\nК сожалению, у него нет username в Telegram."
 
-            await callback.answer("📅 Договоритесь о встрече!")
-            logger.info(f"Приглашение {invitation_id} принято (встреча)")
+            await bot.send_message(
+                transition['from_telegram_id'],
+                team_text
+            )
+            logger.info(f"Уведомление о встрече отправлено команде {transition['from_telegram_id']}")
+        except Exception as e:
+            logger.error(f"Ошибка при отправке уведомления команде: {e}")
+
+        await callback.answer("📅 Договоритесь о встрече!")
+        logger.info(f"Приглашение {invitation_id} принято (встреча)")
 
     except Exception as e:
         logger.error(f"Ошибка при принятии приглашения на встречу: {e}")
@@ -250,39 +235,33 @@ async def reject_invitation(callback: CallbackQuery, bot: Bot):
 
     try:
         async with AsyncSessionLocal() as session:
-            invitation = await crud.get_invitation_by_id(session, invitation_id)
-
-            if not invitation:
-                await callback.answer("❌ Приглашение не найдено", show_alert=True)
-                return
-
-            # Получаем информацию о пользователях
-            from_user = await crud.get_user_by_id(session, invitation.from_user_id)
-            to_user = await crud.get_user_by_id(session, invitation.to_user_id)
-
-            if not from_user or not to_user:
-                await callback.answer("❌ Ошибка получения данных", show_alert=True)
-                return
+            transition = await crud.transition_invitation(
+                session,
+                invitation_id,
+                InvitationStatus.REJECTED,
+                to_telegram_id=callback.from_user.id
+            )
 
-            # Обновляем статус
-            await crud.update_invitation_status(session, invitation_id, InvitationStatus.REJECTED)
+        if not transition:
+            await callback.answer(INVITATION_ALREADY_PROCESSED, show_alert=True)
+            return
 
-            # Отправляем уведомление соискателю (текущий пользователь)
-            await callback.message.edit_text(INVITATION_REJECTED_TO_USER)
+        # Отправляем уведомление соискателю (текущий пользователь)
+        await callback.message.edit_text(INVITATION_REJECTED_TO_USER)
 
-            # Отправляем уведомление команде
-            try:
-                team_text = INVITATION_REJECTED_TO_TEAM.format(name=to_user.name)
-                await bot.send_message(
-                    from_user.telegram_id,
-                    team_text
-                )
-                logger.info(f"Уведомление об отклонении отправлено команде {from_user.telegram_id}")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомления команде: {e}")
+        # Отправляем уведомление команде
+        try:
+            team_text = INVITATION_REJECTED_TO_TEAM.format(name=transition['to_name'])
+            await bot.send_message(
+                transition['from_telegram_id'],
+                team_text
+            )
+            logger.info(f"Уведомление об отклонении отправлено команде {transition['from_telegram_id']}")
+        except Exception as e:
+            logger.error(f"Ошибка при отправке уведомления команде: {e}")
 
-            await callback.answer("Приглашение отклонено")
-            logger.info(f"Приглашение {invitation_id} отклонено")
+        await callback.answer("Приглашение отклонено")
+        logger.info(f"Приглашение {invitation_id} отклонено")
 
     except Exception as e:
         logger.error(f"Ошибка при отклонении приглашения: {e}")
@@ -8,6 +8,7 @@ from datetime import datetime
 from database.db import AsyncSessionLocal
 from database import crud
 from database.models import UserType
+from config import settings
 from keyboards.inline import (
     get_cofounder_search_keyboard, get_participant_team_keyboard,
     get_search_empty_keyboard
@@ -24,13 +25,15 @@ from utils.texts import (
     format_stars, get_compatibility_text, get_match_reason,
     # Для соискателей
     PARTICIPANT_TEAM_CARD, PARTICIPANT_SEARCH_EMPTY, PARTICIPANT_SEARCH_EMPTY_NO_TEAMS,
-    TEAM_INTEREST_SENT, TEAM_INTEREST_RECEIVED
+    TEAM_INTEREST_SENT, TEAM_INTEREST_RECEIVED,
+    SEARCH_ALL_SEEN
 )
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 MAX_INVITATIONS_PER_DAY = 5
+SEARCH_PAGE_SIZE = 10  # Карточек соискателей за один /search
 
 # Временное хранилище для результатов поиска (в продакшене использовать Redis или FSM)
 search_results_cache = {}
@@ -84,12 +87,23 @@ async def search_for_team(message: Message, user, session):
         )
         return
 
-    # Ищем пользователей
-    found_users = await crud.find_users_by_skills(
-        session,
-        team.needed_skills,
-        exclude_user_id=user.id
+    # Тех, кого уже пригласили, отбрасываем при отборе кандидатов.
+    # Готовая страница из ленты совпадений; пока лента не построена
+    # или в ней не осталось непросмотренных - живой поиск
+    seen = await crud.seen_check(session, user.id, UserType.PARTICIPANT)
+    feed = await crud.get_feed_users(
+        session, user.id, UserType.PARTICIPANT, limit=settings.MATCH_FEED_SIZE, seen=seen
     )
+    if feed:
+        found_users = [found_user for found_user, _ in feed]
+    else:
+        found_users = await crud.find_participants_for_team(session, team, exclude_user_id=user.id, seen=seen)
+    # Всего подходящих - независимо от того, кто отдал страницу (лента или живой поиск)
+    total_found = await crud.count_matching_users(session, team.needed_skills, len(found_users))
+
+    if seen.hidden and not found_users:
+        await message.answer(SEARCH_ALL_SEEN)
+        return
 
     if not found_users:
         keyboard = [
@@ -104,13 +118,13 @@ async def search_for_team(message: Message, user, session):
 
     # Показываем результаты
     header = SEARCH_RESULTS_HEADER.format(
-        count=len(found_users),
+        count=total_found,
         skills=team.needed_skills
     )
     await message.answer(header)
 
     # Показываем каждого пользователя
-    for found_user in found_users[:10]:
+    for found_user in found_users[:SEARCH_PAGE_SIZE]:
         await send_user_card(message, found_user, team.id)
 
 
@@ -147,8 +161,22 @@ async def send_user_card(message: Message, user, team_id: int):
 
 async def search_for_cofounder(message: Message, user, session):
     """Поиск других соло-основателей для коллаборации"""
-    # Ищем других соло-основателей с расчетом совместимости
-    cofounders_with_stars = await crud.find_cofounders(session, user.id)
+    # Ищем других соло-основателей с расчетом совместимости (сначала в ленте),
+    # пропущенных ранее отбрасываем при отборе
+    seen = await crud.seen_check(session, user.id, UserType.COFOUNDER)
+    feed = await crud.get_feed_users(
+        session, user.id, UserType.COFOUNDER, limit=settings.MATCH_FEED_SIZE, seen=seen
+    )
+    if feed:
+        cofounders_with_stars = [(cofounder, int(score)) for cofounder, score in feed]
+    else:
+        cofounders_with_stars = await crud.find_cofounders(
+            session, user.id, limit=settings.MATCH_FEED_SIZE, seen=seen
+        )
+
+    if seen.hidden and not cofounders_with_stars:
+        await message.answer(SEARCH_ALL_SEEN, reply_markup=get_search_empty_keyboard())
+        return
 
     if not cofounders_with_stars:
         await message.answer(
@@ -205,8 +233,20 @@ async def show_cofounder_card(message: Message, current_user, results: list, ind
 
 async def search_for_participant(message: Message, user, session):
     """Поиск команд для соискателя (Tinder-style)"""
-    # Ищем команды, которым нужны навыки соискателя
-    matching_teams = await crud.find_teams_for_participant(session, user.id)
+    # Ищем команды, которым нужны навыки соискателя (сначала в ленте),
+    # пропущенные ранее команды отбрасываем при отборе
+    seen = await crud.seen_check(session, user.id, UserType.TEAM)
+    feed = await crud.get_feed_teams(session, user.id, limit=settings.MATCH_FEED_SIZE, seen=seen)
+    if feed:
+        matching_teams = [team for team, _ in feed]
+    else:
+        matching_teams = await crud.find_teams_for_participant(
+            session, user.id, limit=settings.MATCH_FEED_SIZE, seen=seen
+        )
+
+    if seen.hidden and not matching_teams:
+        await message.answer(SEARCH_ALL_SEEN, reply_markup=get_search_empty_keyboard())
+        return
 
     if not matching_teams:
         # Считаем сколько команд ищут основной навык
@@ -340,6 +380,7 @@ async def send_invitation(callback: CallbackQuery):
                 to_user_id=to_user.id,
                 from_team_id=team_id
             )
+            await crud.mark_seen(session, from_user.id, UserType.PARTICIPANT, to_user.id)
 
             logger.info(f"Создано приглашение: {invitation.id} от {from_user.id} к {to_user.id}")
 
@@ -393,6 +434,7 @@ async def send_collaboration_request(callback: CallbackQuery, bot: Bot):
                 to_user_id=to_user.id,
                 from_team_id=None
             )
+            await crud.mark_seen(session, from_user.id, UserType.COFOUNDER, to_user.id)
 
             # Уведомляем отправителя
             await callback.message.answer(
@@ -442,6 +484,10 @@ async def next_cofounder(callback: CallbackQuery):
                 await callback.answer("❌ Результаты поиска устарели. Начните поиск заново: /search", show_alert=True)
                 return
 
+            # Текущего кандидата пропустили - больше не показываем
+            if current_index < len(results):
+                await crud.mark_seen(session, from_user.id, UserType.COFOUNDER, results[current_index][0].id)
+
             # Удаляем предыдущее сообщение
             try:
                 await callback.message.delete()
@@ -546,6 +592,10 @@ async def show_next_team(callback: CallbackQuery, current_index: int):
                 await callback.message.answer("❌ Результаты поиска устарели. Начните поиск заново: /search")
                 return
 
+            # Текущую команду пропустили или отправили заявку - больше не показываем
+            if current_index < len(teams):
+                await crud.mark_seen(session, from_user.id, UserType.TEAM, teams[current_index].id)
+
             # Удаляем предыдущее сообщение
             try:
                 await callback.message.delete()
@@ -193,7 +193,7 @@ async def finish_team_skills_selection(callback: CallbackQuery, state: FSMContex
             logger.info(f"Создана команда: {team.id} ({team.team_name})")
 
             # Проверяем холодный старт
-            total_users = await crud.count_users(session)
+            total_users = await crud.count_users_cached(session)
 
         # Формируем финальное сообщение
         final_message = TEAM_REGISTRATION_COMPLETE.format(team_name=team_name)
@@ -357,7 +357,7 @@ async def finish_cofounder_registration(message: Message, user_data, state: FSMC
             logger.info(f"Создан со-фаундер: {user.id} ({user.name})")
 
             # Проверяем холодный старт
-            total_users = await crud.count_users(session)
+            total_users = await crud.count_users_cached(session)
 
         # Формируем финальное сообщение
         final_message = COFOUNDER_REGISTRATION_COMPLETE.format(name=name)
@@ -474,7 +474,7 @@ async def finish_seeker_skills_selection(callback: CallbackQuery, state: FSMCont
             logger.info(f"Создан соискатель: {user.id} ({user.name})")
 
             # Проверяем холодный старт
-            total_users = await crud.count_users(session)
+            total_users = await crud.count_users_cached(session)
 
         # Формируем финальное сообщение
         final_message = SEEKER_REGISTRATION_COMPLETE.format(name=name)
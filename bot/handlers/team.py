@@ -45,8 +45,8 @@ async def cmd_team(message: Message):
             await message.answer("❌ Ошибка получения статистики команды")
             return
 
-        # Подсчитываем просмотры (количество отправленных приглашений как прокси)
-        views_count = len(team_stats['sent_invitations'])
+        # Подсчитываем просмотры (количество отправленных приглашений за все время как прокси)
+        views_count = team_stats['sent_count']
 
         # Основной текст статистики
         stats_text = TEAM_STATS.format(
@@ -2,43 +2,55 @@ import asyncio
 import logging
 import signal
 import sys
-from pathlib import Path
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.base import BaseSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
 from aiogram.fsm.storage.memory import MemoryStorage
 from config import settings
-from database.db import init_db, close_db, create_tables
-from middlewares import ThrottlingMiddleware
+from database.db import init_db, close_db, create_tables, change_listener, replicas, start_pool_monitors
+from middlewares import (
+    ThrottlingMiddleware, ActivityMiddleware, SqlTraceMiddleware, MetricsMiddleware, TelegramRequestMetrics,
+    UpdateRecordMiddleware, ProfilingMiddleware
+)
+from database.sql_trace import sql_tracer
 from tasks import start_background_tasks, stop_background_tasks
+from services.invitation_expiry import invitation_expiry
+from services.user_counter import user_counter
+from services.skill_histogram import skill_histogram
+from services.affinity import affinity
+from services.match_feed import match_feed
+from services.seen_filter import seen_filters
+from services.profile_snapshot import profile_snapshot
+from services.loop_monitor import loop_monitor
+from services.update_recorder import update_recorder
+from services.profiler import handler_profiler
 from handlers.start import router as start_router
 from handlers.search import router as search_router
 from handlers.invitations import router as invitations_router
 from handlers.profile import router as profile_router
 from handlers.team import router as team_router
 from handlers.commands import router as commands_router
+from utils.metrics import registry
+from utils.log_pipeline import log_pipeline
 
 
 # ===== Настройка логирования =====
 def setup_logging():
-    """Настройка логирования с поддержкой файлов"""
-    log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-
-    # Базовая конфигурация (консоль)
-    logging.basicConfig(
-        level=getattr(logging, settings.LOG_LEVEL),
-        format=log_format,
-        handlers=[logging.StreamHandler(sys.stdout)]
+    """Настройка логирования: запись в консоль и файл в фоновом потоке"""
+    log_pipeline.start(
+        level=settings.LOG_LEVEL,
+        log_file=settings.LOG_FILE_PATH if settings.LOG_TO_FILE else None,
+        as_json=settings.LOG_JSON,
+        queue_size=settings.LOG_QUEUE_SIZE,
+        burst=settings.LOG_RATE_LIMIT_BURST,
+        window=settings.LOG_RATE_LIMIT_WINDOW_SECONDS,
+        sample_rate=settings.LOG_SAMPLE_RATE,
     )
 
-    # Опционально: логирование в файл
     if settings.LOG_TO_FILE:
-        log_file = Path(settings.LOG_FILE_PATH)
-        log_file.parent.mkdir(parents=True, exist_ok=True)
-
-        file_handler = logging.FileHandler(log_file, encoding='utf-8')
-        file_handler.setFormatter(logging.Formatter(log_format))
-        logging.getLogger().addHandler(file_handler)
-
-        logger.info(f"Логирование в файл: {log_file}")
+        logger.info(f"Логирование в файл: {settings.LOG_FILE_PATH}")
 
 
 logger = logging.getLogger(__name__)
@@ -52,15 +64,30 @@ class BotApplication:
         self.bot: Bot | None = None
         self.dp: Dispatcher | None = None
         self.background_task: asyncio.Task | None = None
+        self.metrics_runner: web.AppRunner | None = None
         self.is_shutting_down = False
 
-    async def startup(self):
-        """Инициализация всех компонентов при старте"""
+    async def startup(self, session: BaseSession | None = None):
+        """
+        Инициализация всех компонентов при старте
+
+        Args:
+            session: HTTP-сессия бота (None - aiohttp к TELEGRAM_API_URL или api.telegram.org);
+                нагрузочные тесты подставляют сессию без сети
+        """
         logger.info("🚀 Запуск бота...")
 
+        # Задержка и зависания event loop (с самого старта - загрузка кешей тоже)
+        if settings.LOOP_MONITOR_ENABLED:
+            await loop_monitor.start()
+
         # 1. Инициализация базы данных
         logger.info("Подключение к базе данных...")
         await init_db()
+        # Контроль отставания реплик чтения (если заданы)
+        await replicas.start()
+        # Адаптивный размер пулов соединений (DB_POOL_ADAPTIVE)
+        await start_pool_monitors()
 
         # 2. Создание таблиц (если их нет)
         logger.info("Проверка таблиц в базе данных...")
@@ -70,33 +97,104 @@ class BotApplication:
             logger.error(f"Ошибка при создании таблиц: {e}")
             raise
 
-        # 3. Инициализация бота и диспетчера
-        self.bot = Bot(token=settings.BOT_TOKEN)
-        self.dp = Dispatcher(storage=MemoryStorage())
+        # 3-5. Бот, диспетчер, middleware и обработчики
+        self.bot = self.create_bot(session)
+        self.dp = self.create_dispatcher()
+
+        # 6. Запуск фоновых задач
+        logger.info("Запуск фоновых задач очистки...")
+        self.background_task = start_background_tasks()
+
+        # 7. Слушатель межинстансной инвалидации кешей (LISTEN/NOTIFY).
+        # Запускается до загрузки кешей, чтобы не потерять изменения между ними
+        if settings.INVALIDATION_ENABLED:
+            await change_listener.start()
+
+        # 8. Планировщик истечения приглашений
+        logger.info("Запуск планировщика истечения приглашений...")
+        await invitation_expiry.start(self.bot)
+
+        # 9. Счетчик пользователей для проверки холодного старта
+        await user_counter.start()
+
+        # 10. Гистограмма навыков (спрос команд / предложение соискателей)
+        await skill_histogram.start()
+
+        # 11. Матрица совместимости команд и соискателей
+        await affinity.start()
+
+        # 12. Воркер предрассчитанных лент совпадений для /search
+        await match_feed.start()
+
+        # 13. Фильтры просмотренных кандидатов (отложенная запись в БД)
+        await seen_filters.start()
+
+        # 14. Колоночный снимок профилей для поиска
+        await profile_snapshot.start()
+
+        # 15. Запись апдейтов для воспроизведения
+        if settings.UPDATE_RECORD_ENABLED:
+            await update_recorder.start()
+
+        # 16. Профилировщик обработчиков (поток-сэмплер спит, пока выключен)
+        await handler_profiler.start()
+
+        # 17. Эндпоинт /metrics для Prometheus
+        if settings.METRICS_ENABLED:
+            await self.start_metrics_server()
+
+        logger.info("✅ Бот успешно запущен и готов к работе")
+
+    def create_bot(self, session: BaseSession | None = None) -> Bot:
+        """Бот с замером исходящих вызовов Bot API"""
+        if session is None and settings.TELEGRAM_API_URL:
+            # Свой сервер Bot API (например, bench.fake_api для сквозных тестов)
+            session = AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_URL))
+            logger.info(f"Bot API: {settings.TELEGRAM_API_URL}")
+        bot = Bot(token=settings.BOT_TOKEN, session=session)
+        # Длительность исходящих вызовов Bot API
+        bot.session.middleware(TelegramRequestMetrics())
+        return bot
+
+    def create_dispatcher(self) -> Dispatcher:
+        """Диспетчер со всеми middleware и роутерами"""
+        dp = Dispatcher(storage=MemoryStorage())
 
         # 4. Регистрация middleware
         logger.info("Регистрация middleware...")
-        self.dp.message.middleware(
+        if settings.UPDATE_RECORD_ENABLED:
+            # Запись апдейтов для bench.replay - до фильтров и троттлинга
+            dp.update.outer_middleware(UpdateRecordMiddleware(update_recorder))
+        dp.message.middleware(
             ThrottlingMiddleware(
                 rate_limit=settings.RATE_LIMIT_REQUESTS_PER_MINUTE,
                 time_window=60
             )
         )
+        # last_active и возвращение в поиск после неактивности
+        activity = ActivityMiddleware(interval=settings.ACTIVITY_TOUCH_INTERVAL_SECONDS)
+        dp.message.middleware(activity)
+        dp.callback_query.middleware(activity)
+        if settings.SQL_TRACE_ENABLED:
+            # Запросы к БД по обработчикам, предупреждения о N+1
+            dp.message.middleware(SqlTraceMiddleware(sql_tracer))
+            dp.callback_query.middleware(SqlTraceMiddleware(sql_tracer))
+        # Гистограммы длительности обработчиков
+        dp.message.middleware(MetricsMiddleware())
+        dp.callback_query.middleware(MetricsMiddleware())
+        # Профилирование выбранных апдейтов (включается и /profiler)
+        dp.message.middleware(ProfilingMiddleware(handler_profiler))
+        dp.callback_query.middleware(ProfilingMiddleware(handler_profiler))
 
         # 5. Регистрация роутеров (handlers)
         logger.info("Регистрация обработчиков...")
-        self.dp.include_router(commands_router)  # /help, /cancel первыми
-        self.dp.include_router(start_router)
-        self.dp.include_router(search_router)
-        self.dp.include_router(invitations_router)
-        self.dp.include_router(profile_router)
-        self.dp.include_router(team_router)
-
-        # 6. Запуск фоновых задач
-        logger.info("Запуск фоновых задач очистки...")
-        self.background_task = start_background_tasks()
-
-        logger.info("✅ Бот успешно запущен и готов к работе")
+        dp.include_router(commands_router)  # /help, /cancel первыми
+        dp.include_router(start_router)
+        dp.include_router(search_router)
+        dp.include_router(invitations_router)
+        dp.include_router(profile_router)
+        dp.include_router(team_router)
+        return dp
 
     async def shutdown(self):
         """Graceful shutdown всех компонентов"""
@@ -106,11 +204,29 @@ class BotApplication:
         self.is_shutting_down = True
         logger.info("🛑 Получен сигнал остановки. Graceful shutdown...")
 
+        # Эндпоинт метрик
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
+
         # 1. Остановка фоновых задач
         if self.background_task:
             logger.info("Остановка фоновых задач...")
             await stop_background_tasks(self.background_task)
 
+        # Слушатель инвалидации и планировщик истечения приглашений
+        await change_listener.stop()
+        await replicas.stop()
+        await invitation_expiry.stop()
+        await user_counter.stop()
+        await skill_histogram.stop()
+        await affinity.stop()
+        await match_feed.stop()
+        await seen_filters.stop()
+        await profile_snapshot.stop()
+        await update_recorder.stop()
+        await handler_profiler.stop()
+        await loop_monitor.stop()
+
         # 2. Закрытие бота
         if self.bot:
             logger.info("Закрытие соединений бота...")
@@ -122,6 +238,18 @@ class BotApplication:
 
         logger.info("✅ Бот успешно остановлен")
 
+    async def start_metrics_server(self):
+        """Небольшой aiohttp-сервер: GET /metrics в формате Prometheus"""
+        async def metrics(request: web.Request) -> web.Response:
+            return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", metrics)
+        self.metrics_runner = web.AppRunner(app, access_log=None)
+        await self.metrics_runner.setup()
+        await web.TCPSite(self.metrics_runner, settings.METRICS_HOST, settings.METRICS_PORT).start()
+        logger.info(f"Метрики доступны на http://{settings.METRICS_HOST}:{settings.METRICS_PORT}/metrics")
+
     async def run(self):
         """Главный цикл работы бота"""
         try:
@@ -162,7 +290,11 @@ async def main():
             lambda s=sig: asyncio.create_task(handle_signal(app, s))
         )
 
-    await app.run()
+    try:
+        await app.run()
+    finally:
+        # Дописать очередь логов до выхода
+        log_pipeline.stop()
 
 
 if __name__ == "__main__":
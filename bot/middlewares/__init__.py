@@ -1,4 +1,10 @@
 """Middlewares 4;O Telegram 1>B0"""
 from .throttling import ThrottlingMiddleware
+from .activity import ActivityMiddleware
+from .sql_trace import SqlTraceMiddleware
+from .metrics import MetricsMiddleware, TelegramRequestMetrics
+from .recorder import UpdateRecordMiddleware
+from .profiling import ProfilingMiddleware
 
-__all__ = ["ThrottlingMiddleware"]
+__all__ = ["ThrottlingMiddleware", "ActivityMiddleware", "SqlTraceMiddleware", "MetricsMiddleware",
+           "TelegramRequestMetrics", "UpdateRecordMiddleware", "ProfilingMiddleware"]
@@ -0,0 +1,63 @@
+"""
+Middleware активности пользователей.
+
+Обновляет users.last_active и возвращает в поиск тех, кого фоновая
+очистка сняла за неактивность (crud.record_user_activity). Запись
+выполняется не чаще раза в interval секунд на пользователя - остальные
+апдейты проходят без обращения к БД.
+"""
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from cachetools import TTLCache
+import logging
+from database import crud
+from database.db import get_db
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """Отметка активности пользователя перед обработчиком"""
+
+    def __init__(self, interval: int = 300):
+        """
+        Args:
+            interval: Минимальный интервал между записями для одного пользователя (секунды)
+        """
+        super().__init__()
+        self.interval = interval
+        # telegram_id пользователей, чья активность уже записана в этом окне
+        self.touched: TTLCache = TTLCache(maxsize=100000, ttl=interval)
+        self.writes = 0
+        self.reactivated = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and user.id not in self.touched:
+            self.touched[user.id] = True
+            try:
+                async with get_db() as session:
+                    if await crud.record_user_activity(session, user.id):
+                        self.reactivated += 1
+                self.writes += 1
+            except Exception as e:
+                # Отметка активности не должна мешать обработчику
+                self.touched.pop(user.id, None)
+                logger.error(f"Не удалось записать активность пользователя {user.id}: {e}")
+
+        return await handler(event, data)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Получить статистику записей (для мониторинга)"""
+        return {
+            "interval": self.interval,
+            "cached_users": len(self.touched),
+            "writes": self.writes,
+            "reactivated": self.reactivated,
+        }
@@ -0,0 +1,60 @@
+"""
+Middleware метрик: задержка обработчиков и исходящих вызовов Telegram API.
+
+- MetricsMiddleware - внутренний middleware (dp.message, dp.callback_query):
+  гистограмма длительности по роутеру (модулю handlers.*) и обработчику
+- TelegramRequestMetrics - middleware сессии бота: длительность и ошибки
+  каждого вызова Bot API по методу (SendMessage, AnswerCallbackQuery, ...)
+"""
+import time
+from typing import Callable, Dict, Any, Awaitable, Tuple
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+from utils.metrics import handler_latency, telegram_request_latency, telegram_request_errors
+
+
+def handler_labels(event: TelegramObject, data: Dict[str, Any]) -> Tuple[str, str]:
+    """(роутер, обработчик) выбранного фильтрами обработчика"""
+    callback = getattr(data.get("handler"), "callback", None)
+    if callback is None:
+        return "unknown", type(event).__name__
+    return callback.__module__, callback.__qualname__
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Гистограмма длительности обработчиков"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_latency.observe(time.perf_counter() - started, *handler_labels(event, data))
+
+
+class TelegramRequestMetrics(BaseRequestMiddleware):
+    """Длительность и ошибки исходящих вызовов Bot API"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            telegram_request_errors.inc(name)
+            raise
+        finally:
+            telegram_request_latency.observe(time.perf_counter() - started, name)
@@ -0,0 +1,34 @@
+"""
+Middleware профилирования обработчиков (services.profiler).
+
+Внутренний middleware (dp.message, dp.callback_query): обработчик уже
+выбран фильтрами, поэтому апдейты можно отбирать по его имени. Пока
+профилирование выключено, стоит одну проверку флага.
+"""
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from middlewares.metrics import handler_labels
+from services.profiler import HandlerProfiler
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """Запускает выбранные апдейты под профилировщиком"""
+
+    def __init__(self, profiler: HandlerProfiler):
+        self.profiler = profiler
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not self.profiler.enabled:
+            return await handler(event, data)
+
+        module, qualname = handler_labels(event, data)
+        user = data.get("event_from_user")
+        if not self.profiler.should_profile(module, qualname, user.id if user else None):
+            return await handler(event, data)
+        return await self.profiler.profile(f"{module}.{qualname}", handler(event, data))
@@ -0,0 +1,27 @@
+"""
+Middleware записи входящих апдейтов (services.update_recorder).
+
+Регистрируется как outer middleware на dp.update - видит каждый апдейт
+до фильтров и обработчиков, в том числе те, что никто не обработал.
+"""
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from services.update_recorder import UpdateRecorder
+
+
+class UpdateRecordMiddleware(BaseMiddleware):
+    """Передает апдейт в очередь записи и продолжает обработку"""
+
+    def __init__(self, recorder: UpdateRecorder):
+        self.recorder = recorder
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        self.recorder.record(event, user.id if user else None)
+        return await handler(event, data)
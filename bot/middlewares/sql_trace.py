@@ -0,0 +1,41 @@
+"""
+Middleware учета SQL-запросов по обработчикам.
+
+Открывает трассу database.sql_trace на время обработчика: запросы
+считаются по имени обработчика (модуль.функция), повторяющиеся
+запросы (N+1) попадают в лог, а в строгом режиме - в исключение.
+"""
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from database.sql_trace import SqlTracer
+from middlewares.metrics import handler_labels
+
+
+class SqlTraceMiddleware(BaseMiddleware):
+    """
+    Трасса SQL на каждый апдейт.
+
+    Регистрируется как внутренний middleware (dp.message, dp.callback_query):
+    к этому моменту фильтры уже выбрали обработчик и его имя известно.
+    """
+
+    def __init__(self, tracer: SqlTracer):
+        """
+        Args:
+            tracer: Экземпляр SqlTracer, подписанный на движки БД
+        """
+        super().__init__()
+        self.tracer = tracer
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        trace = self.tracer.begin(".".join(handler_labels(event, data)))
+        try:
+            return await handler(event, data)
+        finally:
+            self.tracer.end(trace)
@@ -10,6 +10,7 @@ from aiogram.types import Message, TelegramObject
 from cachetools import TTLCache
 import time
 import logging
+from utils.metrics import throttling_rejections
 
 logger = logging.getLogger(__name__)
 
@@ -75,6 +76,7 @@ class ThrottlingMiddleware(BaseMiddleware):
 
         if current_count >= self.rate_limit:
             # Превышен лимит!
+            throttling_rejections.inc()
             logger.warning(
                 f"Rate limit exceeded for user {user_id}: "
                 f"{current_count} requests in {self.time_window}s"
@@ -0,0 +1,559 @@
+"""
+Взаимная матрица совместимости команд и соискателей.
+
+Раньше поиск со стороны команды (find_users_by_skills) и со стороны
+соискателя (find_teams_for_participant) использовали разные эвристики
+и расходились в том, кто кому подходит. Теперь обе стороны читают одну
+разреженную матрицу команда x соискатель с общей оценкой пары:
+
+    score = пересечение навыков
+          + (активность команды + активность соискателя) / 2
+          + поправка за историю приглашений пары
+
+Активность - database.ranking.activity_score: затухание по давности
+(updated_at команды, last_active соискателя) и доля принятых
+приглашений (для команды - у лидера). Пары с отказом уходят в минус
+и выпадают.
+
+Матрица хранится как top-k строк (команда -> соискатели) и top-k
+столбцов (соискатель -> команды), отсортированных по убыванию оценки.
+NumPy/SciPy в зависимостях нет, поэтому вместо sparse-операций
+используются корзины по маске навыков (utils.skills): внутри корзины
+пересечение постоянно, кандидаты отсортированы по активности, и top-k
+получается слиянием (heapq.merge) не больше 128 корзин - один раз на
+маску. Полная перестройка - O((T + P) * k), изменение одной строки -
+O(T или P) по совпадающим корзинам.
+
+Строки, из которых ушел кандидат, не добираются до k сразу - это
+делает следующая полная перестройка (AFFINITY_REBUILD_MINUTES).
+
+Полная перестройка идет в пуле потоков на отдельном экземпляре: event
+loop не блокируется, читатели видят старую матрицу. Готовое состояние
+подменяется одним синхронным блоком, а изменения одной строки,
+пришедшие во время сборки, повторяются поверх новой матрицы.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from bisect import insort
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from sqlalchemy import select, and_
+from database.db import get_db
+from database.models import Invitation, InvitationStatus, Team, TeamStatus, User, UserType, active_searchers_filter
+from database.ranking import activity_score
+from utils.skills import skill_mask
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Поправка к оценке пары по статусу приглашения между ними
+HISTORY_WEIGHTS = {
+    InvitationStatus.PENDING: -0.5,   # Уже ждет ответа
+    InvitationStatus.ACCEPTED: -1.0,  # Уже договорились
+    InvitationStatus.REJECTED: -10.0,  # Отказ - пара выпадает из выдачи
+    InvitationStatus.EXPIRED: -0.25,  # Не ответили
+}
+
+# Запись строки/столбца: (-score, id) - по возрастанию это убывание оценки
+Entry = Tuple[float, int]
+
+# Состояние матрицы, которое подменяется после полной перестройки
+STATE_ATTRS = (
+    "_teams", "_participants", "_team_leader", "_moments", "_responses", "_primary_team",
+    "_team_buckets", "_participant_buckets", "_history", "_history_by_team",
+    "_history_by_participant", "_rows", "_cols", "_in_rows", "_in_cols",
+)
+
+
+def _bucket_stream(bucket: List[Entry], overlap: int) -> Iterator[Entry]:
+    """Кандидаты корзины по убыванию частичной оценки"""
+    return ((neg * 0.5 - overlap, other) for neg, other in bucket)
+
+
+class AffinityMatrix:
+    """Top-k матрица совместимости команд и соискателей в памяти"""
+
+    def __init__(self, top_k: int = 100, rebuild_interval: int = 1800):
+        """
+        Args:
+            top_k: Сколько лучших пар хранить в строке и столбце
+            rebuild_interval: Интервал полной перестройки (секунды)
+        """
+        self.top_k = top_k
+        self.rebuild_interval = rebuild_interval
+
+        # id -> (маска навыков, активность)
+        self._teams: Dict[int, Tuple[int, float]] = {}
+        self._participants: Dict[int, Tuple[int, float]] = {}
+        self._team_leader: Dict[int, int] = {}
+        # Моменты активности и ответы на приглашения (для пересчета активности)
+        self._moments: Dict[Tuple[UserType, int], Optional[datetime]] = {}
+        self._responses: Dict[int, List[int]] = {}
+        # Основная команда лидера (активная с наименьшим id)
+        self._primary_team: Dict[int, int] = {}
+
+        # Маска -> [(-активность, id)] по возрастанию
+        self._team_buckets: Dict[int, List[Entry]] = {}
+        self._participant_buckets: Dict[int, List[Entry]] = {}
+
+        # История приглашений: (team_id, participant_id) -> поправка
+        self._history: Dict[Tuple[int, int], float] = {}
+        self._history_by_team: Dict[int, int] = {}
+        self._history_by_participant: Dict[int, int] = {}
+
+        # Строки и столбцы top-k и обратные индексы
+        self._rows: Dict[int, List[Entry]] = {}
+        self._cols: Dict[int, List[Entry]] = {}
+        self._in_rows: Dict[int, Set[int]] = {}
+        self._in_cols: Dict[int, Set[int]] = {}
+
+        self.ready = False
+        self.last_rebuild_seconds: Optional[float] = None
+        self.last_update_ms: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._rebuild_lock = asyncio.Lock()
+        # Изменения, пришедшие во время полной перестройки (повторяются после подмены)
+        self._pending: Optional[List[Tuple[str, tuple]]] = None
+
+    # ===== Чтение =====
+
+    def participants_for_team(self, team_id: int, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Лучшие соискатели для команды: [(user_id, score)]"""
+        return [(pid, -neg) for neg, pid in self._rows.get(team_id, [])[:limit]]
+
+    def teams_for_participant(self, user_id: int, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Лучшие команды для соискателя: [(team_id, score)]"""
+        return [(tid, -neg) for neg, tid in self._cols.get(user_id, [])[:limit]]
+
+    def matching_participants_count(self, team_id: int) -> int:
+        """Сколько активных соискателей пересекаются с командой по навыкам"""
+        team = self._teams.get(team_id)
+        if team is None:
+            return 0
+        return sum(
+            len(bucket) for mask, bucket in self._participant_buckets.items()
+            if mask & team[0]
+        )
+
+    def pair_score(self, team_id: int, user_id: int) -> float:
+        """Оценка пары (0 - если команда или соискатель не в матрице)"""
+        if team_id not in self._teams or user_id not in self._participants:
+            return 0.0
+        return self._score(team_id, user_id)
+
+    def has_team(self, team_id: int) -> bool:
+        return team_id in self._teams
+
+    def has_participant(self, user_id: int) -> bool:
+        return user_id in self._participants
+
+    def team_leader(self, team_id: int) -> Optional[int]:
+        return self._team_leader.get(team_id)
+
+    def primary_team(self, leader_id: int) -> Optional[int]:
+        """Основная активная команда лидера"""
+        return self._primary_team.get(leader_id)
+
+    def viewers_of_participant(self, user_id: int) -> Set[int]:
+        """Команды, в строках которых есть соискатель"""
+        return set(self._in_rows.get(user_id, ()))
+
+    def viewers_of_team(self, team_id: int) -> Set[int]:
+        """Соискатели, в столбцах которых есть команда"""
+        return set(self._in_cols.get(team_id, ()))
+
+    # ===== Изменения одной строки =====
+
+    def set_participant(self, user_id: int, mask: int, last_active: Optional[datetime], active: bool = True) -> None:
+        """Добавить, обновить или убрать соискателя"""
+        if self._pending is not None:
+            self._pending.append(("set_participant", (user_id, mask, last_active, active)))
+        started = time.perf_counter()
+        self._drop_participant(user_id)
+
+        self._moments.pop((UserType.PARTICIPANT, user_id), None)
+        if active and mask:
+            self._moments[(UserType.PARTICIPANT, user_id)] = last_active
+            self._insert_participant(user_id, mask, self._activity(last_active, user_id))
+
+        self.last_update_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    def set_team(self, team_id: int, leader_id: int, mask: int, updated_at: Optional[datetime],
+                 active: bool = True) -> None:
+        """Добавить, обновить или убрать команду"""
+        if self._pending is not None:
+            self._pending.append(("set_team", (team_id, leader_id, mask, updated_at, active)))
+        started = time.perf_counter()
+        self._drop_team(team_id)
+
+        self._moments.pop((UserType.TEAM, team_id), None)
+        if active and mask:
+            self._team_leader[team_id] = leader_id
+            self._moments[(UserType.TEAM, team_id)] = updated_at
+            self._insert_team(team_id, mask, self._activity(updated_at, leader_id))
+
+        self._update_primary_team(leader_id)
+        self.last_update_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    def record_invitation(self, from_user_id: int, to_user_id: int,
+                          from_team_id: Optional[int], status: InvitationStatus) -> None:
+        """Учесть приглашение (команда -> соискатель или заявка соискателя команде)"""
+        if self._pending is not None:
+            self._pending.append(("record_invitation", (from_user_id, to_user_id, from_team_id, status)))
+        # Доля принятых у получателя: новое приглашение или принятие
+        if status in (InvitationStatus.PENDING, InvitationStatus.ACCEPTED):
+            responses = self._responses.setdefault(to_user_id, [0, 0])
+            responses[0 if status == InvitationStatus.ACCEPTED else 1] += 1
+            self._refresh_activity(to_user_id)
+
+        if from_team_id is not None:
+            pair = (from_team_id, to_user_id)
+        else:
+            team_id = self._primary_team.get(to_user_id)
+            if team_id is None:
+                return
+            pair = (team_id, from_user_id)
+
+        team_id, user_id = pair
+        if pair not in self._history:
+            self._history_by_team[team_id] = self._history_by_team.get(team_id, 0) + 1
+            self._history_by_participant[user_id] = self._history_by_participant.get(user_id, 0) + 1
+        self._history[pair] = HISTORY_WEIGHTS.get(status, 0.0)
+
+        # Пересчитываем пару: соискатель переставляется во всех строках
+        if user_id in self._participants and team_id in self._teams:
+            mask, activity = self._participants[user_id]
+            self._drop_participant(user_id)
+            self._insert_participant(user_id, mask, activity)
+
+    # ===== Полная перестройка =====
+
+    async def rebuild(self) -> None:
+        """Перестроить матрицу по БД (сборка - в пуле потоков, затем подмена)"""
+        async with self._rebuild_lock:
+            started = time.perf_counter()
+            since = datetime.utcnow().timestamp() - settings.INVITATION_ARCHIVE_AFTER_DAYS * 86400
+            self._pending = []
+            try:
+                async with get_db() as session:
+                    teams = (await session.execute(
+                        select(Team.id, Team.leader_id, Team.needed_skills, Team.updated_at)
+                        .where(Team.status == TeamStatus.ACTIVE)
+                    )).all()
+                    participants = (await session.execute(
+                        select(User.id, User.primary_skill, User.additional_skills, User.last_active)
+                        .where(and_(User.user_type == UserType.PARTICIPANT, active_searchers_filter()))
+                    )).all()
+                    invitations = (await session.execute(
+                        select(Invitation.from_user_id, Invitation.to_user_id, Invitation.from_team_id, Invitation.status)
+                        .where(Invitation.created_at >= datetime.utcfromtimestamp(since))
+                        .order_by(Invitation.created_at)
+                    )).all()
+
+                built = type(self)(self.top_k, self.rebuild_interval)
+                await asyncio.to_thread(built._build, teams, participants, invitations)
+            except BaseException:
+                self._pending = None
+                raise
+
+            # Подмена без await: читатели видят либо старую, либо новую матрицу
+            for attr in STATE_ATTRS:
+                setattr(self, attr, getattr(built, attr))
+            pending, self._pending = self._pending, None
+            for method, args in pending:
+                getattr(self, method)(*args)
+
+            self.ready = True
+            self.last_rebuild_seconds = round(time.perf_counter() - started, 3)
+            logger.info(
+                f"Матрица совместимости перестроена: {len(self._teams)} команд x "
+                f"{len(self._participants)} соискателей за {self.last_rebuild_seconds} с"
+                + (f", повторено изменений: {len(pending)}" if pending else "")
+            )
+
+    def _build(self, teams: list, participants: list, invitations: list) -> None:
+        """Собрать состояние матрицы из строк БД (синхронно, на новом экземпляре)"""
+        self._responses = {}
+        for _, to_user_id, _, status in invitations:
+            responses = self._responses.setdefault(to_user_id, [0, 0])
+            responses[1] += 1
+            if status == InvitationStatus.ACCEPTED:
+                responses[0] += 1
+
+        self._moments = {}
+        self._teams, self._team_leader, self._team_buckets = {}, {}, {}
+        for team_id, leader_id, needed_skills, updated_at in teams:
+            mask = skill_mask(needed_skills)
+            if not mask:
+                continue
+            activity = self._activity(updated_at, leader_id)
+            self._teams[team_id] = (mask, activity)
+            self._team_leader[team_id] = leader_id
+            self._moments[(UserType.TEAM, team_id)] = updated_at
+            self._team_buckets.setdefault(mask, []).append((-activity, team_id))
+
+        self._participants, self._participant_buckets = {}, {}
+        for user_id, primary_skill, additional_skills, last_active in participants:
+            mask = skill_mask(primary_skill, additional_skills)
+            if not mask:
+                continue
+            activity = self._activity(last_active, user_id)
+            self._participants[user_id] = (mask, activity)
+            self._moments[(UserType.PARTICIPANT, user_id)] = last_active
+            self._participant_buckets.setdefault(mask, []).append((-activity, user_id))
+
+        for bucket in (*self._team_buckets.values(), *self._participant_buckets.values()):
+            bucket.sort()
+
+        self._primary_team = {}
+        for team_id, leader_id in sorted(self._team_leader.items()):
+            self._primary_team.setdefault(leader_id, team_id)
+
+        # Последнее приглашение пары определяет поправку
+        self._history, self._history_by_team, self._history_by_participant = {}, {}, {}
+        for from_user_id, to_user_id, from_team_id, status in invitations:
+            if from_team_id is not None:
+                pair = (from_team_id, to_user_id)
+            elif to_user_id in self._primary_team:
+                pair = (self._primary_team[to_user_id], from_user_id)
+            else:
+                continue
+            self._history[pair] = HISTORY_WEIGHTS.get(status, 0.0)
+        for team_id, user_id in self._history:
+            self._history_by_team[team_id] = self._history_by_team.get(team_id, 0) + 1
+            self._history_by_participant[user_id] = self._history_by_participant.get(user_id, 0) + 1
+
+        # Порядок кандидатов зависит только от маски - считаем его один раз на маску
+        team_ranked = {
+            mask: self._ranked(mask, self._participant_buckets, self.top_k)
+            for mask in self._team_buckets
+        }
+        participant_ranked = {
+            mask: self._ranked(mask, self._team_buckets, self.top_k)
+            for mask in self._participant_buckets
+        }
+        self._rows = {
+            team_id: self._top_participants(team_id, team_ranked[mask])
+            for team_id, (mask, _) in self._teams.items()
+        }
+        self._cols = {
+            user_id: self._top_teams(user_id, participant_ranked[mask])
+            for user_id, (mask, _) in self._participants.items()
+        }
+        self._in_rows, self._in_cols = {}, {}
+        for team_id, row in self._rows.items():
+            for _, user_id in row:
+                self._in_rows.setdefault(user_id, set()).add(team_id)
+        for user_id, col in self._cols.items():
+            for _, team_id in col:
+                self._in_cols.setdefault(team_id, set()).add(user_id)
+
+    async def start(self) -> asyncio.Task:
+        """Построить матрицу и запустить периодическую перестройку"""
+        await self.rebuild()
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self) -> None:
+        """Остановить периодическую перестройку"""
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def get_stats(self) -> dict:
+        """Статистика матрицы (для мониторинга)"""
+        return {
+            "teams": len(self._teams),
+            "participants": len(self._participants),
+            "pairs": sum(len(row) for row in self._rows.values()),
+            "history_pairs": len(self._history),
+            "last_rebuild_seconds": self.last_rebuild_seconds,
+            "last_update_ms": self.last_update_ms,
+        }
+
+    # ===== Внутренняя логика =====
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.error(f"Ошибка при перестройке матрицы совместимости: {e}", exc_info=True)
+
+    def _activity(self, moment: Optional[datetime], user_id: int) -> float:
+        return activity_score(moment, *self._responses.get(user_id, (0, 0)))
+
+    def _refresh_activity(self, user_id: int) -> None:
+        """Пересчитать активность соискателя или команд лидера user_id"""
+        if user_id in self._participants:
+            mask, _ = self._participants[user_id]
+            moment = self._moments.get((UserType.PARTICIPANT, user_id))
+            self._drop_participant(user_id)
+            self._insert_participant(user_id, mask, self._activity(moment, user_id))
+
+        for team_id in [team_id for team_id, leader_id in self._team_leader.items() if leader_id == user_id]:
+            if team_id in self._teams:
+                mask, _ = self._teams[team_id]
+                moment = self._moments.get((UserType.TEAM, team_id))
+                self._drop_team(team_id)
+                self._team_leader[team_id] = user_id
+                self._insert_team(team_id, mask, self._activity(moment, user_id))
+                self._update_primary_team(user_id)
+
+    def _score(self, team_id: int, user_id: int) -> float:
+        team_mask, team_activity = self._teams[team_id]
+        user_mask, user_activity = self._participants[user_id]
+        return (
+            (team_mask & user_mask).bit_count()
+            + 0.5 * user_activity + 0.5 * team_activity
+            + self._history.get((team_id, user_id), 0.0)
+        )
+
+    def _ranked(self, mask: int, buckets: Dict[int, List[Entry]], count: int) -> List[Entry]:
+        """
+        Top-count кандидатов для маски: (-(пересечение + активность кандидата / 2), id).
+
+        Активность самого зрителя и история в порядок не входят - одинаковая
+        маска дает одинаковый порядок, поэтому при перестройке список
+        считается один раз на маску.
+        """
+        streams = [
+            _bucket_stream(bucket, (mask & bucket_mask).bit_count())
+            for bucket_mask, bucket in buckets.items()
+            if mask & bucket_mask
+        ]
+        return list(islice(heapq.merge(*streams), count))
+
+    def _top(self, mask: int, activity: float, buckets: Dict[int, List[Entry]], extra: int,
+             pair_of: Callable[[int], Tuple[int, int]], ranked: Optional[List[Entry]] = None) -> List[Entry]:
+        # Поправки истории только уменьшают оценку - берем запас на такие пары
+        count = self.top_k + extra
+        if ranked is None or len(ranked) < count:
+            ranked = self._ranked(mask, buckets, count)
+
+        own = 0.5 * activity
+        if not extra:
+            # Без истории порядок совпадает с ranked - сдвигаем оценки на константу
+            return [(neg - own, other) for neg, other in ranked[:count]]
+
+        history = self._history
+        entries = [(neg - own - history.get(pair_of(other), 0.0), other) for neg, other in ranked[:count]]
+        entries = [entry for entry in entries if entry[0] < 0]
+        entries.sort()
+        return entries[:self.top_k]
+
+    def _top_participants(self, team_id: int, ranked: Optional[List[Entry]] = None) -> List[Entry]:
+        mask, activity = self._teams[team_id]
+        extra = self._history_by_team.get(team_id, 0)
+        return self._top(
+            mask, activity, self._participant_buckets, extra,
+            lambda user_id: (team_id, user_id), ranked
+        )
+
+    def _top_teams(self, user_id: int, ranked: Optional[List[Entry]] = None) -> List[Entry]:
+        mask, activity = self._participants[user_id]
+        extra = self._history_by_participant.get(user_id, 0)
+        return self._top(
+            mask, activity, self._team_buckets, extra,
+            lambda team_id: (team_id, user_id), ranked
+        )
+
+    def _offer(self, lists: Dict[int, List[Entry]], members: Dict[int, Set[int]],
+               owner: int, other: int, score: float) -> None:
+        """Вставить other в top-k список owner, если проходит по оценке"""
+        if score <= 0:
+            return
+        entry = (-score, other)
+        entries = lists.setdefault(owner, [])
+        if len(entries) >= self.top_k and entry >= entries[-1]:
+            return
+        insort(entries, entry)
+        members.setdefault(entry[1], set()).add(owner)
+        if len(entries) > self.top_k:
+            _, evicted = entries.pop()
+            members.get(evicted, set()).discard(owner)
+
+    def _drop_participant(self, user_id: int) -> None:
+        participant = self._participants.pop(user_id, None)
+        if participant is None:
+            return
+        mask, activity = participant
+        self._remove_from_bucket(self._participant_buckets, mask, (-activity, user_id))
+        for team_id in self._in_rows.pop(user_id, set()):
+            self._rows[team_id] = [entry for entry in self._rows.get(team_id, []) if entry[1] != user_id]
+        for _, team_id in self._cols.pop(user_id, []):
+            self._in_cols.get(team_id, set()).discard(user_id)
+
+    def _drop_team(self, team_id: int) -> None:
+        team = self._teams.pop(team_id, None)
+        leader_id = self._team_leader.pop(team_id, None)
+        if team is not None:
+            mask, activity = team
+            self._remove_from_bucket(self._team_buckets, mask, (-activity, team_id))
+            for user_id in self._in_cols.pop(team_id, set()):
+                self._cols[user_id] = [entry for entry in self._cols.get(user_id, []) if entry[1] != team_id]
+            for _, user_id in self._rows.pop(team_id, []):
+                self._in_rows.get(user_id, set()).discard(team_id)
+        if leader_id is not None:
+            self._update_primary_team(leader_id)
+
+    def _insert_participant(self, user_id: int, mask: int, activity: float) -> None:
+        self._participants[user_id] = (mask, activity)
+        insort(self._participant_buckets.setdefault(mask, []), (-activity, user_id))
+        self._cols[user_id] = self._top_teams(user_id)
+        for _, team_id in self._cols[user_id]:
+            self._in_cols.setdefault(team_id, set()).add(user_id)
+
+        # Вставляем соискателя в строки команд, где он попадает в top-k
+        for team_mask, bucket in self._team_buckets.items():
+            if team_mask & mask:
+                for _, team_id in bucket:
+                    self._offer(self._rows, self._in_rows, team_id, user_id, self._score(team_id, user_id))
+
+    def _insert_team(self, team_id: int, mask: int, activity: float) -> None:
+        self._teams[team_id] = (mask, activity)
+        insort(self._team_buckets.setdefault(mask, []), (-activity, team_id))
+        self._rows[team_id] = self._top_participants(team_id)
+        for _, user_id in self._rows[team_id]:
+            self._in_rows.setdefault(user_id, set()).add(team_id)
+
+        for participant_mask, bucket in self._participant_buckets.items():
+            if participant_mask & mask:
+                for _, user_id in bucket:
+                    self._offer(self._cols, self._in_cols, user_id, team_id, self._score(team_id, user_id))
+
+    def _update_primary_team(self, leader_id: int) -> None:
+        team_ids = [team_id for team_id, leader in self._team_leader.items() if leader == leader_id]
+        if team_ids:
+            self._primary_team[leader_id] = min(team_ids)
+        else:
+            self._primary_team.pop(leader_id, None)
+
+    @staticmethod
+    def _remove_from_bucket(buckets: Dict[int, List[Entry]], mask: int, entry: Entry) -> None:
+        bucket = buckets.get(mask)
+        if not bucket:
+            return
+        try:
+            bucket.remove(entry)
+        except ValueError:
+            return
+        if not bucket:
+            del buckets[mask]
+
+
+# Глобальный экземпляр матрицы
+affinity = AffinityMatrix(
+    top_k=settings.MATCH_FEED_SIZE,
+    rebuild_interval=settings.AFFINITY_REBUILD_MINUTES * 60,
+)
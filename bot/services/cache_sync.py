@@ -0,0 +1,164 @@
+"""
+Применение изменений профилей, команд и приглашений к локальным кешам.
+
+Одно и то же изменение применяется двумя путями:
+- локально - из crud сразу после commit
+- на других экземплярах - из сообщения LISTEN/NOTIFY (database/db.py)
+
+Поэтому crud не трогает кеши напрямую: он публикует изменение
+через notify_change в транзакции записи и вызывает cache_sync.apply.
+
+Типы изменений (поля сообщения):
+- user_created: user_id, telegram_id, mask (None - не соискатель), last_active
+- user_active: те же поля - пользователь, снятый с поиска за неактивность,
+  вернулся (crud.record_user_activity)
+- team: team_id, leader_id, mask, updated_at, active, delta (изменение
+  числа активных команд: +1, -1 или 0)
+- users_inactive: users - [[user_id, telegram_id, mask], ...] - сняты с
+  поиска за неактивность (tasks.cleanup_inactive_users), mask - как в user_created
+- invitation: from_user_id, to_user_id, from_team_id, status (имя enum);
+  в том числе истекшие (services.invitation_expiry, tasks)
+- seen: user_ids - фильтры просмотренных, записанные в БД
+
+Затронутые пользователи и команды на время допустимого отставания реплик
+читаются из primary (read-your-writes, см. database/db.py).
+
+Предрассчитанные ленты (match_feed) и планировщик истечения живут в БД
+и на экземпляре-источнике - сообщения их не касаются.
+"""
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from database.db import register_change_handler, register_resync_handler, replicas
+from database.models import InvitationStatus
+from services.profile_cache import profile_cache
+from services.user_counter import user_counter
+from services.skill_histogram import skill_histogram
+from services.affinity import affinity
+from services.profile_snapshot import profile_snapshot
+from services.seen_filter import seen_filters
+
+logger = logging.getLogger(__name__)
+
+
+def _moment(value) -> Optional[datetime]:
+    """datetime из сообщения (ISO-строка) или локального вызова"""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+class CacheSync:
+    """Раздача изменений по локальным кешам"""
+
+    def __init__(self):
+        self._handlers: Dict[str, Callable[[dict], None]] = {
+            "user_created": self._user_searching,
+            "user_active": self._user_searching,
+            "users_inactive": self._users_inactive,
+            "team": self._team,
+            "invitation": self._invitation,
+            "seen": self._seen,
+        }
+
+        self.applied_local = 0
+        self.applied_remote = 0
+        self.resyncs = 0
+
+    # ===== Публичный API =====
+
+    def apply(self, kind: str, data: dict) -> None:
+        """Применить изменение этого экземпляра (вызывается из crud после commit)"""
+        self._dispatch(kind, data)
+        self.applied_local += 1
+
+    def apply_remote(self, kind: str, data: dict) -> None:
+        """Применить изменение другого экземпляра (из слушателя LISTEN)"""
+        self._dispatch(kind, data)
+        self.applied_remote += 1
+
+    async def resync(self) -> None:
+        """
+        Полная сверка кешей с БД.
+
+        Вызывается после переподключения слушателя: уведомления,
+        отправленные за время разрыва, потеряны.
+        """
+        self.resyncs += 1
+        profile_cache.clear()
+        seen_filters.evict()
+        await user_counter.reconcile()
+        if skill_histogram.ready:
+            await skill_histogram.refresh()
+        if affinity.ready:
+            await affinity.rebuild()
+        if profile_snapshot.ready:
+            await profile_snapshot.sync()
+
+    def get_stats(self) -> dict:
+        """Статистика применения изменений (для мониторинга)"""
+        return {
+            "applied_local": self.applied_local,
+            "applied_remote": self.applied_remote,
+            "resyncs": self.resyncs,
+        }
+
+    # ===== Обработчики изменений =====
+
+    def _dispatch(self, kind: str, data: dict) -> None:
+        handler = self._handlers.get(kind)
+        if handler is None:
+            logger.debug(f"Неизвестный тип изменения: {kind}")
+            return
+        handler(data)
+
+    def _user_searching(self, data: dict) -> None:
+        # Новый или вернувшийся соискатель; для нового снимаем
+        # негативную запись «не зарегистрирован»
+        profile_cache.invalidate_user(data["telegram_id"])
+        replicas.note_write(user_ids=(data["user_id"],))
+        # Новый профиль всегда ищет (is_searching по умолчанию) - как и вернувшийся
+        user_counter.increment()
+        mask = data.get("mask")
+        if mask is not None:
+            skill_histogram.add_participant(mask)
+            affinity.set_participant(data["user_id"], mask, _moment(data.get("last_active")))
+
+    def _users_inactive(self, data: dict) -> None:
+        users = data["users"]
+        replicas.note_write(user_ids=[user_id for user_id, _, _ in users])
+        user_counter.decrement(len(users))
+        for user_id, telegram_id, mask in users:
+            profile_cache.invalidate_user(telegram_id)
+            if mask is not None:
+                skill_histogram.add_participant(mask, -1)
+                affinity.set_participant(user_id, mask, None, active=False)
+
+    def _team(self, data: dict) -> None:
+        profile_cache.invalidate_teams(data["leader_id"])
+        replicas.note_write(user_ids=(data["leader_id"],), team_ids=(data["team_id"],))
+        delta = data.get("delta", 0)
+        if delta:
+            skill_histogram.add_team(data["mask"], delta)
+            affinity.set_team(
+                data["team_id"], data["leader_id"], data["mask"],
+                _moment(data.get("updated_at")), active=data.get("active", True)
+            )
+
+    def _invitation(self, data: dict) -> None:
+        status = InvitationStatus[data["status"]]
+        replicas.note_write(
+            user_ids=(data["from_user_id"], data["to_user_id"]),
+            team_ids=(data.get("from_team_id"),)
+        )
+        affinity.record_invitation(data["from_user_id"], data["to_user_id"], data.get("from_team_id"), status)
+        profile_snapshot.record_invitation(data["to_user_id"], status)
+
+    def _seen(self, data: dict) -> None:
+        seen_filters.evict(data["user_ids"])
+
+
+# Глобальный экземпляр; слушатель LISTEN раздает изменения через него
+cache_sync = CacheSync()
+register_change_handler(cache_sync.apply_remote)
+register_resync_handler(cache_sync.resync)
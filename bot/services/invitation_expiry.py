@@ -0,0 +1,281 @@
+"""
+Планировщик истечения приглашений.
+
+Вместо периодического поиска истекших приглашений держим в памяти кучу
+(heap) ближайших дедлайнов и просыпаемся точно к следующему из них.
+
+- При старте куча загружается по индексу idx_invitation_expired
+  (status, expires_at), не больше INVITATION_EXPIRY_HEAP_SIZE записей
+- Новые приглашения добавляются из crud.create_invitation
+- Истекшие приглашения помечаются EXPIRED небольшими батчами
+  (опционально с уведомлением обеих сторон); каждое публикуется как
+  изменение "invitation" (services.cache_sync) для кешей всех экземпляров
+"""
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Set, Tuple
+from aiogram import Bot
+from sqlalchemy import select, update, and_
+from sqlalchemy.orm import aliased
+from database.db import get_db, notify_change
+from database.models import Invitation, InvitationStatus, User
+from services.cache_sync import cache_sync
+from services.match_feed import match_feed
+from config import settings
+from utils.texts import INVITATION_EXPIRED_TO_SENDER, INVITATION_EXPIRED_TO_RECIPIENT
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повтором, если БД недоступна (секунды)
+RETRY_DELAY = 5.0
+
+
+class InvitationExpiryScheduler:
+    """In-process планировщик дедлайнов приглашений на основе heapq"""
+
+    def __init__(self, capacity: int = 10000, batch_size: int = 100):
+        """
+        Args:
+            capacity: Максимум дедлайнов в памяти (остальные догружаются позже)
+            batch_size: Максимум приглашений, истекающих за одну транзакцию
+        """
+        self.capacity = capacity
+        self.batch_size = batch_size
+
+        self._heap: List[Tuple[datetime, int]] = []
+        self._discarded: Set[int] = set()
+        # Если в БД дедлайнов больше, чем capacity, запоминаем последний
+        # загруженный: более поздние догрузим, когда куча опустеет
+        self._horizon: Optional[datetime] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._bot: Optional[Bot] = None
+
+        self.expired_total = 0
+        self.notified_total = 0
+
+    # ===== Публичный API =====
+
+    def schedule(self, invitation_id: int, expires_at: Optional[datetime]) -> None:
+        """Запланировать истечение приглашения (вызывается из crud)"""
+        if expires_at is None:
+            return
+        if self._horizon is not None and expires_at > self._horizon:
+            # За горизонтом загрузки - подхватится при следующей загрузке
+            return
+
+        is_earliest = not self._heap or expires_at < self._heap[0][0]
+        heapq.heappush(self._heap, (expires_at, invitation_id))
+        if is_earliest:
+            self._wakeup.set()
+
+    def discard(self, invitation_id: int) -> None:
+        """Снять приглашение с расписания (на него уже ответили)"""
+        self._discarded.add(invitation_id)
+
+    async def start(self, bot: Optional[Bot] = None) -> asyncio.Task:
+        """
+        Загрузить дедлайны из БД и запустить цикл планировщика.
+
+        Args:
+            bot: Bot для уведомлений (если INVITATION_EXPIRY_NOTIFY включен)
+        """
+        self._bot = bot
+        await self._backfill_missing_deadlines()
+        await self.load()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Планировщик истечения приглашений запущен: "
+            f"{len(self._heap)} дедлайнов в очереди"
+        )
+        return self._task
+
+    async def stop(self) -> None:
+        """Остановить цикл планировщика (graceful shutdown)"""
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info("Планировщик истечения приглашений остановлен")
+
+    async def load(self) -> None:
+        """Загрузить ближайшие дедлайны PENDING приглашений из БД"""
+        async with get_db() as session:
+            result = await session.execute(
+                select(Invitation.expires_at, Invitation.id)
+                .where(
+                    and_(
+                        Invitation.status == InvitationStatus.PENDING,
+                        Invitation.expires_at.is_not(None)
+                    )
+                )
+                .order_by(Invitation.expires_at)
+                .limit(self.capacity)
+            )
+            rows = [(expires_at, invitation_id) for expires_at, invitation_id in result.all()]
+
+        self._heap = rows  # Отсортированный список - уже корректная куча
+        self._discarded.clear()
+        self._horizon = rows[-1][0] if len(rows) >= self.capacity else None
+        self._wakeup.set()
+
+    def get_stats(self) -> dict:
+        """Получить статистику планировщика (для мониторинга)"""
+        return {
+            "queued": len(self._heap),
+            "next_deadline": self._heap[0][0] if self._heap else None,
+            "horizon": self._horizon,
+            "expired_total": self.expired_total,
+            "notified_total": self.notified_total,
+        }
+
+    # ===== Внутренняя логика =====
+
+    async def _backfill_missing_deadlines(self) -> None:
+        """Проставить expires_at старым PENDING приглашениям, созданным без него"""
+        lifetime = timedelta(hours=settings.CLEANUP_EXPIRED_INVITATIONS_HOURS)
+        async with get_db() as session:
+            result = await session.execute(
+                update(Invitation)
+                .where(
+                    and_(
+                        Invitation.status == InvitationStatus.PENDING,
+                        Invitation.expires_at.is_(None)
+                    )
+                )
+                .values(expires_at=Invitation.created_at + lifetime)
+            )
+            if result.rowcount:
+                logger.info(f"Проставлен expires_at для {result.rowcount} старых приглашений")
+
+    async def _run(self) -> None:
+        """Главный цикл: спим до ближайшего дедлайна, затем истекаем батч"""
+        while True:
+            await self._sleep_until_next_deadline()
+
+            due = self._pop_due()
+            if due:
+                try:
+                    await self._expire(due)
+                except Exception as e:
+                    logger.error(f"Ошибка при истечении приглашений: {e}", exc_info=True)
+                    for item in due:
+                        heapq.heappush(self._heap, item)
+                    await asyncio.sleep(RETRY_DELAY)
+                    continue
+
+            # Куча опустела, а в БД остались дедлайны за горизонтом
+            if not self._heap and self._horizon is not None:
+                try:
+                    await self.load()
+                except Exception as e:
+                    logger.error(f"Ошибка при загрузке дедлайнов: {e}", exc_info=True)
+                    await asyncio.sleep(RETRY_DELAY)
+
+    async def _sleep_until_next_deadline(self) -> None:
+        self._wakeup.clear()
+        if self._heap:
+            delay = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+            if delay <= 0:
+                return
+        else:
+            delay = None
+
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def _pop_due(self) -> List[Tuple[datetime, int]]:
+        """Достать из кучи до batch_size наступивших дедлайнов"""
+        now = datetime.utcnow()
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            item = heapq.heappop(self._heap)
+            if item[1] in self._discarded:
+                self._discarded.discard(item[1])
+                continue
+            due.append(item)
+        return due
+
+    async def _expire(self, due: List[Tuple[datetime, int]]) -> None:
+        """Пометить батч приглашений как EXPIRED (одним запросом)"""
+        invitation_ids = [invitation_id for _, invitation_id in due]
+
+        # UPDATE ... RETURNING вместе с данными для уведомлений.
+        # Условие status=PENDING защищает от гонки с ответом на приглашение
+        expired = (
+            update(Invitation)
+            .where(
+                and_(
+                    Invitation.id.in_(invitation_ids),
+                    Invitation.status == InvitationStatus.PENDING
+                )
+            )
+            .values(status=InvitationStatus.EXPIRED)
+            .returning(Invitation.from_user_id, Invitation.to_user_id, Invitation.from_team_id)
+            .cte("expired")
+        )
+        from_user = aliased(User)
+        to_user = aliased(User)
+
+        async with get_db() as session:
+            result = await session.execute(
+                select(
+                    from_user.telegram_id, from_user.name,
+                    to_user.telegram_id, to_user.name,
+                    expired.c.from_user_id, expired.c.to_user_id, expired.c.from_team_id,
+                )
+                .select_from(expired)
+                .join(from_user, from_user.id == expired.c.from_user_id)
+                .join(to_user, to_user.id == expired.c.to_user_id)
+            )
+            rows = result.all()
+
+            # Изменения уходят другим экземплярам вместе с транзакцией
+            changes = [
+                {
+                    "from_user_id": row[4],
+                    "to_user_id": row[5],
+                    "from_team_id": row[6],
+                    "status": InvitationStatus.EXPIRED.name,
+                }
+                for row in rows
+            ]
+            for change in changes:
+                await notify_change(session, "invitation", change)
+
+        for change in changes:
+            cache_sync.apply("invitation", change)
+            match_feed.mark_viewer(change["from_user_id"])
+            match_feed.mark_viewer(change["to_user_id"])
+
+        self.expired_total += len(rows)
+        if rows:
+            logger.info(f"Истекло {len(rows)} приглашений")
+
+        if settings.INVITATION_EXPIRY_NOTIFY and self._bot is not None:
+            for from_tg_id, from_name, to_tg_id, to_name, *_ in rows:
+                await self._notify(from_tg_id, INVITATION_EXPIRED_TO_SENDER.format(name=to_name))
+                await self._notify(to_tg_id, INVITATION_EXPIRED_TO_RECIPIENT.format(name=from_name))
+
+    async def _notify(self, telegram_id: int, text: str) -> None:
+        try:
+            await self._bot.send_message(telegram_id, text)
+            self.notified_total += 1
+        except Exception as e:
+            logger.error(f"Не удалось отправить уведомление об истечении: {e}")
+
+
+# Глобальный экземпляр планировщика
+invitation_expiry = InvitationExpiryScheduler(
+    capacity=settings.INVITATION_EXPIRY_HEAP_SIZE,
+    batch_size=settings.INVITATION_EXPIRY_BATCH_SIZE,
+)
@@ -0,0 +1,315 @@
+"""
+Мониторинг здоровья event loop.
+
+Все обработчики делят один asyncio loop: синхронная работа внутри него
+(запись логов в файл, ранжирование на Python, гидратация больших списков
+ORM) останавливает обработку апдейтов всех пользователей сразу.
+
+- Проба задержки: корутина спит LOOP_MONITOR_INTERVAL_SECONDS и замеряет,
+  насколько позже запланированного она проснулась (гистограмма
+  bot_event_loop_lag_seconds)
+- Сэмплирование стека: поток-сторож следит за пульсом пробы; если loop
+  не отвечает дольше LOOP_SLOW_CALLBACK_SECONDS, сторож снимает стек
+  потока loop (sys._current_frames) и запоминает место в коде бота, где
+  loop завис. После выхода из зависания оно учитывается в
+  bot_event_loop_stalls_total{location}
+- Медленные колбэки asyncio (LOOP_ASYNCIO_DEBUG): отладочный режим loop
+  сам замеряет каждый колбэк; предупреждения asyncio «Executing ... took»
+  перехватываются и считаются в bot_asyncio_slow_callbacks_total
+- Дампы (LOOP_DUMP_ENABLED): если зависание длится дольше
+  LOOP_DUMP_THRESHOLD_SECONDS, сторож пишет стеки всех потоков в
+  LOOP_DUMP_DIR (не чаще раза в DUMP_COOLDOWN_SECONDS)
+
+Метрики обновляются только в потоке loop: сторож складывает завершенные
+зависания в очередь, проба разбирает ее после пробуждения.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, List, Optional, Tuple
+from config import settings
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Корень кода бота: место зависания ищется среди его файлов
+BOT_ROOT = str(Path(__file__).resolve().parents[1])
+
+# Сколько кадров стека хранить для самого долгого зависания и в дампах
+STACK_DEPTH = 20
+
+# Сколько мест зависаний показывать в get_stats
+TOP_LOCATIONS = 5
+
+# Минимальный интервал между дампами (секунды)
+DUMP_COOLDOWN_SECONDS = 60.0
+
+loop_lag = registry.histogram(
+    "bot_event_loop_lag_seconds", "Event loop scheduling lag measured by the probe"
+)
+loop_stalls = registry.counter(
+    "bot_event_loop_stalls_total", "Event loop stalls by code location", labels=("location",)
+)
+loop_stall_duration = registry.histogram(
+    "bot_event_loop_stall_seconds", "Event loop stall duration"
+)
+asyncio_slow_callbacks = registry.counter(
+    "bot_asyncio_slow_callbacks_total", "Slow callbacks reported by asyncio debug mode", labels=("callback",)
+)
+
+
+def _location(frames: traceback.StackSummary) -> str:
+    """Самый глубокий кадр из кода бота (иначе - самый глубокий вообще)"""
+    for frame in reversed(frames):
+        if frame.filename.startswith(BOT_ROOT) and not frame.filename.endswith("loop_monitor.py"):
+            relative = os.path.relpath(frame.filename, BOT_ROOT)
+            return f"{relative}:{frame.lineno} {frame.name}"
+    if frames:
+        frame = frames[-1]
+        return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    return "unknown"
+
+
+def _callback_name(handle) -> str:
+    """Имя колбэка asyncio.Handle (для задач - имя корутины)"""
+    callback = getattr(handle, "_callback", None)
+    task = getattr(callback, "__self__", None)
+    if isinstance(task, asyncio.Task):
+        return task.get_coro().__qualname__
+    return getattr(callback, "__qualname__", type(handle).__name__)
+
+
+class _SlowCallbackFilter(logging.Filter):
+    """Перехват предупреждений asyncio о медленных колбэках"""
+
+    def __init__(self, monitor: "LoopMonitor"):
+        super().__init__()
+        self.monitor = monitor
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if (isinstance(record.msg, str) and record.msg.startswith("Executing")
+                and isinstance(record.args, tuple) and len(record.args) == 2):
+            handle, duration = record.args
+            self.monitor.record_slow_callback(_callback_name(handle), duration)
+        return True
+
+
+class _Stall:
+    """Одно зависание loop, которое наблюдает сторож"""
+
+    __slots__ = ("started", "samples", "stack", "dumped")
+
+    def __init__(self, started: float):
+        self.started = started
+        self.samples: Counter = Counter()
+        self.stack: List[str] = []
+        self.dumped = False
+
+
+class LoopMonitor:
+    """Проба задержки event loop и поток-сторож со снятием стека"""
+
+    def __init__(self, interval: float = 0.5, slow_threshold: float = 0.1,
+                 dump_enabled: bool = False, dump_threshold: float = 1.0,
+                 dump_dir: str = "logs/loop_dumps", asyncio_debug: bool = False):
+        """
+        Args:
+            interval: Период пробы задержки (секунды)
+            slow_threshold: Сколько loop может не отвечать до снятия стека (секунды)
+            dump_enabled: Писать дампы стеков при долгих зависаниях
+            dump_threshold: Длительность зависания для дампа (секунды)
+            dump_dir: Каталог дампов
+            asyncio_debug: Включить отладочный режим loop для замера колбэков
+        """
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.dump_enabled = dump_enabled
+        self.dump_threshold = dump_threshold
+        self.dump_dir = Path(dump_dir)
+        self.asyncio_debug = asyncio_debug
+        # Сторож проверяет пульс несколько раз за порог - это и частота сэмплов
+        self.sample_interval = max(slow_threshold / 4, 0.005)
+
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._beat = 0.0
+        self._filter: Optional[_SlowCallbackFilter] = None
+        # Завершенные зависания: (длительность, место, стек) - разбирает проба
+        self._finished: Deque[Tuple[float, str, List[str]]] = deque(maxlen=1000)
+        self._last_dump = 0.0
+
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self.stalls = 0
+        self.stall_max = 0.0
+        self.stall_max_location = ""
+        self.stall_max_stack: List[str] = []
+        self.locations: Counter = Counter()
+        self.slow_callbacks = 0
+        self.dumps = 0
+
+    # ===== Публичный API =====
+
+    async def start(self) -> asyncio.Task:
+        """Запустить пробу задержки и поток-сторож"""
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+
+        if self.asyncio_debug:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.slow_threshold
+            self._filter = _SlowCallbackFilter(self)
+            logging.getLogger("asyncio").addFilter(self._filter)
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Мониторинг event loop запущен (проба {self.interval} с, "
+            f"порог зависания {self.slow_threshold * 1000:.0f} мс)"
+        )
+        return self._task
+
+    async def stop(self) -> None:
+        """Остановить пробу и сторожа"""
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, 1.0)
+            self._thread = None
+        if self._filter is not None:
+            logging.getLogger("asyncio").removeFilter(self._filter)
+            self._filter = None
+
+    def record_slow_callback(self, name: str, duration: float) -> None:
+        """Учесть медленный колбэк из отладочного режима asyncio"""
+        self.slow_callbacks += 1
+        asyncio_slow_callbacks.inc(name)
+
+    def get_stats(self) -> dict:
+        """Статистика event loop (для мониторинга)"""
+        return {
+            "lag_last_ms": round(self.lag_last * 1000, 3),
+            "lag_max_ms": round(self.lag_max * 1000, 3),
+            "lag_p99_ms": round((loop_lag.quantile(0.99) or 0.0) * 1000, 3),
+            "stalls": self.stalls,
+            "stall_max_ms": round(self.stall_max * 1000, 3),
+            "stall_max_location": self.stall_max_location,
+            "slow_callbacks": self.slow_callbacks,
+            "dumps": self.dumps,
+            "top_locations": dict(self.locations.most_common(TOP_LOCATIONS)),
+        }
+
+    # ===== Проба (поток loop) =====
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._beat = time.monotonic()
+
+            self.lag_last = lag
+            self.lag_max = max(self.lag_max, lag)
+            loop_lag.observe(lag)
+
+            while self._finished:
+                self._record_stall(*self._finished.popleft())
+
+    def _record_stall(self, duration: float, location: str, stack: List[str]) -> None:
+        self.stalls += 1
+        self.locations[location] += 1
+        loop_stalls.inc(location)
+        loop_stall_duration.observe(duration)
+        if duration > self.stall_max:
+            self.stall_max = duration
+            self.stall_max_location = location
+            self.stall_max_stack = stack
+        logger.warning(f"Event loop не отвечал {duration * 1000:.0f} мс: {location}")
+
+    # ===== Сторож (отдельный поток) =====
+
+    def _watch(self) -> None:
+        stall: Optional[_Stall] = None
+        while not self._stopping.wait(self.sample_interval):
+            now = time.monotonic()
+            # Проба обновляет пульс раз в interval - все сверх этого задержка
+            silent = now - self._beat - self.interval
+
+            if silent < self.slow_threshold:
+                if stall is not None:
+                    self._finish(stall, now)
+                    stall = None
+                continue
+
+            if stall is None:
+                stall = _Stall(started=self._beat + self.interval)
+            self._sample(stall)
+
+            if (self.dump_enabled and not stall.dumped and silent >= self.dump_threshold
+                    and now - self._last_dump >= DUMP_COOLDOWN_SECONDS):
+                stall.dumped = True
+                self._last_dump = now
+                self._dump(silent)
+
+    def _sample(self, stall: _Stall) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        frames = traceback.extract_stack(frame, limit=STACK_DEPTH)
+        location = _location(frames)
+        stall.samples[location] += 1
+        if not stall.stack or stall.samples[location] == max(stall.samples.values()):
+            stall.stack = frames.format()
+
+    def _finish(self, stall: _Stall, now: float) -> None:
+        if not stall.samples:
+            return
+        location = stall.samples.most_common(1)[0][0]
+        self._finished.append((now - stall.started, location, stall.stack))
+
+    def _dump(self, silent: float) -> None:
+        """Стеки всех потоков в файл (loop в этот момент завис)"""
+        try:
+            self.dump_dir.mkdir(parents=True, exist_ok=True)
+            path = self.dump_dir / f"loop-stall-{datetime.now():%Y%m%d-%H%M%S}.txt"
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            with open(path, "w", encoding="utf-8") as dump:
+                dump.write(f"Event loop не отвечает {silent:.3f} с\n")
+                for thread_id, frame in sys._current_frames().items():
+                    marker = " (event loop)" if thread_id == self._loop_thread_id else ""
+                    dump.write(f"\n--- {names.get(thread_id, thread_id)}{marker} ---\n")
+                    dump.writelines(traceback.format_stack(frame, limit=STACK_DEPTH))
+            self.dumps += 1
+            logger.warning(f"Дамп зависания event loop: {path}")
+        except Exception as e:
+            logger.error(f"Не удалось записать дамп event loop: {e}")
+
+
+# Глобальный экземпляр
+loop_monitor = LoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL_SECONDS,
+    slow_threshold=settings.LOOP_SLOW_CALLBACK_SECONDS,
+    dump_enabled=settings.LOOP_DUMP_ENABLED,
+    dump_threshold=settings.LOOP_DUMP_THRESHOLD_SECONDS,
+    dump_dir=settings.LOOP_DUMP_DIR,
+    asyncio_debug=settings.LOOP_ASYNCIO_DEBUG,
+)
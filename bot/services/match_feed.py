@@ -0,0 +1,578 @@
+"""
+Предрассчитанные ленты совпадений.
+
+Вместо пересчета совпадений на каждый /search храним для каждого
+зрителя до MATCH_FEED_SIZE лучших кандидатов в таблице match_feed
+(viewer_id, candidate_type, candidate_id, score):
+- лидер команды (TEAM) - соискатели по оценке database.ranking
+  (пересечение навыков с командой + активность)
+- соло-основатель (COFOUNDER) - другие соло-основатели по совместимости
+- соискатель (PARTICIPANT) - активные команды по той же оценке
+
+crud помечает измененных пользователей и команды, а воркер пересчитывает
+только затронутые пары: ленту самого объекта и его строки в лентах
+других зрителей. Каждый пересчет - несколько INSERT ... SELECT без
+выгрузки кандидатов в Python; зрители с одинаковым порядком кандидатов
+(тип и маска навыков) пересчитываются одним запросом. Раз в MATCH_FEED_REBUILD_HOURS ленты
+перестраиваются целиком (массовые изменения фоновых задач).
+
+Когда матрица совместимости (services.affinity) построена, ленты
+команд и соискателей берутся из ее строк и столбцов - оценка пары в
+ленте и в поиске одна и та же. Ленты соло-основателей по-прежнему
+считаются в SQL.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+from sqlalchemy import Integer, column, select, delete, func, and_, literal, tuple_, values
+from sqlalchemy.dialects.postgresql import insert
+from database.db import get_db
+from database.models import MatchFeed, Team, TeamStatus, User, UserType, active_searchers_filter
+from database.ranking import skill_overlap_expr, cofounder_stars_expr, idea_category, ranking_score_expr, activity_expr
+from services.affinity import affinity
+from utils.skills import skill_mask
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повтором, если БД недоступна (секунды)
+RETRY_DELAY = 5.0
+
+# Строк в одном INSERT из матрицы (5 параметров на строку, лимит asyncpg - 32767)
+INSERT_CHUNK_ROWS = 5000
+
+
+def _active_user(user_type: UserType):
+    return and_(User.user_type == user_type, active_searchers_filter())
+
+
+def _hot_since() -> datetime:
+    # Та же граница, что crud.hot_invitations_since (crud импортирует этот модуль)
+    return datetime.utcnow() - timedelta(days=settings.INVITATION_ARCHIVE_AFTER_DAYS)
+
+
+def _primary_team_ids():
+    """Основная команда лидера - активная команда с наименьшим id"""
+    return (
+        select(func.min(Team.id))
+        .where(Team.status == TeamStatus.ACTIVE)
+        .group_by(Team.leader_id)
+    )
+
+
+class MatchFeedWorker:
+    """Фоновый воркер, поддерживающий таблицу match_feed"""
+
+    def __init__(self, feed_size: int = 100, flush_interval: float = 1.0, rebuild_interval: int = 86400):
+        """
+        Args:
+            feed_size: Максимум кандидатов в ленте одного зрителя
+            flush_interval: Задержка перед обработкой накопленных изменений (секунды)
+            rebuild_interval: Интервал полной перестройки лент (секунды)
+        """
+        self.feed_size = feed_size
+        self.flush_interval = flush_interval
+        self.rebuild_interval = rebuild_interval
+
+        # id -> время первой пометки (для метрики устаревания)
+        self._dirty_users: Dict[int, float] = {}
+        self._dirty_teams: Dict[int, float] = {}
+        # Зрители, потерявшие кандидата: нужен только пересчет их ленты
+        self._refill: Dict[int, float] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_rebuild: float = 0.0
+
+        self.processed_total = 0
+        self.pairs_written = 0
+        self.last_batch_size = 0
+        self.last_batch_seconds = 0.0
+        self.last_staleness_seconds = 0.0
+        self.last_rebuild_seconds: Optional[float] = None
+        self.last_rebuild_at: Optional[datetime] = None
+
+    # ===== Публичный API =====
+
+    def mark_user(self, user_id: int) -> None:
+        """Профиль пользователя изменился (вызывается из crud)"""
+        self._dirty_users.setdefault(user_id, time.monotonic())
+        self._wakeup.set()
+
+    def mark_team(self, team_id: int) -> None:
+        """Команда изменилась (вызывается из crud)"""
+        self._dirty_teams.setdefault(team_id, time.monotonic())
+        self._wakeup.set()
+
+    def mark_viewer(self, user_id: int) -> None:
+        """Пересчитать ленту зрителя (например, она пуста при /search)"""
+        self._refill.setdefault(user_id, time.monotonic())
+        self._wakeup.set()
+
+    async def start(self) -> asyncio.Task:
+        """Запустить воркер (пустая таблица строится в фоне)"""
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Воркер ленты совпадений запущен (до {self.feed_size} кандидатов на зрителя)")
+        return self._task
+
+    async def stop(self) -> None:
+        """Остановить воркер"""
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def rebuild(self) -> None:
+        """Перестроить ленты всех активных зрителей (батчами по CLEANUP_BATCH_SIZE)"""
+        started = time.monotonic()
+        viewers_total = 0
+        last_id = 0
+
+        while True:
+            async with get_db() as session:
+                # Зрители батча - одним запросом (keyset по id)
+                result = await session.execute(
+                    select(User)
+                    .where(and_(active_searchers_filter(), User.id > last_id))
+                    .order_by(User.id)
+                    .limit(settings.CLEANUP_BATCH_SIZE)
+                )
+                viewers = list(result.scalars().all())
+                if not viewers:
+                    break
+                await self._refresh_viewers(session, viewers)
+
+            viewers_total += len(viewers)
+            last_id = viewers[-1].id
+            # Отдаем управление обработчикам между батчами
+            await asyncio.sleep(settings.CLEANUP_BATCH_PAUSE_SECONDS)
+
+        self._last_rebuild = time.monotonic()
+        self.last_rebuild_seconds = round(self._last_rebuild - started, 3)
+        self.last_rebuild_at = datetime.utcnow()
+        logger.info(
+            f"Ленты совпадений перестроены: {viewers_total} зрителей "
+            f"за {self.last_rebuild_seconds} с"
+        )
+
+    def get_stats(self) -> dict:
+        """Метрики ленты (для мониторинга)"""
+        marks = [*self._dirty_users.values(), *self._dirty_teams.values(), *self._refill.values()]
+        now = time.monotonic()
+        return {
+            "pending": len(marks),
+            "staleness_seconds": round(now - min(marks), 3) if marks else 0.0,
+            "last_staleness_seconds": self.last_staleness_seconds,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_seconds": self.last_batch_seconds,
+            "processed_total": self.processed_total,
+            "pairs_written": self.pairs_written,
+            "last_rebuild_seconds": self.last_rebuild_seconds,
+            "last_rebuild_at": self.last_rebuild_at,
+        }
+
+    # ===== Главный цикл =====
+
+    async def _run(self) -> None:
+        try:
+            if await self._is_empty():
+                await self.rebuild()
+            else:
+                self._last_rebuild = time.monotonic()
+        except Exception as e:
+            logger.error(f"Ошибка при построении лент совпадений: {e}", exc_info=True)
+
+        while True:
+            timeout = max(self._last_rebuild + self.rebuild_interval - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                if time.monotonic() - self._last_rebuild >= self.rebuild_interval:
+                    await self.rebuild()
+
+                # Копим изменения: всплеск правок одного профиля - один пересчет
+                await asyncio.sleep(self.flush_interval)
+                await self._flush()
+            except Exception as e:
+                logger.error(f"Ошибка при обновлении лент совпадений: {e}", exc_info=True)
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def _flush(self) -> None:
+        users, self._dirty_users = self._dirty_users, {}
+        teams, self._dirty_teams = self._dirty_teams, {}
+        viewers, self._refill = self._refill, {}
+        if not users and not teams and not viewers:
+            return
+
+        started = time.monotonic()
+        oldest = min([*users.values(), *teams.values(), *viewers.values()])
+        refill: Set[int] = set()
+
+        try:
+            async with get_db() as session:
+                if teams:
+                    result = await session.execute(select(Team).where(Team.id.in_(list(teams))))
+                    for team in result.scalars().all():
+                        refill |= await self._refresh_candidate_team(session, team)
+                        users.setdefault(team.leader_id, oldest)
+
+                viewer_ids = users.keys() | viewers.keys()
+                if viewer_ids:
+                    result = await session.execute(select(User).where(User.id.in_(list(viewer_ids))))
+                    loaded = list(result.scalars().all())
+                    await self._refresh_viewers(session, loaded)
+                    for user in loaded:
+                        if user.id in users and user.user_type != UserType.TEAM:
+                            refill |= await self._refresh_candidate_user(session, user)
+        except Exception:
+            # Возвращаем пометки - обработаем при следующем проходе
+            for user_id, marked in users.items():
+                self._dirty_users.setdefault(user_id, marked)
+            for team_id, marked in teams.items():
+                self._dirty_teams.setdefault(team_id, marked)
+            for viewer_id, marked in viewers.items():
+                self._refill.setdefault(viewer_id, marked)
+            raise
+
+        # Зрители, потерявшие кандидата, добирают ленту до полного размера
+        for viewer_id in refill - users.keys():
+            self.mark_viewer(viewer_id)
+
+        finished = time.monotonic()
+        batch_size = len(users) + len(teams) + len(viewers)
+        self.processed_total += batch_size
+        self.last_batch_size = batch_size
+        self.last_batch_seconds = round(finished - started, 3)
+        self.last_staleness_seconds = round(finished - oldest, 3)
+
+    # ===== Пересчет =====
+
+    async def _refresh_viewers(self, session, users: List[User]) -> None:
+        """
+        Пересчитать ленты зрителей целиком.
+
+        Один DELETE на всех зрителей. Ленты из матрицы вставляются пачками,
+        остальные - одним INSERT ... SELECT на группу зрителей с одинаковым
+        порядком кандидатов (тип и маска навыков, у соло-основателей -
+        навык и категория идеи): top-k группы считается один раз и
+        раздается ее зрителям.
+        """
+        if not users:
+            return
+        await session.execute(delete(MatchFeed).where(MatchFeed.viewer_id.in_([user.id for user in users])))
+
+        from_matrix = affinity.ready
+        team_masks = await self._team_masks(session, [
+            user.id for user in users
+            if user.user_type == UserType.TEAM and not from_matrix
+        ])
+
+        rows: List[dict] = []
+        groups: Dict[tuple, List[int]] = {}
+        for user in users:
+            if from_matrix and user.user_type in (UserType.TEAM, UserType.PARTICIPANT):
+                rows.extend(self._matrix_candidates(user))
+                continue
+            key = self._group_key(user, team_masks)
+            if key is not None:
+                groups.setdefault(key, []).append(user.id)
+
+        for offset in range(0, len(rows), INSERT_CHUNK_ROWS):
+            await session.execute(insert(MatchFeed).values(rows[offset:offset + INSERT_CHUNK_ROWS]))
+        self.pairs_written += len(rows)
+
+        now = datetime.utcnow()
+        for key, viewer_ids in groups.items():
+            result = await session.execute(self._group_insert(key, viewer_ids, now))
+            self.pairs_written += max(result.rowcount, 0)
+
+    def _matrix_candidates(self, user: User) -> List[dict]:
+        """Лента команды или соискателя из матрицы совместимости"""
+        now = datetime.utcnow()
+
+        if user.user_type == UserType.TEAM:
+            team_id = affinity.primary_team(user.id)
+            if team_id is None:
+                return []
+            return [
+                {"viewer_id": user.id, "candidate_type": UserType.PARTICIPANT,
+                 "candidate_id": participant_id, "score": score, "computed_at": now}
+                for participant_id, score in affinity.participants_for_team(team_id)
+                if participant_id != user.id
+            ][:self.feed_size]
+
+        return [
+            {"viewer_id": user.id, "candidate_type": UserType.TEAM,
+             "candidate_id": team_id, "score": score, "computed_at": now}
+            for team_id, score in affinity.teams_for_participant(user.id)
+            if affinity.team_leader(team_id) != user.id
+        ][:self.feed_size]
+
+    async def _team_masks(self, session, leader_ids: List[int]) -> Dict[int, int]:
+        """Маска навыков основной команды каждого лидера (один запрос)"""
+        if not leader_ids:
+            return {}
+        result = await session.execute(
+            select(Team.leader_id, Team.needed_skills)
+            .where(and_(Team.leader_id.in_(leader_ids), Team.status == TeamStatus.ACTIVE))
+            .order_by(Team.id)
+        )
+        masks: Dict[int, int] = {}
+        for leader_id, needed_skills in result.all():
+            masks.setdefault(leader_id, skill_mask(needed_skills))
+        return masks
+
+    @staticmethod
+    def _group_key(user: User, team_masks: Dict[int, int]) -> Optional[tuple]:
+        """Ключ группы зрителей с одинаковым порядком кандидатов (None - ленты нет)"""
+        if user.user_type == UserType.TEAM:
+            mask = team_masks.get(user.id, 0)
+            return (UserType.TEAM, mask) if mask else None
+        if user.user_type == UserType.PARTICIPANT:
+            mask = skill_mask(user.primary_skill, user.additional_skills)
+            return (UserType.PARTICIPANT, mask) if mask else None
+        if user.user_type == UserType.COFOUNDER:
+            return (UserType.COFOUNDER, user.primary_skill, idea_category(user.idea_what))
+        return None
+
+    @staticmethod
+    def _group_candidates(key: tuple):
+        """
+        Кандидаты группы по убыванию оценки.
+
+        Колонки: candidate_id, score, owner (зритель, которому кандидат
+        не показывается - он сам или его команда), tiebreak.
+        """
+        viewer_type = key[0]
+
+        if viewer_type == UserType.TEAM:
+            mask = key[1]
+            overlap = skill_overlap_expr(mask, User.primary_skill, User.additional_skills)
+            score = ranking_score_expr(
+                mask, (User.primary_skill, User.additional_skills), User.last_active, User.id, _hot_since()
+            )
+            return UserType.PARTICIPANT, (
+                select(User.id.label("candidate_id"), score.label("score"),
+                       User.id.label("owner"), User.last_active.label("tiebreak"))
+                .where(and_(_active_user(UserType.PARTICIPANT), overlap > 0))
+                .order_by(score.desc(), User.last_active.desc())
+            )
+
+        if viewer_type == UserType.PARTICIPANT:
+            mask = key[1]
+            overlap = skill_overlap_expr(mask, Team.needed_skills)
+            score = ranking_score_expr(mask, (Team.needed_skills,), Team.updated_at, Team.leader_id, _hot_since())
+            return UserType.TEAM, (
+                select(Team.id.label("candidate_id"), score.label("score"),
+                       Team.leader_id.label("owner"), Team.updated_at.label("tiebreak"))
+                .where(and_(Team.status == TeamStatus.ACTIVE, overlap > 0))
+                .order_by(score.desc(), Team.updated_at.desc())
+            )
+
+        _, primary_skill, category = key
+        score = cofounder_stars_expr(primary_skill, category, User)
+        return UserType.COFOUNDER, (
+            select(User.id.label("candidate_id"), score.label("score"),
+                   User.id.label("owner"), User.last_active.label("tiebreak"))
+            .where(_active_user(UserType.COFOUNDER))
+            .order_by(score.desc(), User.last_active.desc())
+        )
+
+    def _group_insert(self, key: tuple, viewer_ids: List[int], now: datetime):
+        """
+        INSERT лент всех зрителей группы.
+
+        top-(k+1) кандидатов группы считаются один раз; каждому зрителю
+        достаются первые k без него самого.
+        """
+        candidate_type, candidates = self._group_candidates(key)
+        ranked = candidates.limit(self.feed_size + 1).cte("ranked")
+        viewers = values(column("viewer_id", Integer), name="viewers").data([(viewer_id,) for viewer_id in viewer_ids])
+        paired = (
+            select(
+                viewers.c.viewer_id, ranked.c.candidate_id, ranked.c.score,
+                func.row_number().over(
+                    partition_by=viewers.c.viewer_id,
+                    order_by=(ranked.c.score.desc(), ranked.c.tiebreak.desc())
+                ).label("rank")
+            )
+            .select_from(viewers.join(ranked, ranked.c.owner != viewers.c.viewer_id))
+            .subquery()
+        )
+        return insert(MatchFeed).from_select(
+            ["viewer_id", "candidate_type", "candidate_id", "score", "computed_at"],
+            select(
+                paired.c.viewer_id, literal(candidate_type, MatchFeed.candidate_type.type),
+                paired.c.candidate_id, paired.c.score, literal(now)
+            )
+            .where(paired.c.rank <= self.feed_size)
+        )
+
+    async def _refresh_candidate_user(self, session, user: User) -> Set[int]:
+        """
+        Обновить строки пользователя в чужих лентах.
+
+        Returns:
+            Зрители, из лент которых пользователь пропал (им нужна дозагрузка)
+        """
+        removed = await self._remove_candidate(session, user.user_type, user.id)
+        if not user.is_searching or user.deleted_at is not None:
+            return removed
+
+        now = datetime.utcnow()
+        if user.user_type == UserType.PARTICIPANT and affinity.ready:
+            # Зрители - лидеры команд, в строках которых есть соискатель
+            viewers = [
+                {"viewer_id": affinity.team_leader(team_id), "candidate_type": UserType.PARTICIPANT,
+                 "candidate_id": user.id, "score": affinity.pair_score(team_id, user.id), "computed_at": now}
+                for team_id in affinity.viewers_of_participant(user.id)
+                if affinity.primary_team(affinity.team_leader(team_id)) == team_id
+                and affinity.team_leader(team_id) != user.id
+            ]
+        elif user.user_type == UserType.PARTICIPANT:
+            mask = skill_mask(user.primary_skill, user.additional_skills)
+            if not mask:
+                return removed
+            # Зрители - лидеры команд (по основной команде)
+            overlap = skill_overlap_expr(mask, Team.needed_skills)
+            activity = (
+                select(activity_expr(User.last_active, User.id, _hot_since()))
+                .where(User.id == user.id)
+                .scalar_subquery()
+            )
+            viewers = (
+                select(
+                    Team.leader_id, literal(UserType.PARTICIPANT, MatchFeed.candidate_type.type),
+                    literal(user.id), overlap + activity, literal(now)
+                )
+                .where(and_(Team.id.in_(_primary_team_ids()), Team.leader_id != user.id, overlap > 0))
+            )
+        else:
+            score = cofounder_stars_expr(user.primary_skill, idea_category(user.idea_what), User)
+            viewers = (
+                select(
+                    User.id, literal(UserType.COFOUNDER, MatchFeed.candidate_type.type),
+                    literal(user.id), score, literal(now)
+                )
+                .where(and_(_active_user(UserType.COFOUNDER), User.id != user.id))
+            )
+
+        added = await self._add_candidate(session, viewers, user.user_type, user.id)
+        return removed - added
+
+    async def _refresh_candidate_team(self, session, team: Team) -> Set[int]:
+        """Обновить строки команды в лентах соискателей"""
+        removed = await self._remove_candidate(session, UserType.TEAM, team.id)
+        mask = skill_mask(team.needed_skills)
+        if team.status != TeamStatus.ACTIVE or not mask:
+            return removed
+
+        if affinity.ready:
+            now = datetime.utcnow()
+            viewers = [
+                {"viewer_id": user_id, "candidate_type": UserType.TEAM,
+                 "candidate_id": team.id, "score": affinity.pair_score(team.id, user_id), "computed_at": now}
+                for user_id in affinity.viewers_of_team(team.id)
+                if user_id != team.leader_id
+            ]
+            added = await self._add_candidate(session, viewers, UserType.TEAM, team.id)
+            return removed - added
+
+        overlap = skill_overlap_expr(mask, User.primary_skill, User.additional_skills)
+        activity = (
+            select(activity_expr(Team.updated_at, Team.leader_id, _hot_since()))
+            .where(Team.id == team.id)
+            .scalar_subquery()
+        )
+        viewers = (
+            select(
+                User.id, literal(UserType.TEAM, MatchFeed.candidate_type.type),
+                literal(team.id), overlap + activity, literal(datetime.utcnow())
+            )
+            .where(and_(_active_user(UserType.PARTICIPANT), User.id != team.leader_id, overlap > 0))
+        )
+        added = await self._add_candidate(session, viewers, UserType.TEAM, team.id)
+        return removed - added
+
+    async def _remove_candidate(self, session, candidate_type: UserType, candidate_id: int) -> Set[int]:
+        result = await session.execute(
+            delete(MatchFeed)
+            .where(and_(MatchFeed.candidate_type == candidate_type, MatchFeed.candidate_id == candidate_id))
+            .returning(MatchFeed.viewer_id)
+        )
+        return {row[0] for row in result.all()}
+
+    async def _add_candidate(self, session, viewers, candidate_type: UserType, candidate_id: int) -> Set[int]:
+        """
+        Вставить кандидата в ленты зрителей и обрезать их до feed_size.
+
+        viewers - SELECT строк match_feed или готовый список строк (из матрицы).
+        """
+        if isinstance(viewers, list):
+            if not viewers:
+                return set()
+            stmt = insert(MatchFeed).values(viewers)
+        else:
+            stmt = insert(MatchFeed).from_select(
+                ["viewer_id", "candidate_type", "candidate_id", "score", "computed_at"],
+                viewers
+            )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["viewer_id", "candidate_type", "candidate_id"],
+            set_={"score": stmt.excluded.score, "computed_at": stmt.excluded.computed_at}
+        ).returning(MatchFeed.viewer_id)
+        result = await session.execute(stmt)
+        added = {row[0] for row in result.all()}
+        self.pairs_written += len(added)
+
+        if added:
+            # Оставляем в лентах этих зрителей только top-k
+            touched = (
+                select(MatchFeed.viewer_id)
+                .where(and_(MatchFeed.candidate_type == candidate_type, MatchFeed.candidate_id == candidate_id))
+            )
+            ranked = (
+                select(
+                    MatchFeed.viewer_id, MatchFeed.candidate_type, MatchFeed.candidate_id,
+                    func.row_number().over(
+                        partition_by=MatchFeed.viewer_id,
+                        order_by=(MatchFeed.score.desc(), MatchFeed.computed_at.desc())
+                    ).label("rank")
+                )
+                .where(MatchFeed.viewer_id.in_(touched))
+                .subquery()
+            )
+            overflow = (
+                select(ranked.c.viewer_id, ranked.c.candidate_type, ranked.c.candidate_id)
+                .where(ranked.c.rank > self.feed_size)
+            )
+            await session.execute(
+                delete(MatchFeed).where(
+                    tuple_(MatchFeed.viewer_id, MatchFeed.candidate_type, MatchFeed.candidate_id).in_(overflow)
+                )
+            )
+
+        return added
+
+    async def _is_empty(self) -> bool:
+        async with get_db() as session:
+            result = await session.execute(select(MatchFeed.viewer_id).limit(1))
+            return result.first() is None
+
+
+# Глобальный экземпляр воркера
+match_feed = MatchFeedWorker(
+    feed_size=settings.MATCH_FEED_SIZE,
+    flush_interval=settings.MATCH_FEED_FLUSH_SECONDS,
+    rebuild_interval=settings.MATCH_FEED_REBUILD_HOURS * 3600,
+)
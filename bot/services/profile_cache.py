@@ -0,0 +1,162 @@
+"""
+Read-through кеш профилей пользователей и команд.
+
+get_user_by_telegram_id - первый запрос почти в каждом обработчике, поэтому
+профили держим в памяти процесса:
+- LRU с ограничением размера и TTL (TTLCache из cachetools)
+- Негативный кеш для незарегистрированных telegram_id (короткий TTL)
+- Явная инвалидация из функций записи в crud
+- Счетчики попаданий для мониторинга
+
+Закешированные объекты отсоединены от сессии (expire_on_commit=False),
+обработчики только читают их поля. Массовые изменения фоновых задач
+(например, is_searching=False у неактивных) видны после истечения TTL.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+from cachetools import TTLCache
+from database.models import Team, User
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Маркер «такого пользователя нет» в негативном кеше
+_MISSING = object()
+
+
+class CacheStats:
+    """Счетчики попаданий одного кеша"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.invalidations = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+class ProfileCache:
+    """Кеш профилей: пользователи по telegram_id, команды по лидеру"""
+
+    def __init__(self, maxsize: int = 10000, ttl: int = 300, negative_ttl: int = 30):
+        """
+        Args:
+            maxsize: Максимум записей в каждом кеше (LRU вытеснение)
+            ttl: Время жизни записи (секунды)
+            negative_ttl: Время жизни записи «не зарегистрирован» (секунды)
+        """
+        self.enabled = maxsize > 0
+
+        size = max(maxsize, 1)
+        self._users: TTLCache = TTLCache(maxsize=size, ttl=ttl)
+        self._missing_users: TTLCache = TTLCache(maxsize=size, ttl=negative_ttl)
+        self._teams: TTLCache = TTLCache(maxsize=size, ttl=ttl)
+
+        self.user_stats = CacheStats()
+        self.team_stats = CacheStats()
+
+    # ===== Пользователи =====
+
+    def get_user(self, telegram_id: int) -> Any:
+        """
+        Найти пользователя в кеше.
+
+        Returns:
+            User, None (известно, что не зарегистрирован) или _MISSING (нет в кеше)
+        """
+        if not self.enabled:
+            return _MISSING
+
+        user = self._users.get(telegram_id)
+        if user is not None:
+            self.user_stats.hits += 1
+            return user
+
+        if telegram_id in self._missing_users:
+            self.user_stats.negative_hits += 1
+            return None
+
+        self.user_stats.misses += 1
+        return _MISSING
+
+    def put_user(self, telegram_id: int, user: Optional[User]) -> None:
+        """Сохранить результат запроса (None - негативная запись)"""
+        if not self.enabled:
+            return
+
+        if user is None:
+            self._missing_users[telegram_id] = True
+            self._users.pop(telegram_id, None)
+        else:
+            self._users[telegram_id] = user
+            self._missing_users.pop(telegram_id, None)
+
+    def invalidate_user(self, telegram_id: Optional[int]) -> None:
+        """Сбросить пользователя (и негативную запись) после изменения"""
+        if telegram_id is None:
+            return
+        self._users.pop(telegram_id, None)
+        self._missing_users.pop(telegram_id, None)
+        self.user_stats.invalidations += 1
+
+    # ===== Команды =====
+
+    def get_teams(self, leader_id: int) -> Any:
+        """Найти команды лидера в кеше (или _MISSING)"""
+        if not self.enabled:
+            return _MISSING
+
+        teams = self._teams.get(leader_id, _MISSING)
+        if teams is _MISSING:
+            self.team_stats.misses += 1
+        else:
+            self.team_stats.hits += 1
+        return teams
+
+    def put_teams(self, leader_id: int, teams: List[Team]) -> None:
+        if self.enabled:
+            self._teams[leader_id] = teams
+
+    def invalidate_teams(self, leader_id: Optional[int]) -> None:
+        """Сбросить команды лидера после изменения"""
+        if leader_id is None:
+            return
+        self._teams.pop(leader_id, None)
+        self.team_stats.invalidations += 1
+
+    # ===== Обслуживание =====
+
+    def clear(self) -> None:
+        """Сбросить весь кеш"""
+        self._users.clear()
+        self._missing_users.clear()
+        self._teams.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Получить статистику кеша (для мониторинга)"""
+        return {
+            "users": {**self.user_stats.as_dict(), "size": len(self._users), "negative_size": len(self._missing_users)},
+            "teams": {**self.team_stats.as_dict(), "size": len(self._teams)},
+        }
+
+
+def is_cached(value: Any) -> bool:
+    """Проверить, что get_user/get_teams вернули значение из кеша"""
+    return value is not _MISSING
+
+
+# Глобальный экземпляр кеша
+profile_cache = ProfileCache(
+    maxsize=settings.PROFILE_CACHE_SIZE,
+    ttl=settings.PROFILE_CACHE_TTL_SECONDS,
+    negative_ttl=settings.PROFILE_CACHE_NEGATIVE_TTL_SECONDS,
+)
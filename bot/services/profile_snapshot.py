@@ -0,0 +1,399 @@
+"""
+Колоночный снимок профилей для поиска.
+
+В памяти процесса хранятся только поля, нужные для отбора и ранжирования
+кандидатов, - по колонке на поле (array / bytearray, ~26 байт на профиль
+вместо ORM-объекта):
+
+- id (отсортированы - поиск позиции через bisect)
+- тип пользователя, флаг «ищет» (is_searching и не удален)
+- маска навыков (utils.skills), код основного навыка, категория идеи
+- last_active (epoch), принятые / полученные приглашения
+
+Отбор идет целыми колонками: bytes.translate превращает маску навыков
+в число общих навыков, а тип и флаг - в 0x00/0xFF; побайтовое AND
+колонок (через int.from_bytes) дает кандидатов без цикла Python по всем
+профилям. Цикл идет только по подходящим, из БД загружается только
+итоговая страница (crud._load_by_ids).
+
+Синхронизация - опрос users.updated_at выше водяной отметки раз в
+SNAPSHOT_SYNC_SECONDS и полная перезагрузка раз в SNAPSHOT_RELOAD_MINUTES
+(жесткие удаления и прямые изменения в БД). Ответы на приглашения
+приходят из crud.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import compress
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import select, func, literal
+from database.db import get_db
+from database.models import Invitation, InvitationStatus, User, UserType
+from database.ranking import IDEA_CATEGORIES, activity_by_age, idea_category
+from utils.skills import skill_mask
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Коды типов пользователей в колонке
+TYPE_CODES = {UserType.PARTICIPANT: 1, UserType.COFOUNDER: 2, UserType.TEAM: 3}
+
+# Даты в БД - наивные UTC (datetime.utcnow)
+EPOCH = datetime(1970, 1, 1)
+
+# Перекрытие окна синхронизации: строки, закоммиченные позже своего updated_at
+WATERMARK_OVERLAP = timedelta(seconds=5)
+
+# Таблицы bytes.translate: тип -> 0xFF, маска -> число общих навыков с маской
+_TYPE_TABLES = {
+    code: bytes(0xFF if value == code else 0 for value in range(256))
+    for code in TYPE_CODES.values()
+}
+_OVERLAP_TABLES: Dict[int, bytes] = {}
+
+
+def _overlap_table(mask: int) -> bytes:
+    table = _OVERLAP_TABLES.get(mask)
+    if table is None:
+        table = bytes((value & mask).bit_count() for value in range(256))
+        _OVERLAP_TABLES[mask] = table
+    return table
+
+
+def _and(first: bytes, *others: bytes) -> bytes:
+    """Побайтовое AND колонок одинаковой длины"""
+    value = int.from_bytes(first, "little")
+    for other in others:
+        value &= int.from_bytes(other, "little")
+    return value.to_bytes(len(first), "little")
+
+
+class _Columns:
+    """Колонки снимка; при перезагрузке строится новый набор и подменяется целиком"""
+
+    def __init__(self):
+        self.ids = array("q")
+        self.types = bytearray()
+        self.searching = bytearray()
+        self.masks = bytearray()
+        self.primary = array("H")
+        self.categories = bytearray()
+        self.last_active = array("d")
+        self.accepted = array("H")
+        self.received = array("H")
+
+    def all(self) -> tuple:
+        return (
+            self.ids, self.types, self.searching, self.masks, self.primary,
+            self.categories, self.last_active, self.accepted, self.received
+        )
+
+    def position(self, user_id: int) -> Optional[int]:
+        pos = bisect_left(self.ids, user_id)
+        if pos < len(self.ids) and self.ids[pos] == user_id:
+            return pos
+        return None
+
+    def append(self, user_id: int, values: tuple) -> None:
+        self.ids.append(user_id)
+        for column, value in zip(self.all()[1:], (*values, 0, 0)):
+            column.append(value)
+
+    def insert(self, user_id: int) -> int:
+        """Вставить пустую строку на место по id (id коммитятся не по порядку)"""
+        pos = bisect_left(self.ids, user_id)
+        for column in self.all():
+            column.insert(pos, 0)
+        self.ids[pos] = user_id
+        return pos
+
+    def set(self, pos: int, values: tuple) -> None:
+        for column, value in zip(self.all()[1:], values):
+            column[pos] = value
+
+    def nbytes(self) -> int:
+        return sum(len(column) * getattr(column, "itemsize", 1) for column in self.all())
+
+
+class ProfileSnapshot:
+    """Колоночный снимок профилей пользователей"""
+
+    def __init__(self, sync_interval: float = 5.0, reload_interval: int = 3600):
+        """
+        Args:
+            sync_interval: Интервал опроса изменений (секунды)
+            reload_interval: Интервал полной перезагрузки (секунды)
+        """
+        self.sync_interval = sync_interval
+        self.reload_interval = reload_interval
+
+        self._columns = _Columns()
+        # Коды основных навыков (0 - не указан) и маски по строкам навыков
+        self._primary_codes: Dict[str, int] = {}
+        self._masks_cache: Dict[Tuple[Optional[str], Optional[str]], int] = {}
+        # Приглашения, учтенные во время перезагрузки (повторяются на новых колонках)
+        self._pending: Optional[List[Tuple[int, InvitationStatus]]] = None
+
+        self.watermark: Optional[datetime] = None
+        self.ready = False
+        self.synced_rows = 0
+        self.last_reload_seconds: Optional[float] = None
+        self._last_reload = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    # ===== Поиск =====
+
+    def rank_participants(self, mask: int, exclude_user_id: Optional[int] = None,
+                          limit: Optional[int] = None,
+                          skip: Optional[Callable[[int], bool]] = None) -> List[int]:
+        """
+        Активные соискатели с навыками из mask по убыванию оценки
+        (пересечение навыков + database.ranking.activity_by_age).
+
+        skip отбрасывает кандидатов до отбора limit лучших
+        (например, уже просмотренных - services.seen_filter.SeenCheck).
+        """
+        columns = self._columns
+        matched = _and(
+            columns.types.translate(_TYPE_TABLES[TYPE_CODES[UserType.PARTICIPANT]]),
+            columns.searching,
+            columns.masks.translate(_overlap_table(mask))
+        )
+        now = time.time()
+        ids, last_active = columns.ids, columns.last_active
+        accepted, received = columns.accepted, columns.received
+        candidates = (
+            (
+                matched[pos] + activity_by_age((now - last_active[pos]) / 86400, accepted[pos], received[pos]),
+                last_active[pos],
+                ids[pos]
+            )
+            for pos in compress(range(len(matched)), matched)
+            if ids[pos] != exclude_user_id and (skip is None or not skip(ids[pos]))
+        )
+        if limit is None:
+            ranked = sorted(candidates, reverse=True)
+        else:
+            ranked = heapq.nlargest(limit, candidates)
+        return [user_id for _, _, user_id in ranked]
+
+    def rank_cofounders(self, user_id: int, limit: Optional[int] = None,
+                        skip: Optional[Callable[[int], bool]] = None) -> Optional[List[Tuple[int, int]]]:
+        """
+        Другие активные соло-основатели по совместимости (как calculate_compatibility).
+        skip - как в rank_participants.
+
+        Returns:
+            [(user_id, stars)] или None, если пользователя нет в снимке
+        """
+        columns = self._columns
+        pos = columns.position(user_id)
+        if pos is None:
+            return None
+        my_primary, my_category = columns.primary[pos], columns.categories[pos]
+
+        matched = _and(
+            columns.types.translate(_TYPE_TABLES[TYPE_CODES[UserType.COFOUNDER]]),
+            columns.searching
+        )
+        ids, primary, categories = columns.ids, columns.primary, columns.categories
+        ranked = []
+        for other in compress(range(len(matched)), matched):
+            if other == pos or (skip is not None and skip(ids[other])):
+                continue
+            stars = 4 if my_primary and primary[other] and primary[other] != my_primary else 2
+            if my_category and categories[other] == my_category:
+                stars = min(5, stars + 1)
+            ranked.append((stars, columns.last_active[other], ids[other]))
+
+        if limit is None:
+            ranked.sort(reverse=True)
+        else:
+            ranked = heapq.nlargest(limit, ranked)
+        return [(other_id, stars) for stars, _, other_id in ranked]
+
+    # ===== Изменения из crud =====
+
+    def record_invitation(self, to_user_id: int, status: InvitationStatus) -> None:
+        """Учесть новое (PENDING) или принятое приглашение получателя"""
+        if self._pending is not None:
+            self._pending.append((to_user_id, status))
+        pos = self._columns.position(to_user_id)
+        if pos is None:
+            return
+        column = self._columns.accepted if status == InvitationStatus.ACCEPTED else self._columns.received
+        if status in (InvitationStatus.PENDING, InvitationStatus.ACCEPTED) and column[pos] < 0xFFFF:
+            column[pos] += 1
+
+    # ===== Загрузка и синхронизация =====
+
+    async def reload(self) -> None:
+        """Полностью перечитать снимок из БД"""
+        started = time.perf_counter()
+        since = datetime.utcnow() - timedelta(days=settings.INVITATION_ARCHIVE_AFTER_DAYS)
+
+        try:
+            async with get_db() as session:
+                result = await session.stream(
+                    select(*self._select_columns(), literal(None).label("deleted_at"))
+                    .where(User.deleted_at.is_(None))
+                    .order_by(User.id)
+                    .execution_options(yield_per=settings.CLEANUP_BATCH_SIZE)
+                )
+                # Читатели видят старый снимок, пока строится новый
+                columns = _Columns()
+                self._masks_cache = {}
+                watermark = None
+                async for rows in result.partitions():
+                    for row in rows:
+                        columns.append(row.id, self._values(row))
+                        watermark = row.updated_at if watermark is None else max(watermark, row.updated_at)
+
+                # Счетчики новых колонок берутся из этого запроса - приглашения,
+                # учтенные после него, копятся и повторяются при подмене
+                self._pending = []
+                responses = await session.execute(
+                    select(
+                        Invitation.to_user_id,
+                        func.count().filter(Invitation.status == InvitationStatus.ACCEPTED),
+                        func.count()
+                    )
+                    .where(Invitation.created_at >= since)
+                    .group_by(Invitation.to_user_id)
+                )
+                for user_id, accepted, received in responses.all():
+                    pos = columns.position(user_id)
+                    if pos is not None:
+                        columns.accepted[pos] = min(accepted, 0xFFFF)
+                        columns.received[pos] = min(received, 0xFFFF)
+        except BaseException:
+            self._pending = None
+            raise
+
+        self._columns = columns
+        pending, self._pending = self._pending, None
+        for to_user_id, status in pending:
+            self.record_invitation(to_user_id, status)
+        self.watermark = watermark or datetime.utcnow()
+        self.ready = True
+        self._last_reload = time.monotonic()
+        self.last_reload_seconds = round(time.perf_counter() - started, 3)
+        logger.info(f"Снимок профилей загружен: {len(columns.ids)} профилей за {self.last_reload_seconds} с")
+
+    async def sync(self) -> int:
+        """Применить профили, измененные после водяной отметки"""
+        async with get_db() as session:
+            result = await session.execute(
+                select(*self._select_columns(), User.deleted_at)
+                .where(User.updated_at > self.watermark - WATERMARK_OVERLAP)
+                .order_by(User.updated_at)
+            )
+            rows = result.all()
+
+        for row in rows:
+            self._upsert(row)
+            self.watermark = max(self.watermark, row.updated_at)
+        self.synced_rows += len(rows)
+        return len(rows)
+
+    async def start(self) -> asyncio.Task:
+        """Загрузить снимок и запустить синхронизацию"""
+        await self.reload()
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self) -> None:
+        """Остановить синхронизацию"""
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def get_stats(self) -> dict:
+        """Статистика снимка (для мониторинга)"""
+        profiles = len(self._columns.ids)
+        memory = self._columns.nbytes()
+        return {
+            "profiles": profiles,
+            "bytes": memory,
+            "bytes_per_profile": round(memory / profiles, 1) if profiles else 0,
+            "watermark": self.watermark,
+            "synced_rows": self.synced_rows,
+            "last_reload_seconds": self.last_reload_seconds,
+        }
+
+    # ===== Внутренняя логика =====
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                if time.monotonic() - self._last_reload >= self.reload_interval:
+                    await self.reload()
+                else:
+                    await self.sync()
+            except Exception as e:
+                logger.error(f"Ошибка при синхронизации снимка профилей: {e}", exc_info=True)
+
+    @staticmethod
+    def _select_columns():
+        return (
+            User.id, User.user_type, User.is_searching, User.primary_skill,
+            User.additional_skills, User.idea_what, User.last_active, User.updated_at
+        )
+
+    def _values(self, row) -> tuple:
+        """Значения колонок без id и счетчиков приглашений"""
+        searching = row.is_searching and row.deleted_at is None
+        category = idea_category(row.idea_what)
+        skills = (row.primary_skill, row.additional_skills)
+        mask = self._masks_cache.get(skills)
+        if mask is None:
+            mask = self._masks_cache[skills] = skill_mask(*skills)
+        return (
+            TYPE_CODES[row.user_type],
+            0xFF if searching else 0,
+            mask,
+            self._primary_code(row.primary_skill),
+            IDEA_CATEGORIES.index(category) + 1 if category else 0,
+            (row.last_active - EPOCH).total_seconds() if row.last_active else 0.0,
+        )
+
+    def _upsert(self, row) -> None:
+        columns = self._columns
+        pos = columns.position(row.id)
+        if pos is None:
+            if row.deleted_at is not None:
+                return
+            if columns.ids and row.id < columns.ids[-1]:
+                pos = columns.insert(row.id)
+            else:
+                columns.append(row.id, self._values(row))
+                return
+        columns.set(pos, self._values(row))
+
+    def _primary_code(self, primary_skill: Optional[str]) -> int:
+        skill = (primary_skill or "").lower()
+        if not skill:
+            return 0
+        code = self._primary_codes.get(skill)
+        if code is None:
+            code = min(len(self._primary_codes) + 1, 0xFFFF)
+            self._primary_codes[skill] = code
+        return code
+
+
+# Глобальный экземпляр снимка
+profile_snapshot = ProfileSnapshot(
+    sync_interval=settings.SNAPSHOT_SYNC_SECONDS,
+    reload_interval=settings.SNAPSHOT_RELOAD_MINUTES * 60,
+)
@@ -0,0 +1,323 @@
+"""
+Профилирование обработчиков на живом трафике.
+
+ProfilingMiddleware выбирает апдейты для профилирования: долю
+PROFILER_SAMPLE_RATE, все апдейты обработчиков из PROFILER_HANDLERS и
+пользователей из PROFILER_USER_IDS. Администраторы меняют это без
+перезапуска командой /profiler.
+
+Режимы (PROFILER_MODE):
+- sampler (по умолчанию) - статистический: поток-сэмплер раз в
+  PROFILER_INTERVAL_MS смотрит, где сейчас обработчик. Если его задача
+  выполняется - берется стек потока loop, если ждет - цепочка await
+  корутин с пометкой (await). Так видно и CPU, и ожидание БД и Telegram.
+  Несколько обработчиков профилируются одновременно, накладные расходы
+  не зависят от числа вызовов функций
+- cprofile - детерминированный cProfile: точные числа вызовов, но
+  замедляет обработчик в разы и, пока обработчик ждет, учитывает код
+  других задач loop. Одновременно - только один обработчик, остальные
+  пропускаются
+
+Результаты пишутся в PROFILER_DIR/<обработчик>/: collapsed stacks
+(.collapsed, строка «кадр;кадр;кадр число») или .pstats. Хранится не
+более PROFILER_MAX_FILES файлов - старые удаляются. Свести их во вход
+для flamegraph: python -m bench.flamegraph.
+"""
+import asyncio
+import cProfile
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Deque, Dict, List, Optional, Set
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Корень кода бота: пути в кадрах показываются относительно него
+BOT_ROOT = str(Path(__file__).resolve().parents[1])
+
+MODES = ("sampler", "cprofile")
+
+# Метка кадра, где задача обработчика ждет (БД, Bot API, sleep)
+AWAIT_MARKER = "(await)"
+
+
+def frame_label(code) -> str:
+    """Имя кадра для collapsed stacks: функция и место ее определения"""
+    filename = code.co_filename
+    if filename.startswith(BOT_ROOT):
+        filename = os.path.relpath(filename, BOT_ROOT)
+    else:
+        filename = os.path.basename(filename)
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({filename}:{code.co_firstlineno})"
+
+
+def _slug(name: str) -> str:
+    return "".join(char if char.isalnum() or char in "._-" else "_" for char in name)
+
+
+class _Sampling:
+    """Обработчик, который сейчас профилирует сэмплер"""
+
+    __slots__ = ("task", "coro", "samples")
+
+    def __init__(self, task: asyncio.Task, coro: Any):
+        self.task = task
+        self.coro = coro
+        self.samples: Counter = Counter()
+
+
+class HandlerProfiler:
+    """Выбор апдейтов, запуск обработчика под профилировщиком и запись результатов"""
+
+    def __init__(self, enabled: bool = False, mode: str = "sampler", sample_rate: float = 0.01,
+                 handlers: Optional[List[str]] = None, user_ids: Optional[List[int]] = None,
+                 interval: float = 0.005, directory: str = "logs/profiles", max_files: int = 1000):
+        """
+        Args:
+            enabled: Профилировать апдейты
+            mode: sampler или cprofile
+            sample_rate: Доля случайных апдейтов
+            handlers: Обработчики, которые профилируются всегда (имя или модуль.имя)
+            user_ids: Пользователи, чьи апдейты профилируются всегда
+            interval: Период сэмплирования (секунды)
+            directory: Каталог результатов
+            max_files: Сколько файлов хранить
+        """
+        self.enabled = enabled
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.handlers: Set[str] = set(handlers or [])
+        self.user_ids: Set[int] = set(user_ids or [])
+        self.interval = interval
+        self.directory = Path(directory)
+        self.max_files = max_files
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._sessions: Dict[int, _Sampling] = {}
+        self._cprofile_active = False
+
+        self._files_lock = threading.Lock()
+        self._files: Optional[Deque[Path]] = None
+
+        self.profiled = 0
+        self.skipped_busy = 0
+        self.written = 0
+        self.failed = 0
+
+    # ===== Публичный API =====
+
+    async def start(self) -> None:
+        """Запомнить loop и запустить поток-сэмплер (спит, пока нечего профилировать)"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="handler-profiler", daemon=True)
+        self._thread.start()
+        if self.enabled:
+            logger.info(f"Профилирование обработчиков: {self.describe()}")
+
+    async def stop(self) -> None:
+        """Остановить поток-сэмплер"""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, 1.0)
+            self._thread = None
+
+    def should_profile(self, module: str, qualname: str, user_id: Optional[int]) -> bool:
+        """Профилировать ли этот апдейт"""
+        if not self.enabled:
+            return False
+        if user_id is not None and user_id in self.user_ids:
+            return True
+        if qualname in self.handlers or f"{module}.{qualname}" in self.handlers:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def profile(self, name: str, coro: Awaitable) -> Any:
+        """Выполнить корутину обработчика под профилировщиком и сохранить результат"""
+        if self.mode == "cprofile":
+            return await self._run_cprofile(name, coro)
+        return await self._run_sampled(name, coro)
+
+    def describe(self) -> str:
+        """Текущие настройки одной строкой"""
+        if not self.enabled:
+            return "выключено"
+        parts = [f"режим {self.mode}", f"доля {self.sample_rate:g}"]
+        if self.handlers:
+            parts.append("обработчики " + ", ".join(sorted(self.handlers)))
+        if self.user_ids:
+            parts.append("пользователи " + ", ".join(map(str, sorted(self.user_ids))))
+        return "; ".join(parts)
+
+    def get_stats(self) -> dict:
+        """Статистика профилирования (для мониторинга)"""
+        return {
+            "enabled": self.enabled,
+            "mode": self.mode,
+            "sample_rate": self.sample_rate,
+            "active": len(self._sessions) + self._cprofile_active,
+            "profiled": self.profiled,
+            "skipped_busy": self.skipped_busy,
+            "written": self.written,
+            "failed": self.failed,
+        }
+
+    # ===== cProfile =====
+
+    async def _run_cprofile(self, name: str, coro: Awaitable) -> Any:
+        if self._cprofile_active:
+            self.skipped_busy += 1
+            return await coro
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Уже активен другой профилировщик (отладчик, coverage)
+            self.skipped_busy += 1
+            return await coro
+
+        self._cprofile_active = True
+        started = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            profile.disable()
+            self._cprofile_active = False
+            self.profiled += 1
+            elapsed = time.perf_counter() - started
+            self._loop.run_in_executor(None, self._save_pstats, name, elapsed, profile)
+
+    def _save_pstats(self, name: str, elapsed: float, profile: cProfile.Profile) -> None:
+        path = self._path(name, elapsed, "pstats")
+        try:
+            profile.dump_stats(str(path))
+            self._written(path)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Не удалось сохранить профиль {path}: {e}")
+
+    # ===== Сэмплер =====
+
+    async def _run_sampled(self, name: str, coro: Awaitable) -> Any:
+        session = _Sampling(asyncio.current_task(), coro)
+        key = id(session)
+        self._sessions[key] = session
+        self._wake.set()
+        started = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            del self._sessions[key]
+            self.profiled += 1
+            if session.samples:
+                elapsed = time.perf_counter() - started
+                self._loop.run_in_executor(None, self._save_collapsed, name, elapsed, session.samples)
+
+    def _sample_loop(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            while self._sessions and not self._stopping.is_set():
+                self._sample()
+                time.sleep(self.interval)
+
+    def _sample(self) -> None:
+        running = asyncio.current_task(self._loop)
+        frame = sys._current_frames().get(self._loop_thread_id)
+        for session in list(self._sessions.values()):
+            if session.task is running and frame is not None:
+                stack = self._running_stack(frame)
+            else:
+                stack = self._await_stack(session.coro)
+                if stack:
+                    stack.append(AWAIT_MARKER)
+            if stack:
+                session.samples[";".join(stack)] += 1
+
+    @staticmethod
+    def _running_stack(frame) -> List[str]:
+        """Стек потока loop ниже _run_sampled (сверху вниз)"""
+        root = HandlerProfiler._run_sampled.__code__
+        labels: List[str] = []
+        while frame is not None and frame.f_code is not root:
+            labels.append(frame_label(frame.f_code))
+            frame = frame.f_back
+        if frame is None:
+            # Задача еще не дошла до обработчика (внутренности asyncio)
+            return []
+        labels.reverse()
+        return labels
+
+    @staticmethod
+    def _await_stack(coro: Any) -> List[str]:
+        """Цепочка await приостановленной корутины (сверху вниз)"""
+        labels: List[str] = []
+        while coro is not None:
+            frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) \
+                or getattr(coro, "ag_frame", None)
+            if frame is None:
+                break
+            labels.append(frame_label(frame.f_code))
+            coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) \
+                or getattr(coro, "ag_await", None)
+        return labels
+
+    def _save_collapsed(self, name: str, elapsed: float, samples: Counter) -> None:
+        path = self._path(name, elapsed, "collapsed")
+        try:
+            with open(path, "w", encoding="utf-8") as output:
+                for stack, count in samples.most_common():
+                    output.write(f"{stack} {count}\n")
+            self._written(path)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Не удалось сохранить профиль {path}: {e}")
+
+    # ===== Файлы =====
+
+    def _path(self, name: str, elapsed: float, suffix: str) -> Path:
+        directory = self.directory / _slug(name)
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / f"{datetime.now():%Y%m%d-%H%M%S-%f}-{elapsed * 1000:.0f}ms.{suffix}"
+
+    def _written(self, path: Path) -> None:
+        """Учесть новый файл и удалить самые старые сверх max_files"""
+        with self._files_lock:
+            if self._files is None:
+                existing = [item for item in self.directory.glob("*/*") if item != path]
+                self._files = deque(sorted(existing, key=lambda item: item.stat().st_mtime))
+            self._files.append(path)
+            self.written += 1
+            while len(self._files) > self.max_files:
+                oldest = self._files.popleft()
+                try:
+                    oldest.unlink()
+                except FileNotFoundError:
+                    pass
+
+
+# Глобальный экземпляр
+handler_profiler = HandlerProfiler(
+    enabled=settings.PROFILER_ENABLED,
+    mode=settings.PROFILER_MODE,
+    sample_rate=settings.PROFILER_SAMPLE_RATE,
+    handlers=settings.PROFILER_HANDLERS,
+    user_ids=settings.PROFILER_USER_IDS,
+    interval=settings.PROFILER_INTERVAL_MS / 1000,
+    directory=settings.PROFILER_DIR,
+    max_files=settings.PROFILER_MAX_FILES,
+)
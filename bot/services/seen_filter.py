@@ -0,0 +1,342 @@
+"""
+Фильтр просмотренных кандидатов.
+
+Пропущенные команды и соло-основатели (а также те, кому уже отправлен
+запрос) не показываются повторно при новом /search. Для каждого
+пользователя хранится фильтр Блума - SEEN_FILTER_BITS бит на поколение
+вместо списка id, поэтому не нужны длинные NOT IN (...) в запросах:
+проверка (SeenCheck) выполняется в памяти прямо при отборе кандидатов -
+в цикле ранжирования снимка и при чтении ленты страницами.
+
+- Два поколения: проверка идет по обоим, добавление - в текущее
+- Ротация раз в SEEN_FILTER_TTL_DAYS / 2 или при заполнении поколения:
+  предыдущее отбрасывается, так что пропуск живет от TTL/2 до TTL
+- Ложные срабатывания (~1-2% при заполнении) скрывают кандидата
+  до ротации - для ленты это допустимо
+- Изменения пишутся в seen_filters пачкой раз в SEEN_FILTER_FLUSH_SECONDS;
+  записанная другим экземпляром строка блокируется и объединяется
+  с локальной (побитовое OR поколений), так что пропуски не теряются
+"""
+import asyncio
+import hashlib
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+from cachetools import TTLCache
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.db import get_db, notify_change
+from database.models import SeenFilter, UserType
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# id пользователей в одном сообщении инвалидации (лимит pg_notify - 8000 байт)
+NOTIFY_CHUNK = 500
+
+
+class BloomFilter:
+    """Фильтр Блума фиксированного размера поверх bytearray"""
+
+    def __init__(self, bits: int, hashes: int, data: Optional[bytes] = None, count: int = 0):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data and len(data) * 8 == bits else bytearray(bits // 8)
+        self.count = count if data else 0
+
+    def _positions(self, key: str) -> Iterable[int]:
+        # Двойное хеширование: h1 + i*h2 (Kirsch-Mitzenmacher)
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        added = False
+        for position in self._positions(key):
+            byte, bit = divmod(position, 8)
+            if not self.data[byte] & (1 << bit):
+                self.data[byte] |= 1 << bit
+                added = True
+        if added:
+            self.count += 1
+
+    def update(self, other: "BloomFilter") -> None:
+        """Добавить все ключи другого фильтра того же размера (побитовое OR)"""
+        if other.bits != self.bits or other.hashes != self.hashes:
+            return
+        merged = int.from_bytes(self.data, "little") | int.from_bytes(other.data, "little")
+        self.data = bytearray(merged.to_bytes(len(self.data), "little"))
+        self.count = max(self.count, other.count)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.data[position // 8] & (1 << (position % 8))
+            for position in self._positions(key)
+        )
+
+
+class SeenSet:
+    """Два поколения фильтра Блума одного пользователя"""
+
+    def __init__(self, bits: int, hashes: int, row: Optional[SeenFilter] = None):
+        self.bits = bits
+        self.hashes = hashes
+        if row is None:
+            self.current = BloomFilter(bits, hashes)
+            self.previous: Optional[BloomFilter] = None
+            self.rotated_at = datetime.utcnow()
+        else:
+            self.current = BloomFilter(bits, hashes, row.current_bits, row.current_count)
+            self.previous = BloomFilter(bits, hashes, row.previous_bits) if row.previous_bits else None
+            self.rotated_at = row.rotated_at
+
+    def add(self, key: str) -> None:
+        self.current.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.current or (self.previous is not None and key in self.previous)
+
+    def merge(self, row: SeenFilter) -> None:
+        """
+        Объединить с записью другого экземпляра.
+
+        Поколения сопоставляются по rotated_at: поколение того, кто
+        ротировал раньше, попадает в предыдущее поколение другого.
+        """
+        other = SeenSet(self.bits, self.hashes, row)
+        if other.rotated_at > self.rotated_at:
+            mine = self.current
+            self.current, self.previous, self.rotated_at = other.current, other.previous, other.rotated_at
+            self.previous = _union(self.previous, mine)
+        elif other.rotated_at < self.rotated_at:
+            self.previous = _union(self.previous, other.current)
+        else:
+            self.current = _union(self.current, other.current)
+            self.previous = _union(self.previous, other.previous)
+
+    def rotate_if_needed(self, max_age: timedelta, capacity: int) -> bool:
+        """Начать новое поколение, если текущее устарело или заполнено"""
+        if datetime.utcnow() - self.rotated_at < max_age and self.current.count < capacity:
+            return False
+        self.previous = self.current
+        self.current = BloomFilter(self.bits, self.hashes)
+        self.rotated_at = datetime.utcnow()
+        return True
+
+
+def _union(first: Optional[BloomFilter], second: Optional[BloomFilter]) -> Optional[BloomFilter]:
+    if first is None or second is None:
+        return first or second
+    first.update(second)
+    return first
+
+
+def seen_key(candidate_type: UserType, candidate_id: int) -> str:
+    """Ключ кандидата в фильтре"""
+    return f"{candidate_type.value}:{candidate_id}"
+
+
+class SeenCheck:
+    """Проверка кандидатов одного типа по фильтру пользователя (для отбора при ранжировании)"""
+
+    def __init__(self, store: "SeenFilterStore", seen: SeenSet, candidate_type: UserType):
+        self.store = store
+        self.seen = seen
+        self.candidate_type = candidate_type
+        # Сколько кандидатов скрыто - отличает "все просмотрены" от "никого нет"
+        self.hidden = 0
+
+    def __call__(self, candidate_id: int) -> bool:
+        """True, если кандидат уже просмотрен"""
+        if seen_key(self.candidate_type, candidate_id) in self.seen:
+            self.hidden += 1
+            self.store.hidden_total += 1
+            return True
+        return False
+
+
+class SeenFilterStore:
+    """Кеш фильтров в памяти с отложенной записью в seen_filters"""
+
+    def __init__(self, bits: int = 8192, capacity: int = 1000, ttl_days: int = 14, flush_interval: float = 5.0):
+        """
+        Args:
+            bits: Размер поколения фильтра в битах (кратен 8)
+            capacity: Кандидатов в поколении до принудительной ротации
+            ttl_days: Максимальный срок жизни пропуска (дни)
+            flush_interval: Интервал записи изменений в БД (секунды)
+        """
+        self.bits = bits - bits % 8
+        self.capacity = capacity
+        # Оптимальное число хеш-функций для заданного заполнения
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.generation_age = timedelta(days=ttl_days) / 2
+        self.flush_interval = flush_interval
+
+        self._cache: TTLCache = TTLCache(maxsize=10000, ttl=3600)
+        # Измененные фильтры держим до записи, даже если кеш их вытеснил
+        self._dirty: Dict[int, SeenSet] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        self.hidden_total = 0
+        self.flushed_total = 0
+
+    # ===== Публичный API =====
+
+    async def get(self, session: AsyncSession, user_id: int) -> SeenSet:
+        """Фильтр пользователя (из кеша или БД)"""
+        seen = self._dirty.get(user_id) or self._cache.get(user_id)
+        if seen is None:
+            result = await session.execute(
+                select(SeenFilter).where(SeenFilter.user_id == user_id)
+            )
+            seen = SeenSet(self.bits, self.hashes, result.scalar_one_or_none())
+            self._cache[user_id] = seen
+
+        if seen.rotate_if_needed(self.generation_age, self.capacity):
+            self._dirty[user_id] = seen
+        return seen
+
+    async def add(self, session: AsyncSession, user_id: int, candidate_type: UserType, candidate_id: int) -> None:
+        """Отметить кандидата как просмотренного"""
+        seen = await self.get(session, user_id)
+        seen.add(seen_key(candidate_type, candidate_id))
+        self._dirty[user_id] = seen
+
+    async def check(self, session: AsyncSession, user_id: int, candidate_type: UserType) -> SeenCheck:
+        """Предикат "уже просмотрен" для отбора кандидатов"""
+        return SeenCheck(self, await self.get(session, user_id), candidate_type)
+
+    def evict(self, user_ids: Optional[Iterable[int]] = None) -> None:
+        """
+        Забыть закешированные фильтры (все, если user_ids не задан).
+
+        Вызывается, когда фильтр записал другой экземпляр. Незаписанные
+        изменения этого экземпляра остаются и при записи объединяются
+        с записанными (flush).
+        """
+        if user_ids is None:
+            self._cache.clear()
+            return
+        for user_id in user_ids:
+            self._cache.pop(user_id, None)
+
+    async def start(self) -> asyncio.Task:
+        """Запустить периодическую запись изменений"""
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self) -> None:
+        """Остановить запись и сохранить оставшиеся изменения"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Не удалось сохранить фильтры просмотренных: {e}")
+
+    async def flush(self) -> int:
+        """
+        Записать измененные фильтры.
+
+        Новые строки вставляются одним INSERT ... ON CONFLICT DO NOTHING.
+        Уже существующие (их мог записать другой экземпляр) блокируются
+        SELECT ... FOR UPDATE, объединяются с локальными (SeenSet.merge)
+        и перезаписываются одним INSERT ... ON CONFLICT DO UPDATE.
+        """
+        if not self._dirty:
+            return 0
+
+        dirty, self._dirty = self._dirty, {}
+        try:
+            async with get_db() as session:
+                result = await session.execute(
+                    insert(SeenFilter)
+                    .values([self._row(user_id, seen) for user_id, seen in dirty.items()])
+                    .on_conflict_do_nothing(index_elements=[SeenFilter.user_id])
+                    .returning(SeenFilter.user_id)
+                )
+                inserted = set(result.scalars().all())
+
+                existing = [user_id for user_id in dirty if user_id not in inserted]
+                if existing:
+                    result = await session.execute(
+                        select(SeenFilter)
+                        .where(SeenFilter.user_id.in_(existing))
+                        .with_for_update()
+                    )
+                    for row in result.scalars().all():
+                        dirty[row.user_id].merge(row)
+
+                    stmt = insert(SeenFilter).values([self._row(user_id, dirty[user_id]) for user_id in existing])
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[SeenFilter.user_id],
+                        set_={
+                            column: stmt.excluded[column]
+                            for column in ("current_bits", "current_count", "previous_bits", "rotated_at", "updated_at")
+                        }
+                    )
+                    await session.execute(stmt)
+
+                # Другие экземпляры сбрасывают свои копии этих фильтров
+                user_ids = list(dirty)
+                for start in range(0, len(user_ids), NOTIFY_CHUNK):
+                    await notify_change(session, "seen", {"user_ids": user_ids[start:start + NOTIFY_CHUNK]})
+        except Exception:
+            # Не теряем изменения - повторим при следующей записи
+            for user_id, seen in dirty.items():
+                self._dirty.setdefault(user_id, seen)
+            raise
+
+        self.flushed_total += len(dirty)
+        return len(dirty)
+
+    def get_stats(self) -> dict:
+        """Статистика фильтров (для мониторинга)"""
+        return {
+            "cached": len(self._cache),
+            "dirty": len(self._dirty),
+            "hidden_total": self.hidden_total,
+            "flushed_total": self.flushed_total,
+            "bits": self.bits,
+            "hashes": self.hashes,
+        }
+
+    # ===== Внутренняя логика =====
+
+    @staticmethod
+    def _row(user_id: int, seen: SeenSet) -> dict:
+        return {
+            "user_id": user_id,
+            "current_bits": bytes(seen.current.data),
+            "current_count": seen.current.count,
+            "previous_bits": bytes(seen.previous.data) if seen.previous else None,
+            "rotated_at": seen.rotated_at,
+            "updated_at": datetime.utcnow(),
+        }
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при записи фильтров просмотренных: {e}", exc_info=True)
+
+
+# Глобальный экземпляр хранилища
+seen_filters = SeenFilterStore(
+    bits=settings.SEEN_FILTER_BITS,
+    capacity=settings.SEEN_FILTER_CAPACITY,
+    ttl_days=settings.SEEN_FILTER_TTL_DAYS,
+    flush_interval=settings.SEEN_FILTER_FLUSH_SECONDS,
+)
@@ -0,0 +1,165 @@
+"""
+Гистограмма спроса и предложения по навыкам.
+
+Для каждого навыка в памяти хранится:
+- спрос: сколько активных команд ищут навык
+- предложение: сколько активных соискателей (PARTICIPANT) им владеют
+
+Счетчики разложены по маскам навыков (utils.skills): при 7 навыках это
+не больше 128 корзин. Поэтому «сколько команд ищут навык» - O(1), а
+«сколько соискателей подходят под любой из навыков команды» - проход
+по корзинам, без запросов к БД.
+
+- Полный пересчет - GROUP BY по строкам навыков при старте и в фоне
+- Инкрементальные изменения - из crud (create_user, create_team,
+  update_team_status)
+
+Изменение, попавшее между запросом и заменой счетчиков при полном
+пересчете, может потеряться - его исправит следующий пересчет.
+"""
+import asyncio
+import logging
+from collections import Counter
+from typing import Dict, List, Optional
+from sqlalchemy import select, func, and_
+from database.db import get_db
+from database.models import Team, TeamStatus, User, UserType, active_searchers_filter
+from utils.skills import SKILL_KEYS, mask_bits, skill_mask
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SkillHistogram:
+    """Счетчики команд и соискателей по маскам навыков"""
+
+    def __init__(self, refresh_interval: int = 300):
+        """
+        Args:
+            refresh_interval: Интервал полного пересчета (секунды)
+        """
+        self.refresh_interval = refresh_interval
+
+        self._teams_by_mask: Counter = Counter()
+        self._participants_by_mask: Counter = Counter()
+        self._demand: List[int] = [0] * len(SKILL_KEYS)
+        self._supply: List[int] = [0] * len(SKILL_KEYS)
+
+        self.ready = False
+        self.refreshes = 0
+        self._task: Optional[asyncio.Task] = None
+
+    # ===== Чтение =====
+
+    def teams_needing(self, bit: int) -> int:
+        """Количество активных команд, которым нужен навык (по биту)"""
+        return self._demand[bit.bit_length() - 1] if bit else 0
+
+    def participants_offering(self, bit: int) -> int:
+        """Количество активных соискателей с навыком (по биту)"""
+        return self._supply[bit.bit_length() - 1] if bit else 0
+
+    def participants_matching(self, mask: int) -> int:
+        """Количество активных соискателей, у которых есть хотя бы один навык из mask"""
+        if not mask:
+            return 0
+        return sum(
+            count for participant_mask, count in self._participants_by_mask.items()
+            if participant_mask & mask
+        )
+
+    # ===== Инкрементальные изменения =====
+
+    def add_team(self, mask: int, delta: int = 1) -> None:
+        """Учесть активную команду (delta=-1 - команда перестала быть активной)"""
+        if mask:
+            self._apply(self._teams_by_mask, self._demand, mask, delta)
+
+    def add_participant(self, mask: int, delta: int = 1) -> None:
+        """Учесть активного соискателя (delta=-1 - перестал искать)"""
+        if mask:
+            self._apply(self._participants_by_mask, self._supply, mask, delta)
+
+    # ===== Полный пересчет =====
+
+    async def refresh(self) -> None:
+        """Пересчитать гистограмму по БД (GROUP BY по строкам навыков)"""
+        async with get_db() as session:
+            teams = await session.execute(
+                select(Team.needed_skills, func.count())
+                .where(Team.status == TeamStatus.ACTIVE)
+                .group_by(Team.needed_skills)
+            )
+            team_rows = teams.all()
+
+            participants = await session.execute(
+                select(User.primary_skill, User.additional_skills, func.count())
+                .where(and_(User.user_type == UserType.PARTICIPANT, active_searchers_filter()))
+                .group_by(User.primary_skill, User.additional_skills)
+            )
+            participant_rows = participants.all()
+
+        teams_by_mask: Counter = Counter()
+        demand = [0] * len(SKILL_KEYS)
+        for needed_skills, count in team_rows:
+            self._apply(teams_by_mask, demand, skill_mask(needed_skills), count)
+
+        participants_by_mask: Counter = Counter()
+        supply = [0] * len(SKILL_KEYS)
+        for primary_skill, additional_skills, count in participant_rows:
+            self._apply(participants_by_mask, supply, skill_mask(primary_skill, additional_skills), count)
+
+        self._teams_by_mask, self._demand = teams_by_mask, demand
+        self._participants_by_mask, self._supply = participants_by_mask, supply
+        self.ready = True
+        self.refreshes += 1
+
+    async def start(self) -> asyncio.Task:
+        """Построить гистограмму и запустить фоновый пересчет"""
+        await self.refresh()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Гистограмма навыков построена")
+        return self._task
+
+    async def stop(self) -> None:
+        """Остановить фоновый пересчет"""
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Спрос и предложение по каждому навыку (для мониторинга)"""
+        return {
+            key: {"teams": self._demand[index], "participants": self._supply[index]}
+            for index, key in enumerate(SKILL_KEYS)
+        }
+
+    # ===== Внутренняя логика =====
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Ошибка при пересчете гистограммы навыков: {e}", exc_info=True)
+
+    @staticmethod
+    def _apply(buckets: Counter, per_skill: List[int], mask: int, delta: int) -> None:
+        if not mask:
+            return
+        buckets[mask] += delta
+        if buckets[mask] <= 0:
+            del buckets[mask]
+        for index in mask_bits(mask):
+            per_skill[index] = max(per_skill[index] + delta, 0)
+
+
+# Глобальный экземпляр гистограммы
+skill_histogram = SkillHistogram(refresh_interval=settings.SKILL_HISTOGRAM_REFRESH_SECONDS)
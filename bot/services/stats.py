@@ -0,0 +1,99 @@
+"""
+Сводная статистика компонентов бота.
+
+Собирает get_stats() пулов соединений, кешей и фоновых воркеров в один
+словарь - для команды /stats (администраторы из ADMIN_IDS) и эндпоинта
+/metrics: числовые значения отдаются как gauge bot_component_stat, доли
+попаданий кешей - как bot_cache_hit_ratio.
+"""
+from typing import Any, Dict, Iterable, List
+from database.db import change_listener, get_pool_stats, replicas
+from database.sql_trace import sql_tracer
+from services.cache_sync import cache_sync
+from services.invitation_expiry import invitation_expiry
+from services.profile_cache import profile_cache
+from services.user_counter import user_counter
+from services.skill_histogram import skill_histogram
+from services.affinity import affinity
+from services.match_feed import match_feed
+from services.seen_filter import seen_filters
+from services.profile_snapshot import profile_snapshot
+from services.loop_monitor import loop_monitor
+from services.update_recorder import update_recorder
+from services.profiler import handler_profiler
+from tasks import get_cleanup_stats
+from utils.log_pipeline import log_pipeline
+from utils.metrics import registry, handler_latency, telegram_request_latency, Sample
+
+# Ограничение Telegram на длину сообщения
+MESSAGE_LIMIT = 4096
+
+
+def collect_stats() -> Dict[str, Any]:
+    """Статистика всех компонентов: {компонент: get_stats()}"""
+    return {
+        "handlers": handler_latency.summary(),
+        "telegram_api": telegram_request_latency.summary(),
+        "event_loop": loop_monitor.get_stats(),
+        "db_pools": get_pool_stats(),
+        "replicas": replicas.get_stats(),
+        "sql_by_handler": sql_tracer.get_stats(),
+        "invalidation": {**change_listener.get_stats(), **cache_sync.get_stats()},
+        "profile_cache": profile_cache.get_stats(),
+        "user_counter": user_counter.get_stats(),
+        "skill_histogram": skill_histogram.get_stats(),
+        "affinity": affinity.get_stats(),
+        "match_feed": match_feed.get_stats(),
+        "seen_filters": seen_filters.get_stats(),
+        "profile_snapshot": profile_snapshot.get_stats(),
+        "invitation_expiry": invitation_expiry.get_stats(),
+        "cleanup": get_cleanup_stats(),
+        "logging": log_pipeline.get_stats(),
+        "update_recorder": update_recorder.get_stats(),
+        "profiler": handler_profiler.get_stats(),
+    }
+
+
+def _component_samples() -> Iterable[Sample]:
+    for component, values in collect_stats().items():
+        # Гистограммы уже отдаются своими метриками
+        if component in ("handlers", "telegram_api"):
+            continue
+        for key, value in _flatten(values):
+            yield {"component": component, "key": key}, value
+
+
+def _cache_hit_samples() -> Iterable[Sample]:
+    profile = profile_cache.get_stats()
+    yield {"cache": "profile_users"}, profile["users"]["hit_ratio"]
+    yield {"cache": "profile_teams"}, profile["teams"]["hit_ratio"]
+
+
+registry.collector("bot_component_stat", "Numeric values from component get_stats()", _component_samples)
+registry.collector("bot_cache_hit_ratio", "Cache hit ratio", _cache_hit_samples)
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    """Текст для Telegram: компонент и его плоские метрики по строкам"""
+    lines: List[str] = []
+    for component, values in stats.items():
+        lines.append(f"[{component}]")
+        for key, value in _flatten(values):
+            lines.append(f"  {key}: {value}")
+
+    text = "\n".join(lines)
+    if len(text) > MESSAGE_LIMIT:
+        text = text[:MESSAGE_LIMIT - 4] + "\n..."
+    return text
+
+
+def _flatten(values: Any, prefix: str = ""):
+    if not isinstance(values, dict):
+        yield prefix or "value", values
+        return
+    for key, value in values.items():
+        name = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            yield from _flatten(value, name)
+        else:
+            yield name, value
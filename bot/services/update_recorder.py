@@ -0,0 +1,246 @@
+"""
+Запись входящих апдейтов для воспроизведения (bench.replay).
+
+Синтетический трафик не повторяет реальную смесь /search и серий свайпов,
+поэтому апдейты из продакшена пишутся в файл и потом проигрываются на
+тестовой базе.
+
+- Формат: NDJSON в gzip, по строке на апдейт: {"ts": unix-время, "update": {...}}.
+  Файл только дописывается; при превышении UPDATE_RECORD_MAX_FILE_MB
+  начинается новый
+- Сэмплирование по пользователям (UPDATE_RECORD_SAMPLE_RATE): записываются
+  все апдейты выбранной доли пользователей - цепочки регистрации и свайпов
+  не рвутся
+- Анонимизация: id пользователей и чатов заменяются псевдонимами (HMAC с
+  UPDATE_RECORD_SALT - один пользователь получает один псевдоним), имена
+  и username заменяются, свободный текст - строкой из «x» той же длины
+  (команды сохраняются без аргументов), контакты, геопозиция и файлы
+  удаляются. callback_data сохраняется - ее формирует сам бот
+- Сериализация, сжатие и запись выполняются в отдельном потоке; при
+  переполнении очереди апдейт не записывается и учитывается в статистике
+"""
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+from aiogram.types import Update
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Псевдонимы id: PSEUDO_ID_BASE + HMAC по модулю PSEUDO_ID_SPACE
+PSEUDO_ID_BASE = 7 * 10 ** 12
+PSEUDO_ID_SPACE = 10 ** 12
+
+# Объекты с данными пользователя или чата
+PERSON_KEYS = {
+    "from", "chat", "user", "sender_chat", "forward_from", "forward_from_chat",
+    "via_bot", "new_chat_member", "old_chat_member", "left_chat_member",
+}
+
+# Поля со свободным текстом
+TEXT_KEYS = {"text", "caption", "query"}
+
+# Удаляются целиком
+DROP_KEYS = {
+    "contact", "location", "venue", "photo", "document", "voice", "video", "video_note",
+    "audio", "sticker", "animation", "phone_number", "bio", "last_name",
+}
+
+# Период сброса буфера gzip на диск (секунды)
+FLUSH_INTERVAL_SECONDS = 5.0
+
+QUEUE_SIZE = 10000
+
+
+class UpdateRecorder:
+    """Анонимизированная запись апдейтов в сжатый NDJSON"""
+
+    def __init__(self, directory: str = "recordings", sample_rate: float = 1.0, max_file_mb: int = 100,
+                 salt: str = "", keep_text: bool = False):
+        """
+        Args:
+            directory: Каталог записей
+            sample_rate: Доля пользователей, чьи апдейты записываются
+            max_file_mb: Размер файла (сжатый), после которого начинается новый
+            salt: Ключ псевдонимизации (пусто - случайный при каждом запуске)
+            keep_text: Сохранять свободный текст как есть
+        """
+        self.directory = Path(directory)
+        self.sample_rate = sample_rate
+        self.max_file_bytes = max_file_mb * 1024 * 1024
+        self.keep_text = keep_text
+        self._salt = salt.encode() if salt else os.urandom(16)
+
+        self._queue: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._raw = None
+        self._gzip: Optional[gzip.GzipFile] = None
+        self.path: Optional[Path] = None
+
+        self.recorded = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.failed = 0
+        self.files = 0
+
+    # ===== Публичный API =====
+
+    async def start(self) -> None:
+        """Запустить поток записи"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._write_loop, name="update-recorder", daemon=True)
+        self._thread.start()
+        logger.info(f"Запись апдейтов в {self.directory} (доля пользователей {self.sample_rate})")
+
+    async def stop(self) -> None:
+        """Дописать очередь и закрыть файл"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        await asyncio.to_thread(self._thread.join, 10.0)
+        self._thread = None
+
+    def record(self, update: Update, user_id: Optional[int] = None) -> None:
+        """Поставить апдейт в очередь записи (вызывается из middleware)"""
+        if user_id is not None and not self._sampled(user_id):
+            self.skipped += 1
+            return
+        try:
+            self._queue.put_nowait((time.time(), update))
+        except queue.Full:
+            self.dropped += 1
+
+    def anonymize(self, value: Any, key: str = "") -> Any:
+        """Копия апдейта (в формате Bot API) без персональных данных"""
+        if isinstance(value, dict):
+            if key in PERSON_KEYS:
+                return self._person(value)
+            return {
+                name: self.anonymize(item, name)
+                for name, item in value.items()
+                if name not in DROP_KEYS
+            }
+        if isinstance(value, list):
+            return [self.anonymize(item, key) for item in value]
+        if key in TEXT_KEYS and isinstance(value, str):
+            return self._text(value)
+        if key == "chat_instance" and isinstance(value, str):
+            digest = hmac.new(self._salt, value.encode(), hashlib.sha256).digest()
+            return str(int.from_bytes(digest[:8], "big"))
+        return value
+
+    def pseudo_id(self, value: int) -> int:
+        """Стабильный псевдоним id пользователя или чата (знак сохраняется)"""
+        digest = hmac.new(self._salt, str(abs(value)).encode(), hashlib.sha256).digest()
+        pseudo = PSEUDO_ID_BASE + int.from_bytes(digest[:8], "big") % PSEUDO_ID_SPACE
+        return -pseudo if value < 0 else pseudo
+
+    def get_stats(self) -> dict:
+        """Статистика записи (для мониторинга)"""
+        return {
+            "running": self._thread is not None,
+            "recorded": self.recorded,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "queued": self._queue.qsize(),
+            "files": self.files,
+            "file": str(self.path) if self.path else "",
+        }
+
+    # ===== Анонимизация =====
+
+    def _sampled(self, user_id: int) -> bool:
+        if self.sample_rate >= 1:
+            return True
+        digest = hmac.new(self._salt, str(user_id).encode(), hashlib.sha256).digest()
+        return int.from_bytes(digest[:4], "big") / 2 ** 32 < self.sample_rate
+
+    def _person(self, person: dict) -> dict:
+        pseudo = self.pseudo_id(int(person["id"]))
+        result = {"id": pseudo}
+        for name in ("is_bot", "type", "language_code", "is_premium"):
+            if name in person:
+                result[name] = person[name]
+        if "first_name" in person:
+            result["first_name"] = f"User {pseudo}"
+        if "username" in person:
+            result["username"] = f"u{abs(pseudo)}"
+        if "title" in person:
+            result["title"] = f"Chat {pseudo}"
+        return result
+
+    def _text(self, text: str) -> str:
+        if self.keep_text:
+            return text
+        if text.startswith("/"):
+            # Команда без аргументов (в аргументах /start бывают метки)
+            return text.split(maxsplit=1)[0]
+        return "x" * len(text)
+
+    # ===== Поток записи =====
+
+    def _write_loop(self) -> None:
+        last_flush = time.monotonic()
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=FLUSH_INTERVAL_SECONDS)
+                except queue.Empty:
+                    item = False
+                if item is None:
+                    break
+                if item:
+                    self._write(*item)
+                if self._gzip is not None and time.monotonic() - last_flush >= FLUSH_INTERVAL_SECONDS:
+                    self._gzip.flush()
+                    last_flush = time.monotonic()
+        finally:
+            self._close()
+
+    def _write(self, ts: float, update: Update) -> None:
+        try:
+            raw = update.model_dump(mode="json", by_alias=True, exclude_none=True)
+            line = json.dumps({"ts": round(ts, 3), "update": self.anonymize(raw)}, ensure_ascii=False)
+            if self._gzip is None or self._raw.tell() >= self.max_file_bytes:
+                self._open()
+            self._gzip.write(line.encode("utf-8") + b"\n")
+            self.recorded += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Не удалось записать апдейт: {e}")
+
+    def _open(self) -> None:
+        self._close()
+        self.path = self.directory / f"updates-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{self.files}.ndjson.gz"
+        self._raw = open(self.path, "ab")
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode="ab")
+        self.files += 1
+        logger.info(f"Запись апдейтов: новый файл {self.path}")
+
+    def _close(self) -> None:
+        if self._gzip is not None:
+            self._gzip.close()
+            self._raw.close()
+            self._gzip = None
+            self._raw = None
+
+
+# Глобальный экземпляр
+update_recorder = UpdateRecorder(
+    directory=settings.UPDATE_RECORD_DIR,
+    sample_rate=settings.UPDATE_RECORD_SAMPLE_RATE,
+    max_file_mb=settings.UPDATE_RECORD_MAX_FILE_MB,
+    salt=settings.UPDATE_RECORD_SALT,
+    keep_text=settings.UPDATE_RECORD_KEEP_TEXT,
+)
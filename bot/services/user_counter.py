@@ -0,0 +1,152 @@
+"""
+Поддерживаемый счетчик активных пользователей.
+
+Обработчики регистрации сравнивают число пользователей с порогом
+«холодного старта». Вместо SELECT count(*) на каждую регистрацию:
+- счетчик считается один раз при старте - активные соискатели
+  (database.models.active_searchers_filter)
+- изменения того же множества применяются через cache_sync: новый
+  пользователь и вернувшийся в поиск +1, снятые с поиска фоновой
+  очисткой - минус их число
+- фоновый цикл периодически сверяет его с БД (ручные изменения, удаления)
+
+В приближенном режиме (USER_COUNTER_APPROXIMATE) сверка берет
+pg_class.reltuples частичного индекса idx_user_searching - это оценка
+числа активных соискателей из статистики ANALYZE без сканирования.
+"""
+import asyncio
+import logging
+from typing import Optional
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.db import get_db
+from database.models import User, active_searchers_filter
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Индекс, чья статистика используется в приближенном режиме
+APPROXIMATE_INDEX = "idx_user_searching"
+
+# Ниже этого значения оценка reltuples неточна, а точный подсчет дешев
+EXACT_COUNT_BELOW = 1000
+
+
+class UserCounter:
+    """Счетчик активных пользователей с периодической сверкой"""
+
+    def __init__(self, reconcile_interval: int = 600, approximate: bool = False):
+        """
+        Args:
+            reconcile_interval: Интервал сверки с БД (секунды)
+            approximate: Сверять по pg_class.reltuples вместо count(*)
+        """
+        self.reconcile_interval = reconcile_interval
+        self.approximate = approximate
+
+        self._value: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.reconciliations = 0
+        self.last_drift = 0
+
+    # ===== Публичный API =====
+
+    async def get(self, session: AsyncSession) -> int:
+        """Текущее значение (при первом обращении считается по БД)"""
+        if self._value is None:
+            self._value = await self._count(session)
+        return self._value
+
+    def increment(self, amount: int = 1) -> None:
+        """Учесть пользователей, ставших активными соискателями"""
+        if self._value is not None:
+            self._value += amount
+
+    def decrement(self, amount: int = 1) -> None:
+        """Учесть пользователей, снятых с поиска"""
+        if self._value is not None:
+            self._value = max(self._value - amount, 0)
+
+    async def reconcile(self) -> int:
+        """Пересчитать значение по БД"""
+        async with get_db() as session:
+            actual = await self._count(session)
+
+        if self._value is not None:
+            self.last_drift = actual - self._value
+            if self.last_drift:
+                logger.debug(f"Счетчик пользователей скорректирован на {self.last_drift}")
+
+        self._value = actual
+        self.reconciliations += 1
+        return actual
+
+    async def start(self) -> asyncio.Task:
+        """Посчитать значение и запустить периодическую сверку"""
+        await self.reconcile()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Счетчик пользователей запущен: {self._value}")
+        return self._task
+
+    async def stop(self) -> None:
+        """Остановить периодическую сверку"""
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def get_stats(self) -> dict:
+        """Получить статистику счетчика (для мониторинга)"""
+        return {
+            "value": self._value,
+            "approximate": self.approximate,
+            "reconciliations": self.reconciliations,
+            "last_drift": self.last_drift,
+        }
+
+    # ===== Внутренняя логика =====
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Ошибка при сверке счетчика пользователей: {e}", exc_info=True)
+
+    async def _count(self, session: AsyncSession) -> int:
+        if self.approximate:
+            estimate = await self._estimate(session)
+            if estimate is not None and estimate >= EXACT_COUNT_BELOW:
+                return estimate
+
+        result = await session.execute(
+            select(func.count())
+            .select_from(User)
+            .where(active_searchers_filter())
+        )
+        return result.scalar()
+
+    async def _estimate(self, session: AsyncSession) -> Optional[int]:
+        """Оценка по статистике; None, если ANALYZE еще не выполнялся"""
+        result = await session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = :name"),
+            {"name": APPROXIMATE_INDEX}
+        )
+        estimate = result.scalar()
+        if estimate is None or estimate < 0:
+            return None
+        return int(estimate)
+
+
+# Глобальный экземпляр счетчика
+user_counter = UserCounter(
+    reconcile_interval=settings.USER_COUNTER_RECONCILE_SECONDS,
+    approximate=settings.USER_COUNTER_APPROXIMATE,
+)
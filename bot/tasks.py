@@ -2,51 +2,206 @@
 Фоновые задачи для автоматической очистки и обслуживания БД.
 
 Задачи запускаются в отдельных asyncio task и выполняются периодически.
+
+Очистка работает батчами: каждый батч блокирует не больше
+CLEANUP_BATCH_SIZE строк (FOR UPDATE SKIP LOCKED - строки, занятые
+обработчиками, пропускаются до следующего запуска) и коммитится отдельно.
+Поэтому длинных транзакций нет, а прерванная очистка продолжается
+со следующего запуска без повторной обработки.
 """
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
-from sqlalchemy import select, update, and_
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import select, update, delete, insert, and_
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.db import get_db
-from database.models import Invitation, InvitationStatus, User
+from sqlalchemy.sql import Executable
+from database import db
+from database.db import get_db, notify_change
+from database.models import (
+    Invitation, InvitationArchive, InvitationStatus, User, UserType, active_searchers_filter
+)
+from database.partitions import ensure_invitation_partitions, drop_empty_partitions
+from services.cache_sync import cache_sync
+from services.invitation_expiry import invitation_expiry
+from services.match_feed import match_feed
+from utils.metrics import task_rows, task_runs
+from utils.skills import skill_mask
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Изменение для cache_sync: (тип, поля)
+Change = Tuple[str, dict]
+
+# Пользователей в одном сообщении users_inactive (лимит pg_notify - 8000 байт)
+INACTIVE_NOTIFY_CHUNK = 200
+
+# Метрики прогресса фоновой очистки по каждой задаче (для мониторинга)
+cleanup_stats: Dict[str, Dict[str, Any]] = {}
+
+# Сигнал остановки: проверяется между батчами и вместо sleep между запусками
+_stop_event: Optional[asyncio.Event] = None
+
+
+def _stop_requested() -> bool:
+    return _stop_event is not None and _stop_event.is_set()
+
+
+async def run_in_batches(
+    job_name: str,
+    build_batch: Callable[[int], Executable],
+    publish: Optional[Callable[[AsyncSession, list], Awaitable[List[Change]]]] = None,
+    on_commit: Optional[Callable[[list], None]] = None
+) -> int:
+    """
+    Выполнить UPDATE/DELETE батчами с коммитом после каждого батча.
+
+    Args:
+        job_name: имя задачи (ключ в cleanup_stats)
+        build_batch: функция, строящая запрос для батча заданного размера
+        publish: для запросов с RETURNING - публикует изменения по строкам
+            батча (notify_change в той же транзакции) и возвращает их для
+            cache_sync.apply после commit
+        on_commit: вызывается со строками батча после commit (только вместе с publish)
+
+    Returns:
+        Количество обработанных строк за этот запуск
+    """
+    batch_size = settings.CLEANUP_BATCH_SIZE
+    stats = cleanup_stats.setdefault(job_name, {
+        "runs": 0,
+        "total_rows": 0,
+        "last_run_rows": 0,
+        "last_run_batches": 0,
+        "last_run_seconds": 0.0,
+        "last_run_at": None,
+        "interrupted": False,
+        "running": False,
+    })
+    stats.update(running=True, interrupted=False, current_rows=0, current_batches=0)
+
+    processed = 0
+    batches = 0
+    started = time.monotonic()
+
+    try:
+        while not _stop_requested():
+            # Отдельная короткая транзакция на каждый батч
+            changes: List[Change] = []
+            async with get_db() as session:
+                result = await session.execute(build_batch(batch_size))
+                if publish is None:
+                    count = result.rowcount
+                else:
+                    rows = result.all()
+                    count = len(rows)
+                    changes = await publish(session, rows)
+
+            for kind, data in changes:
+                cache_sync.apply(kind, data)
+            if on_commit is not None and publish is not None:
+                on_commit(rows)
+
+            processed += count
+            batches += 1
+            stats.update(current_rows=processed, current_batches=batches)
+
+            if count < batch_size:
+                break
+
+            logger.debug(f"{job_name}: батч {batches}, обработано {processed} строк")
+
+            # Отдаем управление обработчикам между батчами
+            await asyncio.sleep(settings.CLEANUP_BATCH_PAUSE_SECONDS)
+        else:
+            stats["interrupted"] = True
+
+    except asyncio.CancelledError:
+        # Незакоммиченный батч откатится, закоммиченные остаются:
+        # следующий запуск продолжит с того же места
+        stats["interrupted"] = True
+        raise
+
+    finally:
+        stats.update(
+            running=False,
+            runs=stats["runs"] + 1,
+            total_rows=stats["total_rows"] + processed,
+            last_run_rows=processed,
+            last_run_batches=batches,
+            last_run_seconds=round(time.monotonic() - started, 3),
+            last_run_at=datetime.utcnow(),
+        )
+        task_runs.inc(job_name)
+        task_rows.inc(job_name, amount=processed)
+
+    return processed
+
 
 async def cleanup_expired_invitations() -> int:
     """
     Пометить истекшие приглашения как EXPIRED.
 
     Приглашения истекают через CLEANUP_EXPIRED_INVITATIONS_HOURS часов.
+    Основной путь - services.invitation_expiry (истекает точно к дедлайну),
+    здесь только страховочный проход по индексу idx_invitation_expired
+    для приглашений, пропущенных планировщиком (например, другим инстансом).
 
     Returns:
         Количество обработанных приглашений
     """
-    try:
-        async with get_db() as session:
-            now = datetime.utcnow()
-
-            # Находим приглашения со статусом PENDING и истекшим expires_at
-            stmt = (
-                update(Invitation)
-                .where(
-                    and_(
-                        Invitation.status == InvitationStatus.PENDING,
-                        Invitation.expires_at < now
-                    )
+    now = datetime.utcnow()
+
+    def build_batch(batch_size: int) -> Executable:
+        # Находим батч приглашений со статусом PENDING и истекшим expires_at
+        batch = (
+            select(Invitation.id)
+            .where(
+                and_(
+                    Invitation.status == InvitationStatus.PENDING,
+                    Invitation.expires_at < now
                 )
-                .values(status=InvitationStatus.EXPIRED)
             )
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .cte("expired_batch")
+        )
+        return (
+            update(Invitation)
+            .where(Invitation.id.in_(select(batch.c.id)))
+            .values(status=InvitationStatus.EXPIRED)
+            .returning(Invitation.id, Invitation.from_user_id, Invitation.to_user_id, Invitation.from_team_id)
+        )
+
+    async def publish(session: AsyncSession, rows: list) -> List[Change]:
+        changes = []
+        for _, from_user_id, to_user_id, from_team_id in rows:
+            change = {
+                "from_user_id": from_user_id,
+                "to_user_id": to_user_id,
+                "from_team_id": from_team_id,
+                "status": InvitationStatus.EXPIRED.name,
+            }
+            await notify_change(session, "invitation", change)
+            changes.append(("invitation", change))
+        return changes
+
+    def on_commit(rows: list) -> None:
+        # Как у планировщика: дедлайн снимаем с кучи, ленты обеих сторон обновляем
+        for invitation_id, from_user_id, to_user_id, _ in rows:
+            invitation_expiry.discard(invitation_id)
+            match_feed.mark_viewer(from_user_id)
+            match_feed.mark_viewer(to_user_id)
 
-            result = await session.execute(stmt)
-            count = result.rowcount
+    try:
+        count = await run_in_batches("expired_invitations", build_batch, publish, on_commit)
 
-            if count > 0:
-                logger.info(f"Помечено {count} приглашений как истекшие")
+        if count > 0:
+            logger.info(f"Помечено {count} приглашений как истекшие")
 
-            return count
+        return count
 
     except Exception as e:
         logger.error(f"Ошибка при очистке истекших приглашений: {e}", exc_info=True)
@@ -59,45 +214,158 @@ async def cleanup_inactive_users() -> int:
 
     Пользователи считаются неактивными, если last_active >
     CLEANUP_INACTIVE_USERS_DAYS дней назад.
+    last_active обновляет middlewares.ActivityMiddleware; первое же
+    действие пользователя возвращает его в поиск.
+
+    Снятые пользователи публикуются изменением users_inactive
+    (services.cache_sync): кеши профилей, счетчик, гистограмма навыков
+    и матрица совместимости обновляются на всех экземплярах.
 
     Returns:
         Количество обработанных пользователей
     """
+    threshold = datetime.utcnow() - timedelta(
+        days=settings.CLEANUP_INACTIVE_USERS_DAYS
+    )
+
+    def build_batch(batch_size: int) -> Executable:
+        # Находим батч активных пользователей с устаревшим last_active
+        batch = (
+            select(User.id)
+            .where(and_(active_searchers_filter(), User.last_active < threshold))
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .cte("inactive_batch")
+        )
+        # last_active сохраняем: onupdate иначе выставил бы текущее время
+        return (
+            update(User)
+            .where(User.id.in_(select(batch.c.id)))
+            .values(is_searching=False, last_active=User.last_active)
+            .returning(User.id, User.telegram_id, User.user_type, User.primary_skill, User.additional_skills)
+        )
+
+    async def publish(session: AsyncSession, rows: list) -> List[Change]:
+        users = [
+            [
+                user_id,
+                telegram_id,
+                skill_mask(primary_skill, additional_skills) if user_type == UserType.PARTICIPANT else None,
+            ]
+            for user_id, telegram_id, user_type, primary_skill, additional_skills in rows
+        ]
+        changes = []
+        for start in range(0, len(users), INACTIVE_NOTIFY_CHUNK):
+            change = {"users": users[start:start + INACTIVE_NOTIFY_CHUNK]}
+            await notify_change(session, "users_inactive", change)
+            changes.append(("users_inactive", change))
+        return changes
+
     try:
-        async with get_db() as session:
-            threshold = datetime.utcnow() - timedelta(
-                days=settings.CLEANUP_INACTIVE_USERS_DAYS
+        count = await run_in_batches("inactive_users", build_batch, publish)
+
+        if count > 0:
+            logger.info(
+                f"Помечено {count} неактивных пользователей "
+                f"(последняя активность > {settings.CLEANUP_INACTIVE_USERS_DAYS} дней)"
             )
 
-            # Находим активных пользователей с устаревшим last_active
-            stmt = (
-                update(User)
-                .where(
-                    and_(
-                        User.is_searching == True,
-                        User.last_active < threshold,
-                        User.deleted_at.is_(None)
-                    )
+        return count
+
+    except Exception as e:
+        logger.error(f"Ошибка при очистке неактивных пользователей: {e}", exc_info=True)
+        return 0
+
+
+# Колонки, переносимые из invitations в invitations_archive
+ARCHIVE_COLUMNS = (
+    "id", "from_user_id", "from_team_id", "to_user_id", "message",
+    "status", "created_at", "expires_at", "viewed_at", "responded_at",
+)
+
+
+async def archive_closed_invitations() -> int:
+    """
+    Перенести закрытые приглашения (ACCEPTED, REJECTED, EXPIRED) старше
+    INVITATION_ARCHIVE_AFTER_DAYS дней в invitations_archive.
+
+    Перенос батчами: DELETE ... RETURNING + INSERT в одном запросе.
+    Горячая таблица хранит только окно последних дней, а опустевшие
+    старые секции удаляются.
+
+    Returns:
+        Количество перенесенных приглашений
+    """
+    cutoff = datetime.utcnow() - timedelta(days=settings.INVITATION_ARCHIVE_AFTER_DAYS)
+
+    def build_batch(batch_size: int) -> Executable:
+        batch = (
+            select(Invitation.id, Invitation.created_at)
+            .where(
+                and_(
+                    Invitation.created_at < cutoff,
+                    Invitation.status.in_([
+                        InvitationStatus.ACCEPTED,
+                        InvitationStatus.REJECTED,
+                        InvitationStatus.EXPIRED,
+                    ])
+                )
+            )
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .cte("archive_batch")
+        )
+        moved = (
+            delete(Invitation)
+            .where(
+                and_(
+                    Invitation.id == batch.c.id,
+                    Invitation.created_at == batch.c.created_at
                 )
-                .values(is_searching=False)
             )
+            .returning(*[Invitation.__table__.c[name] for name in ARCHIVE_COLUMNS])
+            .cte("moved")
+        )
+        return (
+            insert(InvitationArchive)
+            .from_select(ARCHIVE_COLUMNS, select(*[moved.c[name] for name in ARCHIVE_COLUMNS]))
+            .add_cte(moved)
+        )
 
-            result = await session.execute(stmt)
-            count = result.rowcount
+    try:
+        count = await run_in_batches("archive_invitations", build_batch)
 
-            if count > 0:
-                logger.info(
-                    f"Помечено {count} неактивных пользователей "
-                    f"(последняя активность > {settings.CLEANUP_INACTIVE_USERS_DAYS} дней)"
-                )
+        if count > 0:
+            logger.info(
+                f"Перенесено в архив {count} закрытых приглашений "
+                f"(старше {settings.INVITATION_ARCHIVE_AFTER_DAYS} дней)"
+            )
 
-            return count
+        # Старые секции после переноса пустеют - удаляем их
+        async with db.engine.begin() as conn:
+            await drop_empty_partitions(conn, older_than=cutoff)
+
+        return count
 
     except Exception as e:
-        logger.error(f"Ошибка при очистке неактивных пользователей: {e}", exc_info=True)
+        logger.error(f"Ошибка при архивации приглашений: {e}", exc_info=True)
         return 0
 
 
+async def maintain_invitation_partitions() -> None:
+    """Заранее создать секции invitations на следующие месяцы"""
+    try:
+        async with db.engine.begin() as conn:
+            await ensure_invitation_partitions(conn, settings.INVITATION_PARTITIONS_AHEAD_MONTHS)
+    except Exception as e:
+        logger.error(f"Ошибка при создании секций приглашений: {e}", exc_info=True)
+
+
+def get_cleanup_stats() -> Dict[str, Dict[str, Any]]:
+    """Получить метрики прогресса фоновой очистки (для мониторинга)"""
+    return {job: dict(stats) for job, stats in cleanup_stats.items()}
+
+
 async def cleanup_task_runner():
     """
     Главная функция для запуска фоновых задач очистки.
@@ -109,10 +377,11 @@ async def cleanup_task_runner():
 
     logger.info(
         f"Запущена фоновая задача очистки БД. "
-        f"Интервал: {settings.CLEANUP_INTERVAL_MINUTES} минут"
+        f"Интервал: {settings.CLEANUP_INTERVAL_MINUTES} минут, "
+        f"батч: {settings.CLEANUP_BATCH_SIZE} строк"
     )
 
-    while True:
+    while not _stop_requested():
         try:
             logger.info("Запуск фоновой очистки БД...")
 
@@ -123,17 +392,25 @@ async def cleanup_task_runner():
                 return_exceptions=False
             )
 
+            # Секции на следующие месяцы и перенос старых закрытых приглашений в архив
+            await maintain_invitation_partitions()
+            archived_count = await archive_closed_invitations()
+
             logger.info(
                 f"Фоновая очистка завершена: "
                 f"{expired_count} истекших приглашений, "
-                f"{inactive_count} неактивных пользователей"
+                f"{inactive_count} неактивных пользователей, "
+                f"{archived_count} приглашений в архиве"
             )
 
         except Exception as e:
             logger.error(f"Ошибка в фоновой задаче очистки: {e}", exc_info=True)
 
-        # Ждем до следующего запуска
-        await asyncio.sleep(interval)
+        # Ждем до следующего запуска (или до сигнала остановки)
+        try:
+            await asyncio.wait_for(_stop_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
 
 
 def start_background_tasks() -> asyncio.Task:
@@ -145,19 +422,36 @@ def start_background_tasks() -> asyncio.Task:
     Returns:
         asyncio.Task для отслеживания и graceful shutdown
     """
+    global _stop_event
+
+    _stop_event = asyncio.Event()
     task = asyncio.create_task(cleanup_task_runner())
     logger.info("Фоновые задачи запущены")
     return task
 
 
-async def stop_background_tasks(task: asyncio.Task):
+async def stop_background_tasks(task: asyncio.Task, timeout: float = 10.0):
     """
     Остановить фоновые задачи (graceful shutdown).
 
+    Сначала просим задачу завершиться после текущего батча и ждем до
+    timeout секунд, затем отменяем. В обоих случаях закоммиченные батчи
+    сохраняются, а очистка продолжится при следующем старте.
+
     Args:
         task: Task, возвращенный start_background_tasks()
+        timeout: сколько ждать завершения текущего батча (секунды)
     """
     logger.info("Остановка фоновых задач...")
+    if _stop_event is not None:
+        _stop_event.set()
+
+    done, _ = await asyncio.wait({task}, timeout=timeout)
+    if task in done:
+        logger.info("Фоновые задачи остановлены")
+        return
+
+    logger.warning("Фоновые задачи не завершились вовремя, отменяем")
     task.cancel()
 
     try:
@@ -0,0 +1,53 @@
+"""Возвращение в поиск пользователей, снятых фоновой очисткой за неактивность"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import update
+from config import settings
+from database import crud
+from database.db import get_db
+from database.models import User, UserType
+from middlewares.activity import ActivityMiddleware
+import tasks
+
+
+async def _handler(event, data):
+    return "handled"
+
+
+def test_inactive_user_returns_to_search_after_interacting(run_db):
+    async def scenario():
+        async with get_db() as session:
+            user = await crud.create_user(
+                session, telegram_id=1001, name="Аня", user_type=UserType.PARTICIPANT,
+                primary_skill="Backend (Python/Go)"
+            )
+
+        # Не появлялась дольше CLEANUP_INACTIVE_USERS_DAYS - очистка снимает с поиска
+        stale = datetime.utcnow() - timedelta(days=settings.CLEANUP_INACTIVE_USERS_DAYS + 1)
+        async with get_db() as session:
+            await session.execute(update(User).where(User.id == user.id).values(last_active=stale))
+        assert await tasks.cleanup_inactive_users() == 1
+
+        async with get_db() as session:
+            assert await crud.count_users(session) == 0
+            assert await crud.find_users_by_skills(session, "Backend (Python/Go)") == []
+
+        # Любое действие в боте возвращает пользователя в поиск
+        middleware = ActivityMiddleware(interval=300)
+        result = await middleware(_handler, SimpleNamespace(), {"event_from_user": SimpleNamespace(id=1001)})
+        assert result == "handled"
+        assert middleware.reactivated == 1
+
+        async with get_db() as session:
+            assert await crud.count_users(session) == 1
+            found = await crud.find_users_by_skills(session, "Backend (Python/Go)")
+            assert [item.id for item in found] == [user.id]
+            refreshed = await crud.get_user_by_telegram_id(session, 1001)
+            assert refreshed.is_searching
+            assert refreshed.last_active > stale
+
+        # Повторные апдейты в пределах интервала не пишут в БД
+        await middleware(_handler, SimpleNamespace(), {"event_from_user": SimpleNamespace(id=1001)})
+        assert middleware.writes == 1
+
+    run_db(scenario)
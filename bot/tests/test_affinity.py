@@ -0,0 +1,52 @@
+"""Перестройка матрицы совместимости не блокирует event loop"""
+import asyncio
+import threading
+from datetime import datetime
+from database import crud
+from database.db import get_db
+from database.models import UserType
+from services.affinity import AffinityMatrix
+from utils.skills import skill_mask
+
+BACKEND = "Backend (Python/Go)"
+
+
+def test_rebuild_runs_off_loop_and_keeps_concurrent_changes(run_db):
+    async def scenario():
+        async with get_db() as session:
+            leader = await crud.create_user(session, telegram_id=6000, name="Лидер", user_type=UserType.TEAM)
+            team = await crud.create_team(session, "Команда", leader.id, needed_skills=BACKEND)
+            participant = await crud.create_user(
+                session, telegram_id=6001, name="Соискатель", user_type=UserType.PARTICIPANT, primary_skill=BACKEND
+            )
+
+        entered, release = threading.Event(), threading.Event()
+
+        class SlowMatrix(AffinityMatrix):
+            def _build(self, *args):
+                entered.set()
+                release.wait(5)
+                super()._build(*args)
+
+        matrix = SlowMatrix(top_k=5)
+        task = asyncio.create_task(matrix.rebuild())
+        for _ in range(500):
+            if entered.is_set():
+                break
+            await asyncio.sleep(0.01)
+        assert entered.is_set()
+
+        # Сборка идет в потоке: loop свободен, матрица еще старая
+        assert not matrix.ready
+        late_id = participant.id + 1000
+        matrix.set_participant(late_id, skill_mask(BACKEND), datetime.utcnow())
+        release.set()
+        await task
+
+        assert matrix.ready
+        team_row = [user_id for user_id, _ in matrix.participants_for_team(team.id)]
+        assert participant.id in team_row
+        # Изменение во время сборки повторено поверх новой матрицы
+        assert late_id in team_row
+
+    run_db(scenario)
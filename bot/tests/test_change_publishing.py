@@ -0,0 +1,118 @@
+"""Фоновые изменения (неактивные пользователи, истекшие приглашения) доходят до кешей"""
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from config import settings
+from database import crud
+from database.db import get_db
+from database.models import Invitation, InvitationStatus, User, UserType
+from services import invitation_expiry as expiry_module
+from services.affinity import affinity
+from services.cache_sync import cache_sync
+from services.invitation_expiry import invitation_expiry
+from services.match_feed import match_feed
+from services.profile_cache import profile_cache, is_cached
+from services.user_counter import user_counter
+import tasks
+
+BACKEND = "Backend (Python/Go)"
+
+
+def _capture(monkeypatch, module) -> list:
+    published = []
+
+    async def notify_change(session, kind, data):
+        published.append((kind, data))
+
+    monkeypatch.setattr(module, "notify_change", notify_change)
+    return published
+
+
+def test_inactive_users_are_published_and_dropped_from_caches(run_db, monkeypatch):
+    published = _capture(monkeypatch, tasks)
+
+    async def scenario():
+        async with get_db() as session:
+            user = await crud.create_user(
+                session, telegram_id=7001, name="Соискатель", user_type=UserType.PARTICIPANT, primary_skill=BACKEND
+            )
+            assert await user_counter.get(session) == 1
+        assert affinity.has_participant(user.id)
+
+        stale = datetime.utcnow() - timedelta(days=settings.CLEANUP_INACTIVE_USERS_DAYS + 1)
+        async with get_db() as session:
+            await session.execute(update(User).where(User.id == user.id).values(last_active=stale))
+        # Профиль в кеше до очистки
+        async with get_db() as session:
+            await crud.get_user_by_telegram_id(session, 7001)
+        assert is_cached(profile_cache.get_user(7001))
+
+        assert await tasks.cleanup_inactive_users() == 1
+
+        assert [kind for kind, _ in published] == ["users_inactive"]
+        [[user_id, telegram_id, mask]] = published[0][1]["users"]
+        assert (user_id, telegram_id) == (user.id, 7001) and mask
+        assert not is_cached(profile_cache.get_user(7001))
+        assert not affinity.has_participant(user.id)
+        async with get_db() as session:
+            assert await user_counter.get(session) == 0
+            # Очистка не сдвигает last_active
+            last_active = (await session.execute(select(User.last_active).where(User.id == user.id))).scalar_one()
+        assert last_active == stale
+
+    run_db(scenario)
+
+
+def test_expired_invitations_are_published(run_db, monkeypatch):
+    published = _capture(monkeypatch, expiry_module)
+
+    async def scenario():
+        async with get_db() as session:
+            sender = await crud.create_user(session, telegram_id=7101, name="Лидер", user_type=UserType.TEAM)
+            recipient = await crud.create_user(
+                session, telegram_id=7102, name="Соискатель", user_type=UserType.PARTICIPANT, primary_skill=BACKEND
+            )
+            team = await crud.create_team(session, "Команда", sender.id, needed_skills=BACKEND)
+            invitation = await crud.create_invitation(session, sender.id, recipient.id, from_team_id=team.id)
+
+        applied = cache_sync.applied_local
+        await invitation_expiry._expire([(invitation.expires_at, invitation.id)])
+
+        assert published == [("invitation", {
+            "from_user_id": sender.id,
+            "to_user_id": recipient.id,
+            "from_team_id": team.id,
+            "status": InvitationStatus.EXPIRED.name,
+        })]
+        assert cache_sync.applied_local == applied + 1
+        async with get_db() as session:
+            status = (await session.execute(
+                select(Invitation.status).where(Invitation.id == invitation.id)
+            )).scalar_one()
+        assert status == InvitationStatus.EXPIRED
+
+    run_db(scenario)
+
+
+def test_expiry_sweep_matches_scheduler_side_effects(run_db, monkeypatch):
+    published = _capture(monkeypatch, tasks)
+
+    async def scenario():
+        async with get_db() as session:
+            sender = await crud.create_user(session, telegram_id=7201, name="Основатель", user_type=UserType.COFOUNDER)
+            recipient = await crud.create_user(session, telegram_id=7202, name="Другой", user_type=UserType.COFOUNDER)
+            invitation = await crud.create_invitation(session, sender.id, recipient.id)
+            await session.execute(
+                update(Invitation)
+                .where(Invitation.id == invitation.id)
+                .values(expires_at=datetime.utcnow() - timedelta(minutes=1))
+            )
+
+        match_feed._refill.clear()
+        assert await tasks.cleanup_expired_invitations() == 1
+
+        assert [kind for kind, _ in published] == ["invitation"]
+        # Дедлайн снят с кучи планировщика, ленты обеих сторон пересчитаются
+        assert invitation.id in invitation_expiry._discarded
+        assert {sender.id, recipient.id} <= set(match_feed._refill)
+
+    run_db(scenario)
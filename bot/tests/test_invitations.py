@@ -0,0 +1,119 @@
+"""Приглашения: горячая таблица, архив и счетчики за все время"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import select, update
+from config import settings
+from database import crud, db
+from database.db import get_db
+from database.models import Invitation, InvitationStatus, UserType
+from database.sql_trace import SqlTracer
+from handlers.invitations import cmd_invitations
+import tasks
+
+
+async def _team_and_participant():
+    async with get_db() as session:
+        leader = await crud.create_user(session, telegram_id=2001, name="Лидер", user_type=UserType.TEAM)
+        team = await crud.create_team(session, "Команда", leader.id, needed_skills="Backend (Python/Go)")
+        participant = await crud.create_user(
+            session, telegram_id=2002, name="Соискатель", user_type=UserType.PARTICIPANT,
+            primary_skill="Backend (Python/Go)"
+        )
+    return leader, team, participant
+
+
+def test_lifetime_totals_include_archived_invitations(run_db):
+    async def scenario():
+        leader, team, participant = await _team_and_participant()
+        async with get_db() as session:
+            old = await crud.create_invitation(session, leader.id, participant.id, from_team_id=team.id)
+            await crud.create_invitation(session, leader.id, participant.id, from_team_id=team.id)
+
+        # Закрытое приглашение старше окна хранения уходит в архив
+        created = datetime.utcnow() - timedelta(days=settings.INVITATION_ARCHIVE_AFTER_DAYS + 1)
+        async with get_db() as session:
+            await session.execute(
+                update(Invitation)
+                .where(Invitation.id == old.id)
+                .values(status=InvitationStatus.REJECTED, created_at=created)
+            )
+        assert await tasks.archive_closed_invitations() == 1
+
+        async with get_db() as session:
+            stats = await crud.get_team_stats(session, team.id)
+            assert len(stats["sent_invitations"]) == 1
+            assert stats["sent_count"] == 2
+            assert await crud.count_profile_views(session, participant.id) == 2
+
+            user_stats = await crud.get_user_stats(session, participant.id)
+            assert len(user_stats["received_invitations"]) == 1
+            assert user_stats["received_count"] == 2
+
+    run_db(scenario)
+
+
+def test_second_tap_on_invitation_button_is_rejected(run_db):
+    async def scenario():
+        leader, team, participant = await _team_and_participant()
+        async with get_db() as session:
+            invitation = await crud.create_invitation(session, leader.id, participant.id, from_team_id=team.id)
+
+        # Нажать может только получатель
+        async with get_db() as session:
+            assert await crud.transition_invitation(
+                session, invitation.id, InvitationStatus.ACCEPTED, to_telegram_id=leader.telegram_id
+            ) is None
+
+        async with get_db() as session:
+            first = await crud.transition_invitation(
+                session, invitation.id, InvitationStatus.ACCEPTED, to_telegram_id=participant.telegram_id
+            )
+        assert first["status"] == InvitationStatus.ACCEPTED
+        assert first["team_name"] == team.team_name
+        assert first["from_telegram_id"] == leader.telegram_id
+
+        # Повторное (или параллельное) нажатие не меняет статус и не дублирует уведомления
+        async with get_db() as session:
+            assert await crud.transition_invitation(
+                session, invitation.id, InvitationStatus.REJECTED, to_telegram_id=participant.telegram_id
+            ) is None
+            status = (await session.execute(
+                select(Invitation.status).where(Invitation.id == invitation.id)
+            )).scalar_one()
+        assert status == InvitationStatus.ACCEPTED
+
+    run_db(scenario)
+
+
+def test_invitations_command_has_no_per_invitation_queries(run_db):
+    async def scenario():
+        leader, team, participant = await _team_and_participant()
+        async with get_db() as session:
+            cofounder = await crud.create_user(session, telegram_id=2003, name="Основатель", user_type=UserType.COFOUNDER)
+            for _ in range(3):
+                await crud.create_invitation(session, leader.id, participant.id, from_team_id=team.id)
+            await crud.create_invitation(session, cofounder.id, participant.id)
+
+        answers = []
+
+        async def answer(text, **kwargs):
+            answers.append(text)
+
+        message = SimpleNamespace(from_user=SimpleNamespace(id=participant.telegram_id), answer=answer)
+        tracer = SqlTracer(repeat_threshold=1, strict=True)
+        tracer.attach(db.engine)
+        trace = tracer.begin("cmd_invitations")
+        await cmd_invitations(message)
+        tracer.end(trace)
+
+        # Пользователь, приглашения с отправителями и командами, отметка просмотра
+        assert trace.statements <= 3
+        assert len(answers) == 1 + 4
+        assert any("Основатель" in text for text in answers)
+        async with get_db() as session:
+            unviewed = (await session.execute(
+                select(Invitation.id).where(Invitation.viewed_at.is_(None))
+            )).all()
+        assert unviewed == []
+
+    run_db(scenario)
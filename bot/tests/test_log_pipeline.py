@@ -0,0 +1,39 @@
+"""Ограничение повторяющихся предупреждений RateLimitFilter"""
+import logging
+from utils import log_pipeline
+from utils.log_pipeline import RateLimitFilter
+
+
+def _record(level: int = logging.ERROR, lineno: int = 10) -> logging.LogRecord:
+    return logging.LogRecord("handlers.invitations", level, "invitations.py", lineno, "Ошибка", None, None)
+
+
+def test_burst_then_sampling_with_suppressed_count():
+    limiter = RateLimitFilter(burst=2, window=60.0, sample_rate=3)
+    passed = [limiter.filter(_record()) for _ in range(4)]
+    assert passed == [True, True, False, False]
+
+    # Каждая третья запись после burst проходит с числом подавленных
+    record = _record()
+    assert limiter.filter(record)
+    assert record.suppressed == 2
+    assert record.msg == "Ошибка (+2 подобных записей подавлено)"
+    assert limiter.suppressed == 2
+
+    # Другое место вызова и записи ниже уровня не ограничиваются
+    assert limiter.filter(_record(lineno=20))
+    assert all(limiter.filter(_record(level=logging.INFO)) for _ in range(10))
+
+
+def test_new_window_reports_suppressed_from_previous(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(log_pipeline.time, "monotonic", lambda: now[0])
+    limiter = RateLimitFilter(burst=1, window=60.0, sample_rate=0)
+    assert limiter.filter(_record())
+    assert not limiter.filter(_record())
+    assert not limiter.filter(_record())
+
+    now[0] += 61
+    record = _record()
+    assert limiter.filter(record)
+    assert record.suppressed == 2
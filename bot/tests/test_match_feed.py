@@ -0,0 +1,81 @@
+"""Полная перестройка лент: запросы на группу зрителей, а не на каждого"""
+from sqlalchemy import select
+from database import crud, db
+from database.db import get_db
+from database.models import MatchFeed, UserType
+from database.sql_trace import SqlTracer
+from services.match_feed import MatchFeedWorker
+
+BACKEND = "Backend (Python/Go)"
+
+
+def test_rebuild_is_set_based_per_group(run_db):
+    async def scenario():
+        async with get_db() as session:
+            leader = await crud.create_user(session, telegram_id=4000, name="Лидер", user_type=UserType.TEAM)
+            team = await crud.create_team(session, "Команда", leader.id, needed_skills=BACKEND)
+            participants = [
+                await crud.create_user(
+                    session, telegram_id=4100 + number, name=f"Соискатель {number}",
+                    user_type=UserType.PARTICIPANT, primary_skill=BACKEND
+                )
+                for number in range(6)
+            ]
+            cofounders = [
+                await crud.create_user(
+                    session, telegram_id=4200 + number, name=f"Основатель {number}",
+                    user_type=UserType.COFOUNDER, primary_skill=BACKEND
+                )
+                for number in range(3)
+            ]
+
+        worker = MatchFeedWorker(feed_size=2)
+        tracer = SqlTracer(repeat_threshold=3, strict=True)
+        tracer.attach(db.engine)
+        trace = tracer.begin("rebuild")
+        await worker.rebuild()
+        tracer.end(trace)
+
+        # Батч зрителей, DELETE, маски команд, по INSERT на группу, пустой батч
+        groups = 3  # лидер (маска команды), соискатели (одна маска), основатели
+        assert trace.statements <= 4 + groups
+
+        async with get_db() as session:
+            rows = (await session.execute(
+                select(MatchFeed.viewer_id, MatchFeed.candidate_id)
+                .order_by(MatchFeed.viewer_id, MatchFeed.score.desc())
+            )).all()
+            expected = await crud.find_users_by_skills(session, BACKEND, exclude_user_id=leader.id, limit=2)
+
+        feeds = {}
+        for viewer_id, candidate_id in rows:
+            feeds.setdefault(viewer_id, []).append(candidate_id)
+
+        assert feeds[leader.id] == [user.id for user in expected]
+        for participant in participants:
+            assert feeds[participant.id] == [team.id]
+        for cofounder in cofounders:
+            others = {user.id for user in cofounders} - {cofounder.id}
+            assert set(feeds[cofounder.id]) == others
+
+    run_db(scenario)
+
+
+def test_flush_refreshes_marked_users_and_teams(run_db):
+    async def scenario():
+        worker = MatchFeedWorker(feed_size=5, flush_interval=0)
+        async with get_db() as session:
+            leader = await crud.create_user(session, telegram_id=4300, name="Лидер", user_type=UserType.TEAM)
+            team = await crud.create_team(session, "Команда", leader.id, needed_skills=BACKEND)
+            participant = await crud.create_user(
+                session, telegram_id=4301, name="Соискатель", user_type=UserType.PARTICIPANT, primary_skill=BACKEND
+            )
+        worker.mark_team(team.id)
+        worker.mark_user(participant.id)
+        await worker._flush()
+
+        async with get_db() as session:
+            rows = set((await session.execute(select(MatchFeed.viewer_id, MatchFeed.candidate_id))).all())
+        assert rows == {(leader.id, participant.id), (participant.id, team.id)}
+
+    run_db(scenario)
@@ -0,0 +1,22 @@
+"""Оценка перцентилей гистограммы по корзинам"""
+from utils.metrics import Histogram
+
+
+def test_quantile_interpolates_inside_bucket():
+    histogram = Histogram("test_seconds", "Тест", buckets=(1.0, 2.0, 4.0))
+    for value in (0.5, 0.5, 1.5, 1.5):
+        histogram.observe(value)
+
+    assert histogram.quantile(0.5) == 1.0
+    assert histogram.quantile(0.75) == 1.5
+    assert histogram.quantile(1.0) == 2.0
+
+
+def test_quantile_edge_cases():
+    histogram = Histogram("test_seconds", "Тест", labels=("handler",), buckets=(1.0, 2.0))
+    assert histogram.quantile(0.5, "cmd_start") is None
+
+    # Значения выше последней корзины оцениваются ее границей
+    histogram.observe(10.0, "cmd_start")
+    assert histogram.quantile(0.99, "cmd_start") == 2.0
+    assert histogram.quantile(0.5, "cmd_search") is None
@@ -0,0 +1,63 @@
+"""
+Обрезка пула InstrumentedPool.
+
+_do_return_conn и _dec_overflow - внутренние методы QueuePool: тест
+закрепляет поведение, на которое опирается адаптивный режим, и падает
+при несовместимом обновлении SQLAlchemy.
+"""
+import sqlite3
+from database.pool import InstrumentedPool
+
+
+def _pool(created: list) -> InstrumentedPool:
+    def creator():
+        connection = sqlite3.connect(":memory:")
+        created.append(connection)
+        return connection
+
+    return InstrumentedPool(creator, pool_size=2, max_overflow=3, timeout=0.1)
+
+
+def _is_closed(connection: sqlite3.Connection) -> bool:
+    try:
+        connection.execute("SELECT 1")
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+
+def test_connections_over_target_are_closed_on_return():
+    created = []
+    pool = _pool(created)
+    connections = [pool.connect() for _ in range(5)]
+    assert pool.overflow() == 3
+
+    # Целевой размер меньше pool_size: обычный QueuePool оставил бы 2
+    pool.target_size = 1
+    for connection in connections:
+        connection.close()
+
+    # Лишние соединения закрыты, а их места под overflow освобождены
+    assert pool.checkedin() == 1
+    assert pool.checkedout() == 0
+    assert pool.overflow() == -1
+    assert sum(_is_closed(connection) for connection in created) == 4
+
+
+def test_trimmed_pool_can_grow_back_to_capacity():
+    created = []
+    pool = _pool(created)
+    pool.target_size = 1
+    for connection in [pool.connect() for _ in range(5)]:
+        connection.close()
+    assert pool.checkedin() == 1
+
+    # Все 5 мест снова доступны без ожидания: счетчик overflow не утек
+    pool.target_size = None
+    connections = [pool.connect() for _ in range(5)]
+    assert pool.overflow() == 3
+    for connection in connections:
+        connection.close()
+    # Без целевого размера - обычный QueuePool: в очереди до pool_size
+    assert pool.checkedin() == 2
+    assert pool.overflow() == 0
@@ -0,0 +1,96 @@
+"""Отбор и ранжирование по колонкам снимка профилей"""
+import time
+from contextlib import asynccontextmanager
+from database import crud
+from database.db import get_db
+from database.models import InvitationStatus, UserType
+from database.ranking import activity_by_age
+from services import profile_snapshot as snapshot_module
+from services.profile_snapshot import TYPE_CODES, ProfileSnapshot, _Columns
+
+PARTICIPANT = TYPE_CODES[UserType.PARTICIPANT]
+COFOUNDER = TYPE_CODES[UserType.COFOUNDER]
+DAY = 86400
+
+
+def make_snapshot(rows) -> ProfileSnapshot:
+    """rows: (id, тип, ищет, маска, основной навык, категория, last_active, принято, получено)"""
+    columns = _Columns()
+    for user_id, *values, accepted, received in sorted(rows):
+        columns.append(user_id, (*values[:1], 0xFF if values[1] else 0, *values[2:]))
+        columns.accepted[-1], columns.received[-1] = accepted, received
+    snapshot = ProfileSnapshot()
+    snapshot._columns = columns
+    return snapshot
+
+
+def test_rank_participants_filters_and_orders_by_activity():
+    now = time.time()
+    rows = [
+        (1, PARTICIPANT, True, 0b011, 0, 0, now - DAY, 0, 0),
+        (2, PARTICIPANT, True, 0b001, 0, 0, now, 0, 0),
+        (3, PARTICIPANT, False, 0b011, 0, 0, now, 0, 0),   # не ищет
+        (4, COFOUNDER, True, 0b011, 0, 0, now, 0, 0),      # другой тип
+        (5, PARTICIPANT, True, 0b100, 0, 0, now, 0, 0),    # нет общих навыков
+        (6, PARTICIPANT, True, 0b011, 0, 0, now - 10 * DAY, 3, 4),
+    ]
+    snapshot = make_snapshot(rows)
+
+    def score(row):
+        user_id, _, _, mask, _, _, last_active, accepted, received = row
+        overlap = (mask & 0b011).bit_count()
+        return overlap + activity_by_age((now - last_active) / DAY, accepted, received), last_active, user_id
+
+    expected = [row[0] for row in sorted((rows[0], rows[1], rows[5]), key=score, reverse=True)]
+    assert snapshot.rank_participants(0b011) == expected
+    assert snapshot.rank_participants(0b011, limit=1) == expected[:1]
+    assert snapshot.rank_participants(0b011, exclude_user_id=1) == [i for i in expected if i != 1]
+    assert snapshot.rank_participants(0b011, skip=lambda user_id: user_id == 6) == [i for i in expected if i != 6]
+    assert snapshot.rank_participants(0b1000) == []
+
+
+def test_rank_cofounders_stars_and_skip():
+    now = time.time()
+    snapshot = make_snapshot([
+        (10, COFOUNDER, True, 0, 1, 1, now, 0, 0),
+        (11, COFOUNDER, True, 0, 2, 1, now, 0, 0),     # другой навык + та же категория
+        (12, COFOUNDER, True, 0, 2, 0, now, 0, 0),     # другой навык
+        (13, COFOUNDER, True, 0, 1, 1, now, 0, 0),     # тот же навык + та же категория
+        (14, COFOUNDER, False, 0, 2, 1, now, 0, 0),    # не ищет
+        (15, PARTICIPANT, True, 0, 2, 1, now, 0, 0),   # другой тип
+    ])
+
+    assert snapshot.rank_cofounders(10) == [(11, 5), (12, 4), (13, 3)]
+    assert snapshot.rank_cofounders(10, limit=2) == [(11, 5), (12, 4)]
+    assert snapshot.rank_cofounders(10, skip=lambda user_id: user_id == 11) == [(12, 4), (13, 3)]
+    assert snapshot.rank_cofounders(99) is None
+
+
+def test_invitation_recorded_during_reload_survives_swap(run_db, monkeypatch):
+    async def scenario():
+        async with get_db() as session:
+            user = await crud.create_user(session, telegram_id=6100, name="Соискатель", user_type=UserType.PARTICIPANT)
+
+        snapshot = ProfileSnapshot()
+
+        @asynccontextmanager
+        async def racing_db():
+            async with get_db() as session:
+                execute = session.execute
+
+                async def execute_after_invitation(*args, **kwargs):
+                    # Приглашение учтено после начала перезагрузки, но не попало в запрос
+                    snapshot.record_invitation(user.id, InvitationStatus.PENDING)
+                    return await execute(*args, **kwargs)
+
+                session.execute = execute_after_invitation
+                yield session
+
+        monkeypatch.setattr(snapshot_module, "get_db", racing_db)
+        await snapshot.reload()
+
+        pos = snapshot._columns.position(user.id)
+        assert snapshot._columns.received[pos] == 1
+        assert snapshot._pending is None
+
+    run_db(scenario)
@@ -0,0 +1,86 @@
+"""Маршрутизация чтений между primary и репликами"""
+import asyncio
+from types import SimpleNamespace
+import pytest
+from cachetools import TTLCache
+from database import db
+from database.db import ReplicaRouter, read_only
+
+
+def make_router(lags, max_lag: float = 5.0) -> ReplicaRouter:
+    router = ReplicaRouter(max_lag=max_lag)
+    router.engines = [f"replica{index}" for index in range(len(lags))]
+    router._lag = dict(enumerate(lags))
+    return router
+
+
+def make_session():
+    return SimpleNamespace(sync_session=SimpleNamespace(info={}))
+
+
+def test_no_healthy_replica_reads_primary():
+    # Одна недоступна, другая отстает больше max_lag
+    router = make_router([None, 10.0], max_lag=5.0)
+
+    assert router.pick(user_id=1) is None
+    assert router.primary_reads == 1
+    assert router.replica_reads == 0
+
+
+def test_healthy_replicas_are_used_round_robin():
+    router = make_router([0.1, None, 1.0])
+
+    assert [router.pick() for _ in range(4)] == ["replica0", "replica2", "replica0", "replica2"]
+    assert router.replica_reads == 4
+
+
+def test_written_keys_read_primary_for_max_lag():
+    router = make_router([0.1], max_lag=5.0)
+    clock = [0.0]
+    router._pinned = TTLCache(maxsize=100, ttl=router.max_lag, timer=lambda: clock[0])
+
+    router.note_write(user_ids=[1], team_ids=[7])
+    assert router.pick(user_id=1) is None
+    assert router.pick(team_id=7) is None
+    assert router.pick(user_id=2, team_id=8) == "replica0"
+    assert router.pinned_reads == 2
+
+    clock[0] = 5.1
+    assert router.pick(user_id=1) == "replica0"
+    assert router.pick(team_id=7) == "replica0"
+
+
+def test_nested_read_only_reuses_outer_bind(monkeypatch):
+    router = make_router([0.1, 0.2])
+    monkeypatch.setattr(db, "replicas", router)
+    binds = []
+
+    @read_only(user_arg="user_id")
+    async def inner(session, user_id):
+        binds.append(session.sync_session.info["replica_bind"])
+
+    @read_only()
+    async def outer(session, user_id):
+        binds.append(session.sync_session.info["replica_bind"])
+        await inner(session, user_id)
+
+    session = make_session()
+    asyncio.run(outer(session, 1))
+
+    assert binds == ["replica0", "replica0"]
+    assert router.replica_reads == 1
+    assert "replica_bind" not in session.sync_session.info
+
+
+def test_read_only_removes_bind_on_error(monkeypatch):
+    monkeypatch.setattr(db, "replicas", make_router([0.1]))
+
+    @read_only()
+    async def failing(session):
+        assert session.sync_session.info["replica_bind"] == "replica0"
+        raise ValueError("boom")
+
+    session = make_session()
+    with pytest.raises(ValueError):
+        asyncio.run(failing(session))
+    assert "replica_bind" not in session.sync_session.info
@@ -0,0 +1,153 @@
+"""Фильтр просмотренных: фильтр Блума, поколения и отбор кандидатов"""
+from datetime import timedelta
+from types import SimpleNamespace
+from database import crud
+from database.db import get_db
+from database.models import UserType
+from services.match_feed import MatchFeedWorker
+from services.seen_filter import BloomFilter, SeenFilterStore, SeenSet, seen_key
+
+BACKEND = "Backend (Python/Go)"
+
+
+async def _seed(session):
+    leader = await crud.create_user(session, telegram_id=5000, name="Лидер", user_type=UserType.TEAM)
+    team = await crud.create_team(session, "Команда", leader.id, needed_skills=BACKEND)
+    participants = [
+        await crud.create_user(
+            session, telegram_id=5100 + number, name=f"Соискатель {number}",
+            user_type=UserType.PARTICIPANT, primary_skill=BACKEND
+        )
+        for number in range(4)
+    ]
+    return leader, team, participants
+
+
+def test_sql_search_pages_past_seen_candidates(run_db):
+    async def scenario():
+        async with get_db() as session:
+            leader, _, _ = await _seed(session)
+            ranked = await crud.find_users_by_skills(session, BACKEND, exclude_user_id=leader.id)
+            for user in ranked[:2]:
+                await crud.mark_seen(session, leader.id, UserType.PARTICIPANT, user.id)
+
+            seen = await crud.seen_check(session, leader.id, UserType.PARTICIPANT)
+            found = await crud.find_users_by_skills(
+                session, BACKEND, exclude_user_id=leader.id, limit=2, seen=seen
+            )
+            assert [user.id for user in found] == [user.id for user in ranked[2:]]
+            assert seen.hidden == 2
+
+    run_db(scenario)
+
+
+def test_exhausted_feed_falls_back_to_unseen_candidates(run_db):
+    async def scenario():
+        async with get_db() as session:
+            leader, team, participants = await _seed(session)
+        await MatchFeedWorker(feed_size=2).rebuild()
+
+        async with get_db() as session:
+            feed = await crud.get_feed_users(session, leader.id, UserType.PARTICIPANT, limit=2)
+            assert len(feed) == 2
+            for user, _ in feed:
+                await crud.mark_seen(session, leader.id, UserType.PARTICIPANT, user.id)
+
+            seen = await crud.seen_check(session, leader.id, UserType.PARTICIPANT)
+            assert await crud.get_feed_users(session, leader.id, UserType.PARTICIPANT, limit=2, seen=seen) == []
+            found = await crud.find_participants_for_team(session, team, exclude_user_id=leader.id, seen=seen)
+
+        shown = {user.id for user, _ in feed}
+        assert {user.id for user in found} == {user.id for user in participants} - shown
+        assert seen.hidden >= 2
+
+    run_db(scenario)
+
+
+def test_bloom_filter_has_no_false_negatives_and_survives_serialization():
+    bloom = BloomFilter(bits=8192, hashes=6)
+    keys = [seen_key(UserType.TEAM, candidate_id) for candidate_id in range(300)]
+    for key in keys:
+        bloom.add(key)
+    assert bloom.count == 300
+    assert all(key in bloom for key in keys)
+
+    restored = BloomFilter(8192, 6, bytes(bloom.data), bloom.count)
+    assert all(key in restored for key in keys)
+    assert restored.count == 300
+
+
+def test_seen_set_forgets_candidates_after_two_rotations():
+    seen = SeenSet(bits=1024, hashes=3)
+    key = seen_key(UserType.COFOUNDER, 42)
+    seen.add(key)
+    max_age = timedelta(days=7)
+
+    assert not seen.rotate_if_needed(max_age, capacity=100)
+    # Поколение устарело: пропуск переходит в предыдущее и еще действует
+    seen.rotated_at -= timedelta(days=8)
+    assert seen.rotate_if_needed(max_age, capacity=100)
+    assert key in seen
+
+    # Вторая ротация отбрасывает предыдущее поколение
+    seen.rotated_at -= timedelta(days=8)
+    assert seen.rotate_if_needed(max_age, capacity=100)
+    assert key not in seen
+
+
+def test_seen_set_rotates_when_generation_is_full():
+    seen = SeenSet(bits=1024, hashes=3)
+    seen.add(seen_key(UserType.TEAM, 1))
+    seen.add(seen_key(UserType.TEAM, 2))
+    assert seen.rotate_if_needed(timedelta(days=7), capacity=2)
+    assert seen.current.count == 0
+    assert seen_key(UserType.TEAM, 1) in seen
+
+
+def test_flushes_from_two_instances_are_merged(run_db):
+    async def scenario():
+        async with get_db() as session:
+            viewer = await crud.create_user(session, telegram_id=5200, name="Лидер", user_type=UserType.TEAM)
+
+        first, second = SeenFilterStore(bits=1024, capacity=100), SeenFilterStore(bits=1024, capacity=100)
+        async with get_db() as session:
+            # Оба экземпляра создали фильтр до того, как другой его записал
+            await first.add(session, viewer.id, UserType.PARTICIPANT, 1)
+            await second.add(session, viewer.id, UserType.PARTICIPANT, 2)
+        assert await first.flush() == 1
+        assert await second.flush() == 1
+
+        # Следующий раунд - поверх записанной строки, после сброса по уведомлению
+        first.evict([viewer.id])
+        async with get_db() as session:
+            await first.add(session, viewer.id, UserType.PARTICIPANT, 3)
+            await second.add(session, viewer.id, UserType.PARTICIPANT, 4)
+        await second.flush()
+        await first.flush()
+
+        fresh = SeenFilterStore(bits=1024, capacity=100)
+        async with get_db() as session:
+            seen = await fresh.check(session, viewer.id, UserType.PARTICIPANT)
+        assert all(seen(candidate_id) for candidate_id in (1, 2, 3, 4))
+        assert not seen(5)
+
+    run_db(scenario)
+
+
+def test_merge_keeps_skips_from_an_older_generation():
+    ours = SeenSet(bits=1024, hashes=3)
+    ours.add(seen_key(UserType.TEAM, 1))
+    ours.rotated_at -= timedelta(days=1)
+
+    # Другой экземпляр ротировал позже: наше поколение становится предыдущим
+    theirs = SeenSet(bits=1024, hashes=3)
+    theirs.add(seen_key(UserType.TEAM, 2))
+    row = SimpleNamespace(
+        current_bits=bytes(theirs.current.data), current_count=theirs.current.count,
+        previous_bits=None, rotated_at=theirs.rotated_at
+    )
+    ours.merge(row)
+
+    assert ours.rotated_at == theirs.rotated_at
+    assert seen_key(UserType.TEAM, 2) in ours.current
+    assert seen_key(UserType.TEAM, 1) in ours.previous
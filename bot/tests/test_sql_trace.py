@@ -0,0 +1,34 @@
+"""Отпечатки SQL-запросов и строгий режим поиска N+1"""
+import pytest
+from database.sql_trace import RepeatedQueryError, SqlTracer, fingerprint
+
+
+def test_fingerprint_ignores_parameter_values():
+    first = fingerprint("SELECT * FROM users WHERE id = $1 AND name = 'Аня'  LIMIT 10")
+    second = fingerprint("SELECT *\nFROM users WHERE id = $7 AND name = 'O''Brien' LIMIT 20")
+    assert first == second
+    assert first[1] == "SELECT * FROM users WHERE id = ? AND name = ? LIMIT ?"
+
+
+def test_fingerprint_collapses_in_lists_of_any_length():
+    two = fingerprint("SELECT id FROM teams WHERE id IN ($1, $2)")
+    five = fingerprint("SELECT id FROM teams WHERE id IN ($1, $2, $3, $4, $5)")
+    assert two == five
+    assert two[1].endswith("IN (?+)")
+    assert fingerprint("SELECT id FROM teams WHERE id IN ($1)") != two
+
+
+def test_strict_tracer_raises_on_repeated_statement():
+    tracer = SqlTracer(repeat_threshold=2, strict=True)
+    trace = tracer.begin("show_invitation")
+    for team_id in range(3):
+        trace.record(f"SELECT * FROM teams WHERE id = {team_id}", 0.001)
+    with pytest.raises(RepeatedQueryError):
+        tracer.end(trace)
+
+    trace = tracer.begin("cmd_invitations")
+    trace.record("SELECT * FROM teams WHERE id = 1", 0.001)
+    trace.record("SELECT * FROM users WHERE id = 1", 0.001)
+    tracer.end(trace)
+    assert tracer.get_stats()["show_invitation"]["n_plus_one"] == 1
+    assert tracer.get_stats()["cmd_invitations"]["n_plus_one"] == 0
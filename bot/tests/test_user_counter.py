@@ -0,0 +1,36 @@
+"""Счетчик активных соискателей совпадает с БД без сверки"""
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from config import settings
+from database import crud
+from database.db import get_db
+from database.models import User, UserType
+from services.user_counter import user_counter
+import tasks
+
+
+def test_counter_follows_create_cleanup_and_return(run_db):
+    async def scenario():
+        async with get_db() as session:
+            assert await user_counter.get(session) == 0
+            first = await crud.create_user(session, telegram_id=3001, name="Первый", user_type=UserType.PARTICIPANT)
+            await crud.create_user(session, telegram_id=3002, name="Второй", user_type=UserType.COFOUNDER)
+            assert await user_counter.get(session) == 2
+
+        stale = datetime.utcnow() - timedelta(days=settings.CLEANUP_INACTIVE_USERS_DAYS + 1)
+        async with get_db() as session:
+            await session.execute(update(User).where(User.id == first.id).values(last_active=stale))
+        assert await tasks.cleanup_inactive_users() == 1
+
+        async with get_db() as session:
+            assert await user_counter.get(session) == 1
+        await user_counter.reconcile()
+        assert user_counter.last_drift == 0
+
+        async with get_db() as session:
+            assert await crud.record_user_activity(session, 3001)
+            assert await user_counter.get(session) == 2
+        await user_counter.reconcile()
+        assert user_counter.last_drift == 0
+
+    run_db(scenario)
@@ -0,0 +1,215 @@
+"""
+Неблокирующий вывод логов.
+
+Обработчики пишут в логгеры из потока event loop, поэтому запись в
+stdout и файл вынесена в фоновый поток:
+- на корневом логгере висит только QueueHandler - он кладет запись в
+  очередь и сразу возвращает управление
+- QueueListener в отдельном потоке разбирает очередь и передает записи
+  настоящим обработчикам (консоль, файл)
+- если очередь переполнена, запись отбрасывается и учитывается в
+  статистике - loop никогда не ждет вывода
+
+Повторяющиеся предупреждения и ошибки (например, сбой show_invitation
+для каждого приглашения в списке) ограничиваются по месту вызова: за
+окно LOG_RATE_LIMIT_WINDOW_SECONDS проходят первые LOG_RATE_LIMIT_BURST
+записей, дальше - каждая LOG_SAMPLE_RATE-я. Число подавленных записей
+дописывается к следующей пропущенной.
+
+LOG_JSON переключает формат на JSON - по одному объекту на строку.
+"""
+import copy
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - один JSON-объект"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Ограничение повторяющихся предупреждений и ошибок по месту вызова"""
+
+    def __init__(self, burst: int = 10, window: float = 60.0, sample_rate: int = 100,
+                 level: int = logging.WARNING):
+        """
+        Args:
+            burst: Сколько записей с одного места пропускать за окно
+            window: Длина окна (секунды)
+            sample_rate: После burst пропускать каждую N-ю запись (0 - ни одной)
+            level: Ограничиваются записи с этого уровня и выше
+        """
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.sample_rate = sample_rate
+        self.level = level
+
+        self._lock = threading.Lock()
+        # (логгер, файл, строка) -> [начало окна, записей в окне, подавлено]
+        self._sites: Dict[Tuple[str, str, int], List[float]] = {}
+
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level:
+            return True
+
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                pending = int(site[2]) if site is not None else 0
+                site = self._sites[key] = [now, 0, pending]
+            site[1] += 1
+            seen = site[1]
+
+            allowed = seen <= self.burst or (
+                self.sample_rate > 0 and (seen - self.burst) % self.sample_rate == 0
+            )
+            if not allowed:
+                site[2] += 1
+                self.suppressed += 1
+                return False
+
+            if site[2]:
+                record.suppressed = int(site[2])
+                record.msg = f"{record.msg} (+{int(site[2])} подобных записей подавлено)"
+                site[2] = 0
+            return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler, который отбрасывает запись при полной очереди"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы подставляются здесь: объекты могут измениться до записи.
+        # Трассировка сохраняется отдельно - ее оформит форматтер в потоке записи
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """Корневой логгер -> очередь -> поток записи -> консоль и файл"""
+
+    def __init__(self):
+        self._handlers: List[logging.Handler] = []
+        self._queue_handler: Optional[NonBlockingQueueHandler] = None
+        self._listener: Optional[QueueListener] = None
+        self._rate_limit: Optional[RateLimitFilter] = None
+
+    # ===== Публичный API =====
+
+    def start(self, level: str = "INFO", log_file: Optional[str] = None, as_json: bool = False,
+              queue_size: int = 10000, burst: int = 10, window: float = 60.0,
+              sample_rate: int = 100) -> None:
+        """
+        Настроить корневой логгер и запустить поток записи.
+
+        Args:
+            level: Уровень логирования
+            log_file: Путь к файлу логов (None - только консоль)
+            as_json: Писать записи в JSON
+            queue_size: Размер очереди записей
+            burst, window, sample_rate: Ограничение повторяющихся записей
+        """
+        formatter = JsonFormatter() if as_json else logging.Formatter(LOG_FORMAT)
+
+        self._handlers = [logging.StreamHandler(sys.stdout)]
+        if log_file:
+            path = Path(log_file)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._handlers.append(logging.FileHandler(path, encoding="utf-8"))
+        for handler in self._handlers:
+            handler.setFormatter(formatter)
+
+        self._rate_limit = RateLimitFilter(burst=burst, window=window, sample_rate=sample_rate)
+        self._queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+        self._queue_handler.addFilter(self._rate_limit)
+
+        root = logging.getLogger()
+        root.setLevel(getattr(logging, level))
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(self._queue_handler)
+
+        self._listener = QueueListener(
+            self._queue_handler.queue, *self._handlers, respect_handler_level=True
+        )
+        self._listener.start()
+
+    def stop(self) -> None:
+        """
+        Дописать очередь и остановить поток записи.
+
+        Обработчики возвращаются на корневой логгер напрямую, чтобы
+        сообщения после остановки (завершение процесса) не терялись.
+        """
+        if self._listener is None:
+            return
+        root = logging.getLogger()
+        root.removeHandler(self._queue_handler)
+        self._listener.stop()
+        self._listener = None
+        for handler in self._handlers:
+            root.addHandler(handler)
+
+    def get_stats(self) -> dict:
+        """Статистика вывода логов (для мониторинга)"""
+        if self._queue_handler is None:
+            return {"running": False}
+        return {
+            "running": self._listener is not None,
+            "queued": self._queue_handler.queue.qsize(),
+            "dropped": self._queue_handler.dropped,
+            "suppressed": self._rate_limit.suppressed,
+        }
+
+
+# Глобальный экземпляр
+log_pipeline = LogPipeline()
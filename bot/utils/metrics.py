@@ -0,0 +1,217 @@
+"""
+Метрики в формате Prometheus без внешних зависимостей.
+
+- Counter - монотонный счетчик
+- Histogram - гистограмма с фиксированными корзинами; Prometheus считает
+  перцентили через histogram_quantile, а quantile() дает ту же оценку
+  для /stats (p50/p95/p99)
+- Коллекторы - функции, которые при каждом опросе возвращают значения
+  (gauge) из get_stats() компонентов
+
+Все метрики регистрируются в глобальном registry; render() отдает текст
+для эндпоинта /metrics.
+"""
+import bisect
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Корзины длительностей (секунды): от 1 мс до 30 с
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Корзины количеств (запросов к БД за апдейт и т.п.)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+LabelValues = Tuple[str, ...]
+# Значение коллектора: (метки, значение)
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        key = tuple(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(tuple(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class _HistogramSeries:
+    """Одна серия гистограммы (конкретные значения меток)"""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и метками"""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[LabelValues, _HistogramSeries] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = tuple(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _HistogramSeries(len(self.buckets))
+        series.counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def quantile(self, q: float, *labels: str) -> Optional[float]:
+        """Оценка перцентиля по корзинам (как histogram_quantile в Prometheus)"""
+        series = self._series.get(tuple(labels))
+        if series is None or not series.count:
+            return None
+        rank = q * series.count
+        cumulative = 0
+        for index, count in enumerate(series.counts):
+            if cumulative + count >= rank and count:
+                upper = self.buckets[index]
+                lower = self.buckets[index - 1] if index else 0.0
+                if upper == math.inf:
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-2]
+
+    def summary(self) -> Dict[str, dict]:
+        """p50/p95/p99, количество и среднее по каждой серии (для /stats)"""
+        result = {}
+        for key, series in self._series.items():
+            name = "/".join(key) or "all"
+            result[name] = {
+                "count": series.count,
+                "avg": round(series.sum / series.count, 6) if series.count else 0.0,
+                "p50": round(self.quantile(0.5, *key), 6),
+                "p95": round(self.quantile(0.95, *key), 6),
+                "p99": round(self.quantile(0.99, *key), 6),
+            }
+        return result
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.label_names + ("le",)
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series.counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series.sum)}")
+            lines.append(f"{self.name}_count{labels} {series.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик и коллекторов, которые отдаются на /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Tuple[str, str, Callable[[], Iterable[Sample]]]] = []
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def collector(self, name: str, documentation: str, collect: Callable[[], Iterable[Sample]]) -> None:
+        """Добавить gauge, значения которого вычисляются при каждом опросе"""
+        self._collectors.append((name, documentation, collect))
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Текст в формате Prometheus exposition 0.0.4"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for name, documentation, collect in self._collectors:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in collect():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            return self._metrics[metric.name]
+        self._metrics[metric.name] = metric
+        return metric
+
+
+# Глобальный реестр
+registry = MetricsRegistry()
+
+# ===== Метрики бота =====
+
+handler_latency = registry.histogram(
+    "bot_handler_duration_seconds", "Handler latency", labels=("router", "handler")
+)
+telegram_request_latency = registry.histogram(
+    "bot_telegram_request_duration_seconds", "Outbound Telegram Bot API call latency", labels=("method",)
+)
+telegram_request_errors = registry.counter(
+    "bot_telegram_request_errors_total", "Failed Telegram Bot API calls", labels=("method",)
+)
+update_db_time = registry.histogram(
+    "bot_update_db_seconds", "Database time per update", labels=("handler",)
+)
+update_db_statements = registry.histogram(
+    "bot_update_db_statements", "SQL statements per update", labels=("handler",), buckets=COUNT_BUCKETS
+)
+task_runs = registry.counter(
+    "bot_background_task_runs_total", "Background task runs", labels=("task",)
+)
+task_rows = registry.counter(
+    "bot_background_task_rows_total", "Rows processed by background tasks", labels=("task",)
+)
+throttling_rejections = registry.counter(
+    "bot_throttling_rejections_total", "Messages dropped by the rate limiter"
+)
@@ -0,0 +1,60 @@
+"""
+Битовые маски навыков.
+
+Навыки хранятся в БД строками из названий SKILLS_DESCRIPTIONS через запятую
+("Mobile (Flutter), Design (Figma)"). Для подсчетов в памяти такая строка
+переводится в маску: бит i - навык SKILL_KEYS[i]. Совпадение навыков -
+непустое пересечение масок (как поиск подстроки ilike в crud).
+"""
+from typing import List, Optional
+from utils.texts import SKILLS_DESCRIPTIONS
+
+# Порядок битов
+SKILL_KEYS = tuple(SKILLS_DESCRIPTIONS)
+
+# Название навыка в нижнем регистре -> бит
+_NAME_BITS = tuple(
+    (SKILLS_DESCRIPTIONS[key]["name"].lower(), 1 << index)
+    for index, key in enumerate(SKILL_KEYS)
+)
+
+# Ключевое слово навыка (название до скобки) -> бит,
+# так же как count_teams_need_skill сравнивает навык
+_KEYWORD_BITS = {
+    name.split('(')[0].strip(): bit for name, bit in _NAME_BITS
+}
+
+ALL_SKILLS_MASK = (1 << len(SKILL_KEYS)) - 1
+
+
+def skill_mask(*skills_texts: Optional[str]) -> int:
+    """
+    Маска навыков по строкам из БД.
+
+    Пример: skill_mask("Backend (Python/Go)", "Design (Figma), AI/ML")
+    """
+    mask = 0
+    for skills_text in skills_texts:
+        if not skills_text:
+            continue
+        lowered = skills_text.lower()
+        for name, bit in _NAME_BITS:
+            if name in lowered:
+                mask |= bit
+    return mask
+
+
+def keyword_bit(skill: str) -> int:
+    """Бит навыка по названию или ключевому слову (0 - навык неизвестен)"""
+    keyword = skill.lower().split('(')[0].strip()
+    return _KEYWORD_BITS.get(keyword, 0)
+
+
+def mask_to_keys(mask: int) -> List[str]:
+    """Ключи навыков (backend, design, ...) из маски"""
+    return [key for index, key in enumerate(SKILL_KEYS) if mask & (1 << index)]
+
+
+def mask_bits(mask: int) -> List[int]:
+    """Номера установленных битов маски"""
+    return [index for index in range(len(SKILL_KEYS)) if mask & (1 << index)]
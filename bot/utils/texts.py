@@ -323,6 +323,16 @@ INVITATION_REJECTED_TO_USER = """✅ Вы отказались от пригла
 
 Команда получила уведомление."""
 
+INVITATION_ALREADY_PROCESSED = "⚠️ Приглашение уже обработано или истекло"
+
+INVITATION_EXPIRED_TO_SENDER = """⌛ Приглашение для {name} истекло без ответа.
+
+Попробуйте найти других кандидатов: /search"""
+
+INVITATION_EXPIRED_TO_RECIPIENT = """⌛ Приглашение от {name} истекло.
+
+Новые приглашения: /invitations"""
+
 BUTTON_SEND_CHECKLIST = "📋 Отправить чеклист ему тоже"
 
 MEETING_CHECKLIST = """📋 Чеклист для первой встречи:
@@ -502,6 +512,10 @@ PARTICIPANT_SEARCH_EMPTY_NO_TEAMS = """Пока нет команд 😔
 
 Мы уведомим тебя когда появятся!"""
 
+SEARCH_ALL_SEEN = """Ты уже посмотрел всех подходящих кандидатов 👀
+
+Новые появятся позже - загляни через пару дней: /search"""
+
 # Кнопки для поиска
 BUTTON_SEND_REQUEST = "💬 Отправить запрос"
 BUTTON_NEXT = "👉 Следующий"